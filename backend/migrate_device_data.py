@@ -4,7 +4,8 @@ MongoDB Migration Script: Add device_id to existing sensor data
 This script:
 1. Creates a default device for the first user (or creates a default user if none exists)
 2. Adds device_id field to all existing documents in pzem_data1 collection
-3. Creates indexes for better query performance
+   (chunked backfill, see monitoring/backfill.py; re-run to resume)
+3. Creates indexes for better query performance (monitoring/indexes.py)
 
 Usage:
     python migrate_device_data.py
@@ -21,6 +22,7 @@ os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wattara.settings')
 django.setup()
 
 from django.contrib.auth.models import User
+from monitoring import backfill, indexes
 from monitoring.models import Device
 
 
@@ -90,34 +92,24 @@ def migrate_device_data():
         print(f"  ✓ Using existing device: {device.name}")
         print(f"    Device ID: {device.device_id}")
     
-    # Migrate data
+    # Migrate data (chunked, resumable: re-run this script after a crash)
     print(f"\n🔄 Migrating {docs_without_device} documents...")
     
-    result = collection.update_many(
-        {"device_id": {"$exists": False}},
-        {"$set": {"device_id": device.device_id}}
-    )
+    migration = backfill.get_migration("device_id", {"device_id": device.device_id})
+    # Rencana lama yang sudah selesai tidak mencakup dokumen baru: rencanakan ulang
+    previous = backfill.status(migration.name)
+    header = backfill.plan(migration, restart=bool(previous['total']) and previous['done'] == previous['total'])
+    result = backfill.run(migration.name)
     
-    print(f"  ✓ Updated {result.modified_count} documents")
+    print(f"  ✓ Updated {result['written']} documents in {header['chunks']} chunks")
+    if result['status']['failed']:
+        print(f"  ⚠️  {result['status']['failed']} chunks failed: python manage.py backfill device_id --retry-failed")
     
     # Create indexes
     print(f"\n📑 Creating indexes for performance...")
     
-    try:
-        # Index on device_id
-        collection.create_index("device_id")
-        print(f"  ✓ Created index on 'device_id'")
-        
-        # Compound index on device_id and timestamp
-        collection.create_index([("device_id", 1), ("timestamp", -1)])
-        print(f"  ✓ Created compound index on 'device_id' and 'timestamp'")
-        
-        # Index on timestamp
-        collection.create_index([("timestamp", -1)])
-        print(f"  ✓ Created index on 'timestamp'")
-        
-    except Exception as e:
-        print(f"  ⚠️  Index creation warning: {e}")
+    for index in indexes.ensure():
+        print(f"  ✓ {index['collection']} {index['keys']}: {index['status']}")
     
     # Verify migration
     print(f"\n✅ Verification:")
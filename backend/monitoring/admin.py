@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Device
+from .models import AlertRule, Device
 
 
 @admin.register(Device)
@@ -9,3 +9,11 @@ class DeviceAdmin(admin.ModelAdmin):
     search_fields = ('name', 'device_id', 'location', 'user__username')
     readonly_fields = ('device_id', 'created_at', 'updated_at')
 
+
+
+@admin.register(AlertRule)
+class AlertRuleAdmin(admin.ModelAdmin):
+    list_display = ('name', 'device', 'metric', 'operator', 'threshold', 'duration_seconds', 'is_active')
+    list_filter = ('metric', 'is_active')
+    search_fields = ('name', 'device__device_id', 'device__name', 'device__user__username')
+    readonly_fields = ('created_at', 'updated_at')
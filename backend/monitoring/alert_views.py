@@ -0,0 +1,134 @@
+import datetime
+
+from rest_framework import status
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+
+from mqtt_app.alerts import ALERT_COLLECTION
+from . import mongo
+from .models import AlertRule, Device
+from .serializers import AlertRuleSerializer
+
+ALERT_RANGES = {
+    '24h': datetime.timedelta(days=1),
+    '7d': datetime.timedelta(days=7),
+    '30d': datetime.timedelta(days=30),
+}
+
+
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+def alert_rule_list_create(request):
+    """
+    List the user's alert rules or create a new one
+
+    GET /monitoring/alerts/rules/?device_id=<id>
+    POST /monitoring/alerts/rules/
+        {"device": "<device_id>", "name": "High load", "metric": "power",
+         "operator": "gt", "threshold": 2000, "duration_seconds": 300, "hysteresis": 100}
+    """
+    if request.method == 'GET':
+        rules = AlertRule.objects.filter(device__user=request.user).select_related('device')
+        device_id = request.GET.get('device_id')
+        if device_id:
+            rules = rules.filter(device__device_id=device_id)
+        serializer = AlertRuleSerializer(rules, many=True)
+        return Response({
+            'count': len(serializer.data),
+            'rules': serializer.data
+        }, status=status.HTTP_200_OK)
+
+    elif request.method == 'POST':
+        serializer = AlertRuleSerializer(data=request.data, context={'request': request})
+
+        if serializer.is_valid():
+            rule = serializer.save()
+            return Response(AlertRuleSerializer(rule).data, status=status.HTTP_201_CREATED)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['GET', 'PUT', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def alert_rule_detail(request, rule_id):
+    """
+    Retrieve, update, or delete an alert rule
+
+    GET /monitoring/alerts/rules/<rule_id>/
+    PUT /monitoring/alerts/rules/<rule_id>/
+    DELETE /monitoring/alerts/rules/<rule_id>/
+
+    The ingester picks up changes within ALERTS['RULE_REFRESH_SECONDS'].
+    """
+    try:
+        rule = AlertRule.objects.select_related('device').get(id=rule_id, device__user=request.user)
+    except AlertRule.DoesNotExist:
+        return Response({
+            'error': 'Alert rule not found or you do not have permission to access it'
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    if request.method == 'GET':
+        return Response(AlertRuleSerializer(rule).data, status=status.HTTP_200_OK)
+
+    elif request.method == 'PUT':
+        serializer = AlertRuleSerializer(rule, data=request.data, partial=True, context={'request': request})
+
+        if serializer.is_valid():
+            serializer.save()
+            return Response(AlertRuleSerializer(rule).data, status=status.HTTP_200_OK)
+
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    elif request.method == 'DELETE':
+        rule_name = rule.name
+        rule.delete()
+        return Response({
+            'message': f'Alert rule "{rule_name}" deleted successfully'
+        }, status=status.HTTP_204_NO_CONTENT)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def alert_list(request):
+    """
+    Alerts fired by the user's rules, newest first
+
+    GET /monitoring/alerts/?device_id=<id>&status=firing|resolved&range=24h|7d|30d
+    """
+    device_ids = list(Device.objects.filter(user=request.user).values_list('device_id', flat=True))
+    device_id = request.GET.get('device_id')
+    if device_id:
+        if device_id not in device_ids:
+            return Response({
+                'error': 'Device not found or you do not have permission to access it'
+            }, status=status.HTTP_403_FORBIDDEN)
+        device_ids = [device_id]
+
+    time_range = request.GET.get('range', '7d')
+    if time_range not in ALERT_RANGES:
+        return Response({
+            'error': f'Invalid range. Valid options: {list(ALERT_RANGES)}'
+        }, status=status.HTTP_400_BAD_REQUEST)
+
+    query = {
+        "device_id": {"$in": device_ids},
+        "fired_at": {"$gte": datetime.datetime.utcnow() - ALERT_RANGES[time_range]},
+    }
+    alert_status = request.GET.get('status')
+    if alert_status:
+        query["status"] = alert_status
+
+    alerts = []
+    for doc in mongo.get_collection(ALERT_COLLECTION).find(query).sort("fired_at", -1).limit(500):
+        doc['id'] = str(doc.pop('_id'))
+        for field in ('started_at', 'fired_at', 'resolved_at'):
+            if isinstance(doc.get(field), datetime.datetime):
+                doc[field] = doc[field].isoformat()
+        alerts.append(doc)
+
+    return Response({
+        'count': len(alerts),
+        'range': time_range,
+        'alerts': alerts
+    }, status=status.HTTP_200_OK)
@@ -0,0 +1,287 @@
+"""
+Cold archive of raw readings in partitioned Parquet files.
+
+Readings older than ARCHIVE['AFTER_DAYS'] are moved out of pzem_data1 into
+
+    ARCHIVE['ROOT']/device_id=<quoted id>/date=<YYYY-MM-DD>/part-<n>.parquet
+
+one file per device per UTC day (a later run for the same day, e.g. for
+late readings, adds another part). Columns are written with encodings
+that suit them: delta-packed timestamps, dictionary-encoded values
+(falling back to plain for high-cardinality columns), zstd compression,
+and per-row-group statistics. A day is only deleted from
+MongoDB after its file was read back and matched the exported rows, and
+only the exported _ids are deleted, so readings arriving meanwhile are
+never lost. Like retention, days not yet covered by complete hourly
+rollups / feature buckets (retention.device_plan) are left alone.
+
+Reads are federated: read_device() returns the archived rows of a time
+range from memory-mapped files, pruned by the date partition and by
+row-group timestamp statistics (predicate pushdown), and the callers
+(monitoring_history, prediction.data loaders, Spark training) concatenate
+them with the hot rows still in MongoDB. Archived and hot rows never
+overlap because a reading lives in exactly one of the two.
+
+Only the known reading fields (ARCHIVE_COLUMNS) are archived.
+"""
+import datetime
+import os
+import uuid
+from urllib.parse import quote
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from django.conf import settings
+from pyarrow import fs
+
+from . import mongo, retention
+
+VALUE_COLUMNS = ["voltage", "current", "power", "energy", "frequency", "pf"]
+ARCHIVE_COLUMNS = ["timestamp"] + VALUE_COLUMNS
+SCHEMA = pa.schema([("timestamp", pa.timestamp("ms"))] + [(col, pa.float64()) for col in VALUE_COLUMNS])
+PARTITIONING = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+DELETE_BATCH = 10000
+
+_filesystem = fs.LocalFileSystem(use_mmap=True)
+
+
+def archive_root():
+    return str(settings.ARCHIVE['ROOT'])
+
+
+def device_dir(device_id):
+    return os.path.join(archive_root(), f"device_id={quote(device_id, safe='')}")
+
+
+def day_dir(device_id, day):
+    return os.path.join(device_dir(device_id), f"date={day.isoformat()}")
+
+
+# === Tulis ===
+
+def to_table(docs):
+    """Readings -> Arrow table in SCHEMA (non-numeric values become null), sorted by time"""
+    columns = {"timestamp": [doc["timestamp"] for doc in docs]}
+    for col in VALUE_COLUMNS:
+        columns[col] = [
+            float(doc[col]) if isinstance(doc.get(col), (int, float)) and not isinstance(doc.get(col), bool) else None
+            for doc in docs
+        ]
+    table = pa.table(columns, schema=SCHEMA)
+    return table.take(pc.sort_indices(table, sort_keys=[("timestamp", "ascending")]))
+
+
+def write_day(table, device_id, day):
+    """
+    Write one day's table as a new part file, atomically
+
+    Returns:
+        str: path of the written file
+    """
+    directory = day_dir(device_id, day)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f"part-{uuid.uuid4().hex}.parquet")
+    temp_path = path + ".tmp"
+
+    pq.write_table(
+        table, temp_path,
+        compression=settings.ARCHIVE['COMPRESSION'],
+        compression_level=settings.ARCHIVE['COMPRESSION_LEVEL'],
+        # BYTE_STREAM_SPLIT untuk float belum bisa dibaca Spark 3.5: dictionary (fallback plain) + zstd
+        use_dictionary=VALUE_COLUMNS,
+        column_encoding={"timestamp": "DELTA_BINARY_PACKED"},
+        write_statistics=True,
+        row_group_size=settings.ARCHIVE['ROW_GROUP_SIZE'],
+    )
+    os.replace(temp_path, path)
+    return path
+
+
+def verify(path, table):
+    """True when the file holds exactly the rows of table"""
+    written = pq.ParquetFile(path, memory_map=True).read()
+    return written.num_rows == table.num_rows and written.equals(table)
+
+
+def archive_day(device_id, day, collection=None, delete=True):
+    """
+    Export one device-day to Parquet, verify it, then delete it from MongoDB
+
+    Returns:
+        dict: {"day", "rows", "path", "bytes", "deleted"}
+
+    Raises:
+        RuntimeError: when the written file does not match the exported rows
+    """
+    collection = collection if collection is not None else mongo.get_collection()
+    start = datetime.datetime.combine(day, datetime.time())
+    end = start + datetime.timedelta(days=1)
+
+    docs = list(collection.find(
+        {"device_id": device_id, "timestamp": {"$gte": start, "$lt": end}},
+        {"_id": 1, **{col: 1 for col in ARCHIVE_COLUMNS}},
+        batch_size=10000
+    ))
+    if not docs:
+        return {"day": day.isoformat(), "rows": 0, "path": None, "bytes": 0, "deleted": 0}
+
+    table = to_table(docs)
+    path = write_day(table, device_id, day)
+    if not verify(path, table):
+        os.remove(path)
+        raise RuntimeError(f"Archive verification failed for {device_id} {day.isoformat()}")
+
+    deleted = 0
+    if delete:
+        ids = [doc["_id"] for doc in docs]
+        for offset in range(0, len(ids), DELETE_BATCH):
+            deleted += collection.delete_many({"_id": {"$in": ids[offset:offset + DELETE_BATCH]}}).deleted_count
+
+    return {"day": day.isoformat(), "rows": table.num_rows, "path": path,
+            "bytes": os.path.getsize(path), "deleted": deleted}
+
+
+def archivable_days(device_id, now=None, collection=None):
+    """
+    Whole UTC days of a device that may be archived now
+
+    Days must be older than AFTER_DAYS and covered by complete aggregates
+    (same check as retention), so rollups never miss archived readings.
+
+    Returns:
+        tuple: (list of dates, retention plan)
+    """
+    collection = collection if collection is not None else mongo.get_collection()
+    archive_cutoff = retention.cutoff(settings.ARCHIVE['AFTER_DAYS'], now)
+    features_until = retention.feature_watermark() if settings.RETENTION['REQUIRE_FEATURES'] else None
+    plan = retention.device_plan(device_id, archive_cutoff, features_until, collection)
+    if not plan["complete"]:
+        return [], plan
+
+    first = plan["oldest"].date()
+    # Hanya hari penuh sebelum safe_until
+    last = plan["safe_until"].date() - datetime.timedelta(days=1)
+    days = []
+    day = first
+    while day <= last:
+        days.append(day)
+        day += datetime.timedelta(days=1)
+    return days, plan
+
+
+def archive_device(device_id, now=None, delete=True, log=print):
+    """
+    Archive every archivable day of a device
+
+    Returns:
+        dict: {"device_id", "days", "rows", "bytes", "deleted", "skipped"}
+    """
+    days, plan = archivable_days(device_id, now)
+    summary = {"device_id": device_id, "days": 0, "rows": 0, "bytes": 0, "deleted": 0, "skipped": None}
+    if not days and plan["documents"] and not plan["complete"]:
+        summary["skipped"] = plan["reason"]
+
+    for day in days:
+        result = archive_day(device_id, day, delete=delete)
+        if result["rows"]:
+            summary["days"] += 1
+            summary["rows"] += result["rows"]
+            summary["bytes"] += result["bytes"]
+            summary["deleted"] += result["deleted"]
+            log(f"  {device_id} {result['day']}: {result['rows']} rows -> {result['bytes']} bytes")
+    return summary
+
+
+# === Baca (federasi hot + cold) ===
+
+def read_device(device_id, columns=ARCHIVE_COLUMNS, since=None, until=None, closed="left"):
+    """
+    Archived rows of a device in a time range, oldest first
+
+    Only the date partitions overlapping the range are opened (memory
+    mapped), and the timestamp filter is pushed down to row-group
+    statistics.
+
+    Args:
+        columns (list): columns to read (subset of ARCHIVE_COLUMNS)
+        since (datetime): lower bound (naive UTC)
+        until (datetime): upper bound (naive UTC)
+        closed (str): 'left' = [since, until), 'right' = (since, until]
+
+    Returns:
+        pyarrow.Table, or None when the device has no archive in range
+    """
+    directory = device_dir(device_id)
+    if not os.path.isdir(directory):
+        return None
+
+    dataset = ds.dataset(directory, format="parquet", partitioning=PARTITIONING,
+                         filesystem=_filesystem, schema=SCHEMA.append(pa.field("date", pa.string())))
+    expression = None
+    timestamp = ds.field("timestamp")
+    date = ds.field("date")
+    if since is not None:
+        expression = date >= since.date().isoformat()
+        expression &= (timestamp >= since) if closed == "left" else (timestamp > since)
+    if until is not None:
+        upper = date <= until.date().isoformat()
+        upper &= (timestamp < until) if closed == "left" else (timestamp <= until)
+        expression = upper if expression is None else expression & upper
+
+    table = dataset.to_table(columns=list(dict.fromkeys(["timestamp", *columns])), filter=expression)
+    if table.num_rows == 0:
+        return None
+    return table.take(pc.sort_indices(table, sort_keys=[("timestamp", "ascending")])).select(columns)
+
+
+def read_device_docs(device_id, since=None, until=None):
+    """Archived readings in [since, until) as dicts shaped like MongoDB documents"""
+    table = read_device(device_id, ARCHIVE_COLUMNS, since, until)
+    if table is None:
+        return []
+    docs = table.to_pylist()
+    for doc in docs:
+        doc["device_id"] = device_id
+        doc["source"] = "archive"
+    return docs
+
+
+def read_device_arrays(device_id, columns, since=None, until=None, closed="right"):
+    """
+    Archived numeric columns as float arrays plus timestamps
+
+    Returns:
+        tuple: (list of datetimes, ndarray of shape (rows, len(columns)))
+    """
+    table = read_device(device_id, ["timestamp", *columns], since, until, closed)
+    if table is None:
+        return [], np.empty((0, len(columns)))
+    data = np.column_stack([
+        table.column(col).to_numpy(zero_copy_only=False).astype(np.float64) for col in columns
+    ]) if columns else np.empty((table.num_rows, 0))
+    return table.column("timestamp").to_pylist(), data
+
+
+def archived_days(device_id):
+    """Dates with an archive partition for a device, oldest first"""
+    directory = device_dir(device_id)
+    if not os.path.isdir(directory):
+        return []
+    return [datetime.date.fromisoformat(name[5:]) for name in sorted(os.listdir(directory)) if name.startswith("date=")]
+
+
+def device_archive_paths(device_id, since=None):
+    """Parquet files of a device (optionally only partitions from `since`'s date), for Spark"""
+    directory = device_dir(device_id)
+    if not os.path.isdir(directory):
+        return []
+    first = since.date().isoformat() if since is not None else ""
+    paths = []
+    for name in sorted(os.listdir(directory)):
+        if name.startswith("date=") and name[5:] >= first:
+            day_path = os.path.join(directory, name)
+            paths.extend(os.path.join(day_path, f) for f in sorted(os.listdir(day_path)) if f.endswith(".parquet"))
+    return paths
@@ -0,0 +1,478 @@
+"""
+Resumable, parallel chunked backfills over large collections.
+
+A migration (subclass of Migration) says which documents it reads, how the
+work is split and which bulk operations it writes for a batch of documents.
+plan() splits the range of the split key into chunks:
+
+    split="timestamp"   fixed time windows of the `timestamp` field
+    split="_id"         the same windows over ObjectId creation time
+                        (ObjectId.from_datetime bounds), for documents whose
+                        timestamp is missing or not trusted
+
+optionally once per device (partition="device"), and stores one state
+document per chunk in `backfill_state`. Worker processes claim chunks with
+find_one_and_update under a lease, read them in batches, write unordered
+bulk operations and mark the chunk done. A worker that dies leaves its chunk
+'running' until the lease expires; the next run (or another worker) picks
+it up again, so a crashed backfill resumes where it stopped by running the
+same command again.
+
+Progress is checkpointed per chunk: a re-run chunk is processed again from
+its start, so migrations must be idempotent ($set / upserts of recomputed
+values, never $inc). With BATCH_PAUSE_SECONDS and a small worker count a
+backfill can run next to the ingester without downtime.
+
+Built-in migrations:
+    device_id          set a default device_id on readings that have none
+                       (what migrate_device_data.py did with one update_many)
+    hourly_rollups     recompute pzem_hourly from the raw readings
+    feature_buckets    recompute prediction_features buckets (server-side)
+"""
+import datetime
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+from bson import ObjectId
+from django.conf import settings
+from django.db import connections
+from pymongo import ASCENDING, ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from prediction import feature_store
+
+from . import mongo, rollups
+
+STATE_COLLECTION = "backfill_state"
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def get_state_collection():
+    return mongo.get_collection(STATE_COLLECTION)
+
+
+def ensure_indexes(states=None):
+    states = states if states is not None else get_state_collection()
+    states.create_index([("migration", ASCENDING), ("status", ASCENDING), ("lease_until", ASCENDING)])
+    states.create_index([("migration", ASCENDING), ("index", ASCENDING)])
+
+
+# === Migrasi ===
+
+class Migration:
+    """
+    Base class of a backfill
+
+    Subclasses set the class attributes and implement operations(); chunk
+    bounds are naive UTC datetimes [lower, upper).
+    """
+    name = None
+    description = ""
+    source = mongo.READINGS_COLLECTION
+    target = mongo.READINGS_COLLECTION
+    split = "timestamp"
+    partition = None            # "device": satu seri chunk per device_id
+    align_seconds = 3600        # batas chunk dibulatkan ke kelipatan ini
+    projection = None
+    sort = None                 # urutan baca di dalam chunk (wajib bila group() dipakai)
+
+    def __init__(self, params=None):
+        self.params = params or {}
+
+    def query(self):
+        """Filter of the documents to process (without the chunk range)"""
+        return {}
+
+    def group(self, doc):
+        """Batches are only cut where this value changes (None: anywhere)"""
+        return None
+
+    def start_chunk(self, chunk):
+        """Per-chunk context passed to operations()"""
+        return {}
+
+    def operations(self, docs, context):
+        """Bulk write operations on `target` for one batch of documents"""
+        raise NotImplementedError
+
+    def run_chunk(self, chunk, batch_size, pause, progress):
+        """
+        Process one chunk; progress(processed, written) is called per batch
+
+        Override for migrations that run server-side instead of reading
+        documents (see FeatureBucketBackfill).
+        """
+        db = mongo.get_db()
+        query = {**self.query(), **range_filter(self.split, chunk["lower"], chunk["upper"])}
+        if chunk.get("device_id") is not None:
+            query["device_id"] = chunk["device_id"]
+        cursor = db[self.source].find(query, self.projection, batch_size=batch_size)
+        if self.sort:
+            cursor = cursor.sort(self.sort)
+
+        context = self.start_chunk(chunk)
+        target = db[self.target]
+
+        def flush(batch):
+            operations = self.operations(batch, context)
+            written = 0
+            if operations:
+                result = target.bulk_write(operations, ordered=False)
+                written = result.modified_count + result.upserted_count + result.inserted_count
+            progress(len(batch), written)
+            if pause:
+                time.sleep(pause)
+
+        batch = []
+        for doc in cursor:
+            if len(batch) >= batch_size and self.group(doc) != self.group(batch[-1]):
+                flush(batch)
+                batch = []
+            batch.append(doc)
+        if batch:
+            flush(batch)
+
+    def finalize(self, since, until):
+        """Called once after every chunk is done"""
+
+
+class DeviceIdFix(Migration):
+    name = "device_id"
+    description = "Set params['device_id'] on readings without device_id"
+    split = "_id"
+    projection = {"_id": 1}
+
+    def __init__(self, params=None):
+        super().__init__(params)
+        if not self.params.get("device_id"):
+            raise ValueError("device_id migration needs params device_id=<target device>")
+
+    def query(self):
+        return {"device_id": {"$exists": False}}
+
+    def operations(self, docs, context):
+        device_id = self.params["device_id"]
+        return [UpdateOne({"_id": doc["_id"], "device_id": {"$exists": False}}, {"$set": {"device_id": device_id}})
+                for doc in docs]
+
+
+class RollupBackfill(Migration):
+    name = "hourly_rollups"
+    description = "Recompute hourly energy rollups (pzem_hourly) from raw readings"
+    target = rollups.HOURLY_COLLECTION
+    partition = "device"
+    projection = {"_id": 0, "timestamp": 1, "energy": 1, "power": 1}
+    sort = [("timestamp", ASCENDING)]
+
+    def query(self):
+        return {"energy": {"$type": "number"}}
+
+    def group(self, doc):
+        # Satu jam tidak boleh terbelah dua batch: $set akan menimpa sebagian
+        return rollups.hour_floor(doc["timestamp"])
+
+    def start_chunk(self, chunk):
+        previous = mongo.get_collection(self.source).find_one(
+            {"device_id": chunk["device_id"], "timestamp": {"$lt": chunk["lower"], "$type": "date"},
+             "energy": {"$type": "number"}},
+            {"energy": 1}, sort=[("timestamp", -1)]
+        )
+        return {"device_id": chunk["device_id"], "previous": previous["energy"] if previous else None}
+
+    def operations(self, docs, context):
+        epoch = rollups.to_epoch([doc["timestamp"] for doc in docs])
+        energy = [doc["energy"] for doc in docs]
+        power = [doc.get("power") if isinstance(doc.get("power"), (int, float)) else 0.0 for doc in docs]
+        # Batch berisi jam utuh: reading terakhir berlaku sampai akhir jamnya
+        hour_end = rollups.to_epoch([rollups.hour_floor(docs[-1]["timestamp"])])[0] + rollups.HOUR_SECONDS
+        totals = rollups.hourly_totals(epoch, energy, power, previous=context["previous"], until=hour_end)
+        context["previous"] = energy[-1]
+        return rollups.hourly_operations(context["device_id"], totals)
+
+    def finalize(self, since, until):
+        """
+        Rebuild the daily documents of the range and move each device's
+        rollup watermark to `until` unless it is already past it
+        """
+        readings = mongo.get_collection(self.source)
+        states = mongo.get_collection(rollups.STATE_COLLECTION)
+        for device_id in device_ids(readings, self.params):
+            rollups.refresh_daily(device_id, since, until)
+            last = readings.find_one(
+                {"device_id": device_id, "timestamp": {"$lt": until, "$type": "date"}, "energy": {"$type": "number"}},
+                {"timestamp": 1, "energy": 1}, sort=[("timestamp", -1)]
+            )
+            if last is None:
+                continue
+            state = {"watermark": until, "last_energy": float(last["energy"]), "last_timestamp": last["timestamp"]}
+            try:
+                states.update_one(
+                    {"device_id": device_id, "$or": [{"watermark": {"$exists": False}}, {"watermark": {"$lt": until}}]},
+                    {"$set": state}, upsert=True
+                )
+            except DuplicateKeyError:
+                # Watermark device sudah lebih baru (buildrollups jalan terus)
+                pass
+
+
+class FeatureBucketBackfill(Migration):
+    name = "feature_buckets"
+    description = "Recompute prediction_features buckets from raw readings ($merge, server-side)"
+    target = feature_store.FEATURE_COLLECTION
+    partition = "device"
+
+    def run_chunk(self, chunk, batch_size, pause, progress):
+        # Satu $merge tanpa batch: lease diperpanjang sebelum mulai dan berkala selama berjalan
+        progress(0, 0)
+        finished = threading.Event()
+
+        def keep_lease():
+            while not finished.wait(settings.BACKFILL['LEASE_SECONDS'] / 3):
+                progress(0, 0)
+
+        heartbeat = threading.Thread(target=keep_lease, daemon=True)
+        heartbeat.start()
+        try:
+            feature_store.rebuild([chunk["device_id"]], since=chunk["lower"], until=chunk["upper"])
+        finally:
+            finished.set()
+            heartbeat.join()
+        if pause:
+            time.sleep(pause)
+
+
+MIGRATIONS = {cls.name: cls for cls in (DeviceIdFix, RollupBackfill, FeatureBucketBackfill)}
+
+
+def get_migration(name, params=None):
+    if name not in MIGRATIONS:
+        raise ValueError(f"Unknown migration '{name}'. Available: {', '.join(MIGRATIONS)}")
+    return MIGRATIONS[name](params)
+
+
+# === Rencana chunk ===
+
+def range_filter(split, lower, upper):
+    if split == "_id":
+        return {"_id": {"$gte": ObjectId.from_datetime(lower), "$lt": ObjectId.from_datetime(upper)}}
+    return {"timestamp": {"$gte": lower, "$lt": upper}}
+
+
+def align(ts, seconds, up=False):
+    offset = (ts - EPOCH).total_seconds() % seconds
+    if not offset:
+        return ts
+    floor = ts - datetime.timedelta(seconds=offset)
+    return floor + datetime.timedelta(seconds=seconds) if up else floor
+
+
+def device_ids(collection, params):
+    if params.get("devices"):
+        return list(params["devices"])
+    return sorted(device_id for device_id in collection.distinct("device_id") if device_id)
+
+
+def key_bounds(migration, collection):
+    """Oldest and newest value of the split key among the documents to process"""
+    query = migration.query()
+    if migration.split == "_id":
+        first = collection.find_one(query, {"_id": 1}, sort=[("_id", 1)])
+        last = collection.find_one(query, {"_id": 1}, sort=[("_id", -1)])
+        if first is None:
+            return None, None
+        to_naive = lambda oid: oid.generation_time.replace(tzinfo=None)  # noqa: E731
+        return to_naive(first["_id"]), to_naive(last["_id"]) + datetime.timedelta(seconds=1)
+
+    query = {**query, "timestamp": {"$type": "date"}}
+    first = collection.find_one(query, {"timestamp": 1}, sort=[("timestamp", 1)])
+    last = collection.find_one(query, {"timestamp": 1}, sort=[("timestamp", -1)])
+    if first is None:
+        return None, None
+    return first["timestamp"], last["timestamp"] + datetime.timedelta(milliseconds=1)
+
+
+def plan(migration, since=None, until=None, chunk_hours=None, restart=False, states=None):
+    """
+    Create the chunk documents of a migration, unless a plan already exists
+
+    An existing plan is kept (that is what makes a re-run resume); pass
+    restart=True to drop it and plan again.
+
+    Returns:
+        dict: the plan header {"_id", "since", "until", "chunk_seconds", "chunks", "params"}
+    """
+    states = states if states is not None else get_state_collection()
+    ensure_indexes(states)
+    header_id = f"plan:{migration.name}"
+    if restart:
+        states.delete_many({"migration": migration.name})
+        states.delete_one({"_id": header_id})
+    header = states.find_one({"_id": header_id})
+    if header is not None:
+        return header
+
+    source = mongo.get_collection(migration.source)
+    oldest, newest = key_bounds(migration, source)
+    since = since or oldest
+    until = until or newest
+    chunk_seconds = int((chunk_hours or settings.BACKFILL['CHUNK_HOURS']) * 3600)
+    header = {"_id": header_id, "since": since, "until": until, "chunk_seconds": chunk_seconds,
+              "chunks": 0, "params": migration.params, "created_at": datetime.datetime.utcnow()}
+    if since is None or until is None or since >= until:
+        states.insert_one(header)
+        return header
+
+    since = align(since, migration.align_seconds)
+    until = align(until, migration.align_seconds, up=True)
+    header["since"], header["until"] = since, until
+    partitions = device_ids(source, migration.params) if migration.partition == "device" else [None]
+
+    chunks, index = [], 0
+    step = datetime.timedelta(seconds=chunk_seconds)
+    for device_id in partitions:
+        lower = since
+        while lower < until:
+            upper = min(lower + step, until)
+            chunks.append({
+                "_id": f"{migration.name}:{index}", "migration": migration.name, "index": index,
+                "device_id": device_id, "lower": lower, "upper": upper,
+                "status": "pending", "lease_until": EPOCH, "attempts": 0, "processed": 0, "written": 0,
+            })
+            index += 1
+            lower = upper
+            if len(chunks) >= 10000:
+                states.insert_many(chunks, ordered=False)
+                chunks = []
+    if chunks:
+        states.insert_many(chunks, ordered=False)
+
+    header["chunks"] = index
+    states.insert_one(header)
+    return header
+
+
+# === Worker ===
+
+def claim(states, name, worker):
+    """Take the next pending chunk, or a running one whose lease expired"""
+    now = datetime.datetime.utcnow()
+    return states.find_one_and_update(
+        {"migration": name, "status": {"$in": ["pending", "running"]}, "lease_until": {"$lt": now}},
+        {"$set": {"status": "running", "worker": worker, "started_at": now,
+                  "lease_until": now + datetime.timedelta(seconds=settings.BACKFILL['LEASE_SECONDS'])},
+         "$inc": {"attempts": 1}},
+        sort=[("index", 1)],
+        return_document=ReturnDocument.AFTER,
+    )
+
+
+def work(name, params, worker=None):
+    """
+    Worker loop: claim and process chunks until none are left
+
+    Returns:
+        dict: {"chunks", "processed", "written", "failed"}
+    """
+    config = settings.BACKFILL
+    migration = get_migration(name, params)
+    states = get_state_collection()
+    worker = worker or f"{socket.gethostname()}:{os.getpid()}"
+    summary = {"chunks": 0, "processed": 0, "written": 0, "failed": 0}
+    lease = datetime.timedelta(seconds=config['LEASE_SECONDS'])
+
+    while True:
+        chunk = claim(states, name, worker)
+        if chunk is None:
+            return summary
+
+        counters = {"processed": 0, "written": 0}
+
+        def progress(processed, written):
+            counters["processed"] += processed
+            counters["written"] += written
+            # Checkpoint progres + perpanjang lease setiap batch
+            states.update_one({"_id": chunk["_id"], "worker": worker}, {"$set": {
+                **counters, "lease_until": datetime.datetime.utcnow() + lease,
+            }})
+
+        try:
+            migration.run_chunk(chunk, config['BATCH_SIZE'], config['BATCH_PAUSE_SECONDS'], progress)
+        except Exception as e:
+            states.update_one({"_id": chunk["_id"]}, {"$set": {"status": "failed", "error": str(e),
+                                                               "lease_until": EPOCH}})
+            summary["failed"] += 1
+            continue
+
+        states.update_one({"_id": chunk["_id"], "worker": worker}, {"$set": {
+            **counters, "status": "done", "finished_at": datetime.datetime.utcnow(), "error": None,
+        }})
+        summary["chunks"] += 1
+        summary["processed"] += counters["processed"]
+        summary["written"] += counters["written"]
+
+
+def _work(args):
+    return work(*args)
+
+
+def run(name, workers=None, retry_failed=False):
+    """
+    Process every open chunk of a planned migration with a process pool
+
+    Returns:
+        dict: totals of this run plus status() of the plan
+    """
+    states = get_state_collection()
+    header = states.find_one({"_id": f"plan:{name}"})
+    if header is None:
+        raise ValueError(f"Migration '{name}' has no plan yet (run plan() first)")
+    # Parameter rencana yang berlaku, supaya resume tidak bergantung pada argumen baru
+    migration = get_migration(name, header["params"])
+    if retry_failed:
+        states.update_many({"migration": name, "status": "failed"}, {"$set": {"status": "pending"}})
+
+    workers = workers or settings.BACKFILL['WORKERS']
+    totals = {"chunks": 0, "processed": 0, "written": 0, "failed": 0}
+    if workers == 1:
+        results = [work(name, migration.params)]
+    else:
+        # Proses anak membuat MongoClient sendiri; koneksi SQL tidak dibawa ke fork
+        connections.close_all()
+        with multiprocessing.Pool(workers, initializer=mongo.reset_client) as pool:
+            results = pool.map(_work, [(name, migration.params, None) for _ in range(workers)])
+    for result in results:
+        for key in totals:
+            totals[key] += result[key]
+
+    current = status(name)
+    if current["total"] and current["done"] == current["total"]:
+        migration.finalize(header["since"], header["until"])
+    return {**totals, "status": current}
+
+
+def status(name, states=None):
+    """
+    Chunk counts per status and documents processed so far
+
+    Returns:
+        dict: {"total", "pending", "running", "done", "failed", "processed", "written", "errors"}
+    """
+    states = states if states is not None else get_state_collection()
+    counts = {"total": 0, "pending": 0, "running": 0, "done": 0, "failed": 0, "processed": 0, "written": 0}
+    for row in states.aggregate([
+        {"$match": {"migration": name}},
+        {"$group": {"_id": "$status", "n": {"$sum": 1}, "processed": {"$sum": "$processed"},
+                    "written": {"$sum": "$written"}}},
+    ]):
+        counts[row["_id"]] = row["n"]
+        counts["total"] += row["n"]
+        counts["processed"] += row["processed"]
+        counts["written"] += row["written"]
+    counts["errors"] = [
+        {"chunk": doc["_id"], "device_id": doc.get("device_id"), "lower": doc["lower"], "error": doc.get("error")}
+        for doc in states.find({"migration": name, "status": "failed"}).sort("index", 1).limit(10)
+    ]
+    return counts
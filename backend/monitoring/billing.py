@@ -0,0 +1,266 @@
+"""
+Billing-period electricity cost engine.
+
+Works on the hourly energy rollups (monitoring.rollups), never on raw
+readings, except for the current open hour. For one device and meter type
+it returns the actual consumption and cost of the running billing period
+and a projection to the end of the period, per day and in total, from a
+single rollup query.
+
+Tariffs come from settings.BILLING:
+
+    TARIFFS[meter_type]
+        rate            flat price per kWh (Rp), or
+        blocks          [(upper kWh, price), ..., (None, price)], tiers on the
+                        cumulative kWh of the billing period
+        time_of_use     optional [{"start": h, "end": h, "multiplier": m}]
+                        on local hours [start, end)
+        fixed_monthly   optional fixed charge per period (Rp)
+    TAXES               [{"name", "rate"}] applied to the energy charge
+    PERIOD_START_DAY    day of month a billing period starts
+    PROFILE_DAYS        history used for the projection profile
+
+Projection: each remaining hour gets the device's mean kWh for that local
+hour-of-day over the last PROFILE_DAYS, which keeps time-of-use pricing
+accurate. Tiers are applied along the cumulative kWh curve, so an hour that
+crosses a block boundary is split exactly.
+"""
+import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from django.conf import settings
+
+from . import rollups
+
+DAY_SECONDS = 86400
+HOUR_SECONDS = rollups.HOUR_SECONDS
+
+
+def get_tariff(meter_type):
+    """
+    Tariff entry for a meter type
+
+    Raises:
+        ValueError: for unknown meter types
+    """
+    tariffs = settings.BILLING['TARIFFS']
+    if meter_type not in tariffs:
+        raise ValueError(f"Invalid meter_type. Valid options: {list(tariffs.keys())}")
+    return tariffs[meter_type]
+
+
+def tier_curve(tariff):
+    """
+    Knots of the cumulative cost curve (kWh -> Rp) for block / flat tariffs
+
+    Returns:
+        tuple: (kWh knots, cost knots) suitable for np.interp
+    """
+    blocks = tariff.get('blocks') or [(None, tariff['rate'])]
+    kwh, cost = [0.0], [0.0]
+    for upper, price in blocks:
+        # Blok terakhir tanpa batas: knot sangat jauh supaya np.interp tidak clamp
+        upper = upper if upper is not None else kwh[-1] + 1e9
+        cost.append(cost[-1] + (upper - kwh[-1]) * price)
+        kwh.append(float(upper))
+    return np.asarray(kwh), np.asarray(cost)
+
+
+def tou_multiplier(local_hours, tariff):
+    """Time-of-use price multiplier per local hour-of-day"""
+    multiplier = np.ones(len(local_hours))
+    for window in tariff.get('time_of_use', []):
+        start, end = window['start'], window['end']
+        if start <= end:
+            inside = (local_hours >= start) & (local_hours < end)
+        else:
+            inside = (local_hours >= start) | (local_hours < end)
+        multiplier[inside] = window['multiplier']
+    return multiplier
+
+
+def hourly_costs(kwh, local_hours, tariff, consumed_kwh=0.0):
+    """
+    Energy charge of each hour of a billing period, before taxes
+
+    Args:
+        kwh (ndarray): kWh per hour, in time order
+        local_hours (ndarray): local hour-of-day of each entry
+        tariff (dict): tariff entry
+        consumed_kwh (float): kWh already used in the period before the
+                              first entry (position on the block tariff)
+
+    Returns:
+        ndarray: Rp per hour
+    """
+    knots_kwh, knots_cost = tier_curve(tariff)
+    end = consumed_kwh + np.cumsum(kwh)
+    start = end - kwh
+    energy_charge = np.interp(end, knots_kwh, knots_cost) - np.interp(start, knots_kwh, knots_cost)
+    return energy_charge * tou_multiplier(local_hours, tariff)
+
+
+def period_bounds(now_local, start_day):
+    """Local start and end of the billing period containing now_local"""
+    start = now_local.replace(day=start_day, hour=0, minute=0, second=0, microsecond=0)
+    if now_local < start:
+        start = (start - datetime.timedelta(days=start_day)).replace(day=start_day)
+    month = start.month % 12 + 1
+    end = start.replace(year=start.year + (start.month == 12), month=month)
+    return start, end
+
+
+def hour_profile(hours_epoch, kwh, offset, since_epoch, until_epoch):
+    """Mean kWh per local hour-of-day over [since, until)"""
+    window = (hours_epoch >= since_epoch) & (hours_epoch < until_epoch)
+    if not window.any():
+        return np.zeros(24)
+    local_hours = ((hours_epoch[window] + offset) // HOUR_SECONDS % 24).astype(np.int64)
+    # Hari dihitung dari rollup pertama di window (device baru punya histori lebih pendek)
+    days = max(1.0, (until_epoch - hours_epoch[window].min()) / DAY_SECONDS)
+    return np.bincount(local_hours, weights=kwh[window], minlength=24) / days
+
+
+def price_energy(device_id, meter_type, kwh, epoch, now=None):
+    """
+    Energy charge (before taxes) of future consumption, e.g. a prediction
+
+    Priced like the bill: the block tariff continues from the kWh the
+    device already used in the running period (from the hourly rollups as
+    they are; nothing is refreshed), and time-of-use applies by local hour.
+
+    Args:
+        device_id (str): Device ID
+        meter_type (str): key of settings.BILLING['TARIFFS']
+        kwh (ndarray): kWh per step, in time order
+        epoch (ndarray): step start, epoch seconds (UTC)
+        now (datetime): current naive UTC time (default: utcnow)
+
+    Returns:
+        ndarray: Rp per step
+
+    Raises:
+        ValueError: for unknown meter types
+    """
+    tariff = get_tariff(meter_type)
+    now = now or datetime.datetime.utcnow()
+    zone = ZoneInfo(settings.LOCAL_TIME_ZONE)
+    now_local = now.replace(tzinfo=datetime.timezone.utc).astimezone(zone)
+    offset = now_local.utcoffset().total_seconds()
+
+    start_local, _ = period_bounds(now_local, settings.BILLING['PERIOD_START_DAY'])
+    start = start_local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    _, used = rollups.load_hourly(device_id, since=start)
+
+    local_hours = ((np.asarray(epoch, dtype=np.float64) + offset) // HOUR_SECONDS % 24).astype(np.int64)
+    return hourly_costs(np.asarray(kwh, dtype=np.float64), local_hours, tariff, float(used.sum()))
+
+
+def project_period(device_id, meter_type, now=None):
+    """
+    Actual and projected consumption and cost of the running billing period
+
+    Args:
+        device_id (str): Device ID
+        meter_type (str): key of settings.BILLING['TARIFFS']
+        now (datetime): current naive UTC time (default: utcnow)
+
+    Returns:
+        dict: period, actual, projected, daily breakdown and tariff info
+
+    Raises:
+        ValueError: for unknown meter types
+        rollups.RollupsPending: when the device has not been rolled up yet
+    """
+    config = settings.BILLING
+    tariff = get_tariff(meter_type)
+    now = now or datetime.datetime.utcnow()
+    zone = ZoneInfo(settings.LOCAL_TIME_ZONE)
+    now_local = now.replace(tzinfo=datetime.timezone.utc).astimezone(zone)
+    offset = now_local.utcoffset().total_seconds()
+
+    start_local, end_local = period_bounds(now_local, config['PERIOD_START_DAY'])
+    start = start_local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    end = end_local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+    current_hour = rollups.hour_floor(now)
+
+    # === Satu query rollup: periode berjalan + window profil ===
+    rollups_until = rollups.catch_up(device_id, now)
+    profile_since = current_hour - datetime.timedelta(days=config['PROFILE_DAYS'])
+    hours_epoch, kwh = rollups.load_hourly(device_id, since=min(start, profile_since), until=current_hour)
+    open_start, open_kwh = rollups.open_hour(device_id, now)
+
+    start_epoch = rollups.to_epoch([start])[0]
+    current_epoch = rollups.to_epoch([current_hour])[0]
+    grid = np.arange(start_epoch, rollups.to_epoch([end])[0], HOUR_SECONDS)
+    local_hours = ((grid + offset) // HOUR_SECONDS % 24).astype(np.int64)
+    current_index = int((current_epoch - start_epoch) // HOUR_SECONDS)
+
+    # === Aktual: rollup jam tertutup + jam berjalan dari data mentah ===
+    actual = np.zeros(len(grid))
+    in_period = hours_epoch >= start_epoch
+    np.add.at(actual, ((hours_epoch[in_period] - start_epoch) // HOUR_SECONDS).astype(np.int64), kwh[in_period])
+    if 0 <= current_index < len(grid):
+        actual[current_index] += open_kwh
+
+    # === Proyeksi: profil per jam lokal untuk sisa periode ===
+    profile = hour_profile(hours_epoch, kwh, offset, rollups.to_epoch([profile_since])[0], current_epoch)
+    projected = np.where(np.arange(len(grid)) > current_index, profile[local_hours], 0.0)
+    if 0 <= current_index < len(grid):
+        elapsed = (now - current_hour).total_seconds() / HOUR_SECONDS
+        projected[current_index] = max(profile[local_hours[current_index]] * (1 - elapsed), 0.0)
+
+    tax_rate = sum(tax['rate'] for tax in config['TAXES'])
+    fixed = tariff.get('fixed_monthly', 0)
+    actual_cost = hourly_costs(actual, local_hours, tariff)
+    total_cost = hourly_costs(actual + projected, local_hours, tariff)
+
+    # === Rekap harian (tanggal lokal) ===
+    day_index = ((grid - start_epoch) // DAY_SECONDS).astype(np.int64)
+    days = int(day_index.max()) + 1
+    daily_actual = np.bincount(day_index, weights=actual, minlength=days)
+    daily_projected = np.bincount(day_index, weights=projected, minlength=days)
+    daily_cost = np.bincount(day_index, weights=total_cost, minlength=days) * (1 + tax_rate)
+    today = int((current_epoch - start_epoch) // DAY_SECONDS)
+
+    def charges(energy_charge):
+        taxes = [
+            {"name": tax['name'], "rate": tax['rate'], "amount": round(energy_charge * tax['rate'], 2)}
+            for tax in config['TAXES']
+        ]
+        return {
+            "energy_charge": round(energy_charge, 2),
+            "taxes": taxes,
+            "fixed_charge": fixed,
+            "total_cost": round(energy_charge * (1 + tax_rate) + fixed, 2),
+        }
+
+    return {
+        "period": {
+            "start": start_local.isoformat(),
+            "end": end_local.isoformat(),
+            "days_total": days,
+            "days_elapsed": round((now - start).total_seconds() / DAY_SECONDS, 2),
+        },
+        "actual": {"energy_kwh": round(float(actual.sum()), 3), **charges(float(actual_cost.sum()))},
+        "projected": {
+            "energy_kwh": round(float((actual + projected).sum()), 3),
+            "remaining_kwh": round(float(projected.sum()), 3),
+            **charges(float(total_cost.sum())),
+        },
+        "daily": [
+            {
+                "date": (start_local + datetime.timedelta(days=d)).date().isoformat(),
+                "actual_kwh": round(float(daily_actual[d]), 3),
+                "projected_kwh": round(float(daily_projected[d]), 3),
+                "cost": round(float(daily_cost[d]), 2),
+                "status": "actual" if d < today else "today" if d == today else "projected",
+            }
+            for d in range(days)
+        ],
+        "profile_kwh_per_hour": [round(float(value), 4) for value in profile],
+        "tariff": tariff,
+        "open_hour": {"start": open_start.isoformat(), "energy_kwh": round(open_kwh, 4)},
+        "rollups_until": rollups_until.isoformat(),
+    }
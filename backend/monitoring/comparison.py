@@ -0,0 +1,143 @@
+"""
+Time-aligned comparison of several devices.
+
+All devices share one time axis: buckets of `interval` seconds from `start`
+(bucket i covers [start + i * interval, start + (i + 1) * interval)). The
+result is columnar, one value list per device, so the frontend plots it
+without merging:
+
+    {"timestamps": [...], "series": [{"device_id", "values": [...], "count"}]}
+
+Sources, one database round trip for all devices:
+
+    power, voltage, current, pf, frequency
+        one aggregation over pzem_data1 ($match on device_id $in + time
+        range, $group per device and bucket) - uses the
+        (device_id, timestamp) index; archived days are merged in from
+        Parquet when ARCHIVE['ENABLED']
+    energy
+        kWh per bucket from the hourly rollups (one find), so the interval
+        must be a whole number of hours
+
+Empty buckets are null unless a gap fill policy (monitoring.resampling) is
+given.
+"""
+import numpy as np
+from django.conf import settings
+
+from . import archive, mongo, resampling, rollups
+
+READING_METRICS = ("power", "voltage", "current", "pf", "frequency")
+METRICS = READING_METRICS + ("energy",)
+AGGREGATIONS = ("mean", "min", "max")
+MAX_DEVICES = 20
+MAX_POINTS = 5000
+
+
+def reading_pipeline(device_ids, metric, start, end, interval, agg):
+    """Aggregation: one document per (device, bucket) with n and sum/min/max"""
+    accumulator = {"mean": "$sum", "min": "$min", "max": "$max"}[agg]
+    return [
+        {"$match": {
+            "device_id": {"$in": list(device_ids)},
+            "timestamp": {"$gte": start, "$lt": end},
+            metric: {"$type": "number"},
+        }},
+        {"$group": {
+            "_id": {
+                "device_id": "$device_id",
+                # Selisih dua tanggal = milidetik
+                "bucket": {"$floor": {"$divide": [{"$subtract": ["$timestamp", start]}, interval * 1000]}},
+            },
+            "value": {accumulator: f"${metric}"},
+            "n": {"$sum": 1},
+        }},
+    ]
+
+
+def merge_archive(columns, device_ids, metric, start, end, interval, agg):
+    """Add archived readings (Parquet) of each device to its bucket columns"""
+    size = len(columns["n"][device_ids[0]])
+    for device_id in device_ids:
+        timestamps, data = archive.read_device_arrays(device_id, [metric], start, end, closed="left")
+        if not timestamps:
+            continue
+        index = resampling.bucket_index(resampling.to_epoch(timestamps), resampling.to_epoch([start])[0], interval)
+        values, counts = resampling.aggregate(index, data[:, 0], size, "sum" if agg == "mean" else agg)
+        has = counts > 0
+        current = columns["value"][device_id]
+        if agg == "mean":
+            current[has] = np.nan_to_num(current[has]) + values[has]
+        else:
+            combine = np.fmin if agg == "min" else np.fmax
+            current[has] = combine(current[has], values[has])
+        columns["n"][device_id] += counts
+
+
+def compare(device_ids, metric="power", start=None, end=None, interval=900, agg="mean", gap_fill="null"):
+    """
+    Bucketed series of several devices on a shared time axis
+
+    Args:
+        device_ids (list): device IDs (ownership already checked)
+        metric (str): one of METRICS
+        start, end (datetime): naive UTC range [start, end); start is floored to the interval
+        interval (float): bucket width in seconds
+        agg (str): mean, min or max per bucket (energy is always the kWh sum)
+        gap_fill (str): resampling fill policy for empty buckets
+
+    Returns:
+        dict: start, end, interval, source, timestamps (list of datetimes),
+        series (list of {"device_id", "values", "count"})
+    """
+    start_epoch = np.floor(resampling.to_epoch([start])[0] / interval) * interval
+    start = resampling.from_epoch(start_epoch).tolist()
+    size = int(np.ceil((resampling.to_epoch([end])[0] - start_epoch) / interval))
+    columns = {
+        "value": {device_id: np.full(size, np.nan) for device_id in device_ids},
+        "n": {device_id: np.zeros(size, dtype=np.int64) for device_id in device_ids},
+    }
+
+    if metric == "energy":
+        source = "rollups"
+        cursor = rollups.get_hourly_collection().find(
+            {"device_id": {"$in": list(device_ids)}, "hour": {"$gte": start, "$lt": end}},
+            {"_id": 0, "device_id": 1, "hour": 1, "energy_kwh": 1, "n": 1}
+        )
+        for doc in cursor:
+            bucket = int((resampling.to_epoch([doc["hour"]])[0] - start_epoch) // interval)
+            value = columns["value"][doc["device_id"]]
+            value[bucket] = np.nan_to_num(value[bucket]) + doc["energy_kwh"]
+            columns["n"][doc["device_id"]][bucket] += doc.get("n", 0)
+    else:
+        source = "readings"
+        pipeline = reading_pipeline(device_ids, metric, start, end, interval, agg)
+        for doc in mongo.get_collection().aggregate(pipeline):
+            bucket = int(doc["_id"]["bucket"])
+            if 0 <= bucket < size:
+                columns["value"][doc["_id"]["device_id"]][bucket] = doc["value"]
+                columns["n"][doc["_id"]["device_id"]][bucket] = doc["n"]
+        if settings.ARCHIVE['ENABLED']:
+            merge_archive(columns, device_ids, metric, start, end, interval, agg)
+
+    series = []
+    for device_id in device_ids:
+        values, counts = columns["value"][device_id], columns["n"][device_id]
+        if agg == "mean" and metric != "energy":
+            with np.errstate(invalid='ignore', divide='ignore'):
+                values = np.where(counts > 0, values / counts, np.nan)
+        values = resampling.fill(values, gap_fill)
+        series.append({
+            "device_id": device_id,
+            "values": [None if np.isnan(v) else round(float(v), 6) for v in values],
+            "count": int(counts.sum()),
+        })
+
+    return {
+        "start": start,
+        "end": end,
+        "interval": interval,
+        "source": source,
+        "timestamps": resampling.from_epoch(start_epoch + np.arange(size) * interval).tolist(),
+        "series": series,
+    }
@@ -0,0 +1,298 @@
+"""
+Every MongoDB index the apps need, and a check that the hot queries use them.
+
+declared_indexes() lists the indexes per collection. The per-module
+ensure_indexes() helpers (rollups, feature_store, registry, anomaly,
+alerts, ...) create the same key patterns for their own collections; this
+table is the complete list
+a fresh deployment needs, including the raw reading indexes that used to be
+created only by migrate_device_data.py.
+
+ensure() creates missing indexes and leaves existing ones alone when an index
+with the same key pattern (or its exact reverse, which serves the same
+queries backwards) already exists, whatever its name or options, e.g.
+retention's TTL index on timestamp.
+
+hot_queries() lists the queries the endpoints, the ingester and the batch jobs
+run, with sample parameters. explain_all() runs explain() on each of them and
+reports the winning plan's stages; a COLLSCAN means a missing index. An
+in-memory SORT is reported too, but is not an error.
+
+ensure_on_startup() is the one startup hook: the long-running entry points
+call it (wsgi.py / asgi.py, which runserver loads too, runmqtt and
+runpredictionworker), and it runs in a background thread so an unreachable
+MongoDB never blocks startup. Other commands (migrate, shell, ...) never
+load the modules that own the collections: they are imported inside the
+functions below, not at module level.
+"""
+import datetime
+import logging
+import threading
+
+from django.conf import settings
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import PyMongoError
+
+from . import mongo
+
+logger = logging.getLogger(__name__)
+
+
+def declared_indexes():
+    """
+    Index specs per collection
+
+    Returns:
+        dict: collection name -> list of {"keys", **create_index options}
+    """
+    from mqtt_app import alerts, anomaly
+    from prediction import feature_store, incremental, registry
+
+    from . import backfill, rollups, summary
+
+    # Sama dengan migrate_device_data.py, supaya deployment lama tidak dapat index ganda
+    return {
+        mongo.READINGS_COLLECTION: [
+            {"keys": [("device_id", ASCENDING), ("timestamp", DESCENDING)]},
+            # Rebuild feature store lintas device (filter timestamp saja)
+            {"keys": [("timestamp", DESCENDING)]},
+        ],
+        rollups.HOURLY_COLLECTION: [
+            {"keys": [("device_id", ASCENDING), ("hour", ASCENDING)], "unique": True},
+        ],
+        rollups.DAILY_COLLECTION: [
+            {"keys": [("device_id", ASCENDING), ("start", ASCENDING)], "unique": True},
+        ],
+        rollups.STATE_COLLECTION: [
+            {"keys": [("device_id", ASCENDING)], "unique": True},
+        ],
+        feature_store.FEATURE_COLLECTION: [
+            {"keys": [("device_id", ASCENDING), ("timestamp", ASCENDING)], "unique": True},
+            # Purge retensi feature bucket
+            {"keys": [("timestamp", ASCENDING)]},
+        ],
+        registry.REGISTRY_COLLECTION: [
+            {"keys": [("device_id", ASCENDING), ("algo", ASCENDING)], "unique": True},
+        ],
+        incremental.STATE_COLLECTION: [
+            {"keys": [("device_id", ASCENDING), ("algo", ASCENDING)], "unique": True},
+        ],
+        anomaly.ANOMALY_COLLECTION: [
+            {"keys": [("device_id", ASCENDING), ("started_at", DESCENDING)]},
+            {"keys": [("started_at", DESCENDING)]},
+            {"keys": [("open", ASCENDING)], "partialFilterExpression": {"open": True}},
+        ],
+        anomaly.STATE_COLLECTION: [
+            {"keys": [("device_id", ASCENDING)], "unique": True},
+        ],
+        backfill.STATE_COLLECTION: [
+            {"keys": [("migration", ASCENDING), ("status", ASCENDING), ("lease_until", ASCENDING)]},
+            {"keys": [("migration", ASCENDING), ("index", ASCENDING)]},
+        ],
+        summary.SUMMARY_COLLECTION: [
+            {"keys": [("user_id", ASCENDING)], "unique": True},
+        ],
+        alerts.ALERT_COLLECTION: [
+            {"keys": [("device_id", ASCENDING), ("fired_at", DESCENDING)]},
+            {"keys": [("status", ASCENDING)], "partialFilterExpression": {"status": "firing"}},
+        ],
+    }
+
+
+# === Membuat index ===
+
+def ensure(db=None):
+    """
+    Create every declared index that does not exist yet
+
+    Returns:
+        list: one dict per index {"collection", "keys", "name", "status"}
+        with status 'created', 'exists' or 'failed: <error>'
+    """
+    db = db if db is not None else mongo.get_db()
+    results = []
+    for name, specs in declared_indexes().items():
+        collection = db[name]
+        existing = {tuple(map(tuple, info["key"])): index_name
+                    for index_name, info in collection.index_information().items()}
+        for spec in specs:
+            keys = tuple(spec["keys"])
+            options = {key: value for key, value in spec.items() if key != "keys"}
+            # Index yang arahnya terbalik semua dipindai mundur: sama gunanya
+            reverse = tuple((field, -direction) for field, direction in keys)
+            result = {"collection": name, "keys": list(keys), "name": existing.get(keys) or existing.get(reverse)}
+            if result["name"]:
+                result["status"] = "exists"
+            else:
+                try:
+                    result["name"] = collection.create_index(list(keys), **options)
+                    result["status"] = "created"
+                except PyMongoError as e:
+                    # Misalnya unique index di atas data yang sudah duplikat
+                    result["status"] = f"failed: {e}"
+            results.append(result)
+    return results
+
+
+def ensure_on_startup():
+    """
+    Ensure indexes in a background thread (never blocks or fails startup)
+
+    Called once per process by the long-running entry points only.
+
+    Returns:
+        Thread, or None when MONGODB['ENSURE_INDEXES_ON_STARTUP'] is off
+    """
+    if not settings.MONGODB.get('ENSURE_INDEXES_ON_STARTUP'):
+        return None
+
+    def run():
+        try:
+            results = ensure()
+        except PyMongoError as e:
+            logger.warning("Index check skipped, MongoDB unreachable: %s", e)
+            return
+        for result in results:
+            if result["status"] == "created":
+                logger.info("Created index %s on %s", result["name"], result["collection"])
+            elif result["status"] != "exists":
+                logger.error("Index %s on %s %s", result["keys"], result["collection"], result["status"])
+
+    thread = threading.Thread(target=run, name="ensure-indexes", daemon=True)
+    thread.start()
+    return thread
+
+
+# === Verifikasi query plan ===
+
+def hot_queries(device_id, now=None):
+    """
+    The frequent queries of the apps with sample parameters
+
+    Aggregations are listed with their leading $match/$sort only; later
+    stages do not influence index selection.
+
+    Returns:
+        list: dicts {"name", "collection", "filter", "sort", "limit"} or
+        {"name", "collection", "pipeline"}
+    """
+    from mqtt_app import alerts, anomaly
+    from prediction import feature_store, registry
+
+    from . import rollups, summary
+
+    now = now or datetime.datetime.utcnow()
+    week_ago = now - datetime.timedelta(days=7)
+    number = {"$type": "number"}
+    readings = mongo.READINGS_COLLECTION
+    return [
+        # Endpoint monitoring & prediction cache
+        {"name": "monitoring_api latest reading", "collection": readings,
+         "filter": {"device_id": device_id}, "sort": [("timestamp", -1)], "limit": 1},
+        {"name": "monitoring_history / prediction.data range", "collection": readings,
+         "filter": {"device_id": device_id, "timestamp": {"$gte": week_ago, "$lt": now}},
+         "sort": [("timestamp", 1)]},
+        {"name": "monitoring_compare (readings)", "collection": readings,
+         "pipeline": [{"$match": {"device_id": {"$in": [device_id]}, "timestamp": {"$gte": week_ago, "$lt": now},
+                                  "power": number}}]},
+        {"name": "monitoring_compare (energy)", "collection": rollups.HOURLY_COLLECTION,
+         "filter": {"device_id": {"$in": [device_id]}, "hour": {"$gte": week_ago, "$lt": now}}},
+        {"name": "monitoring_anomalies", "collection": anomaly.ANOMALY_COLLECTION,
+         "filter": {"device_id": {"$in": [device_id]}, "started_at": {"$gte": week_ago}},
+         "sort": [("started_at", -1)], "limit": 100},
+        {"name": "alert_list", "collection": alerts.ALERT_COLLECTION,
+         "filter": {"device_id": {"$in": [device_id]}, "fired_at": {"$gte": week_ago}},
+         "sort": [("fired_at", -1)], "limit": 500},
+        {"name": "hourly energy series (billing)", "collection": rollups.HOURLY_COLLECTION,
+         "filter": {"device_id": device_id, "hour": {"$gte": week_ago, "$lt": now}}, "sort": [("hour", 1)]},
+        {"name": "load profile heatmap", "collection": rollups.DAILY_COLLECTION,
+         "filter": {"device_id": device_id, "start": {"$gte": week_ago, "$lt": now}}, "sort": [("start", 1)]},
+        {"name": "monitoring_summary", "collection": summary.SUMMARY_COLLECTION,
+         "filter": {"user_id": 1}, "limit": 1},
+        {"name": "model registry lookup", "collection": registry.REGISTRY_COLLECTION,
+         "filter": {"device_id": device_id, "algo": "rf"}, "limit": 1},
+        # Ingester (runmqtt) saat start
+        {"name": "open anomaly episodes", "collection": anomaly.ANOMALY_COLLECTION,
+         "filter": {"open": True}},
+        {"name": "firing alerts", "collection": alerts.ALERT_COLLECTION,
+         "filter": {"status": "firing"}},
+        # Batch jobs
+        {"name": "rollup refresh scan", "collection": readings,
+         "filter": {"device_id": device_id, "timestamp": {"$type": "date", "$gte": week_ago}, "energy": number},
+         "sort": [("timestamp", 1)]},
+        {"name": "retention oldest reading", "collection": readings,
+         "filter": {"device_id": device_id, "timestamp": {"$type": "date"}}, "sort": [("timestamp", 1)], "limit": 1},
+        {"name": "training sample counts", "collection": readings,
+         "pipeline": [{"$match": {"device_id": device_id, "timestamp": {"$type": "date", "$gte": week_ago},
+                                  "power": number}}]},
+        {"name": "feature store rebuild (all devices)", "collection": readings,
+         "pipeline": [{"$match": {"timestamp": {"$gte": week_ago, "$lt": now}, "power": number}}]},
+        {"name": "feature series", "collection": feature_store.FEATURE_COLLECTION,
+         "filter": {"device_id": device_id, "timestamp": {"$gte": week_ago}}, "sort": [("timestamp", 1)]},
+        {"name": "feature retention purge", "collection": feature_store.FEATURE_COLLECTION,
+         "filter": {"timestamp": {"$lt": week_ago}}, "sort": [("timestamp", 1)], "limit": 1000},
+    ]
+
+
+def winning_plans(node):
+    """Every winningPlan in an explain output (aggregations and sharded clusters nest them)"""
+    plans = []
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == "winningPlan":
+                plans.append(value)
+            else:
+                plans.extend(winning_plans(value))
+    elif isinstance(node, list):
+        for value in node:
+            plans.extend(winning_plans(value))
+    return plans
+
+
+def plan_stages(node):
+    """(stage, index name) of every stage of a plan tree"""
+    stages = []
+    if isinstance(node, dict):
+        if "stage" in node:
+            stages.append((node["stage"], node.get("indexName")))
+        for value in node.values():
+            stages.extend(plan_stages(value))
+    elif isinstance(node, list):
+        for value in node:
+            stages.extend(plan_stages(value))
+    return stages
+
+
+def explain(query, db=None):
+    """
+    Winning plan summary of one hot query
+
+    Returns:
+        dict: name, collection, stages, indexes, collscan, in_memory_sort
+    """
+    db = db if db is not None else mongo.get_db()
+    collection = db[query["collection"]]
+    if "pipeline" in query:
+        output = db.command("aggregate", collection.name, pipeline=query["pipeline"], explain=True)
+    else:
+        cursor = collection.find(query["filter"])
+        if query.get("sort"):
+            cursor = cursor.sort(query["sort"])
+        if query.get("limit"):
+            cursor = cursor.limit(query["limit"])
+        output = cursor.explain()
+
+    stages = [stage for plan in winning_plans(output) for stage in plan_stages(plan)]
+    names = [stage for stage, _ in stages]
+    return {
+        "name": query["name"],
+        "collection": query["collection"],
+        "stages": list(dict.fromkeys(names)),
+        "indexes": list(dict.fromkeys(index for _, index in stages if index)),
+        "collscan": "COLLSCAN" in names,
+        "in_memory_sort": "SORT" in names,
+    }
+
+
+def explain_all(device_id, now=None, db=None):
+    return [explain(query, db) for query in hot_queries(device_id, now)]
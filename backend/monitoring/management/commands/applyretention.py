@@ -0,0 +1,71 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from monitoring import retention
+
+
+def format_bytes(n_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if n_bytes < 1024:
+            return f"{n_bytes:.1f} {unit}"
+        n_bytes /= 1024
+    return f"{n_bytes:.1f} TB"
+
+
+class Command(BaseCommand):
+    help = "Expire raw readings older than RETENTION['RAW_DAYS'] once hourly / minute aggregates cover them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only report what would be deleted and the storage reclaimed")
+        parser.add_argument('--device', action='append', dest='devices',
+                            help="Only this device_id (repeatable). Default: every device in pzem_data1")
+        parser.add_argument('--no-refresh', action='store_true',
+                            help="Do not roll up closed hours before checking completeness")
+        parser.add_argument('--interval', type=float,
+                            help="Follow mode: repeat every N seconds instead of running once")
+
+    def handle(self, *args, **options):
+        config = settings.RETENTION
+
+        if options['dry_run']:
+            self.print_report(retention.report(options['devices']))
+            return
+
+        if config['MODE'] == 'ttl':
+            print(f"✓ {retention.ensure_ttl(config['RAW_DAYS'])} (raw readings expire without completeness check)")
+        else:
+            # Mode purge: TTL index lama (kalau ada) dilepas supaya tidak menghapus tanpa cek
+            retention.ensure_ttl(0)
+
+        while True:
+            started = time.perf_counter()
+            if config['MODE'] == 'ttl':
+                result = retention.purge_features()
+            else:
+                result = retention.purge(options['devices'], refresh=not options['no_refresh'])
+            print(f"✓ Deleted {result['raw_deleted']} raw readings and {result['feature_deleted']} feature buckets "
+                  f"in {time.perf_counter() - started:.2f}s")
+            for device_id, reason in result['skipped'].items():
+                print(f"  ! {device_id} skipped: {reason}")
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
+
+    def print_report(self, report):
+        print(f"Retention dry run (raw before {report['raw_cutoff'].isoformat(timespec='seconds')})")
+        for plan in report['devices']:
+            if plan['complete']:
+                print(f"  {plan['device_id']}: {plan['documents']} readings before "
+                      f"{plan['safe_until'].isoformat()} (~{format_bytes(plan['estimated_bytes'])})")
+            elif plan['reason']:
+                print(f"  {plan['device_id']}: kept, {plan['reason']}")
+        print(f"Raw readings to delete: {report['raw_documents']} (~{format_bytes(report['raw_bytes'])})")
+        if report['features_cutoff']:
+            print(f"Feature buckets to delete (before {report['features_cutoff'].date().isoformat()}): "
+                  f"{report['feature_documents']} (~{format_bytes(report['feature_bytes'])})")
+        if report['skipped_devices']:
+            print(f"Devices skipped until their aggregates are complete: {', '.join(report['skipped_devices'])}")
@@ -0,0 +1,48 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from monitoring import archive, mongo, retention
+from .applyretention import format_bytes
+
+
+class Command(BaseCommand):
+    help = "Move raw readings older than ARCHIVE['AFTER_DAYS'] to partitioned Parquet files"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', action='append', dest='devices',
+                            help="Only this device_id (repeatable). Default: every device in pzem_data1")
+        parser.add_argument('--dry-run', action='store_true',
+                            help="Only list the days that would be archived")
+        parser.add_argument('--keep', action='store_true',
+                            help="Write and verify the files but keep the readings in MongoDB")
+
+    def handle(self, *args, **options):
+        if not settings.ARCHIVE['ENABLED']:
+            print("ARCHIVE['ENABLED'] is off, nothing to do")
+            return
+
+        device_ids = options['devices'] or retention.all_device_ids(mongo.get_collection())
+        print(f"Archiving readings older than {settings.ARCHIVE['AFTER_DAYS']} days to {archive.archive_root()}")
+
+        if options['dry_run']:
+            for device_id in device_ids:
+                days, plan = archive.archivable_days(device_id)
+                if days:
+                    print(f"  {device_id}: {len(days)} day(s), {days[0].isoformat()} .. {days[-1].isoformat()}")
+                elif plan['documents'] and plan['reason']:
+                    print(f"  {device_id}: kept, {plan['reason']}")
+            return
+
+        started = time.perf_counter()
+        totals = {"days": 0, "rows": 0, "bytes": 0, "deleted": 0}
+        for device_id in device_ids:
+            summary = archive.archive_device(device_id, delete=not options['keep'])
+            for key in totals:
+                totals[key] += summary[key]
+            if summary['skipped']:
+                print(f"  ! {device_id} skipped: {summary['skipped']}")
+
+        print(f"✓ Archived {totals['rows']} readings ({totals['days']} device-days, {format_bytes(totals['bytes'])}), "
+              f"deleted {totals['deleted']} from MongoDB in {time.perf_counter() - started:.2f}s")
@@ -0,0 +1,82 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from monitoring import backfill
+
+
+def parse_param(value):
+    if "=" not in value:
+        raise ValueError(f"expected key=value, got '{value}'")
+    key, _, param = value.partition("=")
+    return key.strip(), param.strip()
+
+
+class Command(BaseCommand):
+    help = "Run a resumable, parallel chunked backfill (re-run the same command to resume after a crash)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('migration', nargs='?', help=f"One of: {', '.join(backfill.MIGRATIONS)}")
+        parser.add_argument('--param', action='append', default=[], type=parse_param,
+                            help="Migration parameter key=value (repeatable), e.g. device_id=<id>")
+        parser.add_argument('--device', action='append', dest='devices',
+                            help="Only this device_id for per-device migrations (repeatable)")
+        parser.add_argument('--since', type=datetime.datetime.fromisoformat,
+                            help="Start of the range, naive UTC ISO datetime. Default: oldest document")
+        parser.add_argument('--until', type=datetime.datetime.fromisoformat,
+                            help="End of the range (exclusive). Default: newest document")
+        parser.add_argument('--chunk-hours', type=float, help="Chunk width. Default: BACKFILL['CHUNK_HOURS']")
+        parser.add_argument('--workers', type=int, help="Worker processes. Default: BACKFILL['WORKERS']")
+        parser.add_argument('--restart', action='store_true',
+                            help="Drop the existing plan and progress and start over")
+        parser.add_argument('--retry-failed', action='store_true', help="Process failed chunks again")
+        parser.add_argument('--status', action='store_true', help="Only print the progress of the migration")
+
+    def handle(self, *args, **options):
+        name = options['migration']
+        if not name:
+            for migration in backfill.MIGRATIONS.values():
+                print(f"  {migration.name:<18} {migration.description}")
+            return
+
+        if options['status']:
+            self.print_status(name, backfill.status(name))
+            return
+
+        params = dict(options['param'])
+        if options['devices']:
+            params['devices'] = options['devices']
+        try:
+            migration = backfill.get_migration(name, params)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        header = backfill.plan(migration, options['since'], options['until'], options['chunk_hours'],
+                               restart=options['restart'])
+        if header['params'] != migration.params and not options['restart']:
+            print(f"! Resuming the existing plan with its parameters {header['params']} (use --restart to replan)")
+        if not header['chunks']:
+            print(f"✓ Nothing to backfill for {name}")
+            return
+        print(f"{name}: {header['chunks']} chunks, {header['since'].isoformat()} .. {header['until'].isoformat()}")
+
+        started = time.perf_counter()
+        result = backfill.run(name, options['workers'], options['retry_failed'])
+        elapsed = time.perf_counter() - started
+        print(f"✓ {result['chunks']} chunks, {result['processed']} documents read, {result['written']} written "
+              f"in {elapsed:.1f}s ({result['processed'] / max(elapsed, 1e-9):,.0f} docs/s)")
+        self.print_status(name, result['status'])
+        if result['status']['failed']:
+            raise CommandError(f"{result['status']['failed']} chunk(s) failed; fix the cause and re-run "
+                               f"with --retry-failed")
+
+    def print_status(self, name, current):
+        if not current['total']:
+            print(f"{name}: no plan")
+            return
+        print(f"{name}: {current['done']}/{current['total']} chunks done, {current['running']} running, "
+              f"{current['pending']} pending, {current['failed']} failed; "
+              f"{current['processed']} documents read, {current['written']} written")
+        for error in current['errors']:
+            print(f"  ! {error['chunk']} ({error['device_id'] or '-'}, {error['lower'].isoformat()}): {error['error']}")
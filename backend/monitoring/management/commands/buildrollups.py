@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from monitoring import rollups
+from monitoring.models import Device
+
+
+class Command(BaseCommand):
+    help = "Roll raw readings up into hourly energy rollups (closed hours since each device's watermark)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', action='append', dest='devices',
+                            help="Only this device_id (repeatable). Default: all active devices")
+        parser.add_argument('--interval', type=float,
+                            help="Follow mode: repeat every N seconds instead of running once")
+
+    def handle(self, *args, **options):
+        rollups.ensure_indexes()
+
+        while True:
+            started = time.perf_counter()
+            device_ids = options['devices'] or Device.objects.filter(is_active=True).values_list('device_id', flat=True)
+            written = sum(rollups.refresh_device(device_id) for device_id in device_ids)
+            print(f"✓ {written} hourly rollups written in {time.perf_counter() - started:.2f}s")
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
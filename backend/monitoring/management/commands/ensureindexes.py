@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from monitoring import indexes, mongo, rollups
+from prediction import benchmark
+
+
+class Command(BaseCommand):
+    help = "Create every MongoDB index the apps need and verify the hot queries use them (explain)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device',
+                            help="device_id used as sample parameter in the explained queries. "
+                                 "Default: device of the newest reading")
+        parser.add_argument('--sample-data', type=benchmark.parse_size, metavar='ROWS',
+                            help="Insert ROWS synthetic readings (and their hourly rollups) for one benchmark "
+                                 "device and explain against it, e.g. 100k")
+        parser.add_argument('--keep', action='store_true',
+                            help="Keep the --sample-data readings afterwards")
+        parser.add_argument('--no-explain', action='store_true',
+                            help="Only create the indexes")
+
+    def handle(self, *args, **options):
+        results = indexes.ensure()
+        for result in results:
+            keys = ", ".join(f"{field} {direction}" for field, direction in result['keys'])
+            mark = "✓" if result['status'] in ("created", "exists") else "✗"
+            print(f"{mark} {result['collection']} ({keys}): {result['status']}"
+                  + (f" [{result['name']}]" if result['name'] else ""))
+        failed = [result for result in results if result['status'].startswith("failed")]
+
+        if options['no_explain']:
+            if failed:
+                raise CommandError(f"{len(failed)} index(es) could not be created")
+            return
+
+        device_id = options['device']
+        if options['sample_data']:
+            print(f"\nGenerating {options['sample_data']} sample readings...")
+            device_id = benchmark.generate(options['sample_data'])[0]
+            rollups.refresh_device(device_id)
+        if device_id is None:
+            latest = mongo.get_collection().find_one({}, {"device_id": 1}, sort=[("timestamp", -1)])
+            if latest is None:
+                raise CommandError("pzem_data1 is empty: pass --device or --sample-data to explain the queries")
+            device_id = latest['device_id']
+
+        try:
+            plans = indexes.explain_all(device_id)
+        finally:
+            if options['sample_data'] and not options['keep']:
+                # Hanya device sampel ini: data benchmark lain tetap utuh
+                benchmark.cleanup(device_ids=[device_id])
+                rollups.get_hourly_collection().delete_many({"device_id": device_id})
+                rollups.get_daily_collection().delete_many({"device_id": device_id})
+                mongo.get_collection(rollups.STATE_COLLECTION).delete_many({"device_id": device_id})
+
+        print(f"\nQuery plans (sample device {device_id}):")
+        for plan in plans:
+            mark = "✗" if plan['collscan'] else "✓"
+            note = " (in-memory sort)" if plan['in_memory_sort'] else ""
+            used = ", ".join(plan['indexes']) or "-"
+            print(f"{mark} {plan['name']} [{plan['collection']}]: {' > '.join(plan['stages'])} index={used}{note}")
+
+        scans = [plan['name'] for plan in plans if plan['collscan']]
+        if failed or scans:
+            raise CommandError(
+                f"{len(failed)} index(es) could not be created; collection scans in: {', '.join(scans) or 'none'}"
+            )
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitoring', '0002_alter_device_device_id'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AlertRule',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text="Rule name (e.g., 'High load')", max_length=200)),
+                ('metric', models.CharField(choices=[('voltage', 'Voltage (V)'), ('current', 'Current (A)'), ('power', 'Power (W)'), ('energy', 'Energy (kWh)'), ('frequency', 'Frequency (Hz)'), ('pf', 'Power factor')], max_length=20)),
+                ('operator', models.CharField(choices=[('gt', '>'), ('gte', '>='), ('lt', '<'), ('lte', '<=')], max_length=3)),
+                ('threshold', models.FloatField()),
+                ('duration_seconds', models.PositiveIntegerField(default=0, help_text='Condition must hold this long before the alert fires (0 = immediately)')),
+                ('hysteresis', models.FloatField(default=0, help_text='Margin past the threshold the value must recover before the alert resolves')),
+                ('is_active', models.BooleanField(default=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('device', models.ForeignKey(help_text='Device the rule watches', on_delete=django.db.models.deletion.CASCADE, related_name='alert_rules', to='monitoring.device')),
+            ],
+            options={
+                'verbose_name': 'Alert rule',
+                'verbose_name_plural': 'Alert rules',
+                'ordering': ['device', 'name'],
+            },
+        ),
+    ]
@@ -50,3 +50,59 @@ class Device(models.Model):
     def __str__(self):
         return f"{self.name} ({self.device_id})"
 
+
+
+class AlertRule(models.Model):
+    """
+    User-defined alert on one metric of a device, e.g. "power > 2000 W for 5 minutes"
+
+    Evaluated on every incoming reading by the MQTT ingester (mqtt_app/alerts.py);
+    fired alerts are stored in the MongoDB `pzem_alerts` collection.
+    """
+    METRIC_CHOICES = [
+        ('voltage', 'Voltage (V)'),
+        ('current', 'Current (A)'),
+        ('power', 'Power (W)'),
+        ('energy', 'Energy (kWh)'),
+        ('frequency', 'Frequency (Hz)'),
+        ('pf', 'Power factor'),
+    ]
+    OPERATOR_CHOICES = [
+        ('gt', '>'),
+        ('gte', '>='),
+        ('lt', '<'),
+        ('lte', '<='),
+    ]
+
+    device = models.ForeignKey(
+        Device,
+        on_delete=models.CASCADE,
+        related_name='alert_rules',
+        help_text="Device the rule watches"
+    )
+    name = models.CharField(
+        max_length=200,
+        help_text="Rule name (e.g., 'High load')"
+    )
+    metric = models.CharField(max_length=20, choices=METRIC_CHOICES)
+    operator = models.CharField(max_length=3, choices=OPERATOR_CHOICES)
+    threshold = models.FloatField()
+    duration_seconds = models.PositiveIntegerField(
+        default=0,
+        help_text="Condition must hold this long before the alert fires (0 = immediately)"
+    )
+    hysteresis = models.FloatField(
+        default=0,
+        help_text="Margin past the threshold the value must recover before the alert resolves"
+    )
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['device', 'name']
+        verbose_name = 'Alert rule'
+        verbose_name_plural = 'Alert rules'
+
+    def __str__(self):
+        return f"{self.name}: {self.metric} {self.get_operator_display()} {self.threshold} ({self.device.device_id})"
@@ -0,0 +1,48 @@
+"""
+Shared MongoDB access for all apps.
+
+One MongoClient (and its connection pool) per process, created lazily so
+importing this module never opens a connection.
+"""
+import threading
+
+from django.conf import settings
+from pymongo import MongoClient
+
+READINGS_COLLECTION = "pzem_data1"
+
+_client = None
+_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide MongoClient"""
+    global _client
+
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _client = MongoClient(settings.MONGODB['URI'])
+
+    return _client
+
+
+def reset_client():
+    """
+    Drop the client inherited from a parent process (pool initializer)
+
+    MongoClient is not fork-safe: a forked child must open its own instead
+    of reusing the parent's sockets and monitor threads.
+    """
+    global _client
+    _client = None
+
+
+def get_db():
+    """Return the IoT database"""
+    return get_client()[settings.MONGODB['DB']]
+
+
+def get_collection(name=READINGS_COLLECTION):
+    """Return a collection of the IoT database (default: raw sensor readings)"""
+    return get_db()[name]
@@ -0,0 +1,80 @@
+"""
+Load-profile analytics from the daily rollups.
+
+Everything is read from `pzem_daily` (one small document per device per
+local day, see monitoring.rollups), so a year of profile costs 365 documents
+whatever the reading rate:
+
+    heatmap       hour-of-week (7 x 24, Monday first) mean power and mean kWh,
+                  from the per-hour sums of each day
+    percentiles   p50 / p95 / p99 power (W) over the whole range and per day
+                  of week, from the merged t-digests (monitoring.sketches)
+
+Power means and percentiles are time-weighted like the rollups, so they
+stay unbiased when ingest compression stores fewer readings while steady.
+"""
+import numpy as np
+
+from . import sketches
+
+DAYS = ("Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun")
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def percentile_dict(digest):
+    return {f"p{round(q * 100)}": None if value is None else round(value, 1)
+            for q, value in zip(QUANTILES, sketches.quantiles(digest, QUANTILES))}
+
+
+def load_profile(daily):
+    """
+    Heatmap and percentiles of a range of daily documents
+
+    Args:
+        daily (list): pzem_daily documents of one device
+
+    Returns:
+        dict: days, heatmap (mean_power_w and mean_energy_kwh, 7 x 24 with
+        None where no day had readings), percentiles, by_day_of_week, peak_w
+    """
+    readings = np.zeros((7, 24))
+    power_sum = np.zeros((7, 24))
+    power_seconds = np.zeros((7, 24))
+    energy_sum = np.zeros((7, 24))
+    days_with_data = np.zeros((7, 24))
+    digests = [[] for _ in DAYS]
+    for doc in daily:
+        dow = doc["dow"]
+        hour_n = np.asarray(doc["hour_n"], dtype=np.float64)
+        readings[dow] += hour_n
+        power_sum[dow] += doc["hour_power_sum"]
+        # Rata-rata berbobot waktu (dokumen lama: bobot per reading)
+        power_seconds[dow] += doc.get("hour_power_seconds", hour_n)
+        energy_sum[dow] += doc["hour_energy_kwh"]
+        days_with_data[dow] += hour_n > 0
+        digests[dow].append(doc.get("power_digest"))
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        mean_power = np.where(power_seconds > 0, power_sum / power_seconds, np.nan)
+        mean_energy = np.where(days_with_data > 0, energy_sum / days_with_data, np.nan)
+
+    def cells(matrix, digits):
+        return [[None if np.isnan(v) else round(float(v), digits) for v in row] for row in matrix]
+
+    by_day = [sketches.merge(day_digests) for day_digests in digests]
+    overall = sketches.merge(by_day)
+    return {
+        "days": len(daily),
+        "heatmap": {
+            "rows": list(DAYS),
+            "mean_power_w": cells(mean_power, 1),
+            "mean_energy_kwh": cells(mean_energy, 4),
+        },
+        "percentiles": percentile_dict(overall),
+        "by_day_of_week": [
+            {"day": DAYS[dow], "readings": int(readings[dow].sum()), **percentile_dict(digest)}
+            for dow, digest in enumerate(by_day)
+        ],
+        "peak_w": max((doc.get("power_max", 0.0) for doc in daily), default=None),
+        "readings": int(readings.sum()),
+    }
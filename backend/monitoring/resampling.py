@@ -0,0 +1,290 @@
+"""
+Vectorized resampling of readings onto a regular time grid.
+
+Raw readings have jitter (the ingester stamps arrival time), gaps (Wi-Fi
+dropouts, compression heartbeats) and duplicates (QoS 1 redelivery).
+resample() turns them into one value per fixed interval:
+
+    1. duplicates (same timestamp) are dropped, keeping the first
+    2. every reading falls into the bucket floor((t - start) / interval)
+    3. buckets are aggregated per field: mean, min, max, sum, count,
+       first or last; non-numeric values are ignored
+    4. empty buckets are gaps; they are filled per policy:
+           ffill    previous bucket value
+           linear   interpolated between the surrounding buckets
+           null     left empty (NaN)
+       gaps longer than max_gap buckets are never filled, and every
+       gap is flagged in the result
+
+Everything runs on NumPy arrays (one sort, bincount / ufunc.reduceat over
+sorted bucket indices), several million readings per second.
+cursor_arrays() turns a projected MongoDB cursor into those arrays.
+
+Used by monitoring_history (?resample=), the comparison endpoint and the
+prediction FeatureBuilder.
+"""
+import numpy as np
+
+AGGREGATIONS = ("mean", "min", "max", "sum", "count", "first", "last")
+FILLS = ("ffill", "linear", "null")
+INTERVAL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_interval(value):
+    """'30s', '15m', '1h', '1d' or plain seconds -> seconds (float)"""
+    value = str(value).strip().lower()
+    unit = INTERVAL_UNITS.get(value[-1:])
+    seconds = float(value[:-1]) * unit if unit else float(value)
+    if seconds <= 0:
+        raise ValueError(f"Interval must be positive: {value}")
+    return seconds
+
+
+def to_epoch(timestamps):
+    """Naive UTC datetimes (as stored by the ingester) to float epoch seconds"""
+    return np.asarray(timestamps, dtype='datetime64[ms]').astype(np.int64) / 1000.0
+
+
+def from_epoch(epoch):
+    """Float epoch seconds to datetime64[ms] (use .tolist() for datetimes)"""
+    return np.round(np.asarray(epoch) * 1000).astype('datetime64[ms]')
+
+
+def cursor_arrays(cursor, fields):
+    """
+    Projected documents -> (epoch seconds, float matrix with one column per field)
+
+    Documents without a datetime timestamp are skipped; non-numeric values
+    become NaN.
+
+    Returns:
+        tuple: (ndarray (n,), ndarray (n, len(fields)))
+    """
+    timestamps, rows = [], []
+    for doc in cursor:
+        timestamp = doc.get("timestamp")
+        if not hasattr(timestamp, "year"):
+            continue
+        timestamps.append(timestamp)
+        rows.append([
+            value if isinstance(value, (int, float)) and not isinstance(value, bool) else np.nan
+            for value in (doc.get(field) for field in fields)
+        ])
+    if not rows:
+        return np.empty(0), np.empty((0, len(fields)))
+    return to_epoch(timestamps), np.asarray(rows, dtype=np.float64)
+
+
+def bucket_index(epoch, start, interval):
+    """Grid step of each timestamp (may be negative or past the end)"""
+    return np.floor((np.asarray(epoch, dtype=np.float64) - start) / interval).astype(np.int64)
+
+
+def bucket_sums(index, values, size):
+    """
+    Per-bucket sum and count of valid values, for running means
+
+    Returns:
+        tuple: (sums, counts) arrays of length size
+    """
+    values = np.asarray(values, dtype=np.float64)
+    valid = ~np.isnan(values) & (index >= 0) & (index < size)
+    return (np.bincount(index[valid], weights=values[valid], minlength=size),
+            np.bincount(index[valid], minlength=size).astype(np.float64))
+
+
+def aggregate(index, values, size, agg="mean"):
+    """
+    Aggregate one field per bucket
+
+    Args:
+        index (ndarray): bucket of each value, sorted ascending, 0 <= index < size
+        values (ndarray): float values (NaN ignored)
+        size (int): number of buckets
+        agg (str): one of AGGREGATIONS
+
+    Returns:
+        tuple: (aggregated values, NaN where a bucket has no value; counts)
+    """
+    valid = ~np.isnan(values)
+    index, values = index[valid], values[valid]
+    counts = np.bincount(index, minlength=size)
+    if agg == "count":
+        return counts.astype(np.float64), counts
+
+    result = np.full(size, np.nan)
+    if len(index) == 0:
+        return result, counts
+    starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+    buckets = index[starts]
+
+    if agg in ("mean", "sum"):
+        sums = np.add.reduceat(values, starts)
+        result[buckets] = sums / counts[buckets] if agg == "mean" else sums
+    elif agg == "min":
+        result[buckets] = np.minimum.reduceat(values, starts)
+    elif agg == "max":
+        result[buckets] = np.maximum.reduceat(values, starts)
+    elif agg == "first":
+        result[buckets] = values[starts]
+    elif agg == "last":
+        result[buckets] = values[np.r_[starts[1:], len(values)] - 1]
+    else:
+        raise ValueError(f"Unknown aggregation '{agg}'. Valid options: {AGGREGATIONS}")
+    return result, counts
+
+
+def gap_runs(missing):
+    """
+    Runs of consecutive True values
+
+    Returns:
+        tuple: (start positions, lengths) arrays
+    """
+    missing = np.asarray(missing, dtype=bool)
+    edges = np.diff(np.r_[0, missing.astype(np.int8), 0])
+    starts = np.flatnonzero(edges == 1)
+    return starts, np.flatnonzero(edges == -1) - starts
+
+
+def fill(values, policy="ffill", max_gap=None, edges=False):
+    """
+    Fill NaN gaps of a regular series
+
+    Args:
+        values (ndarray): series with NaN gaps
+        policy (str): 'ffill', 'linear' or 'null'
+        max_gap (int): longer runs of NaN stay NaN (None: no limit)
+        edges (bool): also fill before the first / after the last valid
+            value by holding it (otherwise those stay NaN)
+
+    Returns:
+        ndarray: filled copy
+    """
+    if policy not in FILLS:
+        raise ValueError(f"Unknown fill '{policy}'. Valid options: {FILLS}")
+    values = np.asarray(values, dtype=np.float64)
+    missing = np.isnan(values)
+    if policy == "null" or not missing.any() or missing.all():
+        return values.copy()
+
+    positions = np.arange(len(values))
+    valid = ~missing
+    first, last = np.argmax(valid), len(values) - 1 - np.argmax(valid[::-1])
+    if policy == "ffill":
+        index = np.where(valid, positions, 0)
+        np.maximum.accumulate(index, out=index)
+        filled = values[index]
+    else:
+        filled = np.interp(positions, positions[valid], values[valid])
+
+    if edges:
+        filled[:first] = values[first]
+        filled[last + 1:] = values[last]
+    else:
+        filled[:first] = np.nan
+        if policy == "linear":
+            filled[last + 1:] = np.nan
+
+    if max_gap is not None:
+        starts, lengths = gap_runs(missing)
+        for start, length in zip(starts[lengths > max_gap], lengths[lengths > max_gap]):
+            filled[start:start + length] = np.nan
+    return filled
+
+
+def resample(epoch, values, interval, start=None, end=None, agg="mean", fill_policy="ffill", max_gap=None):
+    """
+    Readings -> regular grid
+
+    Args:
+        epoch (ndarray): epoch seconds of the readings (any order)
+        values (ndarray): (n,) or (n, k) float values
+        interval (float): grid step in seconds
+        start (float): first bucket (default: first reading), floored to interval
+        end (float): end of the grid, exclusive (default: after the last reading)
+        agg (str): aggregation per bucket, see AGGREGATIONS
+        fill_policy (str): gap filling, see FILLS
+        max_gap (int): only fill gaps of at most this many buckets
+
+    Returns:
+        dict: grid (bucket start epoch), values (same dimensionality as the
+        input), counts (readings per bucket and field), gap (bucket without
+        any reading), filled (gap buckets that got a value)
+    """
+    epoch = np.asarray(epoch, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    matrix = values.reshape(len(values), -1)
+    if start is None:
+        start = epoch.min() if len(epoch) else 0.0
+    start = np.floor(start / interval) * interval
+    if end is None:
+        end = start + (np.floor((epoch.max() - start) / interval) + 1) * interval if len(epoch) else start
+    size = max(int(np.ceil((end - start) / interval)), 0)
+
+    # Urut waktu, duplikat timestamp dibuang (yang pertama dipakai)
+    order = np.argsort(epoch, kind="stable")
+    epoch, matrix = epoch[order], matrix[order]
+    unique = np.r_[True, epoch[1:] != epoch[:-1]] if len(epoch) else np.zeros(0, dtype=bool)
+    epoch, matrix = epoch[unique], matrix[unique]
+
+    index = bucket_index(epoch, start, interval)
+    inside = (index >= 0) & (index < size)
+    index, matrix = index[inside], matrix[inside]
+
+    result = np.full((size, matrix.shape[1]), np.nan)
+    counts = np.zeros((size, matrix.shape[1]), dtype=np.int64)
+    for column in range(matrix.shape[1]):
+        aggregated, counts[:, column] = aggregate(index, matrix[:, column], size, agg)
+        result[:, column] = aggregated if agg == "count" else fill(aggregated, fill_policy, max_gap)
+
+    gap = np.bincount(index, minlength=size) == 0
+    filled = gap & ~np.isnan(result).all(axis=1)
+    return {
+        "grid": start + np.arange(size) * interval,
+        "values": result if values.ndim > 1 else result[:, 0],
+        "counts": counts if values.ndim > 1 else counts[:, 0],
+        "gap": gap,
+        "filled": filled,
+    }
+
+
+# === Keluaran JSON ===
+
+def to_rows(result, fields, digits=6):
+    """
+    resample() result of a (n, k) matrix -> list of dicts
+
+    Returns:
+        list: {"timestamp": datetime, <field>: value or None, "count": readings, "gap": bool}
+    """
+    timestamps = from_epoch(result["grid"]).tolist()
+    values = np.round(result["values"], digits)
+    counts = result["counts"].max(axis=1) if len(result["counts"]) else []
+    rows = []
+    for i, timestamp in enumerate(timestamps):
+        row = {"timestamp": timestamp}
+        for column, field in enumerate(fields):
+            value = values[i, column]
+            row[field] = None if np.isnan(value) else float(value)
+        row["count"] = int(counts[i])
+        row["gap"] = bool(result["gap"][i])
+        rows.append(row)
+    return rows
+
+
+def gap_list(result, interval):
+    """
+    Gaps of a resample() result as time ranges
+
+    Returns:
+        list: {"start": datetime, "end": datetime (exclusive), "buckets": n, "filled": bool}
+    """
+    starts, lengths = gap_runs(result["gap"])
+    grid = result["grid"]
+    return [{
+        "start": from_epoch(grid[start]).tolist(),
+        "end": from_epoch(grid[start] + length * interval).tolist(),
+        "buckets": int(length),
+        "filled": bool(result["filled"][start:start + length].all()),
+    } for start, length in zip(starts, lengths)]
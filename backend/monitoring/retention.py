@@ -0,0 +1,308 @@
+"""
+Tiered retention for the raw readings.
+
+Raw readings (pzem_data1, ~43k documents per device per day) are only kept
+for RAW_DAYS; the aggregates built from them live longer:
+
+    pzem_hourly           hourly energy rollups (monitoring.rollups), kept forever
+    prediction_features   minute buckets (prediction.feature_store), FEATURES_DAYS
+
+purge() never drops a raw reading that is not yet covered by the required
+aggregates. Per device the deletable range ends at
+
+    safe_until = hour floor of min(now - RAW_DAYS,
+                                   hourly rollup watermark of the device,
+                                   feature store rebuild watermark)
+
+and inside that range every hour's number of raw readings with an energy
+counter must equal `n` of the device's rollup for that hour, otherwise the
+device is skipped (e.g. readings arrived late for hours already rolled
+up; `buildrollups` after resetting the watermark repairs that).
+
+Deletes run in batches of BATCH_SIZE _ids, oldest first, so the purge
+can run next to the ingester without long-held locks. With
+mode='ttl' a TTL index on timestamp expires raw readings instead; that is
+cheaper but MongoDB's TTL monitor cannot check rollup completeness, so it
+should only be enabled when rollups are known to run continuously.
+Feature buckets past FEATURES_DAYS are always purged in batches.
+
+report() is the dry run: documents and estimated bytes (documents x
+average object size, plus the proportional index share) per device.
+"""
+import datetime
+import time
+
+from django.conf import settings
+from pymongo.errors import OperationFailure
+
+from prediction import feature_store
+
+from . import mongo, rollups
+
+TTL_INDEX_NAME = "timestamp_ttl"
+
+
+def cutoff(days, now=None):
+    now = now or datetime.datetime.utcnow()
+    return now - datetime.timedelta(days=days)
+
+
+def collection_sizes(collection):
+    """
+    Average document and index bytes per document of a collection
+
+    Returns:
+        dict: {"count", "avg_obj_bytes", "index_bytes_per_doc", "storage_bytes"}
+    """
+    try:
+        stats = collection.database.command("collStats", collection.name)
+    except OperationFailure:
+        stats = {}
+    count = stats.get("count", 0)
+    return {
+        "count": count,
+        "avg_obj_bytes": stats.get("avgObjSize", 0),
+        "index_bytes_per_doc": stats.get("totalIndexSize", 0) / count if count else 0,
+        "storage_bytes": stats.get("storageSize", 0),
+    }
+
+
+def feature_watermark():
+    """Newest minute bucket confirmed by buildfeatures (None: never ran)"""
+    state = mongo.get_collection(feature_store.STATE_COLLECTION).find_one({"_id": "rebuild"}) or {}
+    return state.get("watermark")
+
+
+def device_plan(device_id, raw_cutoff, features_until=None, collection=None):
+    """
+    Deletable raw range of one device and whether it is safe to drop
+
+    Args:
+        device_id (str): Device ID
+        raw_cutoff (datetime): retention cutoff (now - RAW_DAYS)
+        features_until (datetime): feature store watermark when required
+
+    Returns:
+        dict: device_id, oldest, safe_until, documents, rollup_watermark,
+        complete and a reason when the device is skipped
+    """
+    collection = collection if collection is not None else mongo.get_collection()
+    oldest_doc = collection.find_one(
+        {"device_id": device_id, "timestamp": {"$type": "date"}},
+        {"timestamp": 1},
+        sort=[("timestamp", 1)]
+    )
+    state = mongo.get_collection(rollups.STATE_COLLECTION).find_one({"device_id": device_id}) or {}
+    watermark = state.get("watermark")
+    plan = {
+        "device_id": device_id,
+        "oldest": oldest_doc["timestamp"] if oldest_doc else None,
+        "rollup_watermark": watermark,
+        "safe_until": None,
+        "documents": 0,
+        "complete": False,
+        "reason": None,
+    }
+
+    if oldest_doc is None or oldest_doc["timestamp"] >= raw_cutoff:
+        plan["reason"] = "nothing older than the retention window"
+        return plan
+    if watermark is None:
+        plan["reason"] = "no hourly rollups yet (run buildrollups)"
+        return plan
+
+    limits = [raw_cutoff, watermark]
+    if settings.RETENTION['REQUIRE_FEATURES']:
+        if features_until is None:
+            plan["reason"] = "feature store never rebuilt (run buildfeatures)"
+            return plan
+        limits.append(features_until)
+    safe_until = rollups.hour_floor(min(limits))
+    plan["safe_until"] = safe_until
+
+    since = rollups.hour_floor(oldest_doc["timestamp"])
+    if safe_until <= since:
+        plan["reason"] = "aggregates do not cover the expired range yet"
+        return plan
+
+    time_range = {"$gte": since, "$lt": safe_until}
+    plan["documents"] = collection.count_documents({"device_id": device_id, "timestamp": time_range})
+
+    # Kelengkapan per jam: reading ber-counter energi == n rollup jam itu
+    epoch_ms = {"$subtract": ["$timestamp", rollups.EPOCH]}
+    raw_hours = {
+        row["_id"]: row["n"]
+        for row in collection.aggregate([
+            {"$match": {"device_id": device_id, "timestamp": time_range, "energy": {"$type": "number"}}},
+            {"$group": {
+                "_id": {"$subtract": ["$timestamp", {"$mod": [epoch_ms, rollups.HOUR_SECONDS * 1000]}]},
+                "n": {"$sum": 1},
+            }},
+        ], allowDiskUse=True)
+    }
+    rolled_up = {
+        doc["hour"]: doc["n"]
+        for doc in rollups.get_hourly_collection().find(
+            {"device_id": device_id, "hour": {"$in": list(raw_hours)}}, {"_id": 0, "hour": 1, "n": 1}
+        )
+    }
+    # Jam yang raw-nya sudah terhapus sebelumnya tidak ikut dibandingkan
+    missing = [hour for hour, n in raw_hours.items() if rolled_up.get(hour) != n]
+    plan["hours_checked"] = len(raw_hours)
+
+    if missing:
+        plan["reason"] = (f"hourly rollups incomplete for {len(missing)} hour(s), "
+                          f"first {min(missing).isoformat()} (reset the rollup watermark and run buildrollups)")
+        return plan
+
+    plan["complete"] = True
+    return plan
+
+
+def delete_batches(collection, query, batch_size, pause=0.0):
+    """
+    Delete matching documents oldest first in batches of _ids
+
+    Returns:
+        int: documents deleted
+    """
+    deleted = 0
+    while True:
+        ids = [doc["_id"] for doc in collection.find(query, {"_id": 1}).sort("timestamp", 1).limit(batch_size)]
+        if not ids:
+            return deleted
+        deleted += collection.delete_many({"_id": {"$in": ids}}).deleted_count
+        if pause:
+            time.sleep(pause)
+
+
+def all_device_ids(collection):
+    return sorted(device_id for device_id in collection.distinct("device_id") if device_id)
+
+
+def plan_all(device_ids=None, now=None, collection=None):
+    """Retention plan of every device (or the given ones)"""
+    config = settings.RETENTION
+    collection = collection if collection is not None else mongo.get_collection()
+    raw_cutoff = cutoff(config['RAW_DAYS'], now)
+    features_until = feature_watermark() if config['REQUIRE_FEATURES'] else None
+    device_ids = device_ids or all_device_ids(collection)
+    return [device_plan(device_id, raw_cutoff, features_until, collection) for device_id in device_ids]
+
+
+def report(device_ids=None, now=None):
+    """
+    Dry run: what purge() would delete and the storage it would reclaim
+
+    Returns:
+        dict: cutoffs, per-device plans and estimated reclaimed bytes
+    """
+    config = settings.RETENTION
+    collection = mongo.get_collection()
+    plans = plan_all(device_ids, now, collection)
+    sizes = collection_sizes(collection)
+    per_doc = sizes["avg_obj_bytes"] + sizes["index_bytes_per_doc"]
+
+    for plan in plans:
+        plan["estimated_bytes"] = int(plan["documents"] * per_doc) if plan["complete"] else 0
+
+    features = feature_store.get_feature_collection()
+    features_cutoff = cutoff(config['FEATURES_DAYS'], now) if config['FEATURES_DAYS'] else None
+    feature_docs = features.count_documents({"timestamp": {"$lt": features_cutoff}}) if features_cutoff else 0
+    feature_sizes = collection_sizes(features)
+
+    return {
+        "raw_cutoff": cutoff(config['RAW_DAYS'], now),
+        "features_cutoff": features_cutoff,
+        "raw_collection": sizes,
+        "devices": plans,
+        "raw_documents": sum(plan["documents"] for plan in plans if plan["complete"]),
+        "raw_bytes": sum(plan["estimated_bytes"] for plan in plans),
+        "skipped_devices": [plan["device_id"] for plan in plans if plan["documents"] and not plan["complete"]],
+        "feature_documents": feature_docs,
+        "feature_bytes": int(feature_docs * (feature_sizes["avg_obj_bytes"] + feature_sizes["index_bytes_per_doc"])),
+    }
+
+
+def purge(device_ids=None, now=None, refresh=True, log=print):
+    """
+    Delete expired raw readings (only ranges covered by complete aggregates)
+    and expired feature buckets
+
+    Args:
+        device_ids (list): restrict to these devices (default: all)
+        refresh (bool): roll up each device's closed hours first
+
+    Returns:
+        dict: {"raw_deleted", "feature_deleted", "skipped": {device_id: reason}}
+    """
+    config = settings.RETENTION
+    collection = mongo.get_collection()
+    device_ids = device_ids or all_device_ids(collection)
+
+    if refresh:
+        for device_id in device_ids:
+            rollups.refresh_device(device_id, now)
+
+    raw_deleted, skipped = 0, {}
+    for plan in plan_all(device_ids, now, collection):
+        if not plan["complete"]:
+            if plan["documents"]:
+                skipped[plan["device_id"]] = plan["reason"]
+            continue
+        deleted = delete_batches(
+            collection,
+            {"device_id": plan["device_id"], "timestamp": {"$lt": plan["safe_until"]}},
+            config['BATCH_SIZE'], config['BATCH_PAUSE_SECONDS']
+        )
+        raw_deleted += deleted
+        log(f"  {plan['device_id']}: deleted {deleted} raw readings before {plan['safe_until'].isoformat()}")
+
+    return {"raw_deleted": raw_deleted, "feature_deleted": purge_features(now)["feature_deleted"], "skipped": skipped}
+
+
+def purge_features(now=None):
+    """
+    Delete feature buckets older than FEATURES_DAYS (kept forever when 0)
+
+    Returns:
+        dict: same layout as purge(), raw readings untouched
+    """
+    config = settings.RETENTION
+    deleted = 0
+    if config['FEATURES_DAYS']:
+        deleted = delete_batches(
+            feature_store.get_feature_collection(),
+            {"timestamp": {"$lt": cutoff(config['FEATURES_DAYS'], now)}},
+            config['BATCH_SIZE'], config['BATCH_PAUSE_SECONDS']
+        )
+    return {"raw_deleted": 0, "feature_deleted": deleted, "skipped": {}}
+
+
+def ensure_ttl(days, collection=None):
+    """
+    Expire raw readings with a TTL index instead of purge()
+
+    Creates the index, or changes expireAfterSeconds of an existing one;
+    days=0 drops it again.
+
+    Returns:
+        str: what was done
+    """
+    collection = collection if collection is not None else mongo.get_collection()
+    existing = collection.index_information().get(TTL_INDEX_NAME)
+
+    if not days:
+        if existing:
+            collection.drop_index(TTL_INDEX_NAME)
+            return "TTL index dropped"
+        return "no TTL index"
+
+    seconds = int(days * 86400)
+    if existing:
+        collection.database.command("collMod", collection.name, index={
+            "name": TTL_INDEX_NAME, "expireAfterSeconds": seconds
+        })
+        return f"TTL index updated to {days} days"
+    collection.create_index("timestamp", name=TTL_INDEX_NAME, expireAfterSeconds=seconds)
+    return f"TTL index created ({days} days)"
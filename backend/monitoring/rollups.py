@@ -0,0 +1,451 @@
+"""
+Hourly energy rollups of the raw readings.
+
+The PZEM `energy` field is a cumulative kWh counter. Consumption is the
+difference between consecutive readings; when the counter goes backwards
+(meter reset, power loss, device swap) the new value itself is taken as the
+consumption since the reset. Deltas are attributed to the hour of the later
+reading, so the step from the last reading of one hour to the first of the
+next is not lost.
+
+One document per device per closed UTC hour in `pzem_hourly`:
+
+    {device_id, hour, n, energy_kwh, resets, power_sum, power_seconds,
+     power_max, energy_last,
+     power_digest}                              <- t-digest of power (monitoring.sketches)
+
+and one per device per local day (LOCAL_TIME_ZONE) in `pzem_daily`, rebuilt
+from the day's hourly documents whenever they change:
+
+    {device_id, day, start, dow, n, energy_kwh, power_sum, power_seconds, power_max,
+     hour_n, hour_energy_kwh, hour_power_sum,   <- 24 entries, local hour-of-day
+     hour_power_seconds,
+     power_digest}
+
+The daily documents feed the load-profile heatmap: months of hour-of-week
+profiles and power percentiles from a few hundred small documents.
+
+Power is time-weighted: every reading counts for the seconds until the next
+one (reading_seconds), so mean power = power_sum / power_seconds and the
+digest weights are seconds. That matters once ingest compression
+(mqtt_app.compression) stores one reading for a steady stretch; `n` stays
+the stored-reading count that retention checks against.
+
+refresh_device() rolls up only readings newer than the device's watermark
+(kept in `pzem_rollup_state` with the last counter value, so the first delta
+of the next run is exact). Closed hours are written once with upserts, which
+makes a re-run after a crash idempotent. The backlog is rolled up by
+`buildrollups`; API requests only catch up a few hours (catch_up()). All
+arithmetic is vectorized with NumPy.
+"""
+import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from django.conf import settings
+from pymongo import ASCENDING, UpdateOne
+
+from . import mongo, sketches
+
+HOURLY_COLLECTION = "pzem_hourly"
+DAILY_COLLECTION = "pzem_daily"
+STATE_COLLECTION = "pzem_rollup_state"
+HOUR_SECONDS = 3600
+EPOCH = datetime.datetime(1970, 1, 1)
+CATCH_UP_HOURS = 2  # jam tertutup maksimal yang di-rollup di dalam satu request API
+
+
+class RollupsPending(Exception):
+    """The device has no rollup watermark yet: buildrollups has not processed it"""
+
+
+def get_hourly_collection():
+    return mongo.get_collection(HOURLY_COLLECTION)
+
+
+def get_daily_collection():
+    return mongo.get_collection(DAILY_COLLECTION)
+
+
+def ensure_indexes():
+    get_hourly_collection().create_index([("device_id", ASCENDING), ("hour", ASCENDING)], unique=True)
+    get_daily_collection().create_index([("device_id", ASCENDING), ("start", ASCENDING)], unique=True)
+    mongo.get_collection(STATE_COLLECTION).create_index("device_id", unique=True)
+
+
+def to_epoch(timestamps):
+    """Naive UTC datetimes to float epoch seconds"""
+    return np.asarray(timestamps, dtype='datetime64[ms]').astype(np.int64) / 1000.0
+
+
+def from_epoch(seconds):
+    return EPOCH + datetime.timedelta(seconds=float(seconds))
+
+
+def hour_floor(ts):
+    return ts.replace(minute=0, second=0, microsecond=0)
+
+
+def energy_deltas(energy, previous=None):
+    """
+    Consumption between consecutive cumulative counter values
+
+    Args:
+        energy (ndarray): counter values in time order (kWh)
+        previous (float): counter value just before energy[0], if known
+
+    Returns:
+        tuple: (delta kWh per reading, boolean reset flag per reading)
+    """
+    energy = np.asarray(energy, dtype=np.float64)
+    if len(energy) == 0:
+        return energy, np.zeros(0, dtype=bool)
+
+    before = np.empty_like(energy)
+    before[0] = energy[0] if previous is None else previous
+    before[1:] = energy[:-1]
+
+    delta = energy - before
+    reset = delta < 0
+    # Counter mulai dari nol lagi: nilai baru = konsumsi sejak reset
+    delta[reset] = energy[reset]
+    return delta, reset
+
+
+def reading_seconds(epoch, until=None):
+    """
+    Seconds each reading stands for: the time until the next reading
+
+    Uncompressed devices publish at a steady cadence, so this is the same
+    for every reading and the time-weighted mean equals the plain mean.
+    With ingest compression (COMPRESSION['MODE']) a stored reading also
+    stands for the skipped ones after it, and weighting by time keeps power
+    means and percentiles unbiased. Gaps are capped at the heartbeat
+    (COMPRESSION['MAX_INTERVAL_SECONDS']): a longer one means the device was
+    offline. The last reading holds until `until` when given, otherwise for
+    the typical spacing of the others.
+
+    Args:
+        epoch (ndarray): reading times, epoch seconds, in time order
+        until (float): epoch seconds the last reading holds until
+
+    Returns:
+        ndarray: seconds per reading
+    """
+    epoch = np.asarray(epoch, dtype=np.float64)
+    if len(epoch) == 0:
+        return epoch
+    cap = settings.COMPRESSION['MAX_INTERVAL_SECONDS']
+    seconds = np.diff(epoch, append=np.nan)
+    if until is not None:
+        seconds[-1] = until - epoch[-1]
+    elif len(epoch) > 1:
+        seconds[-1] = np.median(seconds[:-1])
+    else:
+        seconds[-1] = 1.0
+    return np.clip(seconds, 0.0, cap)
+
+
+def hourly_totals(epoch, energy, power, previous=None, until=None):
+    """
+    Group readings into UTC hours
+
+    Power aggregates are time-weighted (reading_seconds): power_sum is in
+    watt-seconds over power_seconds, and the digest weights are seconds.
+
+    Args:
+        until (float): epoch seconds the last reading holds until (see reading_seconds)
+
+    Returns:
+        dict of arrays: hour (epoch start), n, energy_kwh, resets, power_sum,
+        power_seconds, power_max, energy_last, power_digest (list of digest
+        documents); one entry per hour that has readings
+    """
+    delta, reset = energy_deltas(energy, previous)
+    hours, index = np.unique(np.floor(np.asarray(epoch) / HOUR_SECONDS) * HOUR_SECONDS, return_inverse=True)
+    size = len(hours)
+
+    power = np.asarray(power, dtype=np.float64)
+    seconds = reading_seconds(epoch, until)
+    power_max = np.full(size, -np.inf)
+    np.maximum.at(power_max, index, power)
+    # Reading terakhir per jam (data sudah urut waktu)
+    last = np.zeros(size, dtype=np.int64)
+    last[index] = np.arange(len(index))
+    # Data urut waktu: reading satu jam berurutan
+    starts = np.cumsum(np.bincount(index))[:-1]
+
+    return {
+        "hour": hours,
+        "n": np.bincount(index, minlength=size),
+        "energy_kwh": np.bincount(index, weights=delta, minlength=size),
+        "resets": np.bincount(index, weights=reset, minlength=size).astype(np.int64),
+        "power_sum": np.bincount(index, weights=power * seconds, minlength=size),
+        "power_seconds": np.bincount(index, weights=seconds, minlength=size),
+        "power_max": power_max,
+        "energy_last": np.asarray(energy, dtype=np.float64)[last],
+        "power_digest": [
+            sketches.from_values(values, weights)
+            for values, weights in zip(np.split(power, starts), np.split(seconds, starts))
+        ],
+    }
+
+
+def mean_power(doc):
+    """Mean power of an hourly or daily document (count-weighted for documents older than power_seconds)"""
+    if doc.get("power_seconds"):
+        return doc.get("power_sum", 0.0) / doc["power_seconds"]
+    return doc.get("power_sum", 0.0) / doc["n"] if doc.get("n") else None
+
+
+def hourly_operations(device_id, totals):
+    """Upserts of the hourly documents of hourly_totals()"""
+    return [
+        UpdateOne(
+            {"device_id": device_id, "hour": from_epoch(hour)},
+            {"$set": {
+                "n": int(totals["n"][i]),
+                "energy_kwh": float(totals["energy_kwh"][i]),
+                "resets": int(totals["resets"][i]),
+                "power_sum": float(totals["power_sum"][i]),
+                "power_seconds": float(totals["power_seconds"][i]),
+                "power_max": float(totals["power_max"][i]),
+                "energy_last": float(totals["energy_last"][i]),
+                "power_digest": totals["power_digest"][i],
+            }},
+            upsert=True
+        )
+        for i, hour in enumerate(totals["hour"])
+    ]
+
+
+def load_counter_readings(device_id, since=None, until=None, collection=None):
+    """
+    Readings with a numeric energy counter in [since, until), oldest first
+
+    Returns:
+        tuple: (epoch seconds, energy kWh, power W) arrays
+    """
+    collection = collection if collection is not None else mongo.get_collection()
+    time_filter = {"$type": "date"}
+    if since is not None:
+        time_filter["$gte"] = since
+    if until is not None:
+        time_filter["$lt"] = until
+
+    timestamps, energy, power = [], [], []
+    cursor = collection.find(
+        {"device_id": device_id, "timestamp": time_filter, "energy": {"$type": "number"}},
+        {"_id": 0, "timestamp": 1, "energy": 1, "power": 1},
+        batch_size=10000
+    ).sort("timestamp", 1)
+    for doc in cursor:
+        timestamps.append(doc["timestamp"])
+        energy.append(doc["energy"])
+        value = doc.get("power")
+        power.append(value if isinstance(value, (int, float)) else 0.0)
+
+    return to_epoch(timestamps), np.asarray(energy, dtype=np.float64), np.asarray(power, dtype=np.float64)
+
+
+def refresh_device(device_id, now=None, max_hours=None):
+    """
+    Roll up the device's closed hours since its watermark
+
+    Args:
+        device_id (str): Device ID
+        now (datetime): current naive UTC time (default: utcnow)
+        max_hours (int): roll up at most this many hours past the watermark
+                         (None: up to the last closed hour)
+
+    Returns:
+        int: number of hourly documents written
+    """
+    now = now or datetime.datetime.utcnow()
+    until = hour_floor(now)
+    states = mongo.get_collection(STATE_COLLECTION)
+    state = states.find_one({"device_id": device_id}) or {}
+    since = state.get("watermark")
+    if since is not None and max_hours:
+        until = min(until, since + datetime.timedelta(hours=max_hours))
+    if since is not None and since >= until:
+        return 0
+
+    epoch, energy, power = load_counter_readings(device_id, since, until)
+    if len(epoch) == 0:
+        states.update_one({"device_id": device_id}, {"$set": {"watermark": until}}, upsert=True)
+        return 0
+
+    totals = hourly_totals(epoch, energy, power, previous=state.get("last_energy"), until=to_epoch([until])[0])
+    operations = hourly_operations(device_id, totals)
+    get_hourly_collection().bulk_write(operations, ordered=False)
+    refresh_daily(device_id, from_epoch(totals["hour"][0]), until)
+
+    # State terakhir: kalau gagal sebelum ini, run berikutnya menulis ulang jam yang sama
+    states.update_one({"device_id": device_id}, {"$set": {
+        "watermark": until,
+        "last_energy": float(energy[-1]),
+        "last_timestamp": from_epoch(epoch[-1]),
+    }}, upsert=True)
+    return len(operations)
+
+
+def catch_up(device_id, now=None):
+    """
+    Bounded refresh for API requests that read the rollups
+
+    The backlog belongs to buildrollups (or retention's purge): a request
+    only rolls up the few hours closed since the last run (CATCH_UP_HOURS),
+    so it never loads a device's whole raw history.
+
+    Returns:
+        datetime: the watermark after the catch-up (rollups are complete before it)
+
+    Raises:
+        RollupsPending: when the device has never been rolled up
+    """
+    state = mongo.get_collection(STATE_COLLECTION).find_one({"device_id": device_id}) or {}
+    if state.get("watermark") is None:
+        raise RollupsPending(f"Rollups for device {device_id} are not built yet. Run `manage.py buildrollups`.")
+    refresh_device(device_id, now, max_hours=CATCH_UP_HOURS)
+    return mongo.get_collection(STATE_COLLECTION).find_one({"device_id": device_id})["watermark"]
+
+
+def open_hour(device_id, now=None):
+    """
+    Energy of the current (not yet rolled up) hour straight from the raw readings
+
+    The state's counter value is the start of the hour only when the
+    watermark is this hour; while the rollups lag behind, the first reading
+    of the hour is the baseline instead, so the lagging hours are not
+    counted into this one.
+
+    Returns:
+        tuple: (hour start datetime, kWh so far)
+    """
+    now = now or datetime.datetime.utcnow()
+    start = hour_floor(now)
+    state = mongo.get_collection(STATE_COLLECTION).find_one({"device_id": device_id}) or {}
+    _, energy, _ = load_counter_readings(device_id, since=start, until=now)
+    previous = state.get("last_energy") if state.get("watermark") == start else None
+    delta, _ = energy_deltas(energy, previous)
+    return start, float(delta.sum())
+
+
+def load_hourly(device_id, since, until=None):
+    """
+    Hourly kWh of a device between since and until, in one query
+
+    Returns:
+        tuple: (hour start epoch seconds, kWh) arrays, oldest first
+    """
+    hour_filter = {"$gte": since}
+    if until is not None:
+        hour_filter["$lt"] = until
+
+    hours, kwh = [], []
+    cursor = get_hourly_collection().find(
+        {"device_id": device_id, "hour": hour_filter},
+        {"_id": 0, "hour": 1, "energy_kwh": 1}
+    ).sort("hour", 1)
+    for doc in cursor:
+        hours.append(doc["hour"])
+        kwh.append(doc["energy_kwh"])
+
+    return to_epoch(hours), np.asarray(kwh, dtype=np.float64)
+
+
+# === Agregat harian (hari lokal) ===
+
+def local_midnight(day):
+    """Naive UTC time of the local midnight starting the date `day`"""
+    midnight = datetime.datetime.combine(day, datetime.time(), tzinfo=ZoneInfo(settings.LOCAL_TIME_ZONE))
+    return midnight.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+
+def local_day_start(ts):
+    """Naive UTC start of the local day containing the naive UTC timestamp ts"""
+    local = ts.replace(tzinfo=datetime.timezone.utc).astimezone(ZoneInfo(settings.LOCAL_TIME_ZONE))
+    return local_midnight(local.date())
+
+
+def daily_document(day_start, hours):
+    """
+    Daily aggregate of one local day from its hourly documents
+
+    Args:
+        day_start (datetime): naive UTC start of the local day
+        hours (list): hourly documents of that day
+
+    Returns:
+        dict: fields of the pzem_daily document (without device_id)
+    """
+    local_day = day_start.replace(tzinfo=datetime.timezone.utc).astimezone(ZoneInfo(settings.LOCAL_TIME_ZONE))
+    hour_n, hour_energy = np.zeros(24, dtype=np.int64), np.zeros(24)
+    hour_power, hour_seconds = np.zeros(24), np.zeros(24)
+    for doc in hours:
+        # Jam ke-berapa sejak tengah malam lokal (hari 23/25 jam tidak ada di Asia/Jakarta)
+        slot = min(int((doc["hour"] - day_start).total_seconds() // HOUR_SECONDS), 23)
+        hour_n[slot] += doc.get("n", 0)
+        hour_energy[slot] += doc.get("energy_kwh", 0.0)
+        # Dokumen lama tanpa power_seconds: bobot satu detik per reading
+        hour_power[slot] += doc.get("power_sum", 0.0)
+        hour_seconds[slot] += doc.get("power_seconds", doc.get("n", 0))
+    return {
+        "day": local_day.date().isoformat(),
+        "start": day_start,
+        "dow": local_day.weekday(),
+        "n": int(hour_n.sum()),
+        "energy_kwh": float(hour_energy.sum()),
+        "power_sum": float(hour_power.sum()),
+        "power_seconds": float(hour_seconds.sum()),
+        "power_max": max((doc.get("power_max", 0.0) for doc in hours), default=0.0),
+        "hour_n": hour_n.tolist(),
+        "hour_energy_kwh": hour_energy.tolist(),
+        "hour_power_sum": hour_power.tolist(),
+        "hour_power_seconds": hour_seconds.tolist(),
+        "power_digest": sketches.merge(doc.get("power_digest") for doc in hours),
+    }
+
+
+def refresh_daily(device_id, since, until):
+    """
+    Rebuild the daily documents of every local day touching [since, until)
+
+    One query for the hourly documents of those days, one bulk write.
+
+    Returns:
+        int: number of daily documents written
+    """
+    first = local_day_start(since)
+    last = local_day_start(until - datetime.timedelta(microseconds=1))
+    days = {}
+    cursor = get_hourly_collection().find(
+        {"device_id": device_id, "hour": {"$gte": first, "$lt": last + datetime.timedelta(days=1)}},
+        {"_id": 0, "hour": 1, "n": 1, "energy_kwh": 1, "power_sum": 1, "power_seconds": 1, "power_max": 1,
+         "power_digest": 1}
+    )
+    for doc in cursor:
+        days.setdefault(local_day_start(doc["hour"]), []).append(doc)
+
+    operations = [
+        UpdateOne(
+            {"device_id": device_id, "start": day_start},
+            {"$set": daily_document(day_start, hours)},
+            upsert=True
+        )
+        for day_start, hours in days.items() if first <= day_start <= last
+    ]
+    if operations:
+        get_daily_collection().bulk_write(operations, ordered=False)
+    return len(operations)
+
+
+def load_daily(device_id, since, until=None):
+    """Daily documents with start in [since, until), oldest first"""
+    start_filter = {"$gte": since}
+    if until is not None:
+        start_filter["$lt"] = until
+    return list(get_daily_collection().find(
+        {"device_id": device_id, "start": start_filter}, {"_id": 0}
+    ).sort("start", 1))
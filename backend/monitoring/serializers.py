@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Device
+from .models import AlertRule, Device
 
 
 class DeviceSerializer(serializers.ModelSerializer):
@@ -39,3 +39,38 @@ class DeviceCreateSerializer(serializers.ModelSerializer):
         user = self.context['request'].user
         validated_data['user'] = user
         return super().create(validated_data)
+
+
+class AlertRuleSerializer(serializers.ModelSerializer):
+    """Serializer for AlertRule model; device is given by its device_id"""
+    device = serializers.SlugRelatedField(slug_field='device_id', queryset=Device.objects.all())
+    device_name = serializers.CharField(source='device.name', read_only=True)
+    
+    class Meta:
+        model = AlertRule
+        fields = (
+            'id',
+            'device',
+            'device_name',
+            'name',
+            'metric',
+            'operator',
+            'threshold',
+            'duration_seconds',
+            'hysteresis',
+            'is_active',
+            'created_at',
+            'updated_at'
+        )
+        read_only_fields = ('id', 'created_at', 'updated_at')
+
+    def validate_device(self, device):
+        # Hanya device milik user sendiri
+        if device.user_id != self.context['request'].user.id:
+            raise serializers.ValidationError("Device not found or you do not have permission to access it")
+        return device
+
+    def validate_hysteresis(self, value):
+        if value < 0:
+            raise serializers.ValidationError("hysteresis must be >= 0")
+        return value
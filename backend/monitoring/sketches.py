@@ -0,0 +1,107 @@
+"""
+Mergeable quantile sketches (t-digest) for stored aggregates.
+
+A digest summarizes a distribution with at most about DELTA + 1 centroids
+(mean, weight), small enough to live inside every hourly and daily rollup
+document. Digests of any set of hours or days are merged by pooling their
+centroids and compressing again, so percentiles over months of readings
+cost a read of a few hundred documents instead of a sort of millions of
+values.
+
+Centroids are clustered with the t-digest arcsine scale function
+k(q) = DELTA / pi * asin(2q - 1): every cluster covers at most one unit of
+k, which keeps clusters tiny near q = 0 and q = 1, so tail quantiles
+(p95, p99) stay accurate while the median region is summarized coarsely.
+Compression is vectorized (one sort, reduceat) instead of the usual
+centroid-by-centroid merge loop.
+
+Documents store a digest as {"mean": [...], "weight": [...], "min", "max"}.
+"""
+import numpy as np
+
+DELTA = 50
+
+
+def compress(means, weights, delta=DELTA):
+    """
+    Cluster centroids (or raw values with weight 1) into a digest
+
+    Returns:
+        tuple: (means, weights) arrays sorted by mean
+    """
+    means = np.asarray(means, dtype=np.float64)
+    weights = np.asarray(weights, dtype=np.float64)
+    if len(means) == 0:
+        return means, weights
+    order = np.argsort(means, kind="stable")
+    means, weights = means[order], weights[order]
+
+    cumulative = np.cumsum(weights)
+    q = (cumulative - weights / 2) / cumulative[-1]
+    cluster = np.floor(delta / np.pi * np.arcsin(np.clip(2 * q - 1, -1, 1)))
+    starts = np.flatnonzero(np.r_[True, cluster[1:] != cluster[:-1]])
+    merged = np.add.reduceat(weights, starts)
+    return np.add.reduceat(means * weights, starts) / merged, merged
+
+
+def from_values(values, weights=None, delta=DELTA):
+    """Digest document of raw values, optionally weighted (NaN ignored); None when there are none"""
+    values = np.asarray(values, dtype=np.float64)
+    weights = np.ones(len(values)) if weights is None else np.asarray(weights, dtype=np.float64)
+    keep = ~np.isnan(values) & (weights > 0)
+    values, weights = values[keep], weights[keep]
+    if len(values) == 0:
+        return None
+    means, weights = compress(values, weights, delta)
+    return to_doc(means, weights, values.min(), values.max())
+
+
+def to_doc(means, weights, minimum, maximum):
+    return {
+        "mean": [round(float(m), 4) for m in means],
+        "weight": [float(w) for w in weights],
+        "min": float(minimum),
+        "max": float(maximum),
+    }
+
+
+def merge(docs, delta=DELTA):
+    """Merge digest documents (None entries skipped); None when all are empty"""
+    docs = [doc for doc in docs if doc and doc.get("weight")]
+    if not docs:
+        return None
+    means, weights = compress(
+        np.concatenate([doc["mean"] for doc in docs]),
+        np.concatenate([doc["weight"] for doc in docs]),
+        delta,
+    )
+    return to_doc(means, weights, min(doc["min"] for doc in docs), max(doc["max"] for doc in docs))
+
+
+def count(doc):
+    return float(np.sum(doc["weight"])) if doc else 0.0
+
+
+def quantiles(doc, qs):
+    """
+    Approximate quantiles of a digest
+
+    Interpolates between centroid centers (cumulative weight at each
+    centroid's middle), anchored at the exact min and max.
+
+    Args:
+        doc (dict): digest document
+        qs (list): quantiles in [0, 1]
+
+    Returns:
+        list: values, or None entries for an empty digest
+    """
+    if not doc or not doc.get("weight"):
+        return [None for _ in qs]
+    means = np.asarray(doc["mean"], dtype=np.float64)
+    weights = np.asarray(doc["weight"], dtype=np.float64)
+    cumulative = np.cumsum(weights)
+    centers = cumulative - weights / 2
+    positions = np.r_[0.0, centers, cumulative[-1]]
+    values = np.r_[doc["min"], means, doc["max"]]
+    return [float(v) for v in np.interp(np.asarray(qs, dtype=np.float64) * cumulative[-1], positions, values)]
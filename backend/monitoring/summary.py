@@ -0,0 +1,337 @@
+"""
+Per-user dashboard summary, maintained at ingest.
+
+One document per user in `dashboard_summary` holds the fleet numbers of
+the dashboard home page, so the endpoint reads a single small document
+however many devices or readings the user has:
+
+    {user_id, day, period,                      <- local date / billing period start
+     energy_today_kwh, energy_period_kwh,
+     period_hour_kwh,                           <- kWh per local hour-of-day (time-of-use cost)
+     load_w, peak_today_w, peak_today_at, peak_period_w, peak_period_at,
+     devices: {<device_id>: {power, energy_last, last_seen,
+                             energy_today_kwh, energy_period_kwh}},
+     updated_at}
+
+SummaryTracker runs in the ingester like the anomaly detector: it keeps the
+documents of active users in memory, folds each reading in (cumulative
+counter deltas with resets handled as in monitoring.rollups) and returns
+one upsert per reading. Load is the sum of the latest power of the devices
+seen within STALE_SECONDS; peaks are the highest fleet load.
+
+A user without a document (new deployment, ingester restarted) is seeded
+from the hourly rollups by build(): energy since the local midnight / period
+start, and each device's counter at the rollup watermark, so the first
+ingested reading adds exactly the consumption since then. Seeded peaks are
+the highest hourly mean fleet load (a lower bound of the real peak).
+"""
+import datetime
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from django.conf import settings
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from . import billing, mongo, rollups
+
+SUMMARY_COLLECTION = "dashboard_summary"
+HOURS = 24
+
+
+def get_summary_collection():
+    return mongo.get_collection(SUMMARY_COLLECTION)
+
+
+def ensure_indexes(collection=None):
+    collection = collection if collection is not None else get_summary_collection()
+    collection.create_index([("user_id", ASCENDING)], unique=True)
+
+
+def load_owners():
+    """device_id -> user_id of active devices, in one query"""
+    from .models import Device
+    return dict(Device.objects.filter(is_active=True).values_list('device_id', 'user_id'))
+
+
+def local_calendar(ts):
+    """
+    Local day, billing period start and hour-of-day of a naive UTC timestamp
+
+    Returns:
+        tuple: (day ISO date, period start ISO date, local hour)
+    """
+    local = ts.replace(tzinfo=datetime.timezone.utc).astimezone(ZoneInfo(settings.LOCAL_TIME_ZONE))
+    period_start, _ = billing.period_bounds(local, settings.BILLING['PERIOD_START_DAY'])
+    return local.date().isoformat(), period_start.date().isoformat(), local.hour
+
+
+def empty_summary(user_id, day, period):
+    return {
+        "user_id": user_id,
+        "day": day,
+        "period": period,
+        "energy_today_kwh": 0.0,
+        "energy_period_kwh": 0.0,
+        "period_hour_kwh": [0.0] * HOURS,
+        "load_w": 0.0,
+        "peak_today_w": 0.0,
+        "peak_today_at": None,
+        "peak_period_w": 0.0,
+        "peak_period_at": None,
+        "devices": {},
+        "updated_at": None,
+    }
+
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def fleet_load(summary, now):
+    """Sum of the latest power of devices seen within STALE_SECONDS"""
+    cutoff = now - datetime.timedelta(seconds=settings.DASHBOARD_SUMMARY['STALE_SECONDS'])
+    return float(sum(
+        device.get("power") or 0.0 for device in summary["devices"].values()
+        if device.get("last_seen") is not None and device["last_seen"] >= cutoff
+    ))
+
+
+# === Seed dari rollup per jam ===
+
+def build(user_id, device_ids, now=None):
+    """
+    Summary of a user's devices from the hourly rollups (two queries)
+
+    Args:
+        user_id (int): owner
+        device_ids (list): the user's devices
+        now (datetime): naive UTC (default: utcnow)
+
+    Returns:
+        dict: summary document (not written)
+    """
+    now = now or datetime.datetime.utcnow()
+    day, period, _ = local_calendar(now)
+    summary = empty_summary(user_id, day, period)
+    zone = ZoneInfo(settings.LOCAL_TIME_ZONE)
+
+    def utc(iso_date):
+        local = datetime.datetime.fromisoformat(iso_date).replace(tzinfo=zone)
+        return local.astimezone(datetime.timezone.utc).replace(tzinfo=None)
+
+    day_start, period_start = utc(day), utc(period)
+    offset = now.replace(tzinfo=datetime.timezone.utc).astimezone(zone).utcoffset().total_seconds()
+    fleet_mean = {}
+    for doc in rollups.get_hourly_collection().find(
+        {"device_id": {"$in": list(device_ids)}, "hour": {"$gte": period_start}},
+        {"_id": 0, "device_id": 1, "hour": 1, "energy_kwh": 1, "power_sum": 1, "power_seconds": 1, "n": 1}
+    ):
+        device = summary["devices"].setdefault(doc["device_id"], {"energy_today_kwh": 0.0, "energy_period_kwh": 0.0})
+        kwh = doc.get("energy_kwh", 0.0)
+        device["energy_period_kwh"] += kwh
+        summary["energy_period_kwh"] += kwh
+        hour = int((rollups.to_epoch([doc["hour"]])[0] + offset) // rollups.HOUR_SECONDS % HOURS)
+        summary["period_hour_kwh"][hour] += kwh
+        if doc["hour"] >= day_start:
+            device["energy_today_kwh"] += kwh
+            summary["energy_today_kwh"] += kwh
+        mean_power = rollups.mean_power(doc)
+        if mean_power is not None:
+            fleet_mean[doc["hour"]] = fleet_mean.get(doc["hour"], 0.0) + mean_power
+
+    for hour, load in fleet_mean.items():
+        if load > summary["peak_period_w"]:
+            summary["peak_period_w"], summary["peak_period_at"] = load, hour
+        if hour >= day_start and load > summary["peak_today_w"]:
+            summary["peak_today_w"], summary["peak_today_at"] = load, hour
+
+    # Counter terakhir di watermark rollup: delta pertama saat ingest tepat
+    for state in mongo.get_collection(rollups.STATE_COLLECTION).find(
+        {"device_id": {"$in": list(device_ids)}}, {"_id": 0, "device_id": 1, "last_energy": 1}
+    ):
+        if state.get("last_energy") is not None:
+            device = summary["devices"].setdefault(state["device_id"], {"energy_today_kwh": 0.0, "energy_period_kwh": 0.0})
+            device["energy_last"] = state["last_energy"]
+    summary["updated_at"] = now
+    return summary
+
+
+def get_or_build(user_id, device_ids, now=None, collection=None):
+    """Stored summary of a user, seeded from rollups (and saved) when missing"""
+    collection = collection if collection is not None else get_summary_collection()
+    summary = collection.find_one({"user_id": user_id}, {"_id": 0})
+    if summary is not None:
+        return summary
+    summary = build(user_id, device_ids, now)
+    try:
+        collection.insert_one(dict(summary))
+    except DuplicateKeyError:
+        # Ingester lebih dulu menulis: pakai versinya
+        return collection.find_one({"user_id": user_id}, {"_id": 0})
+    return summary
+
+
+# === Ingest ===
+
+class SummaryTracker:
+    """
+    Fold readings into per-user summaries
+
+    process() returns the upserts for a reading (at most one); readings of
+    unknown or inactive devices are ignored. The device -> owner map is
+    reloaded every OWNER_REFRESH_SECONDS when an unknown device shows up.
+    """
+
+    def __init__(self, collection, owners=None):
+        self.collection = collection
+        self.owners = owners if owners is not None else load_owners()
+        self.owners_loaded_at = datetime.datetime.utcnow()
+        self.users = {}
+
+    def owner(self, device_id, now):
+        refresh = datetime.timedelta(seconds=settings.DASHBOARD_SUMMARY['OWNER_REFRESH_SECONDS'])
+        if device_id not in self.owners and now - self.owners_loaded_at >= refresh:
+            self.owners = load_owners()
+            self.owners_loaded_at = now
+        return self.owners.get(device_id)
+
+    def summary(self, user_id, now):
+        if user_id not in self.users:
+            device_ids = [device_id for device_id, owner in self.owners.items() if owner == user_id]
+            self.users[user_id] = get_or_build(user_id, device_ids, now, self.collection)
+        return self.users[user_id]
+
+    def process(self, reading):
+        now = reading["timestamp"]
+        device_id = reading["device_id"]
+        user_id = self.owner(device_id, now)
+        if user_id is None:
+            return []
+
+        summary = self.summary(user_id, now)
+        day, period, hour = local_calendar(now)
+        rollover = False
+        if summary["day"] != day:
+            summary.update(day=day, energy_today_kwh=0.0, peak_today_w=0.0, peak_today_at=None)
+            for device in summary["devices"].values():
+                device["energy_today_kwh"] = 0.0
+            rollover = True
+        if summary["period"] != period:
+            summary.update(period=period, energy_period_kwh=0.0, period_hour_kwh=[0.0] * HOURS,
+                           peak_period_w=0.0, peak_period_at=None)
+            for device in summary["devices"].values():
+                device["energy_period_kwh"] = 0.0
+            rollover = True
+
+        device = summary["devices"].setdefault(device_id, {"energy_today_kwh": 0.0, "energy_period_kwh": 0.0})
+        energy = reading.get("energy")
+        if is_number(energy):
+            last = device.get("energy_last")
+            # Counter mundur (reset meter): nilai baru = konsumsi sejak reset
+            delta = 0.0 if last is None else float(energy - last if energy >= last else energy)
+            device["energy_last"] = float(energy)
+            device["energy_today_kwh"] += delta
+            device["energy_period_kwh"] += delta
+            summary["energy_today_kwh"] += delta
+            summary["energy_period_kwh"] += delta
+            summary["period_hour_kwh"][hour] += delta
+        if is_number(reading.get("power")):
+            device["power"] = float(reading["power"])
+        device["last_seen"] = now
+
+        load = fleet_load(summary, now)
+        summary["load_w"] = load
+        if load > summary["peak_today_w"]:
+            summary["peak_today_w"], summary["peak_today_at"] = load, now
+        if load > summary["peak_period_w"]:
+            summary["peak_period_w"], summary["peak_period_at"] = load, now
+        summary["updated_at"] = now
+
+        fields = {key: value for key, value in summary.items() if key not in ("user_id", "devices")}
+        if rollover:
+            fields["devices"] = summary["devices"]
+        else:
+            fields[f"devices.{device_id}"] = device
+        return [UpdateOne({"user_id": user_id}, {"$set": fields}, upsert=True)]
+
+
+# === Keluaran endpoint ===
+
+def period_cost(summary, tariff):
+    """
+    Energy cost of the billing period so far
+
+    Block tiers are applied to each device's period kWh (one meter per
+    device, as in monitoring_billing); time-of-use multipliers weight by the
+    fleet's kWh per local hour-of-day.
+    """
+    knots_kwh, knots_cost = billing.tier_curve(tariff)
+    hour_kwh = np.asarray(summary["period_hour_kwh"], dtype=np.float64)
+    multiplier = billing.tou_multiplier(np.arange(HOURS), tariff)
+    weight = float((hour_kwh * multiplier).sum() / hour_kwh.sum()) if hour_kwh.sum() > 0 else 1.0
+
+    devices = summary["devices"].values()
+    energy_charge = weight * sum(float(np.interp(device.get("energy_period_kwh", 0.0), knots_kwh, knots_cost))
+                                 for device in devices)
+    taxes = settings.BILLING['TAXES']
+    tax_rate = sum(tax['rate'] for tax in taxes)
+    fixed = tariff.get('fixed_monthly', 0) * len(summary["devices"])
+    return {
+        "energy_charge": round(energy_charge, 2),
+        "taxes": [{"name": tax['name'], "rate": tax['rate'], "amount": round(energy_charge * tax['rate'], 2)}
+                  for tax in taxes],
+        "fixed_charge": fixed,
+        "total_cost": round(energy_charge * (1 + tax_rate) + fixed, 2),
+    }
+
+
+def present(summary, names, tariff, now=None):
+    """
+    Endpoint view of a stored summary, restricted to the currently owned devices
+
+    Energy and peaks of a past day or period read as zero; load only counts
+    devices seen within STALE_SECONDS of now.
+    """
+    now = now or datetime.datetime.utcnow()
+    day, period, _ = local_calendar(now)
+    summary = dict(summary, devices={
+        device_id: device for device_id, device in summary["devices"].items() if device_id in names
+    })
+    if summary["period"] != period:
+        summary.update(energy_period_kwh=0.0, period_hour_kwh=[0.0] * HOURS, peak_period_w=0.0, peak_period_at=None,
+                       devices={device_id: dict(device, energy_period_kwh=0.0)
+                                for device_id, device in summary["devices"].items()})
+    if summary["day"] != day:
+        summary.update(energy_today_kwh=0.0, peak_today_w=0.0, peak_today_at=None,
+                       devices={device_id: dict(device, energy_today_kwh=0.0)
+                                for device_id, device in summary["devices"].items()})
+
+    def iso(ts):
+        return ts.isoformat() if isinstance(ts, datetime.datetime) else None
+
+    cutoff = now - datetime.timedelta(seconds=settings.DASHBOARD_SUMMARY['STALE_SECONDS'])
+    return {
+        "day": day,
+        "period_start": period,
+        "energy_today_kwh": round(summary["energy_today_kwh"], 3),
+        "energy_period_kwh": round(summary["energy_period_kwh"], 3),
+        "load_w": round(fleet_load(summary, now), 1),
+        "peak_today": {"power_w": round(summary["peak_today_w"], 1), "at": iso(summary["peak_today_at"])},
+        "peak_period": {"power_w": round(summary["peak_period_w"], 1), "at": iso(summary["peak_period_at"])},
+        "cost_period": period_cost(summary, tariff),
+        "devices_total": len(names),
+        "devices_online": sum(1 for device in summary["devices"].values()
+                              if device.get("last_seen") is not None and device["last_seen"] >= cutoff),
+        "devices": [
+            {
+                "device_id": device_id,
+                "name": name,
+                "power_w": summary["devices"].get(device_id, {}).get("power"),
+                "energy_today_kwh": round(summary["devices"].get(device_id, {}).get("energy_today_kwh", 0.0), 3),
+                "last_seen": iso(summary["devices"].get(device_id, {}).get("last_seen")),
+            }
+            for device_id, name in names.items()
+        ],
+        "updated_at": iso(summary.get("updated_at")),
+    }
@@ -1,3 +1,446 @@
-from django.test import TestCase
+import datetime
+import os
+import tempfile
+import unittest
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from bson import ObjectId
+from django.conf import settings
+from django.core.management import CommandError, call_command
+from django.test import SimpleTestCase, override_settings
+
+from . import archive, backfill, billing, comparison, indexes, mongo, retention, rollups, sketches, summary
+
+try:
+    import mongomock
+    HAS_MONGOMOCK = True
+except ImportError:
+    HAS_MONGOMOCK = False
+
+START = datetime.datetime(2026, 1, 1)
+
+
+def counter_readings(device_id, hours, start=START, minutes=10):
+    """Readings every `minutes` with a steadily rising energy counter"""
+    count = hours * 60 // minutes
+    return [
+        {"device_id": device_id, "timestamp": start + datetime.timedelta(minutes=minutes * i),
+         "energy": round(0.01 * i, 4), "power": 100.0}
+        for i in range(count)
+    ]
+
+
+@unittest.skipUnless(HAS_MONGOMOCK, "mongomock not installed")
+class MongoTestCase(SimpleTestCase):
+    """Runs every test against a fresh in-memory MongoDB (mongomock)"""
+
+    def setUp(self):
+        self.previous_client = mongo._client
+        mongo._client = mongomock.MongoClient()
+        self.readings = mongo.get_collection()
+
+    def tearDown(self):
+        mongo._client = self.previous_client
+
+
+@override_settings(RETENTION={**settings.RETENTION, 'REQUIRE_FEATURES': False, 'BATCH_PAUSE_SECONDS': 0})
+class RetentionTests(MongoTestCase):
+
+    NOW = START + datetime.timedelta(days=120)
+
+    def setUp(self):
+        super().setUp()
+        self.readings.insert_many(counter_readings("dev-1", hours=48))
+        rollups.refresh_device("dev-1", START + datetime.timedelta(days=2))
+
+    def test_complete_rollups_allow_the_purge(self):
+        result = retention.purge(["dev-1"], self.NOW, refresh=False, log=lambda message: None)
+        self.assertEqual(result["raw_deleted"], 288)
+        self.assertEqual(result["skipped"], {})
+        self.assertEqual(self.readings.count_documents({}), 0)
+
+    def test_partly_rolled_up_hour_blocks_the_purge(self):
+        # Reading terlambat untuk jam yang sudah di-rollup: n rollup tidak cocok lagi
+        self.readings.insert_one({"device_id": "dev-1", "timestamp": START + datetime.timedelta(hours=5, minutes=3),
+                                  "energy": 0.305, "power": 100.0})
+
+        plan, = retention.plan_all(["dev-1"], self.NOW)
+        self.assertFalse(plan["complete"])
+        self.assertIn("2026-01-01T05:00:00", plan["reason"])
+
+        result = retention.purge(["dev-1"], self.NOW, refresh=False, log=lambda message: None)
+        self.assertEqual(result["raw_deleted"], 0)
+        self.assertEqual(list(result["skipped"]), ["dev-1"])
+        self.assertEqual(self.readings.count_documents({}), 289)
+
+    def test_nothing_is_purged_past_the_rollup_watermark(self):
+        self.readings.insert_many(counter_readings("dev-1", hours=24, start=START + datetime.timedelta(days=2)))
+        result = retention.purge(["dev-1"], self.NOW, refresh=False, log=lambda message: None)
+        self.assertEqual(result["raw_deleted"], 288)
+        oldest = self.readings.find_one({}, sort=[("timestamp", 1)])["timestamp"]
+        self.assertEqual(oldest, START + datetime.timedelta(days=2))
+
+
+class ArchiveTests(MongoTestCase):
+
+    DAY = START.date()
+
+    def setUp(self):
+        super().setUp()
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        settings_patch = override_settings(ARCHIVE={**settings.ARCHIVE, 'ROOT': root.name})
+        settings_patch.enable()
+        self.addCleanup(settings_patch.disable)
+        self.readings.insert_many(counter_readings("dev-1", hours=24))
+
+    def test_only_exported_ids_are_deleted(self):
+        late = {"device_id": "dev-1", "timestamp": START + datetime.timedelta(hours=12, minutes=5),
+                "energy": 0.725, "power": 100.0}
+        to_table = archive.to_table
+
+        def export_then_insert(docs):
+            # Reading yang masuk setelah export, sebelum delete
+            self.readings.insert_one(dict(late))
+            return to_table(docs)
+
+        with mock.patch.object(archive, "to_table", export_then_insert):
+            result = archive.archive_day("dev-1", self.DAY, self.readings)
+
+        self.assertEqual((result["rows"], result["deleted"]), (144, 144))
+        remaining = list(self.readings.find({}, {"_id": 0}))
+        self.assertEqual(remaining, [late])
+        archived = archive.read_device_docs("dev-1", START, START + datetime.timedelta(days=1))
+        self.assertEqual(len(archived), 144)
+        self.assertNotIn(late["timestamp"], [doc["timestamp"] for doc in archived])
+
+    def test_failed_verification_keeps_the_readings(self):
+        with mock.patch.object(archive, "verify", return_value=False):
+            with self.assertRaises(RuntimeError):
+                archive.archive_day("dev-1", self.DAY, self.readings)
+
+        self.assertEqual(self.readings.count_documents({}), 144)
+        self.assertEqual(os.listdir(archive.day_dir("dev-1", self.DAY)), [])
+
+
+BILLING = {
+    'PERIOD_START_DAY': 1,
+    'PROFILE_DAYS': 14,
+    'TARIFFS': {
+        'blocks': {'blocks': [(30, 169), (60, 360), (None, 495)]},
+        'tou': {'rate': 1000, 'time_of_use': [{'start': 22, 'end': 6, 'multiplier': 0.5}], 'fixed_monthly': 5000},
+    },
+    'TAXES': [{'name': 'PPJ', 'rate': 0.1}, {'name': 'PPN', 'rate': 0.05}],
+}
+
+
+@override_settings(BILLING=BILLING, LOCAL_TIME_ZONE='Asia/Jakarta')
+class BillingTests(MongoTestCase):
+
+    def test_block_tiers_split_hours_at_the_boundaries(self):
+        tariff = BILLING['TARIFFS']['blocks']
+        costs = billing.hourly_costs(np.array([20.0, 20.0, 30.0]), np.array([10, 11, 12]), tariff)
+        np.testing.assert_allclose(costs, [20 * 169, 10 * 169 + 10 * 360, 20 * 360 + 10 * 495])
+        # Lanjut dari kWh yang sudah terpakai di periode
+        np.testing.assert_allclose(billing.hourly_costs(np.array([10.0]), np.array([0]), tariff, consumed_kwh=25),
+                                   [5 * 169 + 5 * 360])
+
+    def test_time_of_use_window_wraps_midnight(self):
+        hours = np.array([21, 22, 23, 3, 5, 6])
+        np.testing.assert_allclose(billing.tou_multiplier(hours, BILLING['TARIFFS']['tou']),
+                                   [1, 0.5, 0.5, 0.5, 0.5, 1])
+
+    def test_period_charges_apply_taxes_and_fixed_charge(self):
+        now = datetime.datetime(2026, 1, 10, 5, 30)   # 12:30 WIB
+        period_start = datetime.datetime(2025, 12, 31, 17)  # 1 Jan 00:00 WIB
+        current_hour = rollups.hour_floor(now)
+        hours = int((current_hour - period_start).total_seconds() // rollups.HOUR_SECONDS)
+        rollups.get_hourly_collection().insert_many([
+            {"device_id": "dev-1", "hour": period_start + datetime.timedelta(hours=h), "energy_kwh": 1.0}
+            for h in range(hours)
+        ])
+        mongo.get_collection(rollups.STATE_COLLECTION).insert_one({"device_id": "dev-1", "watermark": current_hour})
+
+        result = billing.project_period("dev-1", "tou", now)
+
+        # Jam ke-h sejak tengah malam lokal; 22:00-06:00 berharga setengah
+        local_hours = np.arange(hours) % 24
+        energy_charge = float(np.where((local_hours >= 22) | (local_hours < 6), 500, 1000).sum())
+        actual = result["actual"]
+        self.assertEqual(actual["energy_kwh"], hours)
+        self.assertAlmostEqual(actual["energy_charge"], energy_charge, places=2)
+        self.assertEqual([tax["amount"] for tax in actual["taxes"]],
+                         [round(energy_charge * 0.1, 2), round(energy_charge * 0.05, 2)])
+        self.assertAlmostEqual(actual["total_cost"], energy_charge * 1.15 + 5000, places=2)
+        self.assertEqual(result["period"]["start"], "2026-01-01T00:00:00+07:00")
+        self.assertEqual(result["rollups_until"], current_hour.isoformat())
+
+    def test_unknown_meter_type_is_rejected(self):
+        with self.assertRaises(ValueError):
+            billing.get_tariff("100VA")
+
+
+@override_settings(BILLING=BILLING, LOCAL_TIME_ZONE='Asia/Jakarta')
+class SummaryTrackerTests(MongoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.tracker = summary.SummaryTracker(summary.get_summary_collection(), owners={"dev-1": 7, "dev-2": 7})
+
+    def process(self, device_id, timestamp, energy, power=100.0):
+        operations = self.tracker.process({"device_id": device_id, "timestamp": timestamp,
+                                           "energy": energy, "power": power})
+        summary.get_summary_collection().bulk_write(operations)
+        return self.tracker.users[7]
+
+    def test_day_rollover_resets_today_but_not_the_period(self):
+        evening = datetime.datetime(2026, 1, 10, 16, 50)  # 23:50 WIB
+        self.process("dev-1", evening, 10.0)
+        self.process("dev-1", evening + datetime.timedelta(minutes=5), 10.5)
+        state = self.process("dev-2", evening + datetime.timedelta(minutes=6), 3.0, power=300.0)
+        self.assertAlmostEqual(state["energy_today_kwh"], 0.5)
+        self.assertEqual(state["peak_today_w"], 400.0)
+
+        state = self.process("dev-1", evening + datetime.timedelta(minutes=10), 10.8, power=50.0)
+        self.assertEqual(state["day"], "2026-01-11")
+        self.assertAlmostEqual(state["energy_today_kwh"], 0.3)
+        self.assertAlmostEqual(state["devices"]["dev-1"]["energy_today_kwh"], 0.3)
+        self.assertEqual(state["devices"]["dev-2"]["energy_today_kwh"], 0.0)
+        self.assertAlmostEqual(state["energy_period_kwh"], 0.8)
+        self.assertEqual(state["peak_today_w"], 350.0)
+        self.assertEqual(state["peak_period_w"], 400.0)
+
+        stored = summary.get_summary_collection().find_one({"user_id": 7}, {"_id": 0})
+        self.assertEqual(stored["day"], "2026-01-11")
+        self.assertEqual(stored["devices"]["dev-2"]["energy_today_kwh"], 0.0)
+
+    def test_period_rollover_resets_period_energy_and_hour_profile(self):
+        last_day = datetime.datetime(2026, 1, 31, 16, 55)  # 31 Jan 23:55 WIB
+        self.process("dev-1", last_day, 10.0)
+        state = self.process("dev-1", last_day + datetime.timedelta(minutes=2), 11.0)
+        self.assertEqual(state["period_hour_kwh"][23], 1.0)
+
+        state = self.process("dev-1", last_day + datetime.timedelta(minutes=10), 11.2)
+        self.assertEqual(state["period"], "2026-02-01")
+        self.assertAlmostEqual(state["energy_period_kwh"], 0.2)
+        self.assertAlmostEqual(state["period_hour_kwh"][0], 0.2)
+        self.assertEqual(state["period_hour_kwh"][23], 0.0)
+        self.assertEqual(state["peak_period_w"], 100.0)
+
+    def test_counter_reset_counts_the_new_value(self):
+        now = datetime.datetime(2026, 1, 10, 3)
+        self.process("dev-1", now, 10.0)
+        state = self.process("dev-1", now + datetime.timedelta(minutes=1), 0.25)
+        self.assertAlmostEqual(state["energy_today_kwh"], 0.25)
+
+
+class SketchTests(SimpleTestCase):
+
+    def test_merged_digest_tail_quantiles_stay_within_bounds(self):
+        values = np.random.default_rng(3).lognormal(5, 0.8, 100000)
+        # Seperti rollup: digest per jam, digabung per hari, lalu per rentang
+        hours = [sketches.from_values(part) for part in np.array_split(values, 24 * 30)]
+        days = [sketches.merge(hours[i:i + 24]) for i in range(0, len(hours), 24)]
+        digest = sketches.merge(days + [None])
+
+        self.assertLessEqual(len(digest["mean"]), sketches.DELTA + 1)
+        self.assertEqual(sketches.count(digest), len(values))
+        self.assertEqual((digest["min"], digest["max"]), (values.min(), values.max()))
+        for q, bound in ((0.5, 0.01), (0.95, 0.005), (0.99, 0.002)):
+            estimate, = sketches.quantiles(digest, [q])
+            self.assertLessEqual(abs((values <= estimate).mean() - q), bound, f"p{round(q * 100)}")
+
+    def test_weights_are_time_weights(self):
+        # Satu jam 100 W, lonjakan 2000 W selama 10 detik: median tetap 100 W
+        digest = sketches.from_values([100.0, 2000.0], weights=[3590.0, 10.0])
+        self.assertAlmostEqual(sketches.quantiles(digest, [0.5])[0], 100.0, delta=10)
+        self.assertEqual(sketches.count(digest), 3600.0)
+        self.assertIsNone(sketches.from_values([np.nan]))
+        self.assertEqual(sketches.quantiles(None, [0.5, 0.99]), [None, None])
+
+
+@override_settings(BACKFILL={**settings.BACKFILL, 'CHUNK_HOURS': 24, 'BATCH_SIZE': 10})
+class BackfillTests(MongoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # Reading lama tanpa device_id, satu per jam selama tiga hari
+        self.readings.insert_many([
+            {"_id": ObjectId.from_datetime(START + datetime.timedelta(hours=h)), "power": 100.0}
+            for h in range(72)
+        ])
+        self.migration = backfill.get_migration("device_id", {"device_id": "dev-1"})
+        self.states = backfill.get_state_collection()
+
+    def test_plan_is_kept_on_a_rerun(self):
+        header = backfill.plan(self.migration)
+        self.assertEqual(header["chunks"], 3)
+        self.assertEqual(backfill.plan(self.migration, chunk_hours=1)["chunks"], 3)
+        self.assertEqual(backfill.plan(self.migration, chunk_hours=12, restart=True)["chunks"], 6)
+
+    def test_crashed_worker_chunk_is_resumed_after_its_lease(self):
+        backfill.plan(self.migration)
+        # Worker mati setelah mengambil chunk pertama: lease masih berlaku
+        dead = backfill.claim(self.states, "device_id", "dead-worker")
+        self.assertEqual(dead["index"], 0)
+
+        result = backfill.run("device_id", workers=1)
+        self.assertEqual(result["chunks"], 2)
+        self.assertEqual((result["status"]["done"], result["status"]["running"]), (2, 1))
+        self.assertEqual(self.readings.count_documents({"device_id": {"$exists": False}}), 24)
+
+        self.states.update_one({"_id": dead["_id"]}, {"$set": {"lease_until": backfill.EPOCH}})
+        result = backfill.run("device_id", workers=1)
+        self.assertEqual(result["chunks"], 1)
+        self.assertEqual(result["status"]["done"], 3)
+        self.assertEqual(self.states.find_one({"_id": dead["_id"]})["attempts"], 2)
+        self.assertEqual(self.readings.count_documents({"device_id": "dev-1"}), 72)
+
+    def test_failed_chunk_is_retried_on_request(self):
+        backfill.plan(self.migration)
+        with mock.patch.object(backfill.DeviceIdFix, "operations", side_effect=RuntimeError("boom")):
+            result = backfill.run("device_id", workers=1)
+        self.assertEqual(result["failed"], 3)
+        self.assertEqual(result["status"]["errors"][0]["error"], "boom")
+
+        self.assertEqual(backfill.run("device_id", workers=1)["chunks"], 0)
+        result = backfill.run("device_id", workers=1, retry_failed=True)
+        self.assertEqual(result["status"]["done"], 3)
+
+
+@override_settings(ARCHIVE={**settings.ARCHIVE, 'ENABLED': False})
+class ComparisonTests(MongoTestCase):
+
+    def setUp(self):
+        super().setUp()
+        minute = datetime.timedelta(minutes=1)
+        # dev-1 tiap menit selama satu jam, dev-2 hanya di kuartal kedua
+        self.readings.insert_many(
+            [{"device_id": "dev-1", "timestamp": START + i * minute, "power": float(i)} for i in range(60)]
+            + [{"device_id": "dev-2", "timestamp": START + i * minute, "power": 500.0} for i in range(15, 30)]
+        )
+
+    def test_devices_share_one_time_axis(self):
+        result = comparison.compare(["dev-1", "dev-2"], "power", START + datetime.timedelta(minutes=5),
+                                    START + datetime.timedelta(hours=1), interval=900)
+        self.assertEqual(result["start"], START)
+        self.assertEqual(len(result["timestamps"]), 4)
+        dev1, dev2 = result["series"]
+        self.assertEqual(dev1["values"], [7.0, 22.0, 37.0, 52.0])
+        self.assertEqual(dev1["count"], 60)
+        self.assertEqual(dev2["values"], [None, 500.0, None, None])
+
+    def test_max_and_gap_fill(self):
+        result = comparison.compare(["dev-2"], "power", START, START + datetime.timedelta(hours=1),
+                                    interval=900, agg="max", gap_fill="ffill")
+        self.assertEqual(result["series"][0]["values"], [None, 500.0, 500.0, 500.0])
+
+    def test_energy_comes_from_the_hourly_rollups(self):
+        rollups.get_hourly_collection().insert_many([
+            {"device_id": "dev-1", "hour": START + datetime.timedelta(hours=h), "energy_kwh": 0.5, "n": 60}
+            for h in range(4)
+        ])
+        result = comparison.compare(["dev-1"], "energy", START, START + datetime.timedelta(hours=4), interval=7200)
+        self.assertEqual(result["source"], "rollups")
+        self.assertEqual(result["series"][0]["values"], [1.0, 1.0])
+        self.assertEqual(result["series"][0]["count"], 240)
+
+
+def explain_output(plan):
+    return {"queryPlanner": {"winningPlan": plan}}
+
+
+class IndexTests(MongoTestCase):
+
+    def test_missing_indexes_are_created_once(self):
+        # Index lama dengan arah terbalik melayani query yang sama
+        self.readings.create_index([("device_id", -1), ("timestamp", 1)])
+
+        results = indexes.ensure()
+        declared = sum(len(specs) for specs in indexes.declared_indexes().values())
+        self.assertEqual(len(results), declared)
+        existing = [result for result in results if result["status"] == "exists"]
+        self.assertEqual([result["name"] for result in existing], ["device_id_-1_timestamp_1"])
+        self.assertTrue(all(result["status"] in ("created", "exists") for result in results))
+        self.assertIn("device_id_1_hour_1", rollups.get_hourly_collection().index_information())
+
+        self.assertEqual({result["status"] for result in indexes.ensure()}, {"exists"})
+
+    def test_plan_check_reports_index_use_and_collection_scans(self):
+        query = {"name": "latest", "collection": mongo.READINGS_COLLECTION,
+                 "filter": {"device_id": "dev-1"}, "sort": [("timestamp", -1)], "limit": 1}
+        db = mock.MagicMock()
+        cursor = db[mongo.READINGS_COLLECTION].find.return_value.sort.return_value.limit.return_value
+        cursor.explain.return_value = explain_output({"stage": "LIMIT", "inputStage": {
+            "stage": "FETCH", "inputStage": {"stage": "IXSCAN", "indexName": "device_id_1_timestamp_-1"}}})
+
+        plan = indexes.explain(query, db)
+        self.assertEqual(plan["stages"], ["LIMIT", "FETCH", "IXSCAN"])
+        self.assertEqual(plan["indexes"], ["device_id_1_timestamp_-1"])
+        self.assertFalse(plan["collscan"] or plan["in_memory_sort"])
+
+        cursor.explain.return_value = explain_output({"stage": "SORT", "inputStage": {"stage": "COLLSCAN"}})
+        plan = indexes.explain(query, db)
+        self.assertTrue(plan["collscan"] and plan["in_memory_sort"])
+
+    def test_command_fails_on_collection_scans(self):
+        scan = {"name": "latest", "collection": mongo.READINGS_COLLECTION, "stages": ["COLLSCAN"],
+                "indexes": [], "collscan": True, "in_memory_sort": False}
+        with mock.patch("builtins.print"):
+            call_command("ensureindexes", "--no-explain")
+            with mock.patch.object(indexes, "explain_all", return_value=[scan]):
+                with self.assertRaisesMessage(CommandError, "collection scans in: latest"):
+                    call_command("ensureindexes", "--device", "dev-1")
+            with mock.patch.object(indexes, "explain_all", return_value=[dict(scan, collscan=False)]):
+                call_command("ensureindexes", "--device", "dev-1")
+
+
+class PopulateDummyTests(MongoTestCase):
+    """populate_dummy.py generator (the script at the backend root)"""
+
+    OPTIONS = {"start": START, "days": 2, "interval": 600, "utc_offset": datetime.timedelta(hours=7),
+               "reset_probability": 0.0, "drop_rate": 0.0, "batch_size": 100, "seed": 1}
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        import populate_dummy
+        cls.populate = populate_dummy
+
+    def test_device_history_has_requested_rows_and_cadence(self):
+        device_id, rows = self.populate.generate_device((0, "dev-1", self.OPTIONS))
+
+        self.assertEqual((device_id, rows), ("dev-1", 288))
+        docs = list(self.readings.find({"device_id": "dev-1"}).sort("timestamp", 1))
+        self.assertEqual(len(docs), 288)
+        self.assertEqual(docs[0]["timestamp"], START)
+        self.assertEqual({(b["timestamp"] - a["timestamp"]).total_seconds() for a, b in zip(docs, docs[1:])}, {600})
+        # Tanpa reset counter naik terus, juga melewati batas hari
+        energy = np.array([doc["energy"] for doc in docs])
+        self.assertTrue((np.diff(energy) >= 0).all())
+        self.assertGreater(energy[-1], energy[0])
+
+        # Run ulang mengganti histori, tidak menambah
+        self.populate.generate_device((0, "dev-1", self.OPTIONS))
+        self.assertEqual(self.readings.count_documents({"device_id": "dev-1"}), 288)
+
+    def test_counter_reset_restarts_from_zero(self):
+        household = self.populate.Household(np.random.default_rng(0))
+        readings, energy_end = self.populate.device_day(np.random.default_rng(0), household, START, 60,
+                                                        datetime.timedelta(hours=7), 5000.0, 1.0, 0.0)
+
+        self.assertEqual(len(readings), 1440)
+        energy = np.array([reading["energy"] for reading in readings])
+        drops = np.flatnonzero(np.diff(energy) < 0)
+        self.assertEqual(len(drops), 1)
+        self.assertLess(energy[drops[0] + 1], 1.0)
+        self.assertTrue((np.diff(energy[drops[0] + 1:]) >= 0).all())
+        self.assertAlmostEqual(energy_end, energy[-1], places=3)
+
+    def test_drop_rate_skips_readings(self):
+        household = self.populate.Household(np.random.default_rng(0))
+        readings, _ = self.populate.device_day(np.random.default_rng(0), household, START, 60,
+                                               datetime.timedelta(hours=7), 0.0, 0.0, 0.1)
+        self.assertLess(len(readings), 1440)
+        self.assertGreater(len(readings), 1200)
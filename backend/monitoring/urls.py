@@ -1,14 +1,25 @@
 from django.urls import path
 from . import views
 from . import device_views
+from . import alert_views
 
 urlpatterns = [
     # Monitoring endpoints
     path('', views.monitoring_home, name='monitoring_home'),
     path('api/', views.monitoring_api, name='monitoring_api'),
     path('history/', views.monitoring_history, name='monitoring_history'),
+    path('compare/', views.monitoring_compare, name='monitoring_compare'),
+    path('summary/', views.monitoring_summary, name='monitoring_summary'),
+    path('heatmap/', views.monitoring_heatmap, name='monitoring_heatmap'),
+    path('billing/', views.monitoring_billing, name='monitoring_billing'),
+    path('anomalies/', views.monitoring_anomalies, name='monitoring_anomalies'),
     
     # Device management endpoints
     path('devices/', device_views.device_list_create, name='device_list_create'),
     path('devices/<str:device_id>/', device_views.device_detail, name='device_detail'),
+    
+    # Alert rules & fired alerts
+    path('alerts/', alert_views.alert_list, name='alert_list'),
+    path('alerts/rules/', alert_views.alert_rule_list_create, name='alert_rule_list_create'),
+    path('alerts/rules/<int:rule_id>/', alert_views.alert_rule_detail, name='alert_rule_detail'),
 ]
@@ -1,15 +1,36 @@
 from django.http import JsonResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from pymongo import MongoClient
 import datetime
+import numpy as np
+from django.conf import settings
 from .models import Device
+from mqtt_app import compression
+from mqtt_app.anomaly import ANOMALY_COLLECTION
+from . import archive
+from . import billing
+from . import comparison
+from . import mongo
+from . import profiles
+from . import resampling
+from . import rollups
+from . import summary
+
+MAX_FILL_POINTS = 50000
+RESAMPLE_FIELDS = ["voltage", "current", "power", "energy", "frequency", "pf"]
+
 
 def get_db_collection():
     """Helper to get MongoDB collection"""
-    client = MongoClient("mongodb://localhost:27017/")
-    db = client["iot_db"]
-    return db["pzem_data1"]
+    return mongo.get_collection()
+
+def rollups_pending_response(device_id, error):
+    """202 for a device whose rollups are not built yet (buildrollups has not run for it)"""
+    return JsonResponse({
+        "device_id": device_id,
+        "status": "rollups_pending",
+        "message": str(error)
+    }, status=202)
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
@@ -85,6 +106,17 @@ def monitoring_history(request):
     Query Parameters:
         device_id (required): Device ID to get data for
         range (optional): Time range - '1h', '6h', '24h', '7d' (default: '1h')
+        start, end (optional): ISO datetimes, override range ([start, end))
+        fill (optional): seconds; return a regular series reconstructed from
+            the stored readings (for ingest compression, COMPRESSION['MODE'])
+        resample (optional): bucket interval ('30s', '15m', '1h' or seconds);
+            return one aggregated row per bucket with gap flags
+        agg (optional): with resample - mean, min, max, sum, count, first, last (default: mean)
+        gap_fill (optional): with resample - ffill, linear, null (default: ffill)
+        max_gap (optional): with resample - only fill gaps of at most this many buckets
+    
+    Readings already moved to the Parquet archive are read from there and
+    returned before the MongoDB ones (marked "source": "archive").
     """
     try:
         device_id = request.GET.get('device_id')
@@ -118,30 +150,423 @@ def monitoring_history(request):
             delta = datetime.timedelta(hours=1)
             
         start_time = now - delta
+        end_time = None
+        try:
+            if request.GET.get('start'):
+                start_time = datetime.datetime.fromisoformat(request.GET['start'])
+            if request.GET.get('end'):
+                end_time = datetime.datetime.fromisoformat(request.GET['end'])
+        except ValueError:
+            return JsonResponse({
+                "error": "start and end must be ISO datetimes"
+            }, status=400)
+        
+        fill = None
+        if request.GET.get('fill'):
+            try:
+                fill = float(request.GET['fill'])
+            except ValueError:
+                fill = 0
+            if fill <= 0 or ((end_time or now) - start_time).total_seconds() / fill > MAX_FILL_POINTS:
+                return JsonResponse({
+                    "error": f"fill must be a positive number of seconds giving at most {MAX_FILL_POINTS} points"
+                }, status=400)
         
+        resample = None
+        if request.GET.get('resample'):
+            try:
+                resample = resampling.parse_interval(request.GET['resample'])
+                max_gap = int(request.GET['max_gap']) if request.GET.get('max_gap') else None
+            except ValueError:
+                resample = 0
+            agg = request.GET.get('agg', 'mean')
+            gap_fill = request.GET.get('gap_fill', 'ffill')
+            if (fill or not resample or ((end_time or now) - start_time).total_seconds() / resample > MAX_FILL_POINTS
+                    or agg not in resampling.AGGREGATIONS or gap_fill not in resampling.FILLS):
+                return JsonResponse({
+                    "error": f"resample must be an interval giving at most {MAX_FILL_POINTS} buckets (not combined "
+                             f"with fill), agg one of {', '.join(resampling.AGGREGATIONS)}, gap_fill one of "
+                             f"{', '.join(resampling.FILLS)}, max_gap a number of buckets"
+                }, status=400)
+        
+        time_filter = {"$gte": start_time}
+        if end_time is not None:
+            time_filter["$lt"] = end_time
         cursor = collection.find({
             "device_id": device_id,
-            "timestamp": {"$gte": start_time}
-        }).sort("timestamp", 1)
+            "timestamp": time_filter
+        }, {"_id": 0, "timestamp": 1, **{field: 1 for field in RESAMPLE_FIELDS}} if resample else None).sort("timestamp", 1)
+        
+        # Data lama dari arsip Parquet dulu, lalu data hot dari MongoDB
+        archived = archive.read_device_docs(device_id, start_time, end_time) if settings.ARCHIVE['ENABLED'] else []
         
-        history_data = []
+        # Resample langsung ke array NumPy, tanpa dict per reading
+        if resample:
+            archived_epoch, archived_values = resampling.cursor_arrays(archived, RESAMPLE_FIELDS)
+            epoch, values = resampling.cursor_arrays(cursor, RESAMPLE_FIELDS)
+            epoch = np.concatenate([archived_epoch, epoch])
+            values = np.concatenate([archived_values, values])
+            result = resampling.resample(
+                epoch, values, resample,
+                start=resampling.to_epoch([start_time])[0], end=resampling.to_epoch([end_time or now])[0],
+                agg=agg, fill_policy=gap_fill, max_gap=max_gap,
+            )
+            history_data = resampling.to_rows(result, RESAMPLE_FIELDS)
+            gaps = resampling.gap_list(result, resample)
+            for item in history_data + gaps:
+                for key in ("timestamp", "start", "end"):
+                    if key in item:
+                        item[key] = item[key].isoformat()
+            return JsonResponse({
+                "device_id": device_id,
+                "device_name": device.name,
+                "range": time_range,
+                "resample": resample,
+                "agg": agg,
+                "gap_fill": gap_fill,
+                "count": len(history_data),
+                "stored_count": len(epoch),
+                "archived_count": len(archived_epoch),
+                "gaps": gaps,
+                "data": history_data
+            })
+        
+        history_data = list(archived)
         for doc in cursor:
             doc.pop('_id', None)
+            history_data.append(doc)
+        stored_count = len(history_data)
+        
+        # Rekonstruksi deret reguler dari reading yang tersimpan (terkompresi)
+        if fill:
+            history_data = compression.reconstruct(
+                [doc for doc in history_data if isinstance(doc.get('timestamp'), datetime.datetime)],
+                fill, until=end_time or now
+            )
+        
+        for doc in history_data:
             ts = doc.get('timestamp')
             if isinstance(ts, datetime.datetime):
                 doc['timestamp'] = ts.isoformat()
-            history_data.append(doc)
             
         return JsonResponse({
             "device_id": device_id,
             "device_name": device.name,
             "range": time_range,
             "count": len(history_data),
+            "stored_count": stored_count,
+            "archived_count": len(archived),
             "data": history_data
         })
     except Exception as e:
         return JsonResponse({"error": str(e)}, status=500)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def monitoring_billing(request):
+    """
+    Actual and projected energy cost of the running billing period
+    
+    Computed from hourly energy rollups (cumulative counter deltas, resets
+    handled) with the tariff table in settings.BILLING.
+    
+    Query Parameters:
+        device_id (required): Device ID
+        meter_type (optional): key of settings.BILLING['TARIFFS'] (default: '900VA')
+    """
+    try:
+        device_id = request.GET.get('device_id')
+        
+        if not device_id:
+            return JsonResponse({
+                "error": "device_id parameter is required"
+            }, status=400)
+        
+        # Validate device ownership
+        try:
+            device = Device.objects.get(device_id=device_id, user=request.user)
+        except Device.DoesNotExist:
+            return JsonResponse({
+                "error": "Device not found or you do not have permission to access it"
+            }, status=403)
+        
+        meter_type = request.GET.get('meter_type', '900VA').upper()
+        try:
+            result = billing.project_period(device_id, meter_type)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        except rollups.RollupsPending as e:
+            return rollups_pending_response(device_id, e)
+        
+        return JsonResponse({
+            "device_id": device_id,
+            "device_name": device.name,
+            "meter_type": meter_type,
+            **result
+        })
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def monitoring_compare(request):
+    """
+    Several devices on a shared time axis, in one round trip
+    
+    Query Parameters:
+        device_ids (required): comma separated Device IDs (or repeated device_id)
+        metric (optional): power, voltage, current, pf, frequency or energy (kWh, default: power)
+        range (optional): '1h', '6h', '24h', '7d', '30d' (default: '24h')
+        start, end (optional): naive UTC ISO datetimes, override range ([start, end))
+        resolution (optional): bucket width, '15m', '1h' or seconds (default: 15m; energy: whole hours)
+        agg (optional): mean, min, max per bucket (default: mean)
+        gap_fill (optional): ffill, linear, null (default: null)
+    """
+    try:
+        device_ids = [
+            device_id.strip()
+            for value in request.GET.getlist('device_ids') + request.GET.getlist('device_id')
+            for device_id in value.split(',') if device_id.strip()
+        ]
+        device_ids = list(dict.fromkeys(device_ids))
+        if not device_ids or len(device_ids) > comparison.MAX_DEVICES:
+            return JsonResponse({
+                "error": f"device_ids must list 1 to {comparison.MAX_DEVICES} devices"
+            }, status=400)
+        
+        # Validasi kepemilikan semua device dalam satu query
+        names = dict(Device.objects.filter(
+            device_id__in=device_ids, user=request.user
+        ).values_list('device_id', 'name'))
+        missing = [device_id for device_id in device_ids if device_id not in names]
+        if missing:
+            return JsonResponse({
+                "error": "Device not found or you do not have permission to access it",
+                "device_ids": missing
+            }, status=403)
+        
+        metric = request.GET.get('metric', 'power')
+        agg = request.GET.get('agg', 'mean')
+        gap_fill = request.GET.get('gap_fill', 'null')
+        if metric not in comparison.METRICS or agg not in comparison.AGGREGATIONS or gap_fill not in resampling.FILLS:
+            return JsonResponse({
+                "error": f"metric must be one of {', '.join(comparison.METRICS)}, agg one of "
+                         f"{', '.join(comparison.AGGREGATIONS)}, gap_fill one of {', '.join(resampling.FILLS)}"
+            }, status=400)
+        
+        ranges = {
+            '1h': datetime.timedelta(hours=1),
+            '6h': datetime.timedelta(hours=6),
+            '24h': datetime.timedelta(days=1),
+            '7d': datetime.timedelta(days=7),
+            '30d': datetime.timedelta(days=30),
+        }
+        time_range = request.GET.get('range', '24h')
+        end_time = datetime.datetime.utcnow()
+        try:
+            if request.GET.get('end'):
+                end_time = datetime.datetime.fromisoformat(request.GET['end'])
+            start_time = end_time - ranges.get(time_range, ranges['24h'])
+            if request.GET.get('start'):
+                start_time = datetime.datetime.fromisoformat(request.GET['start'])
+            resolution = resampling.parse_interval(request.GET.get('resolution', '15m'))
+        except ValueError:
+            return JsonResponse({
+                "error": "start and end must be ISO datetimes, resolution an interval like 15m"
+            }, status=400)
+        
+        points = (end_time - start_time).total_seconds() / resolution
+        if not 0 < points <= comparison.MAX_POINTS or (metric == 'energy' and resolution % 3600):
+            return JsonResponse({
+                "error": f"the range must give 1 to {comparison.MAX_POINTS} buckets per device "
+                         f"(energy needs a resolution in whole hours)"
+            }, status=400)
+        
+        result = comparison.compare(device_ids, metric, start_time, end_time, resolution, agg, gap_fill)
+        for series in result['series']:
+            series['name'] = names[series['device_id']]
+        
+        return JsonResponse({
+            "metric": metric,
+            "agg": agg,
+            "range": time_range,
+            "resolution": resolution,
+            "source": result['source'],
+            "start": result['start'].isoformat(),
+            "end": result['end'].isoformat(),
+            "timestamps": [ts.isoformat() for ts in result['timestamps']],
+            "series": result['series']
+        })
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def monitoring_summary(request):
+    """
+    Fleet summary of the user's devices for the dashboard home page
+    
+    Served from one precomputed document (maintained by the ingester, see
+    monitoring/summary.py), whatever the number of devices or readings.
+    
+    Query Parameters:
+        meter_type (optional): key of settings.BILLING['TARIFFS'] for the cost
+            (default: DASHBOARD_SUMMARY['METER_TYPE'])
+    """
+    try:
+        meter_type = request.GET.get('meter_type', settings.DASHBOARD_SUMMARY['METER_TYPE']).upper()
+        try:
+            tariff = billing.get_tariff(meter_type)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+        
+        names = dict(Device.objects.filter(user=request.user).values_list('device_id', 'name'))
+        current = summary.get_or_build(request.user.id, list(names))
+        
+        return JsonResponse({
+            "meter_type": meter_type,
+            **summary.present(current, names, tariff)
+        })
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def monitoring_heatmap(request):
+    """
+    Load profile of a device: hour-of-week heatmap and power percentiles
+    
+    Read from the daily rollups (merged t-digests, see monitoring/profiles.py),
+    one small document per day of the range. Rollups are built by
+    buildrollups; the request only catches up the last few closed hours and
+    answers 202 "rollups_pending" for a device that was never rolled up.
+    
+    Query Parameters:
+        device_id (required): Device ID
+        range (optional): '7d', '30d', '90d', '365d' (default: '30d'), whole local days up to today
+        start, end (optional): local ISO dates, override range ([start, end))
+    """
+    try:
+        device_id = request.GET.get('device_id')
+        
+        if not device_id:
+            return JsonResponse({
+                "error": "device_id parameter is required"
+            }, status=400)
+        
+        # Validate device ownership
+        try:
+            device = Device.objects.get(device_id=device_id, user=request.user)
+        except Device.DoesNotExist:
+            return JsonResponse({
+                "error": "Device not found or you do not have permission to access it"
+            }, status=403)
+        
+        ranges = {'7d': 7, '30d': 30, '90d': 90, '365d': 365}
+        time_range = request.GET.get('range', '30d')
+        now = datetime.datetime.utcnow()
+        today = rollups.local_day_start(now)
+        until = today + datetime.timedelta(days=1)
+        since = until - datetime.timedelta(days=ranges.get(time_range, 30))
+        try:
+            # Tanggal lokal -> awal hari lokal dalam UTC
+            if request.GET.get('start'):
+                since = rollups.local_midnight(datetime.date.fromisoformat(request.GET['start']))
+            if request.GET.get('end'):
+                until = rollups.local_midnight(datetime.date.fromisoformat(request.GET['end']))
+        except ValueError:
+            return JsonResponse({
+                "error": "start and end must be ISO dates"
+            }, status=400)
+        
+        try:
+            rollups_until = rollups.catch_up(device_id, now)
+        except rollups.RollupsPending as e:
+            return rollups_pending_response(device_id, e)
+        result = profiles.load_profile(rollups.load_daily(device_id, since, until))
+        
+        return JsonResponse({
+            "device_id": device_id,
+            "device_name": device.name,
+            "range": time_range,
+            "start": since.isoformat(),
+            "end": until.isoformat(),
+            "rollups_until": rollups_until.isoformat(),
+            **result
+        })
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def monitoring_anomalies(request):
+    """
+    Anomaly events flagged by the ingest-side detector (mqtt_app/anomaly.py)
+    
+    Query Parameters:
+        device_id (optional): Device ID; default: every device of the user
+        range (optional): '1h', '6h', '24h', '7d', '30d' (default: '24h')
+        metric (optional): voltage | current | pf | power
+        open (optional): 'true' for events that are still ongoing only
+        limit (optional): max events, newest first (default: 100, max: 1000)
+    """
+    try:
+        device_id = request.GET.get('device_id')
+        devices = Device.objects.filter(user=request.user)
+        if device_id:
+            devices = devices.filter(device_id=device_id)
+        device_names = dict(devices.values_list('device_id', 'name'))
+        
+        if device_id and not device_names:
+            return JsonResponse({
+                "error": "Device not found or you do not have permission to access it"
+            }, status=403)
+        
+        ranges = {
+            '1h': datetime.timedelta(hours=1),
+            '6h': datetime.timedelta(hours=6),
+            '24h': datetime.timedelta(days=1),
+            '7d': datetime.timedelta(days=7),
+            '30d': datetime.timedelta(days=30),
+        }
+        time_range = request.GET.get('range', '24h')
+        if time_range not in ranges:
+            return JsonResponse({"error": f"Invalid range. Valid options: {list(ranges)}"}, status=400)
+        try:
+            limit = min(max(int(request.GET.get('limit', 100)), 1), 1000)
+        except ValueError:
+            return JsonResponse({"error": "limit must be an integer"}, status=400)
+        
+        # Timestamp reading disimpan dalam UTC (runmqtt)
+        query = {
+            "device_id": {"$in": list(device_names)},
+            "started_at": {"$gte": datetime.datetime.utcnow() - ranges[time_range]},
+        }
+        metric = request.GET.get('metric')
+        if metric:
+            query["metric"] = metric
+        if request.GET.get('open', '').lower() == 'true':
+            query["open"] = True
+        
+        events = []
+        cursor = mongo.get_collection(ANOMALY_COLLECTION).find(query).sort("started_at", -1).limit(limit)
+        for doc in cursor:
+            doc["id"] = str(doc.pop("_id"))
+            doc["device_name"] = device_names.get(doc["device_id"])
+            for field in ("started_at", "ended_at"):
+                if isinstance(doc.get(field), datetime.datetime):
+                    doc[field] = doc[field].isoformat()
+            events.append(doc)
+        
+        return JsonResponse({
+            "device_id": device_id,
+            "range": time_range,
+            "count": len(events),
+            "anomalies": events
+        })
+    except Exception as e:
+        return JsonResponse({"error": str(e)}, status=500)
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def monitoring_home(request):
@@ -149,7 +574,14 @@ def monitoring_home(request):
         "message": "Power Monitoring API",
         "endpoints": {
             "/monitoring/api/": "Latest real-time data (requires device_id parameter)",
-            "/monitoring/history/": "Historical data with ?device_id=<id>&range=1h|6h|24h|7d",
+            "/monitoring/history/": "Historical data with ?device_id=<id>&range=1h|6h|24h|7d (or &start=&end= ISO), archived readings included, &fill=<seconds> reconstructs a regular series, &resample=15m&agg=mean&gap_fill=ffill|linear|null buckets it with gap flags",
+            "/monitoring/compare/": "Several devices on one time axis, columnar, with ?device_ids=<id>,<id>&metric=power|energy|...&range=24h&resolution=15m&agg=mean",
+            "/monitoring/summary/": "Dashboard fleet summary: energy today, current load, peaks, cost this period (?meter_type=900VA)",
+            "/monitoring/heatmap/": "Hour-of-week load heatmap and p50/p95/p99 power with ?device_id=<id>&range=7d|30d|90d|365d (or &start=&end= local dates)",
+            "/monitoring/billing/": "Billing period cost, actual and projected, with ?device_id=<id>&meter_type=900VA",
+            "/monitoring/anomalies/": "Detected anomaly events with ?device_id=<id>&range=24h&metric=voltage&open=true",
+            "/monitoring/alerts/": "Fired alerts with ?device_id=<id>&status=firing&range=7d",
+            "/monitoring/alerts/rules/": "Alert rules (list/create), e.g. power gt 2000 for 300 s",
             "/monitoring/devices/": "Device management (list/create)",
             "/monitoring/devices/<device_id>/": "Device detail (get/update/delete)"
         }
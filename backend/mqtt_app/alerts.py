@@ -0,0 +1,224 @@
+"""
+Alert-rule engine for the MQTT ingester.
+
+User rules (monitoring.models.AlertRule, e.g. "power > 2000 W for 5
+minutes") are compiled into an in-memory index keyed by device_id, so a
+reading only visits the rules of its own device: evaluation is
+O(rules for that device) no matter how many rules exist in total.
+
+Each rule has a small state machine:
+
+    ok        condition false
+    pending   condition true since `since`, waiting for duration_seconds
+    firing    alert written to `pzem_alerts`; resolves once the value has
+              recovered past the threshold by `hysteresis` (so a value
+              hovering around the threshold does not flap)
+
+Alerts in `pzem_alerts`:
+
+    {rule_id, device_id, rule_name, metric, operator, threshold,
+     duration_seconds, status (firing | resolved), started_at, fired_at,
+     resolved_at, value, peak_value, readings}
+
+RuleIndex.process() returns the pymongo write operations of one reading,
+like the anomaly detector, so the ingester writes them in one bulk_write.
+Rules are reloaded from the database every RULE_REFRESH_SECONDS; firing
+alerts are reloaded from MongoDB on restart.
+"""
+import operator
+
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, InsertOne, UpdateOne
+
+from monitoring.models import AlertRule
+
+ALERT_COLLECTION = "pzem_alerts"
+
+OPERATORS = {
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+}
+
+
+def ensure_indexes(alerts):
+    alerts.create_index([("device_id", ASCENDING), ("fired_at", DESCENDING)])
+    alerts.create_index("status", partialFilterExpression={"status": "firing"})
+
+
+class CompiledRule:
+    """One active rule with its evaluation state"""
+
+    __slots__ = ("id", "name", "metric", "operator", "threshold", "duration", "hysteresis",
+                 "breach", "recovered", "since", "alert_id", "peak")
+
+    def __init__(self, rule_id, name, metric, op, threshold, duration, hysteresis):
+        self.id = rule_id
+        self.name = name
+        self.metric = metric
+        self.operator = op
+        self.threshold = threshold
+        self.duration = duration
+        self.hysteresis = hysteresis
+        self.breach = OPERATORS[op]
+        # Batas pulih: threshold digeser ke arah aman sebesar hysteresis
+        clear_at = threshold - hysteresis if op in ('gt', 'gte') else threshold + hysteresis
+        self.recovered = lambda value: not OPERATORS[op](value, clear_at)
+        self.since = None
+        self.alert_id = None
+        self.peak = None
+
+    def definition(self):
+        return (self.name, self.metric, self.operator, self.threshold, self.duration, self.hysteresis)
+
+    def more_extreme(self, value):
+        if self.peak is None:
+            return True
+        return value > self.peak if self.operator in ('gt', 'gte') else value < self.peak
+
+
+class RuleIndex:
+    """
+    Per-device index of compiled alert rules
+
+    Rules are passed in as dicts with the AlertRule field names plus
+    device_id (see load_rules), so the index itself has no database access.
+    """
+
+    def __init__(self):
+        self.devices = {}   # device_id -> list of CompiledRule
+        self.rules = {}     # rule id -> CompiledRule
+
+    def __len__(self):
+        return len(self.rules)
+
+    def update(self, rules, now=None):
+        """
+        Replace the rule set, keeping the state of unchanged rules
+
+        Returns:
+            list: UpdateOne operations resolving alerts of removed / changed rules
+        """
+        operations = []
+        devices, compiled = {}, {}
+        for rule in rules:
+            new = CompiledRule(rule['id'], rule['name'], rule['metric'], rule['operator'],
+                               rule['threshold'], rule['duration_seconds'], rule['hysteresis'])
+            old = self.rules.get(rule['id'])
+            if old is not None and old.definition() == new.definition():
+                new = old
+            compiled[new.id] = new
+            devices.setdefault(rule['device_id'], []).append(new)
+
+        for rule_id, old in self.rules.items():
+            if old.alert_id is not None and compiled.get(rule_id) is not old:
+                operations.append(self._resolve(old, now, reason="rule_changed"))
+
+        self.devices = devices
+        self.rules = compiled
+        return operations
+
+    def _resolve(self, rule, timestamp, reason="recovered", value=None):
+        update = {"status": "resolved", "resolved_at": timestamp, "resolved_reason": reason}
+        if value is not None:
+            update["resolved_value"] = value
+        operation = UpdateOne({"_id": rule.alert_id}, {"$set": update})
+        rule.alert_id = None
+        rule.since = None
+        rule.peak = None
+        return operation
+
+    def process(self, reading):
+        """
+        Evaluate the device's rules against one reading
+
+        Args:
+            reading (dict): reading as saved to pzem_data1 (with timestamp)
+
+        Returns:
+            tuple: (InsertOne / UpdateOne operations for the alerts
+            collection, list of alerts fired by this reading)
+        """
+        rules = self.devices.get(reading["device_id"])
+        if not rules:
+            return [], []
+
+        timestamp = reading["timestamp"]
+        operations, fired = [], []
+        for rule in rules:
+            value = reading.get(rule.metric)
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+
+            if rule.alert_id is not None:
+                if rule.recovered(value):
+                    operations.append(self._resolve(rule, timestamp, value=value))
+                else:
+                    update = {"$inc": {"readings": 1}, "$set": {"value": value}}
+                    if rule.more_extreme(value):
+                        rule.peak = value
+                        update["$set"]["peak_value"] = value
+                    operations.append(UpdateOne({"_id": rule.alert_id}, update))
+                continue
+
+            if not rule.breach(value, rule.threshold):
+                rule.since = None
+                continue
+
+            if rule.since is None:
+                rule.since = timestamp
+            if (timestamp - rule.since).total_seconds() < rule.duration:
+                continue
+
+            rule.alert_id = ObjectId()
+            rule.peak = value
+            fired.append({
+                "_id": rule.alert_id,
+                "rule_id": rule.id,
+                "device_id": reading["device_id"],
+                "rule_name": rule.name,
+                "metric": rule.metric,
+                "operator": rule.operator,
+                "threshold": rule.threshold,
+                "duration_seconds": rule.duration,
+                "status": "firing",
+                "started_at": rule.since,
+                "fired_at": timestamp,
+                "resolved_at": None,
+                "value": value,
+                "peak_value": value,
+                "readings": 1,
+            })
+            operations.append(InsertOne(fired[-1]))
+
+        return operations, fired
+
+    def restore(self, alerts, now=None):
+        """
+        Re-attach alerts that were still firing when the ingester stopped
+
+        Returns:
+            list: UpdateOne operations resolving alerts whose rule is gone
+        """
+        operations = []
+        for doc in alerts.find({"status": "firing"}, {"rule_id": 1, "peak_value": 1}):
+            rule = self.rules.get(doc["rule_id"])
+            if rule is None:
+                operations.append(UpdateOne({"_id": doc["_id"]}, {"$set": {
+                    "status": "resolved", "resolved_at": now, "resolved_reason": "rule_changed"
+                }}))
+                continue
+            rule.alert_id = doc["_id"]
+            rule.peak = doc.get("peak_value")
+        return operations
+
+
+def load_rules():
+    """Active rules of active devices, in one query"""
+    rules = list(AlertRule.objects.filter(is_active=True, device__is_active=True).values(
+        'id', 'name', 'metric', 'operator', 'threshold', 'duration_seconds', 'hysteresis', 'device__device_id'
+    ))
+    for rule in rules:
+        rule['device_id'] = rule.pop('device__device_id')
+    return rules
@@ -0,0 +1,254 @@
+"""
+Streaming anomaly detection for incoming PZEM readings.
+
+The ingester keeps a few online statistics per device and metric, with the
+same fixed memory however long the device has been running:
+
+    Welford   count, mean and M2 of all normal readings (long-run baseline,
+              reported with each event)
+    EWMA      exponentially weighted mean and variance (adaptive baseline the
+              reading is scored against, follows slow load changes)
+
+Each reading is scored in O(1) against the EWMA baseline before it is
+folded in: z = (x - ewma) / max(ewma std, min_std). A metric is anomalous
+when |z| exceeds Z_THRESHOLD in its configured direction (after
+WARMUP_READINGS) or when it leaves its absolute min / max limits, e.g. a
+voltage sag below 198 V, overcurrent, or a power-factor drop. A metric
+with a `min_load` rule (pf) is only scored while the device draws at least
+that current or power: without load the meter reports pf = 0, which is not
+a power-factor drop.
+
+Consecutive anomalous readings of one metric form a single event in
+`pzem_anomalies`:
+
+    {device_id, metric, kind, started_at, ended_at, open, readings,
+     first_value, last_value, extreme_value, max_abs_zscore,
+     baseline_mean, baseline_std, limit}
+
+AnomalyDetector.process() returns the pymongo write operations for a
+reading (insert on start, update while it lasts, close when the metric is
+back to normal), so the ingester writes them with one bulk_write and no
+query ever touches pzem_data1. The per-device statistics are saved to
+`pzem_anomaly_state` every STATE_SAVE_SECONDS and reloaded on restart.
+"""
+import math
+
+from bson import ObjectId
+from django.conf import settings
+from pymongo import ASCENDING, DESCENDING, InsertOne, UpdateOne
+
+ANOMALY_COLLECTION = "pzem_anomalies"
+STATE_COLLECTION = "pzem_anomaly_state"
+
+# Nama kejadian per (metric, sisi); selain ini: "<metric>_low" / "<metric>_high"
+KINDS = {
+    ("voltage", "low"): "voltage_sag",
+    ("voltage", "high"): "voltage_swell",
+    ("current", "high"): "overcurrent",
+    ("pf", "low"): "pf_drop",
+    ("power", "high"): "power_spike",
+}
+
+
+def ensure_indexes(anomalies, states):
+    anomalies.create_index([("device_id", ASCENDING), ("started_at", DESCENDING)])
+    anomalies.create_index([("started_at", DESCENDING)])
+    anomalies.create_index("open", partialFilterExpression={"open": True})
+    states.create_index("device_id", unique=True)
+
+
+class MetricStats:
+    """Welford + EWMA statistics of one metric of one device"""
+
+    __slots__ = ("n", "mean", "m2", "ewma", "ewvar")
+
+    def __init__(self, n=0, mean=0.0, m2=0.0, ewma=None, ewvar=0.0):
+        self.n = n
+        self.mean = mean
+        self.m2 = m2
+        self.ewma = ewma
+        self.ewvar = ewvar
+
+    @property
+    def std(self):
+        """Long-run (Welford) sample standard deviation"""
+        return math.sqrt(self.m2 / (self.n - 1)) if self.n > 1 else 0.0
+
+    def zscore(self, value, min_std):
+        if self.ewma is None:
+            return 0.0
+        return (value - self.ewma) / max(math.sqrt(self.ewvar), min_std)
+
+    def update(self, value, alpha, baseline=True):
+        """
+        Fold a reading into the statistics
+
+        Args:
+            value (float): reading
+            alpha (float): EWMA weight of the new reading
+            baseline (bool): also update the Welford baseline (False for
+                             anomalous readings, so they do not skew it)
+        """
+        if self.ewma is None:
+            self.ewma = value
+        else:
+            diff = value - self.ewma
+            increment = alpha * diff
+            self.ewma += increment
+            self.ewvar = (1 - alpha) * (self.ewvar + diff * increment)
+
+        if baseline:
+            self.n += 1
+            delta = value - self.mean
+            self.mean += delta / self.n
+            self.m2 += delta * (value - self.mean)
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+class AnomalyDetector:
+    """
+    Per-device online anomaly scoring
+
+    Args:
+        config (dict): settings.ANOMALY_DETECTION layout (default: settings)
+    """
+
+    def __init__(self, config=None):
+        self.config = config or settings.ANOMALY_DETECTION
+        self.devices = {}   # device_id -> {metric: MetricStats}
+        self.open = {}      # (device_id, metric) -> _id event yang sedang berjalan
+        self.dirty = set()
+
+    @staticmethod
+    def _loaded(rule, reading):
+        """True when the reading meets the rule's min_load (any listed field at or above its minimum)"""
+        min_load = rule.get('min_load')
+        if not min_load:
+            return True
+        for field, minimum in min_load.items():
+            value = reading.get(field)
+            if isinstance(value, (int, float)) and not isinstance(value, bool) and value >= minimum:
+                return True
+        return False
+
+    def _check(self, metric, value, stats):
+        """(side, zscore, limit) when the value is anomalous, else None"""
+        rule = self.config['METRICS'][metric]
+        direction = rule.get('direction', 'both')
+        zscore = stats.zscore(value, rule.get('min_std', 0.0))
+
+        if rule.get('min') is not None and value < rule['min']:
+            return "low", zscore, rule['min']
+        if rule.get('max') is not None and value > rule['max']:
+            return "high", zscore, rule['max']
+
+        if stats.n < self.config['WARMUP_READINGS']:
+            return None
+        threshold = self.config['Z_THRESHOLD']
+        if zscore <= -threshold and direction in ("low", "both"):
+            return "low", zscore, None
+        if zscore >= threshold and direction in ("high", "both"):
+            return "high", zscore, None
+        return None
+
+    def process(self, reading):
+        """
+        Score one reading and update the device statistics
+
+        Args:
+            reading (dict): reading as saved to pzem_data1 (with timestamp)
+
+        Returns:
+            tuple: (InsertOne / UpdateOne operations for the anomalies
+            collection, list of events started by this reading)
+        """
+        device_id = reading["device_id"]
+        timestamp = reading["timestamp"]
+        device = self.devices.setdefault(device_id, {})
+        operations = []
+        started = []
+
+        for metric in self.config['METRICS']:
+            value = reading.get(metric)
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+                continue
+            key = (device_id, metric)
+            event_id = self.open.get(key)
+            if not self._loaded(self.config['METRICS'][metric], reading):
+                # Tanpa beban nilai metric tidak bermakna: tidak dinilai, tidak masuk baseline
+                if event_id is not None:
+                    del self.open[key]
+                    operations.append(UpdateOne({"_id": event_id}, {"$set": {"ended_at": timestamp, "open": False}}))
+                continue
+            stats = device.setdefault(metric, MetricStats())
+            anomaly = self._check(metric, value, stats)
+
+            if anomaly is not None:
+                side, zscore, limit = anomaly
+                if event_id is None:
+                    event_id = ObjectId()
+                    self.open[key] = event_id
+                    started.append({
+                        "_id": event_id,
+                        "device_id": device_id,
+                        "metric": metric,
+                        "kind": KINDS.get((metric, side), f"{metric}_{side}"),
+                        "started_at": timestamp,
+                        "ended_at": None,
+                        "open": True,
+                        "readings": 1,
+                        "first_value": value,
+                        "last_value": value,
+                        "extreme_value": value,
+                        "max_abs_zscore": abs(zscore),
+                        "baseline_mean": stats.mean,
+                        "baseline_std": stats.std,
+                        "limit": limit,
+                    })
+                    operations.append(InsertOne(started[-1]))
+                else:
+                    update = {
+                        "$inc": {"readings": 1},
+                        "$set": {"last_value": value},
+                        "$max": {"max_abs_zscore": abs(zscore)},
+                    }
+                    if side == "low":
+                        update["$min"] = {"extreme_value": value}
+                    else:
+                        update["$max"]["extreme_value"] = value
+                    operations.append(UpdateOne({"_id": event_id}, update))
+            elif event_id is not None:
+                # Kembali normal: tutup event
+                del self.open[key]
+                operations.append(UpdateOne({"_id": event_id}, {"$set": {"ended_at": timestamp, "open": False}}))
+
+            stats.update(value, self.config['EWMA_ALPHA'], baseline=anomaly is None)
+
+        self.dirty.add(device_id)
+        return operations, started
+
+    # === Persistensi state (restart ingester tidak mulai warmup dari nol) ===
+
+    def state_operations(self):
+        """Upserts of the statistics of devices changed since the last call"""
+        operations = [
+            UpdateOne(
+                {"device_id": device_id},
+                {"$set": {"metrics": {metric: stats.to_dict() for metric, stats in self.devices[device_id].items()}}},
+                upsert=True
+            )
+            for device_id in self.dirty
+        ]
+        self.dirty = set()
+        return operations
+
+    def load(self, anomalies, states):
+        """Restore statistics and still-open events from MongoDB"""
+        for doc in states.find({}, {"_id": 0}):
+            self.devices[doc["device_id"]] = {
+                metric: MetricStats(**values) for metric, values in doc.get("metrics", {}).items()
+            }
+        for doc in anomalies.find({"open": True}, {"device_id": 1, "metric": 1}):
+            self.open[(doc["device_id"], doc["metric"])] = doc["_id"]
@@ -0,0 +1,260 @@
+"""
+Compression of stored readings at ingest.
+
+Devices publish every ~2 seconds even when nothing changes. With
+COMPRESSION['MODE'] set, runmqtt passes each reading through a Compressor
+and inserts only the readings it emits; the feature store, anomaly
+detection and alert rules still see every reading.
+
+Modes (per-field tolerances in COMPRESSION['TOLERANCES']):
+
+    deadband        store a reading when any field moved more than its
+                    tolerance from the last stored reading; reconstruct
+                    by holding the last stored value (error <= tolerance)
+    swinging_door   swinging-door trending: from the last stored point a
+                    "door" of slopes that keeps every later point within
+                    tolerance is narrowed per field; when a new point
+                    closes it for any field (or the line to the point
+                    leaves it), the previous point is stored and becomes
+                    the new pivot. Reconstruct by linear
+                    interpolation (error <= tolerance). The newest reading
+                    is held back until the next one decides about it (or
+                    runmqtt's periodic flush stores it once the device has
+                    been idle for MAX_INTERVAL_SECONDS).
+
+In both modes a reading is stored at least every MAX_INTERVAL_SECONDS
+(heartbeat), and readings whose tolerance fields are missing or
+non-numeric are always stored, together with the held-back one. A gap
+longer than 1.5 x MAX_INTERVAL_SECONDS between stored readings therefore
+means the device was offline, and reconstruct() does not fill it.
+
+Stored readings are ordinary documents of pzem_data1, but they are no
+longer a uniform sample in time: a steady stretch keeps one reading, a
+transition keeps many. What that means for the readers:
+
+    exact           energy from the cumulative counter (rollup energy_kwh,
+                    billing, dashboard summary energy); retention (compares
+                    stored counts with rollup counts)
+    time-weighted   rollup power means and digests, and everything built on
+                    them (daily documents, heatmap profiles and percentiles,
+                    summary peaks): each reading counts for the seconds
+                    until the next one (monitoring.rollups.reading_seconds)
+    every reading   the feature store, anomaly detection, alert rules and
+                    the dashboard summary tracker are fed by the ingester
+                    before compression
+    biased          per-reading (count-weighted) means of raw readings:
+                    /monitoring/compare/ and /monitoring/history/ with
+                    resample=... for non-energy metrics over-weight
+                    transitions; use history's fill=<seconds> (reconstruct())
+                    for a regular series. Training on raw readings is biased
+                    the same way, so compression requires the feature store
+                    (FEATURE_STORE['ENABLED']), which training reads instead.
+"""
+import datetime
+import math
+
+import numpy as np
+from django.conf import settings
+
+MODES = ("deadband", "swinging_door")
+
+
+def numeric_values(reading, fields):
+    """Tolerance fields of a reading that hold a finite number"""
+    values = {}
+    for field in fields:
+        value = reading.get(field)
+        if isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value):
+            values[field] = float(value)
+    return values
+
+
+class DeviceState:
+    """Last stored reading, held-back reading and the open door of one device"""
+    __slots__ = ("archived_at", "archived", "pending", "upper", "lower")
+
+    def __init__(self, reading, values):
+        self.archived_at = reading["timestamp"]
+        self.archived = values
+        self.pending = None
+        self.upper = {}
+        self.lower = {}
+
+
+class Compressor:
+    """
+    Decide which readings to store
+
+    process() returns the readings to insert now (0, 1 or 2, oldest first);
+    flush() returns held-back readings of idle devices (or all, on
+    shutdown).
+    """
+
+    def __init__(self, config=None):
+        config = config or settings.COMPRESSION
+        if config['MODE'] not in MODES:
+            raise ValueError(f"COMPRESSION['MODE'] must be one of {MODES}")
+        # Training dari reading mentah yang terkompresi bias ke transisi
+        if not settings.FEATURE_STORE['ENABLED']:
+            raise ValueError("COMPRESSION['MODE'] requires FEATURE_STORE['ENABLED'] "
+                             "(training would otherwise read the compressed, transition-weighted readings)")
+        self.mode = config['MODE']
+        self.tolerances = dict(config['TOLERANCES'])
+        self.max_interval = config['MAX_INTERVAL_SECONDS']
+        self.devices = {}
+        self.received = 0
+        self.stored = 0
+
+    def ratio(self):
+        """Received readings per stored reading"""
+        return self.received / self.stored if self.stored else 0.0
+
+    def _archive(self, device_id, reading, values):
+        self.devices[device_id] = DeviceState(reading, values)
+        self.stored += 1
+        return reading
+
+    def process(self, reading):
+        self.received += 1
+        device_id = reading["device_id"]
+        values = numeric_values(reading, self.tolerances)
+        state = self.devices.get(device_id)
+        if state is None:
+            return [self._archive(device_id, reading, values)]
+
+        elapsed = (reading["timestamp"] - state.archived_at).total_seconds()
+        # Field hilang / tidak numerik: simpan apa adanya (plus yang tertahan)
+        if values.keys() != state.archived.keys() or elapsed <= 0:
+            return self._store_with_pending(state, device_id, reading, values)
+
+        if self.mode == "deadband":
+            moved = any(abs(values[f] - state.archived[f]) > self.tolerances[f] for f in values)
+            if moved or elapsed >= self.max_interval:
+                return [self._archive(device_id, reading, values)]
+            return []
+
+        emitted = []
+        if not self._narrow(state, values, elapsed):
+            # Pintu tertutup: reading tertahan jadi pivot baru
+            pending, pending_values = state.pending
+            emitted.append(self._archive(device_id, pending, pending_values))
+            state = self.devices[device_id]
+            elapsed = (reading["timestamp"] - state.archived_at).total_seconds()
+            self._narrow(state, values, elapsed)
+
+        if elapsed >= self.max_interval:
+            emitted.append(self._archive(device_id, reading, values))
+        else:
+            state.pending = (reading, values)
+        return emitted
+
+    def _narrow(self, state, values, elapsed):
+        """
+        Narrow the door of every field with a new point; False when it closed
+
+        The line from the pivot to the new point must itself lie inside
+        the door, so interpolating between stored readings stays within
+        tolerance of every skipped one.
+        """
+        upper, lower = {}, {}
+        for field, value in values.items():
+            tolerance = self.tolerances[field]
+            delta = value - state.archived[field]
+            upper[field] = min(state.upper.get(field, math.inf), (delta + tolerance) / elapsed)
+            lower[field] = max(state.lower.get(field, -math.inf), (delta - tolerance) / elapsed)
+            if not lower[field] <= delta / elapsed <= upper[field]:
+                return False
+        state.upper, state.lower = upper, lower
+        return True
+
+    def _store_with_pending(self, state, device_id, reading, values):
+        emitted = [state.pending[0]] if state.pending else []
+        self.stored += len(emitted)
+        emitted.append(self._archive(device_id, reading, values))
+        return emitted
+
+    def flush(self, now=None, idle_seconds=None):
+        """
+        Held-back readings to store: of devices idle for idle_seconds
+        (default MAX_INTERVAL_SECONDS), or of every device when now is None
+
+        Returns:
+            list: readings to insert
+        """
+        idle = datetime.timedelta(seconds=self.max_interval if idle_seconds is None else idle_seconds)
+        emitted = []
+        for device_id, state in list(self.devices.items()):
+            if state.pending is None:
+                continue
+            reading, values = state.pending
+            if now is None or now - reading["timestamp"] >= idle:
+                emitted.append(self._archive(device_id, reading, values))
+        return emitted
+
+
+# === Rekonstruksi untuk pembaca histori ===
+
+def reconstruct(docs, step_seconds, fields=None, mode=None, max_gap_seconds=None, until=None):
+    """
+    Regular series from stored (compressed) readings
+
+    Args:
+        docs (list): stored readings of one device, oldest first, with
+            naive datetime timestamps
+        step_seconds (float): spacing of the output series
+        fields (list): fields to reconstruct (default: the tolerance fields)
+        mode (str): 'deadband' holds, 'swinging_door' interpolates
+            (default: COMPRESSION['MODE'])
+        max_gap_seconds (float): gaps longer than this are left empty
+            (default: 1.5 x MAX_INTERVAL_SECONDS)
+        until (datetime): extend the series past the last stored reading
+            (holding its values, at most MAX_INTERVAL_SECONDS): readings
+            inside the tolerance after it were not stored
+
+    Returns:
+        list: dicts {"timestamp", <field>: value or None, "stored": bool}
+    """
+    config = settings.COMPRESSION
+    mode = mode or config['MODE'] or "swinging_door"
+    fields = fields or list(config['TOLERANCES'])
+    max_gap = max_gap_seconds or 1.5 * config['MAX_INTERVAL_SECONDS']
+    if not docs:
+        return []
+
+    epoch = np.array([(doc["timestamp"] - docs[0]["timestamp"]).total_seconds() for doc in docs])
+    end = epoch[-1]
+    if until is not None:
+        end = max(end, min((until - docs[0]["timestamp"]).total_seconds(), end + config['MAX_INTERVAL_SECONDS']))
+    grid = np.arange(0.0, end + step_seconds / 2, step_seconds)
+    # Titik grid jatuh di celah offline: kosongkan
+    right = np.clip(np.searchsorted(epoch, grid, side="right"), 1, len(epoch) - 1)
+    gap = (epoch[right] - epoch[right - 1]) > max_gap
+    online = ~gap | np.isin(grid, epoch)
+    stored = np.isin(grid, epoch)
+
+    series = {}
+    for field in fields:
+        values = np.array([
+            float(doc[field]) if isinstance(doc.get(field), (int, float)) and not isinstance(doc.get(field), bool)
+            else np.nan for doc in docs
+        ])
+        valid = ~np.isnan(values)
+        if not valid.any():
+            series[field] = np.full(len(grid), np.nan)
+        elif mode == "deadband":
+            index = np.searchsorted(epoch[valid], grid, side="right") - 1
+            series[field] = np.where(index >= 0, values[valid][np.clip(index, 0, None)], np.nan)
+        else:
+            series[field] = np.interp(grid, epoch[valid], values[valid])
+
+    start = docs[0]["timestamp"]
+    rows = []
+    for i, offset in enumerate(grid):
+        if not online[i]:
+            continue
+        row = {"timestamp": start + datetime.timedelta(seconds=float(offset)), "stored": bool(stored[i])}
+        for field in fields:
+            value = series[field][i]
+            row[field] = None if np.isnan(value) else round(float(value), 6)
+        rows.append(row)
+    return rows
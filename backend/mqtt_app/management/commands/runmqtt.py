@@ -1,8 +1,14 @@
+from django.conf import settings
 from django.core.management.base import BaseCommand
 import paho.mqtt.client as mqtt
-from pymongo import MongoClient
 from datetime import datetime
 import json
+import threading
+import time
+
+from monitoring import indexes, mongo, summary
+from mqtt_app import alerts, anomaly, compression
+from prediction import feature_store
 
 class Command(BaseCommand):
     help = "Run MQTT subscriber to save PZEM data into MongoDB"
@@ -12,10 +18,62 @@ class Command(BaseCommand):
         port = 1883
         topic = "iot/lab/pzem004t"
 
-        # koneksi MongoDB
-        client_mongo = MongoClient("mongodb://localhost:27017/")
-        db = client_mongo["iot_db"]
-        collection = db["pzem_data1"]
+        indexes.ensure_on_startup()
+
+        # koneksi MongoDB (settings.MONGODB)
+        db = mongo.get_db()
+        collection = db[mongo.READINGS_COLLECTION]
+
+        # Feature store: reading langsung digabung ke bucket per menit
+        features = db[feature_store.FEATURE_COLLECTION] if settings.FEATURE_STORE['ENABLED'] else None
+        if features is not None:
+            feature_store.ensure_indexes(features)
+
+        # Deteksi anomali: statistik online per device, event ke pzem_anomalies
+        detector = None
+        if settings.ANOMALY_DETECTION['ENABLED']:
+            anomalies = db[anomaly.ANOMALY_COLLECTION]
+            anomaly_states = db[anomaly.STATE_COLLECTION]
+            anomaly.ensure_indexes(anomalies, anomaly_states)
+            detector = anomaly.AnomalyDetector()
+            detector.load(anomalies, anomaly_states)
+            print(f"Anomaly detector ready ({len(detector.devices)} devices restored)")
+        last_state_save = time.monotonic()
+
+        # Alert rules: index per device, dimuat ulang berkala dari database
+        rule_index = None
+        if settings.ALERTS['ENABLED']:
+            alert_collection = db[alerts.ALERT_COLLECTION]
+            alerts.ensure_indexes(alert_collection)
+            rule_index = alerts.RuleIndex()
+            rule_index.update(alerts.load_rules())
+            operations = rule_index.restore(alert_collection, datetime.utcnow())
+            if operations:
+                alert_collection.bulk_write(operations)
+            print(f"Alert rules loaded: {len(rule_index)}")
+        last_rule_refresh = time.monotonic()
+
+        # Ringkasan dashboard per user: satu upsert per reading
+        tracker = None
+        if settings.DASHBOARD_SUMMARY['ENABLED']:
+            summaries = db[summary.SUMMARY_COLLECTION]
+            summary.ensure_indexes(summaries)
+            tracker = summary.SummaryTracker(summaries)
+            print(f"Dashboard summary ready ({len(tracker.owners)} devices)")
+
+        # Kompresi: hanya reading yang informatif disimpan ke pzem_data1
+        compressor = compression.Compressor() if settings.COMPRESSION['MODE'] else None
+        if compressor is not None:
+            print(f"Compression: {compressor.mode}, heartbeat {compressor.max_interval}s")
+        # Compressor dipakai thread MQTT (process) dan thread utama (flush berkala)
+        compressor_lock = threading.Lock()
+
+        def flush_compressor(now=None):
+            with compressor_lock:
+                pending = compressor.flush(now)
+                if pending:
+                    collection.insert_many(pending)
+            return pending
 
         def on_connect(client, userdata, flags, rc):
             print("Connected with result code " + str(rc))
@@ -23,6 +81,7 @@ class Command(BaseCommand):
             print(f"Subscribed to topic: {topic}")
 
         def on_message(client, userdata, msg):
+            nonlocal last_state_save, last_rule_refresh
             payload = msg.payload.decode()
             print("RAW:", payload)
             try:
@@ -38,8 +97,52 @@ class Command(BaseCommand):
                 data["timestamp"] = datetime.utcnow()
 
                 # Simpan ke MongoDB
-                collection.insert_one(data)
-                print(f"✓ Saved data from device: {data['device_id']}")
+                if compressor is None:
+                    collection.insert_one(data)
+                    print(f"✓ Saved data from device: {data['device_id']}")
+                else:
+                    with compressor_lock:
+                        stored = compressor.process(data)
+                        if stored:
+                            collection.insert_many(stored)
+                    print(f"✓ {'Saved' if stored else 'Compressed'} data from device: {data['device_id']} "
+                          f"(stored {len(stored)}, ratio {compressor.ratio():.1f}x)")
+
+                if features is not None:
+                    update = feature_store.ingest_update(data)
+                    if update is not None:
+                        features.bulk_write([update])
+
+                if tracker is not None:
+                    operations = tracker.process(data)
+                    if operations:
+                        summaries.bulk_write(operations)
+
+                if detector is not None:
+                    operations, started = detector.process(data)
+                    if operations:
+                        anomalies.bulk_write(operations, ordered=True)
+                        for event in started:
+                            print(f"⚠ Anomaly {event['kind']} on {event['device_id']}: "
+                                  f"{event['metric']}={event['first_value']} (z={event['max_abs_zscore']:.1f})")
+                    if time.monotonic() - last_state_save >= settings.ANOMALY_DETECTION['STATE_SAVE_SECONDS']:
+                        state_operations = detector.state_operations()
+                        if state_operations:
+                            anomaly_states.bulk_write(state_operations, ordered=False)
+                        last_state_save = time.monotonic()
+
+                if rule_index is not None:
+                    if time.monotonic() - last_rule_refresh >= settings.ALERTS['RULE_REFRESH_SECONDS']:
+                        operations = rule_index.update(alerts.load_rules(), data["timestamp"])
+                        if operations:
+                            alert_collection.bulk_write(operations)
+                        last_rule_refresh = time.monotonic()
+                    operations, fired = rule_index.process(data)
+                    if operations:
+                        alert_collection.bulk_write(operations, ordered=True)
+                        for alert in fired:
+                            print(f"🔔 Alert '{alert['rule_name']}' on {alert['device_id']}: "
+                                  f"{alert['metric']}={alert['value']}")
                 print(f"  Voltage: {data.get('voltage', 'N/A')}V, Current: {data.get('current', 'N/A')}A, Power: {data.get('power', 'N/A')}W")
             except json.JSONDecodeError as e:
                 print(f"JSON Error: {e}")
@@ -56,4 +159,19 @@ class Command(BaseCommand):
 
         print(f"Listening on topic: {topic}")
         print("Waiting for messages... (Press Ctrl+C to stop)")
-        client.loop_forever()
+        try:
+            if compressor is None:
+                client.loop_forever()
+            else:
+                # Reading tertahan dari device yang diam di-flush dengan timer, tidak menunggu pesan berikutnya
+                client.loop_start()
+                try:
+                    while True:
+                        time.sleep(settings.COMPRESSION['FLUSH_SECONDS'])
+                        flush_compressor(datetime.utcnow())
+                finally:
+                    client.loop_stop()
+        finally:
+            if compressor is not None:
+                flush_compressor()
+                print(f"Compression: {compressor.received} received, {compressor.stored} stored")
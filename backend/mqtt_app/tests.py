@@ -1,3 +1,181 @@
-from django.test import TestCase
+import datetime
 
-# Create your tests here.
+import numpy as np
+from django.test import SimpleTestCase, override_settings
+
+from .alerts import RuleIndex
+from .anomaly import AnomalyDetector, MetricStats
+from .compression import Compressor, reconstruct
+
+CONFIG = {
+    'EWMA_ALPHA': 0.05,
+    'Z_THRESHOLD': 4.0,
+    'WARMUP_READINGS': 30,
+    'METRICS': {
+        'voltage': {'direction': 'both', 'min_std': 1.0, 'min': 198.0, 'max': 242.0},
+        'current': {'direction': 'high', 'min_std': 0.05},
+    },
+}
+
+
+class AnomalyDetectorTests(SimpleTestCase):
+
+    def test_welford_matches_numpy(self):
+        values = np.random.default_rng(0).normal(220, 3, 500)
+        stats = MetricStats()
+        for value in values:
+            stats.update(float(value), alpha=0.05)
+        self.assertAlmostEqual(stats.mean, values.mean(), places=9)
+        self.assertAlmostEqual(stats.std, values.std(ddof=1), places=9)
+
+    def test_sag_opens_updates_and_closes_one_event(self):
+        detector = AnomalyDetector(CONFIG)
+        rng = np.random.default_rng(1)
+        start = datetime.datetime(2026, 1, 1)
+
+        def reading(i, voltage, current=2.0):
+            return {"device_id": "dev-1", "timestamp": start + datetime.timedelta(seconds=2 * i),
+                    "voltage": voltage, "current": current}
+
+        for i in range(200):
+            operations, started = detector.process(reading(i, 220 + rng.normal(0, 0.5), 2 + rng.normal(0, 0.02)))
+            self.assertEqual(operations, [])
+
+        operations, started = detector.process(reading(200, 185.0))
+        self.assertEqual([event["kind"] for event in started], ["voltage_sag"])
+        self.assertEqual(started[0]["limit"], 198.0)
+
+        operations, started = detector.process(reading(201, 180.0))
+        self.assertEqual(started, [])
+        self.assertEqual(operations[0]._doc["$min"], {"extreme_value": 180.0})
+
+        operations, _ = detector.process(reading(202, 220.0))
+        self.assertEqual(operations[0]._doc["$set"]["open"], False)
+        self.assertEqual(detector.open, {})
+
+    def test_zscore_flags_overcurrent_after_warmup_only(self):
+        detector = AnomalyDetector(CONFIG)
+        now = datetime.datetime(2026, 1, 1)
+        _, started = detector.process({"device_id": "dev-2", "timestamp": now, "current": 2.0})
+        _, started = detector.process({"device_id": "dev-2", "timestamp": now, "current": 9.0})
+        self.assertEqual(started, [])
+
+        for _ in range(50):
+            detector.process({"device_id": "dev-2", "timestamp": now, "current": 2.0})
+        _, started = detector.process({"device_id": "dev-2", "timestamp": now, "current": 9.0})
+        self.assertEqual([event["kind"] for event in started], ["overcurrent"])
+
+    def test_pf_is_only_scored_under_load(self):
+        config = {**CONFIG, 'METRICS': {
+            'pf': {'direction': 'low', 'min_std': 0.02, 'min': 0.5, 'min_load': {'current': 0.05, 'power': 5.0}},
+        }}
+        detector = AnomalyDetector(config)
+        now = datetime.datetime(2026, 1, 1)
+
+        # Tanpa beban PZEM melaporkan pf = 0: bukan pf_drop
+        for _ in range(10):
+            operations, started = detector.process({"device_id": "dev-3", "timestamp": now,
+                                                    "pf": 0.0, "current": 0.0, "power": 0.0})
+            self.assertEqual((operations, started), ([], []))
+        self.assertNotIn("pf", detector.devices["dev-3"])
+
+        _, started = detector.process({"device_id": "dev-3", "timestamp": now, "pf": 0.3, "current": 1.0, "power": 60.0})
+        self.assertEqual([event["kind"] for event in started], ["pf_drop"])
+
+        # Beban hilang: event ditutup
+        operations, _ = detector.process({"device_id": "dev-3", "timestamp": now, "pf": 0.0, "current": 0.0, "power": 0.0})
+        self.assertEqual(operations[0]._doc["$set"]["open"], False)
+        self.assertEqual(detector.open, {})
+
+
+class RuleIndexTests(SimpleTestCase):
+
+    RULE = {'id': 1, 'device_id': 'dev-1', 'name': 'High load', 'metric': 'power', 'operator': 'gt',
+            'threshold': 2000.0, 'duration_seconds': 300, 'hysteresis': 100.0}
+
+    def reading(self, minute, power, device_id='dev-1'):
+        return {"device_id": device_id, "timestamp": datetime.datetime(2026, 1, 1) + datetime.timedelta(minutes=minute),
+                "power": power}
+
+    def test_fires_after_duration_and_resolves_with_hysteresis(self):
+        index = RuleIndex()
+        index.update([self.RULE])
+
+        self.assertEqual(index.process(self.reading(0, 2500))[1], [])
+        self.assertEqual(index.process(self.reading(4, 2500))[1], [])
+        _, fired = index.process(self.reading(5, 2600))
+        self.assertEqual(len(fired), 1)
+        self.assertEqual(fired[0]["started_at"], datetime.datetime(2026, 1, 1))
+
+        # Di bawah threshold tapi masih di dalam hysteresis: tetap firing
+        operations, _ = index.process(self.reading(6, 1950))
+        self.assertEqual(operations[0]._doc["$inc"], {"readings": 1})
+        operations, _ = index.process(self.reading(7, 1850))
+        self.assertEqual(operations[0]._doc["$set"]["status"], "resolved")
+
+    def test_dip_resets_pending_window_and_other_devices_are_skipped(self):
+        index = RuleIndex()
+        index.update([self.RULE])
+        index.process(self.reading(0, 2500))
+        index.process(self.reading(3, 1500))
+        self.assertEqual(index.process(self.reading(5, 2500))[1], [])
+        self.assertEqual(index.process(self.reading(10, 9999, device_id='dev-2')), ([], []))
+
+    def test_changed_rule_resolves_its_firing_alert(self):
+        index = RuleIndex()
+        index.update([{**self.RULE, 'duration_seconds': 0}])
+        index.process(self.reading(0, 2500))
+        operations = index.update([{**self.RULE, 'threshold': 3000.0}])
+        self.assertEqual(operations[0]._doc["$set"]["resolved_reason"], "rule_changed")
+
+
+COMPRESSION = {
+    'MODE': 'swinging_door',
+    'MAX_INTERVAL_SECONDS': 300,
+    'FLUSH_SECONDS': 10,
+    'TOLERANCES': {'voltage': 1.0, 'power': 20.0},
+}
+
+
+@override_settings(COMPRESSION=COMPRESSION)
+class CompressorTests(SimpleTestCase):
+
+    def readings(self, n=3000):
+        rng = np.random.default_rng(2)
+        start = datetime.datetime(2026, 1, 1)
+        power = 500 + np.cumsum(rng.normal(0, 3, n)) + np.where(np.arange(n) % 700 < 100, 1500, 0)
+        voltage = 220 + np.cumsum(rng.normal(0, 0.1, n))
+        return [{"device_id": "dev-1", "timestamp": start + datetime.timedelta(seconds=2 * i),
+                 "voltage": float(voltage[i]), "power": float(power[i])} for i in range(n)]
+
+    def compress(self, mode, readings):
+        compressor = Compressor({**COMPRESSION, 'MODE': mode})
+        stored = []
+        for reading in readings:
+            stored += compressor.process(dict(reading))
+        return stored + compressor.flush()
+
+    def test_reconstruction_error_is_bounded(self):
+        readings = self.readings()
+        for mode in ('deadband', 'swinging_door'):
+            stored = self.compress(mode, readings)
+            self.assertLess(len(stored) * 3, len(readings), mode)
+            series = {row["timestamp"]: row for row in reconstruct(stored, 2, mode=mode,
+                                                                    until=readings[-1]["timestamp"])}
+            for field, tolerance in COMPRESSION['TOLERANCES'].items():
+                error = max(abs(series[r["timestamp"]][field] - r[field]) for r in readings)
+                self.assertLessEqual(error, tolerance + 1e-6, f"{mode} {field}")
+
+    def test_heartbeat_and_invalid_values_force_storage(self):
+        start = datetime.datetime(2026, 1, 1)
+        readings = [{"device_id": "dev-1", "timestamp": start + datetime.timedelta(seconds=2 * i),
+                     "voltage": 220.0, "power": 100.0} for i in range(1000)]
+        readings[500]["power"] = None
+        stored = self.compress('swinging_door', readings)
+        gaps = np.diff([(r["timestamp"] - start).total_seconds() for r in stored])
+        self.assertLessEqual(gaps.max(), 300)
+        self.assertIn(readings[500]["timestamp"], [r["timestamp"] for r in stored])
+        # Celah offline tidak diisi
+        offline = reconstruct(stored[:2] + [{**stored[-1], "timestamp": start + datetime.timedelta(hours=5)}], 60)
+        self.assertFalse(any(datetime.timedelta(hours=1) < row["timestamp"] - start < datetime.timedelta(hours=4)
+                             for row in offline))
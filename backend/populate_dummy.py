@@ -1,104 +1,314 @@
+"""
+Synthetic PZEM data generator for demos and load tests.
+
+Creates users and devices in Django (SQL) and their readings in MongoDB
+(pzem_data1), shaped like what runmqtt stores:
+
+- every household gets its own daily profile: base load, a morning and an
+  evening peak, more daytime load on weekends, and noise
+- appliance spikes (rice cooker, iron, pump, AC, ...) arrive as a Poisson
+  process, each with its own power, duration and lower power factor
+- voltage sags with load, current follows from P = V * I * pf
+- the energy counter (kWh) accumulates and sometimes resets to zero
+- a small share of readings is dropped, like missed MQTT messages
+
+Readings of each device are generated with NumPy one day at a time and
+written with unordered bulk inserts by a pool of worker processes (one
+device per task), so tens of millions of rows take minutes. Indexes are
+ensured after the inserts (building them once is cheaper than updating
+them per insert).
+
+Examples:
+    python populate_dummy.py                                   # 1 demo device, 24h, 15 min
+    python populate_dummy.py --devices 2000 --users 500 --days 7 --interval 10
+    python populate_dummy.py --devices 100 --days 30 --interval 2 --workers 16
+
+Device 0 is always the demo device (DEVICE_ID, user 'admin'); the others
+are loadtest-* devices with deterministic ids, so a re-run replaces their
+readings instead of creating new devices.
+"""
+import argparse
+import datetime
+import multiprocessing
 import os
+import time
+import uuid
+import zoneinfo
+
 import django
-import random
-import datetime
-from pymongo import MongoClient
-from django.utils import timezone
+import numpy as np
 
 # 1. Setup Django Environment (Hanya untuk akses model Device & User)
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wattara.settings')
 django.setup()
 
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
 from django.contrib.auth.models import User
+from django.db import connections
+from monitoring import indexes, mongo
 from monitoring.models import Device
 
-def populate_mongodb():
-    print("--- Starting Dummy Data Population ---")
+DEVICE_ID = "d4fa4f1c-e4cb-40be-b37d-4c7421c070db"
+LOADTEST_NAMESPACE = uuid.UUID("5b0c2a52-7f1e-4c43-9d3e-2f7d0f6f4e10")
+LOADTEST_PASSWORD = "loadtest123"
 
-    # 2. Setup Koneksi MongoDB
-    try:
-        # Sesuaikan URI jika MongoDB Anda ada di server lain/docker
-        client = MongoClient("mongodb://localhost:27017/") 
-        db = client["iot_db"]           # Nama database (sesuai views.py)
-        collection = db["pzem_data1"]   # Nama collection (sesuai views.py)
-        print("✓ Connected to MongoDB")
-    except Exception as e:
-        print(f"❌ Failed to connect to MongoDB: {e}")
-        return
-
-    # 3. Pastikan ada User Admin (untuk pemilik device)
-    user, created = User.objects.get_or_create(
-        username='admin',
-        defaults={'email': 'admin@example.com'}
-    )
+# (nama, daya W min-max, durasi menit min-max, pf, bobot)
+APPLIANCES = [
+    ("rice_cooker", (300, 450), (20, 45), 0.99, 3),
+    ("iron", (800, 1200), (10, 30), 0.99, 1),
+    ("water_pump", (250, 400), (5, 15), 0.75, 3),
+    ("air_conditioner", (700, 1300), (60, 240), 0.85, 2),
+    ("washing_machine", (300, 500), (40, 70), 0.70, 1),
+    ("kettle", (1500, 2200), (3, 6), 0.99, 2),
+]
+
+
+# === Users & devices (SQL) ===
+
+def loadtest_device_id(n):
+    return str(uuid.uuid5(LOADTEST_NAMESPACE, f"device-{n}"))
+
+
+def create_owners(n_users):
+    """Admin (owner of the demo device) plus loadtest-user-* accounts"""
+    admin, created = User.objects.get_or_create(username='admin', defaults={'email': 'admin@example.com'})
     if created:
-        user.set_password('admin123')
-        user.save()
+        admin.set_password('admin123')
+        admin.save()
         print("✓ Created dummy user: admin")
 
-    # 4. Buat Device Dummy di Django (SQL)
-    # ID ini yang nanti menghubungkan data di MongoDB
-    DEVICE_ID = "d4fa4f1c-e4cb-40be-b37d-4c7421c070db" 
-    
+    # Hash sekali saja: PBKDF2 per user terlalu lambat untuk ribuan akun
+    password = make_password(LOADTEST_PASSWORD)
+    usernames = [f"loadtest-user-{n:05d}" for n in range(n_users)]
+    User.objects.bulk_create(
+        [User(username=name, email=f"{name}@example.com", password=password) for name in usernames],
+        ignore_conflicts=True, batch_size=1000
+    )
+    users = dict(User.objects.filter(username__in=usernames).values_list('username', 'id'))
+    return admin, [users[name] for name in usernames]
+
+
+def create_devices(n_devices, n_users):
+    """
+    Demo device + loadtest devices (round-robin over the loadtest users)
+
+    Returns:
+        list: device ids, index = device number
+    """
+    admin, user_ids = create_owners(max(n_users, 1) if n_devices > 1 else 0)
+
     device, created = Device.objects.get_or_create(
         device_id=DEVICE_ID,
-        defaults={
-            'name': "Simulation Panel", 
-            'location': "Virtual Lab",
-            'user': user,
-            'is_active': True
-        }
+        defaults={'name': "Simulation Panel", 'location': "Virtual Lab", 'user': admin, 'is_active': True}
     )
-    if created:
-        print(f"✓ Created Django Device: {device.name} ({DEVICE_ID})")
-    else:
-        print(f"✓ Found existing Django Device: {device.name}")
-
-    # 5. Generate Data Dummy ke MongoDB
-    # Kita hapus data lama device ini agar grafik bersih (Opsional)
-    delete_result = collection.delete_many({"device_id": DEVICE_ID})
-    print(f"  - Cleared {delete_result.deleted_count} old records for this device.")
-
-    print("  - Generating data for the last 24 hours...")
-    
-    end_time = datetime.datetime.now()
-    start_time = end_time - datetime.timedelta(hours=24)
-    current_time = start_time
-
-    bulk_data = []
-
-    while current_time <= end_time:
-        # Simulasi nilai listrik naik-turun sedikit
-        voltage = 220.0 + random.uniform(-5.0, 5.0)
-        current = random.uniform(1.5, 8.0)
-        pf = random.uniform(0.85, 0.99)
-        power = voltage * current * pf
-        frequency = 50.0 + random.uniform(-0.1, 0.1)
-        energy = 1000 + (current_time.hour * 5) # Simulasi kWh meter bertambah
-
-        # Format data sesuai yang diharapkan backend/monitoring/views.py
-        data_point = {
-            "device_id": DEVICE_ID,
-            "timestamp": current_time, # PyMongo akan simpan sebagai ISODate
-            "voltage": round(voltage, 2),
-            "current": round(current, 2),
-            "power": round(power, 2),
-            "pf": round(pf, 2),
-            "frequency": round(frequency, 2),
-            "energy": round(energy, 2)
-        }
-        bulk_data.append(data_point)
-        
-        # Interval data setiap 15 menit
-        current_time += datetime.timedelta(minutes=15)
-
-    # 6. Insert ke MongoDB
-    if bulk_data:
-        collection.insert_many(bulk_data)
-        print(f"✓ Successfully inserted {len(bulk_data)} records into MongoDB!")
-    else:
-        print("⚠ No data generated.")
+    print(f"✓ {'Created' if created else 'Found existing'} Django Device: {device.name} ({DEVICE_ID})")
+
+    device_ids = [DEVICE_ID] + [loadtest_device_id(n) for n in range(1, n_devices)]
+    Device.objects.bulk_create(
+        [
+            Device(device_id=device_id, name=f"Load Test Panel {n}", location="Load Test",
+                   user_id=user_ids[(n - 1) % len(user_ids)], is_active=True)
+            for n, device_id in enumerate(device_ids[1:], start=1)
+        ],
+        ignore_conflicts=True, batch_size=1000
+    )
+    if n_devices > 1:
+        print(f"✓ {n_devices - 1} load test devices over {len(user_ids)} users "
+              f"(password '{LOADTEST_PASSWORD}')")
+    return device_ids
+
+
+# === Profil beban ===
+
+class Household:
+    """Random but fixed load characteristics of one device"""
+
+    def __init__(self, rng):
+        self.base_w = rng.uniform(60, 300)
+        self.morning_hour = rng.normal(6.0, 0.6)
+        self.morning_w = rng.uniform(100, 600)
+        self.evening_hour = rng.normal(19.0, 0.8)
+        self.evening_w = rng.uniform(300, 1200)
+        self.weekend_w = rng.uniform(50, 400)
+        self.appliances_per_day = rng.uniform(4, 20)
+        self.base_pf = rng.uniform(0.85, 0.97)
+        self.grid_voltage = rng.normal(220, 3)
+
+    def base_power(self, local_hours, weekend):
+        """Smooth daily profile (W) for fractional local hours"""
+        def bump(center, width):
+            # Jarak melingkar supaya puncak malam menyambung ke dini hari
+            distance = np.abs((local_hours - center + 12) % 24 - 12)
+            return np.exp(-0.5 * (distance / width) ** 2)
+
+        power = (self.base_w
+                 + self.morning_w * bump(self.morning_hour, 1.0)
+                 + self.evening_w * bump(self.evening_hour, 2.0))
+        daytime = bump(13.0, 3.5)
+        return power + np.where(weekend, self.weekend_w * daytime, 0.0)
+
+
+def appliance_load(rng, household, n_rows, interval):
+    """Extra power (W) and power factor of appliance spikes over one day"""
+    extra = np.zeros(n_rows)
+    pf = np.full(n_rows, np.nan)
+    weights = np.array([appliance[4] for appliance in APPLIANCES], dtype=float)
+    for _ in range(rng.poisson(household.appliances_per_day)):
+        _, (low_w, high_w), (low_min, high_min), appliance_pf, _ = APPLIANCES[
+            rng.choice(len(APPLIANCES), p=weights / weights.sum())
+        ]
+        start = rng.integers(0, n_rows)
+        length = max(1, int(rng.uniform(low_min, high_min) * 60 / interval))
+        extra[start:start + length] += rng.uniform(low_w, high_w)
+        pf[start:start + length] = np.fmin(pf[start:start + length], appliance_pf)
+    return extra, pf
+
+
+def device_day(rng, household, day_start, interval, utc_offset, energy, reset_probability, drop_rate):
+    """
+    One day of readings of one device
+
+    Returns:
+        tuple: (list of reading dicts without device_id, energy counter at the end of the day)
+    """
+    n_rows = int(86400 // interval)
+    seconds = np.arange(n_rows) * interval
+    local = day_start + utc_offset
+    local_hours = (local.hour + local.minute / 60 + seconds / 3600) % 24
+    day_offset = ((local.hour * 3600 + local.minute * 60) + seconds) // 86400
+    weekend = (local.weekday() + day_offset) % 7 >= 5
+
+    power = household.base_power(local_hours, weekend)
+    power *= rng.lognormal(0.0, 0.08, n_rows)
+    spikes, spike_pf = appliance_load(rng, household, n_rows, interval)
+    power += spikes
+
+    pf = np.clip(np.fmin(household.base_pf + rng.normal(0, 0.01, n_rows), spike_pf), 0.5, 1.0)
+    voltage = household.grid_voltage - power / 1000 * 1.5 + rng.normal(0, 0.8, n_rows)
+    current = power / (voltage * pf)
+    frequency = 50.0 + rng.normal(0, 0.03, n_rows)
+
+    # Counter kWh kumulatif, kadang reset ke nol (meter diganti / power loss)
+    steps = power * interval / 3_600_000
+    counter = energy + np.cumsum(steps)
+    if rng.random() < reset_probability:
+        at = rng.integers(0, n_rows)
+        counter[at:] = np.cumsum(steps[at:])
+    energy_end = float(counter[-1])
+
+    keep = rng.random(n_rows) >= drop_rate
+    timestamps = [day_start + datetime.timedelta(seconds=float(s)) for s in seconds[keep]]
+    columns = zip(
+        timestamps,
+        np.round(voltage[keep], 2).tolist(),
+        np.round(current[keep], 3).tolist(),
+        np.round(power[keep], 1).tolist(),
+        np.round(counter[keep], 3).tolist(),
+        np.round(frequency[keep], 2).tolist(),
+        np.round(pf[keep], 2).tolist(),
+    )
+    readings = [
+        {"timestamp": ts, "voltage": v, "current": i, "power": p, "energy": e, "frequency": f, "pf": c}
+        for ts, v, i, p, e, f, c in columns
+    ]
+    return readings, energy_end
+
+
+# === Worker (satu proses, satu MongoClient) ===
+
+def generate_device(task):
+    """
+    Replace all readings of one device with a generated history
+
+    Returns:
+        tuple: (device_id, rows inserted)
+    """
+    n, device_id, options = task
+    rng = np.random.default_rng(options["seed"] + n)
+    household = Household(rng)
+    collection = mongo.get_collection()
+    collection.delete_many({"device_id": device_id})
+
+    energy = rng.uniform(0, 5000)
+    rows = 0
+    batch = []
+    for day in range(options["days"]):
+        day_start = options["start"] + datetime.timedelta(days=day)
+        readings, energy = device_day(rng, household, day_start, options["interval"], options["utc_offset"],
+                                      energy, options["reset_probability"], options["drop_rate"])
+        for reading in readings:
+            reading["device_id"] = device_id
+        batch.extend(readings)
+        while len(batch) >= options["batch_size"]:
+            collection.insert_many(batch[:options["batch_size"]], ordered=False)
+            rows += options["batch_size"]
+            del batch[:options["batch_size"]]
+    if batch:
+        collection.insert_many(batch, ordered=False)
+        rows += len(batch)
+    return device_id, rows
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Generate synthetic users, devices and PZEM readings")
+    parser.add_argument('--devices', type=int, default=1, help="Number of devices (default: 1, the demo device)")
+    parser.add_argument('--users', type=int, default=1,
+                        help="Load test users owning the extra devices round-robin (default: 1)")
+    parser.add_argument('--days', type=int, default=1, help="History length in days (default: 1)")
+    parser.add_argument('--interval', type=float, default=900,
+                        help="Seconds between readings (default: 900; the real devices send every 2s)")
+    parser.add_argument('--end', type=datetime.datetime.fromisoformat,
+                        help="End of the history, naive UTC ISO datetime (default: now)")
+    parser.add_argument('--reset-probability', type=float, default=0.02,
+                        help="Daily probability of an energy counter reset (default: 0.02)")
+    parser.add_argument('--drop-rate', type=float, default=0.001,
+                        help="Share of readings dropped like missed messages (default: 0.001)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                        help="Parallel insert processes (default: CPU count)")
+    parser.add_argument('--batch-size', type=int, default=5000, help="Documents per insert_many (default: 5000)")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    if args.devices < 1 or args.interval <= 0 or args.days <= 0 or args.workers < 1:
+        parser.error("--devices, --days, --interval and --workers must be positive")
+    return args
+
+
+def populate_mongodb(args):
+    print("--- Starting Dummy Data Population ---")
+    device_ids = create_devices(args.devices, args.users)
+
+    days = args.days
+    end = args.end or datetime.datetime.utcnow()
+    start = end - datetime.timedelta(days=days)
+    utc_offset = zoneinfo.ZoneInfo(settings.LOCAL_TIME_ZONE).utcoffset(end)
+    options = {
+        "start": start, "days": days, "interval": args.interval, "utc_offset": utc_offset,
+        "reset_probability": args.reset_probability, "drop_rate": args.drop_rate,
+        "batch_size": args.batch_size, "seed": args.seed,
+    }
+    expected = int(len(device_ids) * days * 86400 // args.interval)
+    print(f"  - Generating ~{expected:,} readings: {len(device_ids)} device(s) x {days} day(s) "
+          f"every {args.interval:g}s, {args.workers} worker(s)")
+
+    started = time.perf_counter()
+    total = 0
+    tasks = [(n, device_id, options) for n, device_id in enumerate(device_ids)]
+    # Proses anak membuat MongoClient sendiri (mongo.get_client lazy); koneksi SQL tidak dibawa ke fork
+    connections.close_all()
+    with multiprocessing.Pool(min(args.workers, len(tasks))) as pool:
+        for done, (device_id, rows) in enumerate(pool.imap_unordered(generate_device, tasks), start=1):
+            total += rows
+            if done == len(tasks) or done % max(1, len(tasks) // 20) == 0:
+                elapsed = time.perf_counter() - started
+                print(f"  - {done}/{len(tasks)} devices, {total:,} readings, {total / elapsed:,.0f} rows/s")
+
+    print(f"✓ Inserted {total:,} records into MongoDB in {time.perf_counter() - started:.1f}s")
+    for result in indexes.ensure():
+        if result["status"] != "exists":
+            print(f"  - Index {result['name'] or result['keys']} on {result['collection']}: {result['status']}")
+
 
 if __name__ == '__main__':
-    populate_mongodb()
-    print("--- Done ---")
\ No newline at end of file
+    populate_mongodb(parse_args())
+    print("--- Done ---")
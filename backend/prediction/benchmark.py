@@ -0,0 +1,465 @@
+"""
+Prediction / training benchmark suite.
+
+Generates synthetic device histories of several sizes into the local
+MongoDB (device ids "bench-<rows>-<n>", in the normal readings collection
+so the real loaders and sampling pipeline are exercised) and times every
+phase of a training run for each engine and algorithm:
+
+    load       MongoDB -> engine (sampling pipeline, cursor / connector read)
+    clean      drop null / non-numeric rows, build the feature matrix
+    split      80/20 train/test split
+    fit        fit one algorithm
+    evaluate   predict the test split and compute RMSE / MAE
+
+load, clean and split are shared by all algorithms of an engine and are
+repeated in each of its result rows, so every row is a complete run.
+
+Peak memory per phase:
+    numpy   tracemalloc peak of Python + NumPy allocations (optional, it
+            slows the load phase down)
+    spark   JVM heap peak (sum of the heap pools' peak usage, reset before
+            each phase; local mode, so driver and executor share the JVM)
+and the process high-water mark (ru_maxrss) after each phase.
+
+Results are plain dicts; write_report() stores them as JSON (with the
+environment) and as a flat CSV so runs can be diffed against each other.
+"""
+import csv
+import datetime
+import json
+import os
+import platform
+import resource
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from pymongo import ASCENDING, DESCENDING
+
+from monitoring import mongo
+
+from . import numpy_engine
+from .numpy_engine import ALGORITHMS, FEATURE_COLS, LABEL_COL
+from .sampling import build_pipeline
+
+DEVICE_PREFIX = "bench-"
+INSERT_BATCH = 50000
+READING_INTERVAL = 2  # detik antar reading, seperti PZEM di lapangan
+INVALID_RATIO = 0.01  # porsi reading rusak (null / string) untuk fase clean
+PHASES = ("load", "clean", "split", "fit", "evaluate")
+NO_SAMPLING = {"days": None, "max_rows": None, "strategy": "hourly"}
+
+CSV_FIELDS = [
+    "run_id", "engine", "algo", "rows", "devices", "records", "train_records", "test_records",
+    *[f"{phase}_seconds" for phase in PHASES], "total_seconds", "rows_per_second",
+    *[f"{phase}_peak_mb" for phase in PHASES], "peak_mb", "max_rss_mb", "rmse", "mae",
+]
+
+
+def parse_size(value):
+    """'10k' / '1m' / '2500' -> number of rows"""
+    value = str(value).strip().lower()
+    factor = {"k": 1000, "m": 1000000}.get(value[-1:], 1)
+    number = value[:-1] if factor > 1 else value
+    try:
+        rows = int(float(number) * factor)
+    except ValueError:
+        raise ValueError(f"Invalid size: {value!r} (use e.g. 10000, 10k, 1m)")
+    if rows <= 0:
+        raise ValueError(f"Invalid size: {value!r} (must be > 0)")
+    return rows
+
+
+def _mb(n_bytes):
+    return round(n_bytes / (1024 * 1024), 1)
+
+
+def max_rss_mb():
+    """Process memory high-water mark so far"""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux: KiB, macOS: byte
+    return _mb(usage if sys.platform == "darwin" else usage * 1024)
+
+
+# === Data sintetis ===
+
+def device_ids(rows, devices):
+    return [f"{DEVICE_PREFIX}{rows}-{n}" for n in range(devices)]
+
+
+def synthetic_readings(device_id, rows, end=None, seed=0):
+    """
+    Yield batches of synthetic readings ending at `end`, oldest first
+
+    Daily load curve plus noise; about INVALID_RATIO of the readings carry a
+    null or string value like a flaky sensor would.
+    """
+    end = end or datetime.datetime.utcnow()
+    rng = np.random.default_rng(seed)
+    start = end - datetime.timedelta(seconds=rows * READING_INTERVAL)
+    energy = 0.0
+
+    for offset in range(0, rows, INSERT_BATCH):
+        size = min(INSERT_BATCH, rows - offset)
+        seconds = (np.arange(offset, offset + size) * READING_INTERVAL).astype(np.float64)
+        hour = (seconds / 3600 + start.hour) % 24
+
+        voltage = 220 + 5 * np.sin(2 * np.pi * hour / 24) + rng.normal(0, 1.5, size)
+        pf = np.clip(0.85 + 0.1 * np.sin(2 * np.pi * (hour - 6) / 24) + rng.normal(0, 0.02, size), 0.3, 1.0)
+        current = np.clip(1.5 + 1.2 * np.sin(2 * np.pi * (hour - 14) / 24) + rng.normal(0, 0.3, size), 0.05, None)
+        power = voltage * current * pf
+        energy_steps = np.cumsum(power * READING_INTERVAL / 3600 / 1000) + energy
+        energy = float(energy_steps[-1])
+        invalid = rng.random(size) < INVALID_RATIO
+
+        batch = []
+        for i in range(size):
+            doc = {
+                "device_id": device_id,
+                "timestamp": start + datetime.timedelta(seconds=float(seconds[i])),
+                "voltage": float(voltage[i]),
+                "current": float(current[i]),
+                "power": float(power[i]),
+                "energy": float(energy_steps[i]),
+                "frequency": 50.0,
+                "pf": float(pf[i]),
+            }
+            if invalid[i]:
+                doc["power" if i % 2 else "pf"] = None if i % 3 else "nan"
+            batch.append(doc)
+        yield batch
+
+
+def generate(rows, devices=1, collection=None, log=print):
+    """
+    Insert `devices` synthetic histories of `rows` readings each
+
+    Existing benchmark data of the same size is reused when it is complete.
+
+    Returns:
+        list: device ids
+    """
+    collection = collection if collection is not None else mongo.get_collection()
+    collection.create_index([("device_id", ASCENDING), ("timestamp", DESCENDING)])
+
+    ids = device_ids(rows, devices)
+    for n, device_id in enumerate(ids):
+        if collection.count_documents({"device_id": device_id}) == rows:
+            log(f"  {device_id}: reusing {rows} readings")
+            continue
+        collection.delete_many({"device_id": device_id})
+        started = time.perf_counter()
+        for batch in synthetic_readings(device_id, rows, seed=n):
+            collection.insert_many(batch, ordered=False)
+        log(f"  {device_id}: inserted {rows} readings in {time.perf_counter() - started:.1f}s")
+    return ids
+
+
+def cleanup(collection=None, device_ids=None):
+    """
+    Remove benchmark readings and models
+
+    Args:
+        device_ids (list): only these devices (default: every benchmark device)
+
+    Returns:
+        int: deleted readings
+    """
+    from . import registry
+
+    collection = collection if collection is not None else mongo.get_collection()
+    devices = {"$in": list(device_ids)} if device_ids else {"$regex": f"^{DEVICE_PREFIX}"}
+    deleted = collection.delete_many({"device_id": devices}).deleted_count
+    registry.get_registry_collection().delete_many({"device_id": devices})
+    return deleted
+
+
+# === Pengukuran ===
+
+class PhaseTimer:
+    """
+    Time named phases and record their peak memory
+
+    Args:
+        peak (callable): () -> peak bytes since the last reset, or None
+        reset (callable): resets the peak counter before a phase
+    """
+
+    def __init__(self, peak=None, reset=None):
+        self.peak = peak
+        self.reset = reset
+        self.seconds = {}
+        self.peak_mb = {}
+        self.max_rss_mb = None
+
+    def measure(self, phase, fn):
+        if self.reset is not None:
+            self.reset()
+        started = time.perf_counter()
+        result = fn()
+        self.seconds[phase] = round(time.perf_counter() - started, 3)
+        if self.peak is not None:
+            self.peak_mb[phase] = _mb(self.peak())
+        self.max_rss_mb = max_rss_mb()
+        return result
+
+    def row(self, phases=PHASES):
+        return {
+            **{f"{phase}_seconds": self.seconds.get(phase) for phase in phases},
+            **{f"{phase}_peak_mb": self.peak_mb.get(phase) for phase in phases},
+            "max_rss_mb": self.max_rss_mb,
+        }
+
+
+def _tracemalloc_peak():
+    return tracemalloc.get_traced_memory()[1]
+
+
+def _finish_row(row, records):
+    seconds = [row[f"{phase}_seconds"] for phase in PHASES if row[f"{phase}_seconds"] is not None]
+    peaks = [row[f"{phase}_peak_mb"] for phase in PHASES if row[f"{phase}_peak_mb"] is not None]
+    row["total_seconds"] = round(sum(seconds), 3)
+    row["rows_per_second"] = round(records / row["total_seconds"]) if row["total_seconds"] else None
+    row["peak_mb"] = max(peaks) if peaks else None
+    return row
+
+
+def bench_numpy(device_id, algos=ALGORITHMS, sampling=NO_SAMPLING, trace_memory=True):
+    """
+    Phase timings of the NumPy engine for one device
+
+    load / clean mirror data.load_device_arrays, split into the cursor read
+    and the array conversion.
+
+    Returns:
+        list: one result dict per algorithm
+    """
+    collection = mongo.get_collection()
+    columns = FEATURE_COLS + [LABEL_COL]
+    timer = PhaseTimer(_tracemalloc_peak, tracemalloc.reset_peak) if trace_memory else PhaseTimer()
+    if trace_memory:
+        tracemalloc.start()
+
+    try:
+        def load():
+            pipeline, _ = build_pipeline(device_id, sampling, collection)
+            return [[doc.get(col) for col in columns] for doc in collection.aggregate(pipeline, batchSize=10000)]
+
+        def clean(rows):
+            valid = [values for values in rows if all(isinstance(v, (int, float)) for v in values)]
+            data = np.asarray(valid, dtype=np.float64).reshape(-1, len(columns))
+            data = data[np.isfinite(data).all(axis=1)]
+            return data[:, :-1], data[:, -1]
+
+        def split(X, y):
+            mask = numpy_engine.split_mask(len(y))
+            return X[mask], y[mask], X[~mask], y[~mask]
+
+        rows = timer.measure("load", load)
+        records = len(rows)
+        X, y = timer.measure("clean", lambda: clean(rows))
+        del rows
+        X_train, y_train, X_test, y_test = timer.measure("split", lambda: split(X, y))
+
+        results = []
+        for algo in algos:
+            model = timer.measure("fit", lambda: numpy_engine.fit(algo, X_train, y_train))
+
+            def evaluate():
+                error = model.predict(X_test) - y_test
+                return float(np.sqrt(np.mean(error ** 2))), float(np.mean(np.abs(error)))
+
+            rmse, mae = timer.measure("evaluate", evaluate)
+            results.append(_finish_row({
+                "engine": "numpy",
+                "algo": algo,
+                "records": records,
+                "train_records": len(y_train),
+                "test_records": len(y_test),
+                **timer.row(),
+                "rmse": round(rmse, 4),
+                "mae": round(mae, 4),
+            }, records))
+        return results
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+
+
+def _jvm_heap(spark):
+    """(peak, reset) callables over the JVM heap memory pools"""
+    jvm = spark.sparkContext._jvm
+    pools = [
+        pool for pool in jvm.java.lang.management.ManagementFactory.getMemoryPoolMXBeans()
+        if pool.getType().toString() == "Heap memory"
+    ]
+
+    def peak():
+        return sum(pool.getPeakUsage().getUsed() for pool in pools)
+
+    def reset():
+        jvm.java.lang.System.gc()
+        for pool in pools:
+            pool.resetPeakUsage()
+
+    return peak, reset
+
+
+def bench_spark(spark, device_id, algos=ALGORITHMS, sampling=NO_SAMPLING):
+    """
+    Phase timings of the Spark engine for one device
+
+    Same calls as training.prepare_training_data / fit_and_evaluate, with a
+    count() after each lazy phase so its work is done inside the timing.
+
+    Returns:
+        list: one result dict per algorithm
+    """
+    from .training import evaluate_predictions, fit_pipeline, load_device_frame, release_training_data
+
+    timer = PhaseTimer(*_jvm_heap(spark))
+
+    def load():
+        df, _ = load_device_frame(spark, device_id, sampling)
+        df = df.cache()
+        return df, df.count()
+
+    def clean(df):
+        df_clean = df.na.drop(subset=FEATURE_COLS + [LABEL_COL]).select(FEATURE_COLS + [LABEL_COL]).cache()
+        df_clean.count()
+        return df_clean
+
+    def split(df_clean):
+        train_data, test_data = df_clean.randomSplit([0.8, 0.2], seed=42)
+        train_data, test_data = train_data.cache(), test_data.cache()
+        return train_data, test_data, train_data.count(), test_data.count()
+
+    df, records = timer.measure("load", load)
+    df_clean = timer.measure("clean", lambda: clean(df))
+    train_data, test_data, train_records, test_records = timer.measure("split", lambda: split(df_clean))
+
+    results = []
+    try:
+        for algo in algos:
+            model, _ = timer.measure("fit", lambda: fit_pipeline(algo, train_data))
+            metrics = timer.measure("evaluate", lambda: evaluate_predictions(model.transform(test_data)))
+            results.append(_finish_row({
+                "engine": "spark",
+                "algo": algo,
+                "records": records,
+                "train_records": train_records,
+                "test_records": test_records,
+                **timer.row(),
+                "rmse": round(metrics["rmse"], 4),
+                "mae": round(metrics["mae"], 4),
+            }, records))
+    finally:
+        release_training_data(df, df_clean, train_data, test_data)
+    return results
+
+
+def bench_fleet(ids, algos=ALGORITHMS, sampling=NO_SAMPLING, workers=None):
+    """
+    Whole-fleet retrain of the benchmark devices with the NumPy engine
+
+    Returns:
+        dict: result row (load = per-device sampled reads, fit = process
+        pool fits including the registry writes)
+    """
+    from .fleet import train_fleet_numpy
+
+    summary = train_fleet_numpy(ids, algos, workers=workers, log=lambda message: None, sampling=sampling)
+    row = dict.fromkeys(CSV_FIELDS)
+    row.update({
+        "engine": "numpy-fleet",
+        "algo": "+".join(algos),
+        "records": None,
+        "load_seconds": summary["load_seconds"],
+        "fit_seconds": round(summary["total_seconds"] - summary["load_seconds"], 2),
+        "total_seconds": summary["total_seconds"],
+        "max_rss_mb": max_rss_mb(),
+    })
+    return row
+
+
+def run(sizes, devices=1, engines=("numpy",), algos=ALGORITHMS, sampling=NO_SAMPLING,
+        trace_memory=True, spark=None, log=print):
+    """
+    Generate data and benchmark every size / engine / algorithm combination
+
+    Args:
+        sizes (list): rows per device
+        devices (int): devices per size; with more than one, a numpy-fleet
+                       row times a whole-fleet retrain of them
+        engines (tuple): 'numpy' and / or 'spark'
+        spark (SparkSession): required for the spark engine
+
+    Returns:
+        list: result rows (CSV_FIELDS)
+    """
+    run_id = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    results = []
+
+    for rows in sizes:
+        log(f"=== {rows} rows x {devices} device(s) ===")
+        ids = generate(rows, devices, log=log)
+
+        for engine in engines:
+            log(f"  {engine}: {', '.join(algos)}")
+            if engine == "spark":
+                engine_rows = bench_spark(spark, ids[0], algos, sampling)
+            else:
+                engine_rows = bench_numpy(ids[0], algos, sampling, trace_memory)
+            if devices > 1 and engine == "numpy":
+                engine_rows.append(bench_fleet(ids, algos, sampling))
+
+            for row in engine_rows:
+                row.update({"run_id": run_id, "rows": rows, "devices": devices})
+                log(f"    {row['engine']:<11} {row['algo']:<10} total {row['total_seconds']:>8}s  "
+                    f"fit {row['fit_seconds']}s  peak {row['peak_mb']} MB")
+            results.extend(engine_rows)
+
+    return results
+
+
+def environment(spark=None):
+    """Machine and library versions stored with a report"""
+    info = {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "numpy": np.__version__,
+    }
+    if spark is not None:
+        info["spark"] = spark.version
+        info["spark_master"] = spark.sparkContext.master
+    return info
+
+
+def write_report(results, output_dir, settings_used, spark=None):
+    """
+    Write <run_id>.json (results + environment + settings) and <run_id>.csv
+
+    Returns:
+        tuple: (json path, csv path)
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    run_id = results[0]["run_id"] if results else datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S")
+    base = os.path.join(output_dir, f"benchmark-{run_id}")
+
+    with open(f"{base}.json", "w") as f:
+        json.dump({
+            "run_id": run_id,
+            "environment": environment(spark),
+            "settings": settings_used,
+            "results": results,
+        }, f, indent=2, default=str)
+
+    with open(f"{base}.csv", "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction="ignore")
+        writer.writeheader()
+        writer.writerows(results)
+
+    return f"{base}.json", f"{base}.csv"
@@ -0,0 +1,245 @@
+"""
+Prediction result cache.
+
+Results are keyed by (kind, device_id, algo, meter_type, ..., watermark)
+where the watermark is the timestamp of the device's latest reading. When
+new readings land the watermark moves, so stale results are never served;
+they simply stop being read and age out through TTL / LRU eviction.
+
+Backends (settings.PREDICTION_CACHE['BACKEND']):
+    locmem  per-process OrderedDict with LRU eviction (default)
+    file    one JSON file per entry in LOCATION, shared by all processes on the host
+    redis   Redis-compatible server at LOCATION (requires the `redis` package);
+            eviction follows the server's maxmemory-policy
+"""
+import datetime
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from pymongo.errors import PyMongoError
+
+from monitoring import mongo
+
+
+class LocMemBackend:
+    def __init__(self, max_entries, **kwargs):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl):
+        with self._lock:
+            self._data[key] = (time.time() + ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FileBackend:
+    """JSON files named by key hash; file mtime is the LRU clock"""
+
+    def __init__(self, max_entries, location, **kwargs):
+        if not location:
+            raise ValueError("PREDICTION_CACHE BACKEND 'file' needs LOCATION (a cache directory)")
+        self.max_entries = max_entries
+        self.location = location
+        os.makedirs(location, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.location, hashlib.sha1(key.encode()).hexdigest() + '.json')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if entry["expires"] < time.time():
+            self._remove(path)
+            return None
+        os.utime(path)
+        return entry["value"]
+
+    def set(self, key, value, ttl):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"expires": time.time() + ttl, "value": value}, f)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    def _evict(self):
+        entries = [entry for entry in os.scandir(self.location) if entry.name.endswith('.json')]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            self._remove(entry.path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        for entry in os.scandir(self.location):
+            if entry.name.endswith('.json'):
+                self._remove(entry.path)
+
+    def __len__(self):
+        return sum(1 for entry in os.scandir(self.location) if entry.name.endswith('.json'))
+
+
+class RedisBackend:
+    def __init__(self, location, key_prefix='wattara:prediction:', **kwargs):
+        try:
+            import redis
+        except ImportError:
+            raise ImportError("PREDICTION_CACHE BACKEND 'redis' requires the redis package (pip install redis)")
+        self.client = redis.Redis.from_url(location)
+        self.key_prefix = key_prefix
+
+    def get(self, key):
+        value = self.client.get(self.key_prefix + key)
+        return json.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.key_prefix + key, json.dumps(value), ex=int(ttl))
+
+    def clear(self):
+        for key in self.client.scan_iter(self.key_prefix + '*'):
+            self.client.delete(key)
+
+    def __len__(self):
+        return sum(1 for _ in self.client.scan_iter(self.key_prefix + '*'))
+
+
+BACKENDS = {
+    'locmem': LocMemBackend,
+    'file': FileBackend,
+    'redis': RedisBackend,
+}
+
+
+class ResultCache:
+    """Backend wrapper with TTL and hit/miss counters (counted per process)"""
+
+    def __init__(self, backend, ttl, watermark_resolution=0):
+        self.backend = backend
+        self.ttl = ttl
+        self.watermark_resolution = watermark_resolution
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def make_key(self, kind, device_id, *parts, watermark=None):
+        return ':'.join([kind, device_id] + [str(part) for part in parts] + [watermark or 'none'])
+
+    def get(self, key):
+        try:
+            value = self.backend.get(key)
+        except Exception:
+            value = None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        try:
+            self.backend.set(key, value, self.ttl)
+        except Exception as e:
+            print(f"Prediction cache write failed: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        try:
+            entries = len(self.backend)
+        except Exception:
+            entries = None
+        return {
+            "backend": type(self.backend).__name__,
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            "ttl_seconds": self.ttl,
+        }
+
+    def watermark(self, device_id):
+        """
+        Latest-ingest watermark of a device (one indexed lookup)
+
+        Rounded down to WATERMARK_RESOLUTION seconds (0 = exact) so a device
+        reporting every few seconds still gets cache hits within the same window;
+        results may then lag the newest readings by up to that many seconds.
+        None when the device has no readings or MongoDB is unreachable (result
+        is not cached).
+        """
+        try:
+            latest = mongo.get_collection().find_one(
+                {"device_id": device_id},
+                {"_id": 0, "timestamp": 1},
+                sort=[("timestamp", -1)]
+            )
+        except PyMongoError:
+            return None
+        if not latest or not isinstance(latest.get("timestamp"), datetime.datetime):
+            return None
+
+        ts = latest["timestamp"]
+        if self.watermark_resolution:
+            epoch = ts.replace(tzinfo=datetime.timezone.utc).timestamp()
+            epoch -= epoch % self.watermark_resolution
+            ts = datetime.datetime.fromtimestamp(epoch, datetime.timezone.utc).replace(tzinfo=None)
+        return ts.isoformat()
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Process-wide ResultCache configured from settings.PREDICTION_CACHE"""
+    global _cache
+
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                config = settings.PREDICTION_CACHE
+                backend = BACKENDS[config['BACKEND']](
+                    max_entries=config['MAX_ENTRIES'],
+                    location=config.get('LOCATION'),
+                )
+                _cache = ResultCache(backend, config['TTL'], config.get('WATERMARK_RESOLUTION', 0))
+
+    return _cache
@@ -0,0 +1,51 @@
+"""
+Client side of the prediction worker protocol (see prediction.worker).
+
+Safe to import from any Django process: it does not touch pyspark.
+"""
+from multiprocessing.connection import Client
+
+from django.conf import settings
+
+from .exceptions import PredictionError, WorkerUnavailable
+
+
+def call(method, timeout=None, **params):
+    """
+    Call a method on the prediction worker and wait for the result
+
+    Args:
+        method (str): worker handler name (e.g. 'train', 'health')
+        timeout (float): seconds to wait for the reply. Default: PREDICTION_WORKER['TIMEOUT']
+        **params: keyword arguments for the handler
+
+    Returns:
+        The handler result
+
+    Raises:
+        WorkerUnavailable: when the worker is not running or does not answer in time
+        PredictionError: when the handler itself fails
+    """
+    config = settings.PREDICTION_WORKER
+    address = tuple(config['ADDRESS'])
+
+    try:
+        conn = Client(address, authkey=config['AUTHKEY'])
+    except OSError as e:
+        raise WorkerUnavailable(f"Prediction worker is not reachable at {address[0]}:{address[1]} ({e})")
+
+    with conn:
+        conn.send({"method": method, "params": params})
+
+        if not conn.poll(timeout if timeout is not None else config['TIMEOUT']):
+            raise WorkerUnavailable("Prediction worker did not respond in time")
+
+        try:
+            response = conn.recv()
+        except EOFError:
+            raise WorkerUnavailable("Prediction worker closed the connection")
+
+    if not response["ok"]:
+        raise PredictionError(response["error"], status=response["status"], payload=response["payload"])
+
+    return response["result"]
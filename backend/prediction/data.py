@@ -0,0 +1,125 @@
+"""
+Training data loaders for the in-process (NumPy) engine.
+
+Reads readings straight from MongoDB with a projection and turns them into
+float arrays, dropping rows with missing or non-numeric values. Reads of
+the raw readings also include the cold Parquet archive (monitoring.archive)
+for the part of the range that was moved out of MongoDB.
+"""
+import functools
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+from django.conf import settings
+
+from monitoring import archive, mongo
+
+from .numpy_engine import FEATURE_COLS, LABEL_COL
+
+
+def archived_arrays(device_id, columns, since, until, collection):
+    """Archived rows of (since, until] when `collection` is the raw readings"""
+    if not settings.ARCHIVE['ENABLED'] or collection.name != mongo.READINGS_COLLECTION:
+        return [], np.empty((0, len(columns)))
+    return archive.read_device_arrays(device_id, columns, since, until, closed="right")
+
+
+def archived_window(device_id, columns, since, collection):
+    """
+    Archived rows of a training window [since, now) and their local hours
+
+    Returns:
+        tuple: (pyarrow.Table of timestamp + columns, or None; ndarray of local hours)
+    """
+    if not settings.ARCHIVE['ENABLED'] or collection.name != mongo.READINGS_COLLECTION:
+        return None, np.empty(0, dtype=np.int64)
+    table = archive.read_device(device_id, ["timestamp", *columns], since, None, closed="left")
+    if table is None:
+        return None, np.empty(0, dtype=np.int64)
+    # Baris dengan nilai kosong tidak pernah lolos $match di MongoDB: buang juga di sini
+    valid = [pc.is_finite(table.column(col)).fill_null(False) for col in columns]
+    table = table.filter(functools.reduce(pc.and_, valid))
+    local = table.column("timestamp").cast(pa.timestamp("ms", tz=settings.LOCAL_TIME_ZONE))
+    return table, pc.hour(local).to_numpy(zero_copy_only=False).astype(np.int64)
+
+
+def load_device_arrays(device_id, since=None, until=None, collection=None):
+    """
+    Load one device's readings as arrays, oldest first
+
+    Args:
+        device_id (str): Device ID
+        since (datetime): only readings with timestamp > since
+        until (datetime): only readings with timestamp <= until
+
+    Returns:
+        tuple: (X, y, timestamps) where timestamps is a list of datetimes
+    """
+    collection = collection if collection is not None else mongo.get_collection()
+    query = {"device_id": device_id}
+    time_filter = {}
+    if since is not None:
+        time_filter["$gt"] = since
+    if until is not None:
+        time_filter["$lte"] = until
+    if time_filter:
+        query["timestamp"] = time_filter
+
+    columns = FEATURE_COLS + [LABEL_COL]
+    projection = {"_id": 0, "timestamp": 1, **{col: 1 for col in columns}}
+
+    rows, timestamps = [], []
+    for doc in collection.find(query, projection, batch_size=10000).sort("timestamp", 1):
+        values = [doc.get(col) for col in columns]
+        if any(not isinstance(v, (int, float)) for v in values):
+            continue
+        rows.append(values)
+        timestamps.append(doc.get("timestamp"))
+
+    cold_timestamps, cold_data = archived_arrays(device_id, columns, since, until, collection)
+    data = np.vstack([cold_data, np.asarray(rows, dtype=np.float64).reshape(-1, len(columns))])
+    timestamps = cold_timestamps + timestamps
+    finite = np.isfinite(data).all(axis=1)
+    timestamps = [ts for ts, ok in zip(timestamps, finite) if ok]
+    return data[finite, :-1], data[finite, -1], timestamps
+
+
+def load_device_series(device_id, field=LABEL_COL, since=None, until=None, collection=None):
+    """
+    Load one numeric field of a device as (timestamps, values), oldest first
+
+    Args:
+        device_id (str): Device ID
+        field (str): reading field (default: power)
+        since (datetime): only readings with timestamp > since
+        until (datetime): only readings with timestamp <= until
+
+    Returns:
+        tuple: (list of datetimes, float ndarray)
+    """
+    collection = collection if collection is not None else mongo.get_collection()
+    query = {"device_id": device_id, field: {"$type": "number"}}
+    time_filter = {}
+    if since is not None:
+        time_filter["$gt"] = since
+    if until is not None:
+        time_filter["$lte"] = until
+    if time_filter:
+        query["timestamp"] = time_filter
+
+    timestamps, values = [], []
+    cursor = collection.find(query, {"_id": 0, "timestamp": 1, field: 1}, batch_size=10000).sort("timestamp", 1)
+    for doc in cursor:
+        timestamps.append(doc["timestamp"])
+        values.append(doc[field])
+
+    values = np.asarray(values, dtype=np.float64)
+    if field in archive.VALUE_COLUMNS:
+        cold_timestamps, cold_data = archived_arrays(device_id, [field], since, until, collection)
+        if len(cold_timestamps):
+            numeric = ~np.isnan(cold_data[:, 0])
+            timestamps = [ts for ts, ok in zip(cold_timestamps, numeric) if ok] + timestamps
+            values = np.concatenate([cold_data[numeric, 0], values])
+
+    return timestamps, values
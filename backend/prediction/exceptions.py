@@ -0,0 +1,22 @@
+class PredictionError(Exception):
+    """
+    Error raised by the prediction pipeline
+
+    Carries the HTTP status and any extra response fields so the web view
+    can turn it into a JsonResponse without knowing where it came from.
+    """
+
+    def __init__(self, message, status=500, payload=None):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+        self.payload = payload or {}
+
+
+class WorkerUnavailable(PredictionError):
+    """Raised when the prediction worker process cannot be reached"""
+
+    def __init__(self, message):
+        super().__init__(message, status=503, payload={
+            "hint": "Start the worker with: python manage.py runpredictionworker"
+        })
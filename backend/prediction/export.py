@@ -0,0 +1,127 @@
+"""
+Export fitted Spark ML regression models to NumPy structures.
+
+    LinearRegressionModel            -> numpy_engine.LinearModel
+    RandomForestRegressionModel      -> numpy_engine.TreeEnsemble (weights 1/numTrees)
+    GBTRegressionModel               -> numpy_engine.TreeEnsemble (weights = treeWeights)
+    DecisionTreeRegressionModel      -> numpy_engine.TreeEnsemble (one tree)
+
+Tree nodes are read from Spark's own persistence format: the model is saved
+to a temporary directory and its `data` parquet (one NodeData row per node)
+is loaded with pyarrow, which is much faster than walking the JVM node
+objects through py4j. Only continuous splits are supported, which is all the
+VectorAssembler pipeline produces.
+
+The exported models score with numpy_engine's vectorized evaluators inside
+the web process, with no SparkSession.
+"""
+import os
+import tempfile
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from .numpy_engine import FEATURE_COLS, LEAF, LinearModel, TreeEnsemble
+
+
+def _read_nodes(model):
+    """Save a tree model and return its node table as flat numpy columns"""
+    with tempfile.TemporaryDirectory(prefix="wattara-export-") as tmp:
+        path = os.path.join(tmp, "model")
+        model.write().save(path)
+        table = pq.read_table(os.path.join(path, "data"))
+
+    # nodeData.split.* bersarang dua tingkat
+    while any(pa.types.is_struct(field.type) for field in table.schema):
+        table = table.flatten()
+
+    columns = {name.replace("nodeData.", ""): table.column(name) for name in table.column_names}
+    nodes = {
+        "tree": np.asarray(columns["treeID"].to_numpy()) if "treeID" in columns else np.zeros(table.num_rows, dtype=np.int64),
+        "id": columns["id"].to_numpy(),
+        "prediction": columns["prediction"].to_numpy(),
+        "left": columns["leftChild"].to_numpy(),
+        "right": columns["rightChild"].to_numpy(),
+        "feature": columns["split.featureIndex"].to_numpy(),
+        "num_categories": columns["split.numCategories"].to_numpy(),
+        "threshold": np.array([
+            values[0] if values else 0.0
+            for values in columns["split.leftCategoriesOrThreshold"].to_pylist()
+        ]),
+    }
+    return nodes
+
+
+def _tree_ensemble(model, weights):
+    """Convert a Spark tree model's node table into one flat TreeEnsemble"""
+    nodes = _read_nodes(model)
+    internal = nodes["left"] != -1
+    if np.any(internal & (nodes["num_categories"] != -1)):
+        raise ValueError("Categorical splits are not supported by the NumPy exporter")
+
+    order = np.lexsort((nodes["id"], nodes["tree"]))
+    nodes = {key: value[order] for key, value in nodes.items()}
+    trees, starts = np.unique(nodes["tree"], return_index=True)
+
+    left = np.full(len(order), LEAF, dtype=np.int32)
+    right = np.full(len(order), LEAF, dtype=np.int32)
+    roots = np.zeros(len(trees), dtype=np.int32)
+
+    for t, start in enumerate(starts):
+        end = starts[t + 1] if t + 1 < len(starts) else len(order)
+        ids = nodes["id"][start:end]
+        is_internal = nodes["left"][start:end] != -1
+        # Posisi global node anak = awal tree + posisi id anak di dalam tree
+        left[start:end][is_internal] = start + np.searchsorted(ids, nodes["left"][start:end][is_internal])
+        right[start:end][is_internal] = start + np.searchsorted(ids, nodes["right"][start:end][is_internal])
+
+        children = np.concatenate([nodes["left"][start:end], nodes["right"][start:end]])
+        root_id = np.setdiff1d(ids, children)[0]
+        roots[t] = start + np.searchsorted(ids, root_id)
+
+    feature = np.where(left != LEAF, nodes["feature"], 0)
+    threshold = np.where(left != LEAF, nodes["threshold"], 0.0)
+    return TreeEnsemble(feature, threshold, left, right, nodes["prediction"], roots, weights)
+
+
+def export_model(model):
+    """
+    Convert a fitted Spark regression model (or a PipelineModel ending in one)
+
+    Args:
+        model: PipelineModel, LinearRegressionModel, RandomForestRegressionModel,
+               GBTRegressionModel or DecisionTreeRegressionModel
+
+    Returns:
+        LinearModel or TreeEnsemble expecting features in FEATURE_COLS order
+
+    Raises:
+        ValueError: for unsupported models or feature layouts
+    """
+    from pyspark.ml import PipelineModel
+    from pyspark.ml.feature import VectorAssembler
+    from pyspark.ml.regression import (
+        DecisionTreeRegressionModel, GBTRegressionModel,
+        LinearRegressionModel, RandomForestRegressionModel,
+    )
+
+    if isinstance(model, PipelineModel):
+        assemblers = [stage for stage in model.stages if isinstance(stage, VectorAssembler)]
+        if assemblers and assemblers[0].getInputCols() != FEATURE_COLS:
+            raise ValueError(f"Expected features {FEATURE_COLS}, got {assemblers[0].getInputCols()}")
+        model = model.stages[-1]
+
+    if isinstance(model, LinearRegressionModel):
+        return LinearModel(model.coefficients.toArray(), model.intercept)
+
+    if isinstance(model, RandomForestRegressionModel):
+        return _tree_ensemble(model, np.full(model.getNumTrees, 1.0 / model.getNumTrees))
+
+    if isinstance(model, GBTRegressionModel):
+        return _tree_ensemble(model, np.asarray(model.treeWeights, dtype=np.float64))
+
+    if isinstance(model, DecisionTreeRegressionModel):
+        return _tree_ensemble(model, np.ones(1))
+
+    raise ValueError(f"Unsupported model type: {type(model).__name__}")
@@ -0,0 +1,252 @@
+"""
+Materialized training feature store.
+
+Raw readings (one every few seconds) are rolled up into one clean row per
+device per BUCKET_SECONDS in the `prediction_features` collection:
+
+    {device_id, timestamp (bucket start), n,
+     voltage, current, pf, power,                      <- bucket means
+     voltage_sum, current_sum, pf_sum, power_sum}      <- running sums
+
+Rows have the same field names as raw readings, so every loader (Spark
+aggregation pipeline, data.load_device_arrays / load_device_series, the
+sampling pipeline) reads them unchanged by pointing at this collection.
+Non-numeric readings never reach the store, so training input is already
+clean and about BUCKET_SECONDS / cadence times smaller than the raw data.
+
+Two writers keep it current:
+    ingester   runmqtt folds each reading into its (open) bucket with one
+               upsert (pipeline update: sums, n and means in one round trip)
+    rebuild    `manage.py buildfeatures` recomputes closed buckets from raw
+               readings server-side with $group + $merge, idempotently, from
+               its watermark; use it to backfill history or repair gaps
+
+Lag and rolling features are not stored: FeatureBuilder derives them from
+the bucket series with array slicing, which is cheaper than reading them.
+"""
+import datetime
+
+from django.conf import settings
+from pymongo import ASCENDING, UpdateOne
+
+from monitoring import archive, mongo
+
+from .numpy_engine import FEATURE_COLS, LABEL_COL
+
+FEATURE_COLLECTION = "prediction_features"
+STATE_COLLECTION = "prediction_feature_state"
+VALUE_COLS = FEATURE_COLS + [LABEL_COL]
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def get_feature_collection():
+    return mongo.get_collection(FEATURE_COLLECTION)
+
+
+def ensure_indexes(collection=None):
+    collection = collection if collection is not None else get_feature_collection()
+    # Unik: dipakai $merge dan upsert ingester
+    collection.create_index([("device_id", ASCENDING), ("timestamp", ASCENDING)], unique=True)
+
+
+def bucket_seconds():
+    return settings.FEATURE_STORE['BUCKET_SECONDS']
+
+
+def bucket_start(ts):
+    """Start of the bucket holding a naive UTC datetime"""
+    seconds = (ts - EPOCH).total_seconds()
+    return EPOCH + datetime.timedelta(seconds=seconds - seconds % bucket_seconds())
+
+
+def closed_until(now=None):
+    """Newest bucket start that no in-flight reading can still change"""
+    now = now or datetime.datetime.utcnow()
+    lag = datetime.timedelta(seconds=settings.FEATURE_STORE['INGEST_LAG_SECONDS'])
+    return bucket_start(now - lag)
+
+
+def ingest_update(reading):
+    """
+    Upsert that folds one raw reading into its bucket, for the ingester
+
+    Args:
+        reading (dict): reading as saved to pzem_data1 (with timestamp)
+
+    Returns:
+        UpdateOne, or None when the reading has non-numeric values
+    """
+    values = {col: reading.get(col) for col in VALUE_COLS}
+    if any(isinstance(v, bool) or not isinstance(v, (int, float)) for v in values.values()):
+        return None
+
+    sums = {
+        f"{col}_sum": {"$add": [{"$ifNull": [f"${col}_sum", 0]}, float(value)]}
+        for col, value in values.items()
+    }
+    means = {col: {"$divide": [f"${col}_sum", "$n"]} for col in VALUE_COLS}
+
+    return UpdateOne(
+        {"device_id": reading["device_id"], "timestamp": bucket_start(reading["timestamp"])},
+        [
+            {"$set": {"n": {"$add": [{"$ifNull": ["$n", 0]}, 1]}, **sums}},
+            {"$set": means},
+        ],
+        upsert=True
+    )
+
+
+def rebuild(device_ids=None, since=None, until=None, readings=None, features=None):
+    """
+    Recompute buckets in [since, until) from raw readings inside MongoDB
+
+    Buckets are grouped with epoch arithmetic and written with $merge
+    (replace on (device_id, timestamp)), so re-running a range is safe.
+
+    Args:
+        device_ids (list): restrict to these devices (default: all)
+        since (datetime): first bucket to rebuild (default: all history)
+        until (datetime): end, exclusive (default: closed_until())
+
+    Returns:
+        datetime: the `until` that was used (next watermark)
+    """
+    readings = readings if readings is not None else mongo.get_collection()
+    features = features if features is not None else get_feature_collection()
+    until = until or closed_until()
+    bucket_ms = bucket_seconds() * 1000
+
+    time_filter = {"$type": "date", "$lt": until}
+    if since is not None:
+        time_filter["$gte"] = bucket_start(since)
+    match = {
+        "timestamp": time_filter,
+        **{col: {"$type": "number"} for col in VALUE_COLS},
+    }
+    if device_ids:
+        match["device_id"] = {"$in": list(device_ids)}
+
+    # date - date = milidetik; date + angka = date
+    epoch_ms = {"$subtract": ["$timestamp", EPOCH]}
+    readings.aggregate([
+        {"$match": match},
+        {"$group": {
+            "_id": {
+                "device_id": "$device_id",
+                "timestamp": {"$add": [EPOCH, {"$subtract": [epoch_ms, {"$mod": [epoch_ms, bucket_ms]}]}]},
+            },
+            "n": {"$sum": 1},
+            **{f"{col}_sum": {"$sum": f"${col}"} for col in VALUE_COLS},
+        }},
+        {"$project": {
+            "_id": 0,
+            "device_id": "$_id.device_id",
+            "timestamp": "$_id.timestamp",
+            "n": 1,
+            **{f"{col}_sum": 1 for col in VALUE_COLS},
+            **{col: {"$divide": [f"${col}_sum", "$n"]} for col in VALUE_COLS},
+        }},
+        {"$merge": {
+            "into": features.name,
+            "on": ["device_id", "timestamp"],
+            "whenMatched": "replace",
+            "whenNotMatched": "insert",
+        }},
+    ], allowDiskUse=True)
+
+    return until
+
+
+def rebuild_incremental(device_ids=None, full=False):
+    """
+    Rebuild closed buckets since the last run's watermark
+
+    The bucket containing the old watermark is recomputed as well, since
+    the ingester may still have been writing to it.
+
+    Returns:
+        dict: {"since", "until"} of the rebuilt range
+    """
+    state = mongo.get_collection(STATE_COLLECTION)
+    key = {"_id": "rebuild"}
+    watermark = None if full or device_ids else (state.find_one(key) or {}).get("watermark")
+
+    until = rebuild(device_ids, since=watermark)
+    if not device_ids:
+        state.update_one(key, {"$set": {"watermark": until}}, upsert=True)
+
+    return {"since": watermark, "until": until}
+
+
+def training_collection(device_id, since=None):
+    """
+    Collection training should read for a device
+
+    The feature store when it is enabled and covers the whole window:
+    a rebuild has run, the device's oldest bucket reaches back to the start
+    of the window (rebuild filled everything before its watermark), and the
+    ingester's buckets after the watermark hold every raw reading stored
+    since (see ingested_since). Otherwise the raw readings, e.g. before the
+    first buildfeatures run, while a rebuild has only filled the ingester's
+    recent buckets, or after readings bypassed the ingester.
+
+    Args:
+        device_id (str): Device ID
+        since (datetime): start of the training window (None: all history,
+                          i.e. the device's oldest raw or archived reading)
+
+    Returns:
+        tuple: (collection, source name)
+    """
+    raw = mongo.get_collection()
+    if not settings.FEATURE_STORE['ENABLED']:
+        return raw, "raw"
+    watermark = (mongo.get_collection(STATE_COLLECTION).find_one({"_id": "rebuild"}) or {}).get("watermark")
+    if watermark is None:
+        return raw, "raw"
+
+    oldest = get_feature_collection().find_one({"device_id": device_id}, {"timestamp": 1}, sort=[("timestamp", ASCENDING)])
+    if oldest is None:
+        return raw, "raw"
+
+    if since is None:
+        first = raw.find_one({"device_id": device_id}, {"timestamp": 1}, sort=[("timestamp", ASCENDING)])
+        starts = [first["timestamp"]] if first else []
+        days = archive.archived_days(device_id) if settings.ARCHIVE['ENABLED'] else []
+        if days:
+            starts.append(datetime.datetime.combine(days[0], datetime.time()))
+        since = min(starts, default=None)
+
+    if since is not None and oldest["timestamp"] > since:
+        return raw, "raw"
+    if not ingested_since(device_id, watermark, raw, get_feature_collection()):
+        return raw, "raw"
+    return get_feature_collection(), "features"
+
+
+def ingested_since(device_id, watermark, readings, features):
+    """
+    Whether the buckets after the rebuild watermark hold every raw reading
+
+    Only the ingester writes those buckets, so a reading stored by another
+    path (or while the ingester's upsert failed) leaves a gap that the next
+    rebuild repairs. The bucket reading counts (n) must add up to at least
+    the numeric raw readings since the watermark; more is fine, since with
+    ingest compression the ingester folds readings that are not stored raw.
+
+    Returns:
+        bool
+    """
+    stored = readings.count_documents({
+        "device_id": device_id,
+        "timestamp": {"$gte": watermark},
+        **{col: {"$type": "number"} for col in VALUE_COLS},
+    })
+    if not stored:
+        return True
+
+    folded = next(features.aggregate([
+        {"$match": {"device_id": device_id, "timestamp": {"$gte": watermark}}},
+        {"$group": {"_id": None, "n": {"$sum": "$n"}}},
+    ]), {}).get("n", 0)
+    return folded >= stored
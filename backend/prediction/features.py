@@ -0,0 +1,194 @@
+"""
+Vectorized lag/calendar feature builder for time-ahead power forecasting.
+
+Raw readings are bucketed onto a regular grid (mean per interval, gaps
+forward-filled, see monitoring/resampling.py). From that series the builder
+produces, for every grid step t, the features used to predict power at t:
+
+    lag_l      power at t - l steps, for each l in `lags`
+    mean_w     mean power over steps t - w .. t - 1, for each w in `windows`
+    calendar   hour-of-day and day-of-week as sin/cos pairs, weekend flag
+
+Everything is computed with array slicing and cumulative sums; the builder
+keeps per-bucket sums and counts, so new readings can be appended without
+rebuilding the series.
+"""
+import numpy as np
+
+from monitoring import resampling
+
+DAY_SECONDS = 86400
+WEEK_DAYS = 7
+
+# Konfigurasi per horizon: interval grid (detik), jumlah langkah ke depan,
+# lag & rolling window (dalam langkah), dan panjang histori yang disimpan
+HORIZONS = {
+    'hour': {'interval': 60, 'steps': 60, 'lags': (1, 2, 3, 5, 10, 30, 60), 'windows': (5, 15, 60), 'history_days': 3},
+    'day': {'interval': 900, 'steps': 96, 'lags': (1, 2, 3, 4, 8, 96), 'windows': (4, 16, 96), 'history_days': 28},
+    'week': {'interval': 3600, 'steps': 168, 'lags': (1, 2, 3, 24, 168), 'windows': (3, 24, 168), 'history_days': 90},
+}
+
+
+to_epoch_seconds = resampling.to_epoch
+
+
+def calendar_features(epoch, utc_offset_seconds=0):
+    """
+    Hour-of-day / day-of-week encodings for an array of epoch seconds
+
+    Returns:
+        ndarray: (n, 5) columns hour_sin, hour_cos, dow_sin, dow_cos, is_weekend
+    """
+    local = np.asarray(epoch, dtype=np.float64) + utc_offset_seconds
+    day_fraction = (local % DAY_SECONDS) / DAY_SECONDS
+    # 1970-01-01 adalah hari Kamis; Senin = 0
+    dow = (np.floor(local / DAY_SECONDS) + 3) % WEEK_DAYS
+    week_fraction = (dow + day_fraction) / WEEK_DAYS
+    return np.column_stack([
+        np.sin(2 * np.pi * day_fraction),
+        np.cos(2 * np.pi * day_fraction),
+        np.sin(2 * np.pi * week_fraction),
+        np.cos(2 * np.pi * week_fraction),
+        (dow >= 5).astype(np.float64),
+    ])
+
+
+class FeatureBuilder:
+    """
+    Regular-grid power series with lag, rolling-mean and calendar features
+
+    Args:
+        interval (int): grid step in seconds
+        lags (tuple): lag offsets in steps
+        windows (tuple): rolling-mean window lengths in steps
+        max_steps (int): history kept; older buckets are dropped on extend()
+        utc_offset_seconds (int): local time offset for calendar features
+    """
+
+    def __init__(self, interval, lags, windows, max_steps, utc_offset_seconds=0):
+        self.interval = interval
+        self.lags = tuple(lags)
+        self.windows = tuple(windows)
+        self.max_steps = max_steps
+        self.utc_offset_seconds = utc_offset_seconds
+        self.context = max(self.lags + self.windows)
+
+        self.start = None           # epoch seconds of bucket 0
+        self.watermark = None       # epoch seconds of the newest reading seen
+        self.sums = np.zeros(0)
+        self.counts = np.zeros(0)
+
+    @classmethod
+    def for_horizon(cls, horizon, utc_offset_seconds=0):
+        config = HORIZONS[horizon]
+        max_steps = config['history_days'] * DAY_SECONDS // config['interval']
+        return cls(config['interval'], config['lags'], config['windows'], max_steps, utc_offset_seconds)
+
+    @property
+    def feature_names(self):
+        return (
+            [f"lag_{lag}" for lag in self.lags]
+            + [f"mean_{window}" for window in self.windows]
+            + ["hour_sin", "hour_cos", "dow_sin", "dow_cos", "is_weekend"]
+        )
+
+    def __len__(self):
+        return len(self.sums)
+
+    def extend(self, epoch, values):
+        """
+        Add readings (epoch seconds, power) to the grid
+
+        Readings older than the kept history are ignored. Readings that fall
+        into an existing bucket are merged into its mean.
+        """
+        epoch = np.asarray(epoch, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        if len(epoch) == 0:
+            return
+
+        if self.start is None:
+            self.start = np.floor(epoch.min() / self.interval) * self.interval
+
+        index = resampling.bucket_index(epoch, self.start, self.interval)
+        keep = index >= 0
+        index, values = index[keep], values[keep]
+        if len(index) == 0:
+            return
+
+        size = max(len(self.sums), int(index.max()) + 1)
+        sums = np.zeros(size)
+        counts = np.zeros(size)
+        sums[:len(self.sums)] = self.sums
+        counts[:len(self.counts)] = self.counts
+        new_sums, new_counts = resampling.bucket_sums(index, values, size)
+        sums += new_sums
+        counts += new_counts
+
+        if size > self.max_steps:
+            cut = size - self.max_steps
+            sums, counts = sums[cut:], counts[cut:]
+            self.start += cut * self.interval
+
+        self.sums, self.counts = sums, counts
+        self.watermark = max(self.watermark or 0.0, float(epoch.max()))
+
+    @property
+    def series(self):
+        """Mean power per grid step, gaps forward-filled"""
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = self.sums / self.counts
+        # Celah awal diisi nilai valid pertama; tanpa data sama sekali: nol
+        return np.nan_to_num(resampling.fill(means, "ffill", edges=True))
+
+    @property
+    def grid(self):
+        """Epoch seconds of each grid step"""
+        return self.start + np.arange(len(self)) * self.interval
+
+    def _features(self, series, positions, epoch):
+        """Feature rows for `positions` of `series` (positions >= context)"""
+        cumulative = np.concatenate([[0.0], np.cumsum(series)])
+        columns = [series[positions - lag] for lag in self.lags]
+        columns += [(cumulative[positions] - cumulative[positions - w]) / w for w in self.windows]
+        return np.column_stack(columns + [calendar_features(epoch, self.utc_offset_seconds)])
+
+    def design_matrix(self):
+        """
+        Training matrix over the whole kept history
+
+        Returns:
+            tuple: (X, y, epoch) for every step that has full lag context
+        """
+        series = self.series
+        positions = np.arange(self.context, len(series))
+        epoch = self.grid[positions]
+        return self._features(series, positions, epoch), series[positions], epoch
+
+    def forecast(self, model, steps):
+        """
+        Recursive multi-step forecast from the end of the series
+
+        Calendar features for all steps are computed in one batch; lags and
+        rolling means are read from the series extended with the previous
+        predictions.
+
+        Returns:
+            tuple: (epoch of each forecast step, predicted power)
+        """
+        series = self.series
+        last = self.start + (len(series) - 1) * self.interval
+        epoch = last + self.interval * np.arange(1, steps + 1)
+        calendar = calendar_features(epoch, self.utc_offset_seconds)
+
+        buffer = np.concatenate([series[-self.context:], np.zeros(steps)])
+        predictions = np.empty(steps)
+        for k in range(steps):
+            position = self.context + k
+            lagged = [buffer[position - lag] for lag in self.lags]
+            means = [buffer[position - w:position].mean() for w in self.windows]
+            row = np.concatenate([lagged, means, calendar[k]])[None, :]
+            predictions[k] = max(float(model.predict(row)[0]), 0.0)
+            buffer[position] = predictions[k]
+
+        return epoch, predictions
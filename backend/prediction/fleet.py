@@ -0,0 +1,419 @@
+"""
+Fleet-wide batch training.
+
+Reads the fleet's readings once, selects every device's training rows with
+the same sampling spec as single-device training (TRAINING_SAMPLING:
+window, max_rows, strategy, applied per device), fits every device's models
+in parallel, then writes them to the registry in bulk.
+
+Two engines:
+    numpy  one grouped cursor sorted by device_id; each device's block is
+           sampled as it streams and fit in a process pool
+    spark  one Spark job: per-device sampling, then
+           groupBy(device_id).applyInPandas(...) with the NumPy engine
+           running inside each group
+"""
+import datetime
+import itertools
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from operator import itemgetter
+
+import numpy as np
+import pyarrow as pa
+from bson import json_util
+from django.conf import settings
+
+from monitoring import mongo
+
+from . import numpy_engine, registry
+from .data import archived_window
+from .numpy_engine import ALGORITHMS, FEATURE_COLS, LABEL_COL, MODEL_NAMES
+from .sampling import _hour_expression, get_sampling, keep_fractions
+
+MIN_DEVICE_RECORDS = 10
+
+# Kolom hasil grouped map (satu baris per device per algoritma)
+SPARK_RESULT_SCHEMA = (
+    "device_id string, algo string, algo_used string, engine string, model binary, "
+    "rmse double, train_records long, test_records long, fit_seconds double"
+)
+
+
+def fit_device(device_id, X, y, algos=ALGORITHMS, engine='numpy', seed=42):
+    """
+    Fit and evaluate every requested algorithm for one device
+
+    Args:
+        device_id (str): Device ID
+        X (ndarray): feature matrix in FEATURE_COLS order
+        y (ndarray): power labels
+        algos (tuple): algorithms to fit
+        engine (str): recorded in the registry entry
+
+    Returns:
+        list: registry entries (empty when the device has too little data)
+    """
+    if len(y) < MIN_DEVICE_RECORDS:
+        return []
+
+    train = numpy_engine.split_mask(len(y), seed=seed)
+    if train.all() or not train.any():
+        return []
+
+    entries = []
+    for algo in algos:
+        started = time.perf_counter()
+        model = numpy_engine.fit(algo, X[train], y[train], seed=seed)
+        rmse = numpy_engine.rmse(y[~train], model.predict(X[~train]))
+        entries.append({
+            "device_id": device_id,
+            "algo": algo,
+            "algo_used": MODEL_NAMES[algo],
+            "engine": engine,
+            "model": numpy_engine.dumps_model(model),
+            "rmse": rmse,
+            "train_records": int(train.sum()),
+            "test_records": int((~train).sum()),
+            "fit_seconds": round(time.perf_counter() - started, 3),
+        })
+    return entries
+
+
+def _fit_device_task(args):
+    return fit_device(*args)
+
+
+# === NumPy engine ===
+
+def fleet_devices(device_ids=None, collection=None):
+    """Devices to retrain: the given ones, or every device_id in the readings"""
+    if device_ids:
+        return list(dict.fromkeys(device_ids))
+    collection = collection if collection is not None else mongo.get_collection()
+    return sorted(device_id for device_id in collection.distinct("device_id") if device_id)
+
+
+def fleet_match(device_ids, since, now):
+    """$match of the training rows of a fleet window (same filter for both engines)"""
+    match = {
+        "device_id": {"$in": list(device_ids)} if device_ids else {"$type": "string"},
+        "timestamp": {"$type": "date", "$lte": now},
+        **{col: {"$type": "number"} for col in FEATURE_COLS + [LABEL_COL]},
+    }
+    if since is not None:
+        match["timestamp"]["$gte"] = since
+    return match
+
+
+def sample_device_block(device_id, docs, hot_counts, sampling, since, until, rng, collection):
+    """
+    Sampled training arrays of one device from its block of the grouped read
+
+    `docs` are the device's hot rows newest first, each with its local
+    `hour`; rows are kept or dropped while they stream (the newest max_rows
+    for 'latest', the per-hour probability of sampling.keep_fractions
+    otherwise), so only the sample is held in memory. Archived rows of the
+    window count toward the budget like in sampling.build_selection.
+
+    Returns:
+        tuple: (X, y, sampling info for model metadata)
+    """
+    columns = FEATURE_COLS + [LABEL_COL]
+    cold, cold_hours = archived_window(device_id, columns, since, collection)
+    counts = dict(hot_counts)
+    for hour, count in zip(*np.unique(cold_hours, return_counts=True)):
+        counts[int(hour)] = counts.get(int(hour), 0) + int(count)
+
+    window_records = sum(counts.values())
+    max_rows = sampling["max_rows"]
+    sampled = bool(max_rows and window_records > max_rows)
+    latest = sampling["strategy"] == 'latest'
+    fractions = keep_fractions(counts, sampling) if sampled and not latest else {}
+    hour_fraction = np.array([fractions.get(hour, 1.0) for hour in range(24)])
+
+    rows = []
+    for doc in docs:
+        if sampled and (len(rows) >= max_rows if latest else rng.random() >= hour_fraction[doc["hour"]]):
+            continue
+        rows.append([doc[col] for col in columns])
+    hot = np.asarray(rows[::-1], dtype=np.float64).reshape(-1, len(columns))
+
+    keep = np.ones(len(cold_hours), dtype=bool)
+    if sampled and latest:
+        # Arsip selalu lebih tua dari data hot: hanya sisa budget, yang terbaru
+        keep[:max(len(keep) - max(max_rows - sum(hot_counts.values()), 0), 0)] = False
+    elif sampled:
+        keep = rng.random(len(cold_hours)) < hour_fraction[cold_hours]
+
+    data = hot
+    if cold is not None:
+        cold = cold.filter(pa.array(keep))
+        data = np.vstack([np.column_stack([
+            cold.column(col).to_numpy(zero_copy_only=False).astype(np.float64) for col in columns
+        ]).reshape(-1, len(columns)), hot])
+    data = data[np.isfinite(data).all(axis=1)]
+
+    info = {
+        **sampling,
+        "since": since.isoformat() if since else None,
+        "until": until.isoformat(),
+        "window_records": window_records,
+        "archive_records": len(cold_hours),
+        "archive_selected": int(keep.sum()),
+        "sampled": sampled,
+        "source": "raw",
+    }
+    return data[:, :-1], data[:, -1], info
+
+
+def iter_fleet_arrays(device_ids, sampling, now=None, collection=None):
+    """
+    Stream the sampled training rows of many devices from one grouped read
+
+    One small aggregation counts each device's rows per local hour (to size
+    the samples), then a single cursor over the window, sorted by device_id
+    and newest first (the (device_id, timestamp) index), delivers the devices
+    one block after another. Each block is sampled as it streams
+    (sample_device_block), so only one device's sample is in memory at once.
+    Devices without hot rows in the window get their archived rows only.
+
+    Like the Spark engine this reads the raw readings (and their archive),
+    never the feature store.
+
+    Args:
+        device_ids (list): devices to load (None: every device)
+        sampling (dict): spec from sampling.get_sampling
+
+    Yields:
+        tuple: (device_id, X, y, sampling info)
+    """
+    collection = collection if collection is not None else mongo.get_collection()
+    now = now or datetime.datetime.utcnow()
+    since = now - datetime.timedelta(days=sampling["days"]) if sampling["days"] else None
+    devices = fleet_devices(device_ids, collection)
+    match = fleet_match(device_ids, since, now)
+    counts = fleet_hour_counts(match, collection)
+    rng = np.random.default_rng()
+
+    cursor = collection.aggregate([
+        {"$match": match},
+        {"$sort": {"device_id": 1, "timestamp": -1}},
+        {"$project": {"_id": 0, "device_id": 1, "hour": _hour_expression(),
+                      **{col: 1 for col in FEATURE_COLS + [LABEL_COL]}}},
+    ], allowDiskUse=True, batchSize=10000)
+
+    seen = set()
+    for device_id, docs in itertools.groupby(cursor, key=itemgetter("device_id")):
+        seen.add(device_id)
+        yield (device_id, *sample_device_block(device_id, docs, counts.get(device_id, {}), sampling,
+                                               since, now, rng, collection))
+    for device_id in devices:
+        if device_id not in seen:
+            yield (device_id, *sample_device_block(device_id, [], {}, sampling, since, now, rng, collection))
+
+
+def train_fleet_numpy(device_ids=None, algos=ALGORITHMS, workers=None, log=print, days=None, sampling=None):
+    """
+    Retrain every device with the NumPy engine in a process pool
+
+    Devices stream out of one grouped read (iter_fleet_arrays) while earlier
+    ones are being fit; at most two fits per worker wait in the pool, so
+    memory stays bounded by a few device samples whatever the fleet size.
+
+    Args:
+        days (int): train on the last N days only (ignored when sampling is given)
+        sampling (dict): spec from sampling.get_sampling (default: settings, with `days`)
+
+    Returns:
+        dict: summary (devices, models written, skipped devices, seconds)
+    """
+    started = time.perf_counter()
+    sampling = sampling or get_sampling(days=days)
+    workers = workers or os.cpu_count()
+
+    devices = 0
+    written = 0
+    trained = 0
+    records = 0
+    load_seconds = 0.0
+    pending = []
+    in_flight = {}  # future -> sampling info of its device
+
+    def collect(done):
+        nonlocal trained, written, pending
+        for future in done:
+            info = in_flight.pop(future)
+            entries = future.result()
+            for entry in entries:
+                entry["sampling"] = info
+            if entries:
+                trained += 1
+                pending.extend(entries)
+            if len(pending) >= registry.BULK_WRITE_SIZE:
+                written += registry.save_models(pending)
+                pending = []
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        stream = iter_fleet_arrays(device_ids, sampling)
+        while True:
+            load_started = time.perf_counter()
+            item = next(stream, None)
+            load_seconds += time.perf_counter() - load_started
+            if item is None:
+                break
+            device_id, X, y, info = item
+            devices += 1
+            records += len(y)
+            in_flight[pool.submit(_fit_device_task, (device_id, X, y, algos))] = info
+            if len(in_flight) >= 2 * workers:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(list(as_completed(in_flight)))
+
+    if pending:
+        written += registry.save_models(pending)
+
+    log(f"Loaded {records} readings for {devices} devices in {load_seconds:.1f}s")
+    return {
+        "engine": "numpy",
+        "devices": devices,
+        "devices_trained": trained,
+        "devices_skipped": devices - trained,
+        "models_written": written,
+        "sampling": sampling,
+        "load_seconds": round(load_seconds, 2),
+        "total_seconds": round(time.perf_counter() - started, 2),
+    }
+
+
+# === Spark engine ===
+
+def _fit_group(algos, pdf):
+    """applyInPandas function: fit one device's models inside a Spark task"""
+    import pandas as pd
+
+    X = pdf[FEATURE_COLS].to_numpy(dtype=np.float64)
+    y = pdf[LABEL_COL].to_numpy(dtype=np.float64)
+    entries = fit_device(pdf["device_id"].iloc[0], X, y, algos, engine='spark')
+    return pd.DataFrame(entries, columns=[field.split()[0] for field in SPARK_RESULT_SCHEMA.split(", ")])
+
+
+def fleet_hour_counts(match, collection=None):
+    """Readings per (device_id, local hour) inside the window, in one small aggregation"""
+    collection = collection if collection is not None else mongo.get_collection()
+    counts = {}
+    for row in collection.aggregate([
+        {"$match": match},
+        {"$group": {"_id": {"device_id": "$device_id", "hour": _hour_expression()}, "count": {"$sum": 1}}},
+    ], allowDiskUse=True):
+        counts.setdefault(row["_id"]["device_id"], {})[row["_id"]["hour"]] = row["count"]
+    return counts
+
+
+def sample_fleet_frame(df, sampling, counts, seed=42):
+    """
+    Apply the sampling spec to every device of a fleet DataFrame
+
+    Same selection as the single-device pipeline: the newest max_rows rows
+    ('latest'), or each row kept with its device's per-hour probability
+    ('random', 'hourly'; see sampling.keep_fractions). `df` needs device_id,
+    timestamp and the local `hour` column.
+    """
+    from pyspark.sql import Window, functions as F
+
+    if not sampling["max_rows"]:
+        return df
+    if sampling["strategy"] == 'latest':
+        newest = F.row_number().over(Window.partitionBy("device_id").orderBy(F.col("timestamp").desc()))
+        return df.withColumn("rank", newest).where(F.col("rank") <= sampling["max_rows"]).drop("rank")
+
+    fractions = [
+        (device_id, int(hour), float(fraction))
+        for device_id, device_counts in counts.items()
+        for hour, fraction in keep_fractions(device_counts, sampling).items()
+    ]
+    if not fractions:
+        return df
+    keep = df.sparkSession.createDataFrame(fractions, "device_id string, hour int, fraction double")
+    return df.join(F.broadcast(keep), ["device_id", "hour"], "left") \
+        .where(F.col("fraction").isNull() | (F.rand(seed) < F.col("fraction"))) \
+        .drop("fraction")
+
+
+def train_fleet_spark(spark, device_ids=None, algos=ALGORITHMS, log=print, days=None, sampling=None):
+    """
+    Retrain every device in one Spark job using a grouped map
+
+    The window filter and the local hour are pushed into MongoDB; the
+    per-device row bound is applied in Spark before the grouped fit, so no
+    group holds more than about max_rows rows.
+
+    Args:
+        days (int): train on the last N days only (ignored when sampling is given)
+        sampling (dict): spec from sampling.get_sampling (default: settings, with `days`)
+
+    Returns:
+        dict: summary (devices trained, models written, seconds)
+    """
+    from functools import partial
+
+    started = time.perf_counter()
+    sampling = sampling or get_sampling(days=days)
+    now = datetime.datetime.utcnow()
+    since = now - datetime.timedelta(days=sampling["days"]) if sampling["days"] else None
+
+    match = fleet_match(device_ids, since, now)
+    counts = fleet_hour_counts(match)
+
+    pipeline = [
+        {"$match": match},
+        {"$project": {"_id": 0, "device_id": 1, "timestamp": 1, "hour": _hour_expression(),
+                      **{col: 1 for col in FEATURE_COLS + [LABEL_COL]}}},
+    ]
+    df = spark.read.format("mongodb") \
+        .option("database", settings.MONGODB['DB']) \
+        .option("collection", mongo.READINGS_COLLECTION) \
+        .option("aggregation.pipeline", json_util.dumps(pipeline)) \
+        .load() \
+        .select(["device_id", "timestamp", "hour"] + FEATURE_COLS + [LABEL_COL]) \
+        .na.drop()
+
+    results = sample_fleet_frame(df, sampling, counts) \
+        .select(["device_id"] + FEATURE_COLS + [LABEL_COL]) \
+        .groupBy("device_id") \
+        .applyInPandas(partial(_fit_group, tuple(algos)), schema=SPARK_RESULT_SCHEMA)
+
+    written = 0
+    devices = set()
+    pending = []
+    for row in results.toLocalIterator():
+        entry = row.asDict()
+        entry["model"] = bytes(entry["model"])
+        window_records = sum(counts.get(entry["device_id"], {}).values())
+        entry["sampling"] = {
+            **sampling,
+            "since": since.isoformat() if since else None,
+            "until": now.isoformat(),
+            "window_records": window_records,
+            "sampled": bool(sampling["max_rows"] and window_records > sampling["max_rows"]),
+            "source": "raw",
+        }
+        devices.add(entry["device_id"])
+        pending.append(entry)
+        if len(pending) >= registry.BULK_WRITE_SIZE:
+            written += registry.save_models(pending)
+            pending = []
+
+    if pending:
+        written += registry.save_models(pending)
+
+    log(f"Spark grouped fit finished for {len(devices)} devices")
+    return {
+        "engine": "spark",
+        "devices_trained": len(devices),
+        "models_written": written,
+        "sampling": sampling,
+        "total_seconds": round(time.perf_counter() - started, 2),
+    }
@@ -0,0 +1,131 @@
+"""
+Time-ahead power forecasting with the NumPy engine.
+
+Per (device, horizon) a FeatureBuilder is kept in process memory and
+extended with readings newer than its watermark on every request, so only
+new data is read from MongoDB after the first call. The builder reads the
+closed buckets of the feature store when the device has any, otherwise the
+raw readings.
+"""
+import datetime
+import threading
+import time
+from collections import OrderedDict
+from zoneinfo import ZoneInfo
+
+import numpy as np
+from django.conf import settings
+
+from . import numpy_engine
+from .data import load_device_series
+from .exceptions import PredictionError
+from .feature_store import closed_until, training_collection
+from .features import HORIZONS, FeatureBuilder, to_epoch_seconds
+from .numpy_engine import MODEL_NAMES
+
+MAX_BUILDERS = 256
+HOLDOUT_RATIO = 0.2
+
+_builders = OrderedDict()
+_builders_lock = threading.Lock()
+
+
+def local_utc_offset_seconds():
+    """Current UTC offset of settings.LOCAL_TIME_ZONE"""
+    offset = datetime.datetime.now(ZoneInfo(settings.LOCAL_TIME_ZONE)).utcoffset()
+    return int(offset.total_seconds())
+
+
+def get_builder(device_id, horizon):
+    """
+    Return the device's feature builder, extended with readings since its watermark
+
+    Builders are cached per process (LRU, MAX_BUILDERS entries); each has its
+    own lock so concurrent requests for one device do not extend it twice.
+    The data source is fixed when the builder is created.
+    """
+    key = (device_id, horizon)
+    with _builders_lock:
+        entry = _builders.pop(key, None)
+        if entry is None:
+            history_start = datetime.datetime.utcnow() - datetime.timedelta(days=HORIZONS[horizon]['history_days'])
+            collection, source = training_collection(device_id, history_start)
+            entry = (
+                FeatureBuilder.for_horizon(horizon, local_utc_offset_seconds()),
+                threading.Lock(),
+                collection,
+                source
+            )
+        _builders[key] = entry
+        while len(_builders) > MAX_BUILDERS:
+            _builders.popitem(last=False)
+
+    builder, lock, collection, source = entry
+    with lock:
+        if builder.watermark is None:
+            since = datetime.datetime.utcnow() - datetime.timedelta(days=HORIZONS[horizon]['history_days'])
+        else:
+            since = datetime.datetime.utcfromtimestamp(builder.watermark)
+
+        # Bucket feature store yang masih terbuka belum dibaca: nanti ikut sekali saat sudah tertutup
+        until = closed_until() - datetime.timedelta(microseconds=1) if source == 'features' else None
+        timestamps, values = load_device_series(device_id, since=since, until=until, collection=collection)
+        builder.extend(to_epoch_seconds(timestamps), values)
+
+    return builder
+
+
+def forecast_device(device_id, horizon='day', algo='gbt'):
+    """
+    Fit a lag/calendar model on the device history and forecast the next horizon
+
+    Args:
+        device_id (str): Device ID
+        horizon (str): 'hour', 'day' or 'week'
+        algo (str): 'rf', 'gbt' or 'lr'
+
+    Returns:
+        dict: forecast series, recent actual series, holdout RMSE and energy total
+
+    Raises:
+        PredictionError: when there is not enough history
+    """
+    started = time.perf_counter()
+    config = HORIZONS[horizon]
+    builder = get_builder(device_id, horizon)
+
+    X, y, _ = builder.design_matrix() if len(builder) > builder.context else (None, np.zeros(0), None)
+    if len(y) < 20:
+        raise PredictionError(
+            f"Not enough history for a {horizon} forecast. "
+            f"Need at least {builder.context + 20} intervals of {config['interval']}s.",
+            status=400
+        )
+
+    # Holdout kronologis: fit di bagian awal, evaluasi satu-langkah di bagian akhir
+    split = int(len(y) * (1 - HOLDOUT_RATIO))
+    holdout_model = numpy_engine.fit(algo, X[:split], y[:split])
+    rmse = numpy_engine.rmse(y[split:], holdout_model.predict(X[split:]))
+
+    model = numpy_engine.fit(algo, X, y)
+    epoch, predictions = builder.forecast(model, config['steps'])
+
+    series = builder.series
+    recent = series[-config['steps']:]
+    recent_epoch = builder.grid[-len(recent):]
+
+    def iso(seconds):
+        return datetime.datetime.utcfromtimestamp(seconds).isoformat()
+
+    return {
+        "horizon": horizon,
+        "interval_seconds": config['interval'],
+        "steps": config['steps'],
+        "algo_used": MODEL_NAMES.get(algo, MODEL_NAMES['rf']),
+        "rmse": rmse,
+        "training_rows": len(y),
+        "forecast": [{"timestamp": iso(t), "predicted_power": float(p)} for t, p in zip(epoch, predictions)],
+        "history": [{"timestamp": iso(t), "actual_power": float(p)} for t, p in zip(recent_epoch, recent)],
+        "forecast_energy_kwh": float(predictions.sum() * config['interval'] / 3600.0 / 1000.0),
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+    }
@@ -0,0 +1,176 @@
+"""
+Incremental model updates from new readings only.
+
+Each (device_id, algo) pair has a state document whose watermark is the
+timestamp of the newest reading already folded into the registered model.
+An update only reads readings after the watermark (plus, for trees, a
+bounded recent window):
+
+    lr   exact: the sufficient statistics (XᵀX, Xᵀy, ...) kept in the state
+         document are updated with the new rows and the ridge solution is
+         recomputed. Cost is proportional to the new rows.
+    gbt  warm start: GBT_EXTRA_ITER boosting stages fitted on the recent
+         window are appended; once the ensemble would exceed GBT_MAX_TREES it
+         is refitted from the window.
+    rf   rolling forest: the oldest RF_REPLACE_TREES trees are replaced by
+         trees fitted on the recent window.
+
+The first update of a pair without state seeds it from a bounded read:
+TRAINING_SAMPLING['DAYS'] (newest MAX_ROWS rows) for lr, the tree window for
+gbt/rf. Older history stays out of the model, as with a batch retrain.
+"""
+import datetime
+
+import numpy as np
+from django.conf import settings
+from pymongo import ASCENDING
+
+from monitoring import mongo
+from monitoring.models import Device
+
+from . import numpy_engine, registry
+from .data import load_device_arrays
+from .numpy_engine import ALGORITHMS, MODEL_NAMES
+
+STATE_COLLECTION = "prediction_model_state"
+
+
+def get_state_collection():
+    return mongo.get_collection(STATE_COLLECTION)
+
+
+def ensure_indexes(collection=None):
+    collection = collection if collection is not None else get_state_collection()
+    collection.create_index([("device_id", ASCENDING), ("algo", ASCENDING)], unique=True)
+
+
+def _encode_stats(stats):
+    return {key: value.tolist() if isinstance(value, np.ndarray) else value for key, value in stats.items()}
+
+
+def _decode_stats(stats):
+    return {
+        key: np.asarray(value, dtype=np.float64) if isinstance(value, list) else value
+        for key, value in stats.items()
+    }
+
+
+def _update_linear(state, X_new, y_new):
+    stats = numpy_engine.linear_stats(X_new, y_new)
+    if state.get("stats"):
+        stats = numpy_engine.merge_linear_stats(_decode_stats(state["stats"]), stats)
+    return numpy_engine.fit_linear_from_stats(stats), stats, stats["n"]
+
+
+def _update_trees(algo, model, device_id, window_start, until, config):
+    X, y, _ = load_device_arrays(device_id, since=window_start, until=until)
+    if len(y) < 2:
+        return None, 0
+
+    if algo == 'gbt':
+        extra = config['GBT_EXTRA_ITER']
+        if model is None or model.n_trees + extra > config['GBT_MAX_TREES']:
+            return numpy_engine.fit('gbt', X, y), len(y)
+        return numpy_engine.fit_gradient_boosting(X, y, max_iter=extra, init=model), len(y)
+
+    if model is None:
+        return numpy_engine.fit('rf', X, y), len(y)
+
+    replace = min(config['RF_REPLACE_TREES'], model.n_trees)
+    fresh = numpy_engine.fit_random_forest(X, y, num_trees=replace, seed=int(until.timestamp()))
+    kept = [model.tree(t) for t in range(replace, model.n_trees)]
+    n_trees = len(kept) + replace
+    return numpy_engine.stack_trees(kept + [fresh], weights=np.full(n_trees, 1.0 / n_trees)), len(y)
+
+
+def _first_window(algo, until, config):
+    """Start of the first read for a pair without state (None = no lower bound)"""
+    if algo != 'lr':
+        return until - datetime.timedelta(hours=config['TREE_WINDOW_HOURS'])
+    days = settings.TRAINING_SAMPLING['DAYS']
+    return until - datetime.timedelta(days=days) if days else None
+
+
+def update_device(device_id, algo, now=None):
+    """
+    Fold readings newer than the watermark into one device's model
+
+    Args:
+        device_id (str): Device ID
+        algo (str): 'rf', 'gbt' or 'lr'
+        now (datetime): current UTC time (default: utcnow)
+
+    Returns:
+        dict: summary with status 'updated', 'up_to_date' or 'waiting'
+    """
+    config = settings.INCREMENTAL_TRAINING
+    now = now or datetime.datetime.utcnow()
+    # Jangan baca sampai detik ini: insert yang masih berjalan bisa tertinggal di belakang watermark
+    until = now - datetime.timedelta(seconds=config['INGEST_LAG_SECONDS'])
+
+    states = get_state_collection()
+    key = {"device_id": device_id, "algo": algo}
+    state = states.find_one(key) or {}
+    watermark = state.get("watermark")
+    model, _ = registry.load_model(device_id, algo)
+
+    if watermark is None:
+        # Run pertama: jangan baca seluruh histori device
+        X_new, y_new, timestamps = load_device_arrays(device_id, since=_first_window(algo, until, config),
+                                                      until=until)
+        max_rows = settings.TRAINING_SAMPLING['MAX_ROWS']
+        if algo == 'lr' and max_rows and len(y_new) > max_rows:
+            X_new, y_new, timestamps = X_new[-max_rows:], y_new[-max_rows:], timestamps[-max_rows:]
+    else:
+        X_new, y_new, timestamps = load_device_arrays(device_id, since=watermark, until=until)
+    summary = {"device_id": device_id, "algo": algo, "new_records": len(y_new)}
+
+    if len(y_new) == 0:
+        return {**summary, "status": "up_to_date"}
+    if algo != 'lr' and model is not None and len(y_new) < config['MIN_NEW_RECORDS']:
+        return {**summary, "status": "waiting"}
+
+    # Prequential error: the previous model scored on readings it has not seen yet
+    prequential_rmse = numpy_engine.rmse(y_new, model.predict(X_new)) if model is not None else None
+
+    state_update = {"watermark": timestamps[-1], "updated_at": now}
+    if algo == 'lr':
+        new_model, stats, records = _update_linear(state, X_new, y_new)
+        state_update["stats"] = _encode_stats(stats)
+    else:
+        window_start = until - datetime.timedelta(hours=config['TREE_WINDOW_HOURS'])
+        new_model, records = _update_trees(algo, model, device_id, window_start, until, config)
+        if new_model is None:
+            return {**summary, "status": "waiting"}
+
+    registry.save_models([{
+        "device_id": device_id,
+        "algo": algo,
+        "algo_used": MODEL_NAMES[algo],
+        "engine": "numpy",
+        "update_mode": "incremental",
+        "model": numpy_engine.dumps_model(new_model),
+        "rmse": prequential_rmse,
+        "evaluation": "prequential",
+        "train_records": records,
+        "new_records": len(y_new),
+        "watermark": timestamps[-1],
+    }])
+    # State last: if we crash before this, the next run recomputes the same update
+    states.update_one(key, {"$set": state_update}, upsert=True)
+
+    return {**summary, "status": "updated", "watermark": timestamps[-1], "rmse": prequential_rmse}
+
+
+def update_fleet(algos=ALGORITHMS, device_ids=None):
+    """
+    Run update_device for every active device (or the given ones)
+
+    Returns:
+        list: one summary per (device, algo)
+    """
+    if not device_ids:
+        device_ids = Device.objects.filter(is_active=True).values_list('device_id', flat=True)
+
+    now = datetime.datetime.utcnow()
+    return [update_device(device_id, algo, now) for device_id in device_ids for algo in algos]
@@ -0,0 +1,84 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from prediction import benchmark
+from prediction.exceptions import PredictionError
+from prediction.numpy_engine import ALGORITHMS
+from prediction.sampling import get_sampling
+
+DEFAULT_SIZES = "10k,100k,1m"
+DEFAULT_OUTPUT = os.path.join(settings.BASE_DIR, "benchmarks")
+
+
+class Command(BaseCommand):
+    help = "Benchmark training phases (load, clean, split, fit, evaluate) over synthetic histories of several sizes"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                            help=f"Comma-separated rows per device, e.g. 10k,100k,1m,10m. Default: {DEFAULT_SIZES}")
+        parser.add_argument('--devices', type=int, default=1,
+                            help="Devices per size; more than one adds a whole-fleet retrain row. Default: 1")
+        parser.add_argument('--engine', action='append', dest='engines', choices=['numpy', 'spark'],
+                            help="Engine to benchmark (repeatable). Default: numpy")
+        parser.add_argument('--algo', action='append', choices=ALGORITHMS,
+                            help="Algorithm to benchmark (repeatable). Default: all")
+        parser.add_argument('--days', type=int, default=0,
+                            help="Training window in days, 0 = all history (default)")
+        parser.add_argument('--max-rows', type=int, default=0,
+                            help="Sampling row bound like run_prediction, 0 = unbounded (default)")
+        parser.add_argument('--sample', choices=['latest', 'random', 'hourly'], default='hourly',
+                            help="Sampling strategy when --max-rows applies")
+        parser.add_argument('--no-tracemalloc', action='store_true',
+                            help="Skip Python/NumPy peak memory tracing (faster load phase)")
+        parser.add_argument('--output', default=DEFAULT_OUTPUT,
+                            help="Report directory. Default: backend/benchmarks")
+        parser.add_argument('--keep', action='store_true',
+                            help="Keep the synthetic readings for the next run (reused when complete)")
+        parser.add_argument('--cleanup', action='store_true',
+                            help="Only delete leftover benchmark readings and models, then exit")
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            print(f"Deleted {benchmark.cleanup()} benchmark readings")
+            return
+
+        try:
+            sizes = [benchmark.parse_size(size) for size in options['sizes'].split(',') if size.strip()]
+            sampling = get_sampling(options['days'], options['max_rows'], options['sample'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['devices'] < 1:
+            raise CommandError("--devices must be >= 1")
+
+        engines = tuple(options['engines'] or ['numpy'])
+        algos = tuple(options['algo'] or ALGORITHMS)
+
+        spark = None
+        if 'spark' in engines:
+            from prediction.spark import get_spark
+            print("Starting Spark session...")
+            spark = get_spark()
+
+        try:
+            results = benchmark.run(
+                sizes, options['devices'], engines, algos, sampling,
+                trace_memory=not options['no_tracemalloc'], spark=spark
+            )
+        except PredictionError as e:
+            raise CommandError(e.message)
+        finally:
+            if not options['keep']:
+                print(f"Deleted {benchmark.cleanup()} benchmark readings")
+
+        json_path, csv_path = benchmark.write_report(results, options['output'], {
+            "sizes": sizes,
+            "devices": options['devices'],
+            "engines": engines,
+            "algos": algos,
+            "sampling": sampling,
+            "tracemalloc": not options['no_tracemalloc'],
+        }, spark)
+        print(f"✓ Report written: {json_path}")
+        print(f"✓ Report written: {csv_path}")
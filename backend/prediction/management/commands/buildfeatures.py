@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from prediction import feature_store
+
+
+class Command(BaseCommand):
+    help = "Roll raw readings up into the training feature store (closed buckets since the last run)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', action='append', dest='devices',
+                            help="Only rebuild this device_id, over its full history (repeatable)")
+        parser.add_argument('--full', action='store_true',
+                            help="Ignore the watermark and rebuild every bucket from the raw readings")
+        parser.add_argument('--interval', type=float,
+                            help="Follow mode: repeat every N seconds instead of running once")
+
+    def handle(self, *args, **options):
+        feature_store.ensure_indexes()
+        full = options['full']
+
+        while True:
+            started = time.perf_counter()
+            result = feature_store.rebuild_incremental(options['devices'], full=full)
+            since = result['since'].isoformat() if result['since'] else "the beginning"
+            print(f"✓ Feature buckets rebuilt from {since} to {result['until'].isoformat()} "
+                  f"in {time.perf_counter() - started:.2f}s")
+
+            if not options['interval']:
+                break
+            full = False
+            time.sleep(options['interval'])
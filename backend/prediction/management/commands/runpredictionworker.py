@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from monitoring import indexes
+from prediction.worker import PredictionWorker
+
+
+class Command(BaseCommand):
+    help = "Run the prediction worker that owns the SparkSession"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', help="Override PREDICTION_WORKER['ADDRESS'] host")
+        parser.add_argument('--port', type=int, help="Override PREDICTION_WORKER['ADDRESS'] port")
+        parser.add_argument('--no-warmup', action='store_true', help="Start Spark lazily on the first request")
+
+    def handle(self, *args, **options):
+        # Authkey bawaan bisa dihitung siapa pun yang membaca repo: tolak di produksi
+        if not settings.DEBUG and not settings.PREDICTION_WORKER['AUTHKEY_FROM_ENV']:
+            raise CommandError("Set the PREDICTION_WORKER_AUTHKEY environment variable (a long random secret, "
+                               "the same for the worker and the web processes) before running with DEBUG off")
+
+        indexes.ensure_on_startup()
+
+        host, port = settings.PREDICTION_WORKER['ADDRESS']
+        address = (options['host'] or host, options['port'] or port)
+
+        worker = PredictionWorker(address, settings.PREDICTION_WORKER['AUTHKEY'])
+
+        if not options['no_warmup']:
+            print("Starting Spark session...")
+            worker.warmup()
+            print("✓ Spark session ready")
+
+        print(f"Prediction worker listening on {address[0]}:{address[1]}")
+        print("Waiting for requests... (Press Ctrl+C to stop)")
+        try:
+            worker.serve_forever()
+        except KeyboardInterrupt:
+            print("Prediction worker stopped")
@@ -0,0 +1,87 @@
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from prediction import client, fleet, registry
+from prediction.exceptions import PredictionError
+from prediction.numpy_engine import ALGORITHMS
+from prediction.sampling import SAMPLING_STRATEGIES, get_sampling
+
+FLEET_TIMEOUT = 6 * 3600  # detik; fleet retrain jauh lebih lama dari satu request
+
+
+class Command(BaseCommand):
+    help = "Retrain prediction models for every device in one batch and save them to the registry"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engine', choices=['numpy', 'spark'], default='numpy',
+                            help="numpy: process pool in this process, spark: one grouped-map Spark job in the prediction worker")
+        parser.add_argument('--algo', action='append', choices=ALGORITHMS,
+                            help="Algorithm to train (repeatable). Default: all")
+        parser.add_argument('--device', action='append', dest='devices',
+                            help="Only retrain this device_id (repeatable). Default: all devices")
+        parser.add_argument('--workers', type=int, help="Process pool size for the numpy engine")
+        parser.add_argument('--days', type=int, default=settings.TRAINING_SAMPLING['DAYS'],
+                            help="Train on the last N days only, 0 = all history. Default: TRAINING_SAMPLING['DAYS']")
+        parser.add_argument('--max-rows', type=int, default=settings.TRAINING_SAMPLING['MAX_ROWS'],
+                            help="Row bound per device, 0 = unbounded. Default: TRAINING_SAMPLING['MAX_ROWS']")
+        parser.add_argument('--sample', choices=SAMPLING_STRATEGIES, default=settings.TRAINING_SAMPLING['STRATEGY'],
+                            help="Sampling strategy when --max-rows applies. Default: TRAINING_SAMPLING['STRATEGY']")
+        parser.add_argument('--at', metavar='HH:MM',
+                            help="Scheduled mode: keep running and retrain every day at this time (server local time)")
+
+    def handle(self, *args, **options):
+        try:
+            options['sampling'] = get_sampling(options['days'], options['max_rows'], options['sample'])
+        except ValueError as e:
+            raise CommandError(str(e))
+        registry.ensure_indexes()
+
+        if not options['at']:
+            self.run_once(options)
+            return
+
+        try:
+            hour, minute = (int(part) for part in options['at'].split(':'))
+        except ValueError:
+            raise CommandError("--at must look like HH:MM")
+
+        print(f"Scheduled fleet training every day at {hour:02d}:{minute:02d} (Press Ctrl+C to stop)")
+        while True:
+            now = datetime.now()
+            next_run = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            if next_run <= now:
+                next_run += timedelta(days=1)
+            print(f"Next run: {next_run.isoformat(sep=' ', timespec='minutes')}")
+            time.sleep((next_run - now).total_seconds())
+            try:
+                self.run_once(options)
+            except Exception as e:
+                print(f"❌ Fleet training failed: {e}")
+
+    def run_once(self, options):
+        algos = tuple(options['algo'] or ALGORITHMS)
+        print(f"Fleet training started ({options['engine']} engine, algorithms: {', '.join(algos)})")
+
+        if options['engine'] == 'spark':
+            # Lewat prediction worker (pool 'batch'): satu JVM, antre di belakang request interaktif
+            try:
+                summary = client.call(
+                    'train_fleet',
+                    timeout=FLEET_TIMEOUT,
+                    device_ids=options['devices'],
+                    algos=algos,
+                    sampling=options['sampling']
+                )
+            except PredictionError as e:
+                raise CommandError(e.message)
+            print(f"Queued {summary['scheduling']['queue_seconds']}s in the '{summary['scheduling']['pool']}' pool")
+        else:
+            summary = fleet.train_fleet_numpy(options['devices'], algos, options['workers'],
+                                              sampling=options['sampling'])
+
+        print(f"✓ {summary['models_written']} models written for {summary['devices_trained']} devices "
+              f"in {summary['total_seconds']}s")
+        return summary
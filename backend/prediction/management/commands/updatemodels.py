@@ -0,0 +1,37 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from prediction import incremental, registry
+from prediction.numpy_engine import ALGORITHMS
+
+
+class Command(BaseCommand):
+    help = "Incrementally update registered models with readings newer than their watermark"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--algo', action='append', choices=ALGORITHMS,
+                            help="Algorithm to update (repeatable). Default: all")
+        parser.add_argument('--device', action='append', dest='devices',
+                            help="Only update this device_id (repeatable). Default: all active devices")
+        parser.add_argument('--interval', type=float,
+                            help="Follow mode: repeat every N seconds instead of running once")
+
+    def handle(self, *args, **options):
+        registry.ensure_indexes()
+        incremental.ensure_indexes()
+        algos = tuple(options['algo'] or ALGORITHMS)
+
+        while True:
+            started = time.perf_counter()
+            summaries = incremental.update_fleet(algos, options['devices'])
+            updated = [s for s in summaries if s['status'] == 'updated']
+
+            for s in updated:
+                rmse = f"{s['rmse']:.2f}" if s['rmse'] is not None else "n/a"
+                print(f"✓ {s['device_id']} [{s['algo']}] +{s['new_records']} readings, prequential RMSE {rmse}")
+            print(f"{len(updated)}/{len(summaries)} models updated in {time.perf_counter() - started:.2f}s")
+
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,450 @@
+"""
+In-process NumPy training engine.
+
+Array-backed versions of the three algorithms used by the Spark pipeline
+(random forest, gradient boosted trees, linear regression) with the same
+hyperparameters, so models can be fitted and scored without a JVM.
+
+Tree ensembles are stored as flat node arrays shared by every tree:
+feature/threshold/left/right/value, one entry per node, with `roots` holding
+the index of each tree's root and `weights` the per-tree multiplier. A row goes
+to the left child when x[feature] <= threshold (same convention as Spark).
+Leaves have left == right == LEAF. Each tree's nodes are stored contiguously,
+in roots order, which lets trees be sliced out and re-stacked (stack_trees).
+"""
+import io
+import math
+
+import numpy as np
+
+FEATURE_COLS = ["voltage", "current", "pf"]
+LABEL_COL = "power"
+
+ALGORITHMS = ('rf', 'gbt', 'lr')
+MULTI_ALGO_MODES = ('auto', 'all')   # latih & bandingkan semua ALGORITHMS
+
+MODEL_NAMES = {
+    'rf': "Random Forest",
+    'gbt': "Gradient Boosted Trees",
+    'lr': "Linear Regression",
+}
+
+# Sama dengan hyperparameter di training.get_model_by_algorithm
+RF_PARAMS = {'num_trees': 50, 'max_depth': 10}
+GBT_PARAMS = {'max_iter': 50, 'max_depth': 5, 'step_size': 0.1}
+LR_PARAMS = {'reg_param': 0.1}
+MAX_BINS = 32
+
+LEAF = -1
+
+
+class LinearModel:
+    """y = X @ coef + intercept"""
+
+    kind = 'linear'
+
+    def __init__(self, coef, intercept):
+        self.coef = np.asarray(coef, dtype=np.float64)
+        self.intercept = float(intercept)
+
+    def predict(self, X):
+        return np.asarray(X, dtype=np.float64) @ self.coef + self.intercept
+
+    def to_arrays(self):
+        return {'coef': self.coef, 'intercept': np.array([self.intercept])}
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(arrays['coef'], arrays['intercept'][0])
+
+
+class TreeEnsemble:
+    """base + sum(weights[t] * tree_t(x)) over flat node arrays"""
+
+    kind = 'trees'
+
+    def __init__(self, feature, threshold, left, right, value, roots, weights, base=0.0):
+        self.feature = np.asarray(feature, dtype=np.int32)
+        self.threshold = np.asarray(threshold, dtype=np.float64)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.roots = np.asarray(roots, dtype=np.int32)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.base = float(base)
+
+    @property
+    def n_trees(self):
+        return len(self.roots)
+
+    @property
+    def n_nodes(self):
+        return len(self.value)
+
+    def predict(self, X):
+        """
+        Score a batch of rows through every tree at once
+
+        All (row, tree) pairs descend one level per iteration, so the Python
+        loop runs max-depth times regardless of batch size or tree count.
+        """
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim == 1:
+            X = X[None, :]
+
+        rows = np.arange(len(X))[:, None]
+        node = np.broadcast_to(self.roots, (len(X), self.n_trees)).copy()
+
+        while True:
+            left = self.left[node]
+            internal = left != LEAF
+            if not internal.any():
+                break
+            go_left = X[rows, self.feature[node]] <= self.threshold[node]
+            node = np.where(internal, np.where(go_left, left, self.right[node]), node)
+
+        return self.base + self.value[node] @ self.weights
+
+    def tree(self, t):
+        """Tree `t` as a standalone single-tree ensemble (keeps its weight)"""
+        start = self.roots[t]
+        end = self.roots[t + 1] if t + 1 < self.n_trees else self.n_nodes
+        left, right = self.left[start:end], self.right[start:end]
+        return TreeEnsemble(
+            self.feature[start:end], self.threshold[start:end],
+            np.where(left == LEAF, LEAF, left - start), np.where(right == LEAF, LEAF, right - start),
+            self.value[start:end], [0], [self.weights[t]]
+        )
+
+    def to_arrays(self):
+        return {
+            'feature': self.feature,
+            'threshold': self.threshold,
+            'left': self.left,
+            'right': self.right,
+            'value': self.value,
+            'roots': self.roots,
+            'weights': self.weights,
+            'base': np.array([self.base]),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays):
+        return cls(
+            arrays['feature'], arrays['threshold'], arrays['left'], arrays['right'],
+            arrays['value'], arrays['roots'], arrays['weights'], arrays['base'][0]
+        )
+
+
+def stack_trees(ensembles, weights=None, base=0.0):
+    """
+    Concatenate the trees of several ensembles into one
+
+    Args:
+        ensembles (list): TreeEnsemble objects, trees kept in order
+        weights (array): per-tree weights for the result (default: keep each tree's weight)
+        base (float): constant added to every prediction
+    """
+    offset = 0
+    parts = {'feature': [], 'threshold': [], 'left': [], 'right': [], 'value': [], 'roots': [], 'weights': []}
+    for ensemble in ensembles:
+        parts['feature'].append(ensemble.feature)
+        parts['threshold'].append(ensemble.threshold)
+        parts['left'].append(np.where(ensemble.left == LEAF, LEAF, ensemble.left + offset))
+        parts['right'].append(np.where(ensemble.right == LEAF, LEAF, ensemble.right + offset))
+        parts['value'].append(ensemble.value)
+        parts['roots'].append(ensemble.roots + offset)
+        parts['weights'].append(ensemble.weights)
+        offset += ensemble.n_nodes
+
+    arrays = {key: np.concatenate(value) for key, value in parts.items()}
+    return TreeEnsemble(
+        arrays['feature'], arrays['threshold'], arrays['left'], arrays['right'], arrays['value'],
+        arrays['roots'], arrays['weights'] if weights is None else weights, base
+    )
+
+
+MODEL_CLASSES = {cls.kind: cls for cls in (LinearModel, TreeEnsemble)}
+
+
+def dumps_model(model):
+    """Serialize a model to compressed .npz bytes"""
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, kind=np.array(model.kind), **model.to_arrays())
+    return buffer.getvalue()
+
+
+def loads_model(data):
+    """Inverse of dumps_model"""
+    with np.load(io.BytesIO(data), allow_pickle=False) as arrays:
+        arrays = {key: arrays[key] for key in arrays.files}
+    return MODEL_CLASSES[str(arrays.pop('kind'))].from_arrays(arrays)
+
+
+# === Linear regression (sufficient statistics) ===
+
+def linear_stats(X, y):
+    """
+    Sufficient statistics for linear regression
+
+    Everything fit_linear_from_stats needs, and additive across batches
+    (see merge_linear_stats), so a model can be updated from new rows only.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    return {
+        'n': len(y),
+        'sum_x': X.sum(axis=0),
+        'sum_y': float(y.sum()),
+        'xtx': X.T @ X,
+        'xty': X.T @ y,
+        'yty': float(y @ y),
+    }
+
+
+def merge_linear_stats(a, b):
+    """Add two sets of linear_stats"""
+    return {key: a[key] + b[key] for key in a}
+
+
+def fit_linear_from_stats(stats, reg_param=LR_PARAMS['reg_param']):
+    """
+    Ridge regression on standardized features from sufficient statistics
+
+    Mirrors Spark's normal-equation solver (standardization=True): the L2
+    penalty applies to standardized coefficients and is scaled by the label
+    standard deviation. Constant features get a zero coefficient.
+    """
+    n = stats['n']
+    mean_x = stats['sum_x'] / n
+    mean_y = stats['sum_y'] / n
+
+    cov_xx = stats['xtx'] / n - np.outer(mean_x, mean_x)
+    cov_xy = stats['xty'] / n - mean_x * mean_y
+    var_y = max(stats['yty'] / n - mean_y ** 2, 0.0)
+
+    std_x = np.sqrt(np.clip(np.diag(cov_xx), 0.0, None))
+    std_y = math.sqrt(var_y)
+    varying = std_x > 1e-12
+
+    coef = np.zeros(len(mean_x))
+    if varying.any() and std_y > 0:
+        s = std_x[varying]
+        corr = cov_xx[np.ix_(varying, varying)] / np.outer(s, s)
+        rhs = cov_xy[varying] / s
+        penalty = reg_param / std_y
+        coef[varying] = np.linalg.solve(corr + penalty * np.eye(len(s)), rhs) / s
+
+    return LinearModel(coef, mean_y - mean_x @ coef)
+
+
+# === Regression trees ===
+
+def bin_features(X, max_bins=MAX_BINS):
+    """
+    Quantile-bin every feature once per fit
+
+    Returns:
+        tuple: (binned int32 matrix, list of split thresholds per feature).
+        Bin b of feature j holds rows with thresholds[j][b-1] < x <= thresholds[j][b].
+    """
+    quantiles = np.linspace(0, 1, max_bins + 1)[1:-1]
+    binned = np.empty(X.shape, dtype=np.int32)
+    thresholds = []
+    for j in range(X.shape[1]):
+        edges = np.unique(np.quantile(X[:, j], quantiles))
+        thresholds.append(edges)
+        binned[:, j] = np.searchsorted(edges, X[:, j], side='left')
+    return binned, thresholds
+
+
+def _best_split(binned, thresholds, y, features, min_leaf):
+    """Best (feature, bin) split of one node by variance reduction"""
+    n = len(y)
+    total = y.sum()
+    parent_score = total * total / n
+    best = None
+
+    for j in features:
+        n_bins = len(thresholds[j]) + 1
+        if n_bins < 2:
+            continue
+        counts = np.bincount(binned[:, j], minlength=n_bins)
+        sums = np.bincount(binned[:, j], weights=y, minlength=n_bins)
+
+        count_left = np.cumsum(counts)[:-1]
+        sum_left = np.cumsum(sums)[:-1]
+        count_right = n - count_left
+        sum_right = total - sum_left
+
+        valid = (count_left >= min_leaf) & (count_right >= min_leaf)
+        if not valid.any():
+            continue
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            gain = sum_left ** 2 / count_left + sum_right ** 2 / count_right - parent_score
+        gain = np.where(valid, gain, -np.inf)
+
+        k = int(np.argmax(gain))
+        if gain[k] > 1e-9 * max(abs(parent_score), 1.0) and (best is None or gain[k] > best[2]):
+            best = (j, k, gain[k])
+
+    return best
+
+
+class _NodeArrays:
+    """Growable flat node storage shared by all trees of an ensemble"""
+
+    def __init__(self):
+        self.feature, self.threshold, self.left, self.right, self.value = [], [], [], [], []
+
+    def add(self, value):
+        self.feature.append(0)
+        self.threshold.append(0.0)
+        self.left.append(LEAF)
+        self.right.append(LEAF)
+        self.value.append(value)
+        return len(self.value) - 1
+
+    def build(self, roots, weights, base=0.0):
+        return TreeEnsemble(
+            self.feature, self.threshold, self.left, self.right, self.value, roots, weights, base
+        )
+
+
+def grow_tree(nodes, binned, thresholds, y, rows, max_depth, max_features=None, rng=None, min_leaf=1):
+    """
+    Grow one regression tree into `nodes` and return its root index
+
+    Args:
+        nodes (_NodeArrays): shared node storage
+        binned, thresholds: output of bin_features
+        y (ndarray): targets for all rows
+        rows (ndarray): row indices used by this tree (bootstrap sample)
+        max_depth (int): maximum depth (root = depth 0)
+        max_features (int): features tried per node (None = all)
+        rng (Generator): random source for feature subsets
+        min_leaf (int): minimum rows per child
+    """
+    n_features = binned.shape[1]
+    root = nodes.add(float(y[rows].mean()))
+    stack = [(root, rows, 0)]
+
+    while stack:
+        node, idx, depth = stack.pop()
+        if depth >= max_depth or len(idx) < 2 * min_leaf:
+            continue
+
+        if max_features is None or max_features >= n_features:
+            features = range(n_features)
+        else:
+            features = rng.choice(n_features, size=max_features, replace=False)
+
+        y_node = y[idx]
+        split = _best_split(binned[idx], thresholds, y_node, features, min_leaf)
+        if split is None:
+            continue
+
+        j, k, _ = split
+        goes_left = binned[idx, j] <= k
+        left_idx, right_idx = idx[goes_left], idx[~goes_left]
+
+        left = nodes.add(float(y[left_idx].mean()))
+        right = nodes.add(float(y[right_idx].mean()))
+        nodes.feature[node] = int(j)
+        nodes.threshold[node] = float(thresholds[j][k])
+        nodes.left[node] = left
+        nodes.right[node] = right
+
+        stack.append((left, left_idx, depth + 1))
+        stack.append((right, right_idx, depth + 1))
+
+    return root
+
+
+def fit_random_forest(X, y, num_trees=RF_PARAMS['num_trees'], max_depth=RF_PARAMS['max_depth'], seed=42):
+    """Bootstrap-aggregated regression trees, one third of the features per split"""
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    rng = np.random.default_rng(seed)
+    binned, thresholds = bin_features(X)
+    max_features = max(1, math.ceil(X.shape[1] / 3))
+
+    nodes = _NodeArrays()
+    roots = []
+    for _ in range(num_trees):
+        sample = rng.integers(0, len(y), size=len(y))
+        roots.append(grow_tree(nodes, binned, thresholds, y, sample, max_depth, max_features, rng))
+
+    return nodes.build(roots, np.full(num_trees, 1.0 / num_trees))
+
+
+def fit_gradient_boosting(X, y, max_iter=GBT_PARAMS['max_iter'], max_depth=GBT_PARAMS['max_depth'],
+                          step_size=GBT_PARAMS['step_size'], init=None):
+    """
+    Squared-error gradient boosting
+
+    Like Spark, the first tree fits the label with weight 1.0 and every later
+    tree fits the residual with weight step_size. Passing `init` (an existing
+    TreeEnsemble) continues boosting from it instead (warm start).
+    """
+    X = np.asarray(X, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    binned, thresholds = bin_features(X)
+    rows = np.arange(len(y))
+
+    nodes = _NodeArrays()
+    roots, weights = [], []
+    prediction = np.zeros(len(y))
+    base = 0.0
+
+    if init is not None:
+        nodes.feature = list(init.feature)
+        nodes.threshold = list(init.threshold)
+        nodes.left = list(init.left)
+        nodes.right = list(init.right)
+        nodes.value = list(init.value)
+        roots, weights, base = list(init.roots), list(init.weights), init.base
+        prediction = init.predict(X)
+
+    for _ in range(max_iter):
+        weight = 1.0 if not roots else step_size
+        roots.append(grow_tree(nodes, binned, thresholds, y - prediction, rows, max_depth))
+        weights.append(weight)
+        prediction = prediction + nodes.build([roots[-1]], [weight]).predict(X)
+
+    return nodes.build(roots, weights, base)
+
+
+def fit_linear_regression(X, y, reg_param=LR_PARAMS['reg_param']):
+    return fit_linear_from_stats(linear_stats(X, y), reg_param)
+
+
+def fit(algo, X, y, seed=42):
+    """
+    Fit one algorithm with the same hyperparameters as the Spark pipeline
+
+    Args:
+        algo (str): Algorithm identifier ('rf', 'gbt', 'lr'); unknown values fall back to 'rf'
+        X (ndarray): feature matrix, columns in FEATURE_COLS order
+        y (ndarray): power labels
+
+    Returns:
+        LinearModel or TreeEnsemble
+    """
+    if algo == 'gbt':
+        return fit_gradient_boosting(X, y)
+    elif algo == 'lr':
+        return fit_linear_regression(X, y)
+    return fit_random_forest(X, y, seed=seed)
+
+
+# === Evaluation helpers ===
+
+def split_mask(n, ratio=0.8, seed=42):
+    """Random train mask for an (approximately) ratio / 1 - ratio split"""
+    return np.random.default_rng(seed).random(n) < ratio
+
+
+def rmse(y_true, y_pred):
+    return float(np.sqrt(np.mean((np.asarray(y_true) - np.asarray(y_pred)) ** 2)))
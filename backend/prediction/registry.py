@@ -0,0 +1,126 @@
+"""
+Model registry stored in MongoDB.
+
+One document per (device_id, algo) holding the serialized NumPy model
+(see numpy_engine.dumps_model) plus its evaluation metadata. Writes are
+batched upserts so fleet retraining saves thousands of models in a few
+round trips.
+"""
+import datetime
+import threading
+from collections import OrderedDict
+
+from pymongo import ASCENDING, ReplaceOne
+
+from monitoring import mongo
+
+from . import numpy_engine
+
+REGISTRY_COLLECTION = "prediction_models"
+BULK_WRITE_SIZE = 500
+MAX_CACHED_MODELS = 256
+
+# Model yang sudah di-deserialize, per proses: (device_id, algo) -> (trained_at, model)
+_model_cache = OrderedDict()
+_model_cache_lock = threading.Lock()
+
+
+def get_registry_collection():
+    return mongo.get_collection(REGISTRY_COLLECTION)
+
+
+def ensure_indexes(collection=None):
+    collection = collection if collection is not None else get_registry_collection()
+    collection.create_index([("device_id", ASCENDING), ("algo", ASCENDING)], unique=True)
+
+
+def save_models(entries, collection=None):
+    """
+    Upsert many registry entries with unordered bulk writes
+
+    Args:
+        entries (iterable): dicts with at least device_id, algo and model (bytes)
+        collection: target collection (default: prediction_models)
+
+    Returns:
+        int: number of documents inserted or replaced
+    """
+    collection = collection if collection is not None else get_registry_collection()
+    now = datetime.datetime.utcnow()
+    written = 0
+    batch = []
+
+    def flush():
+        result = collection.bulk_write(batch, ordered=False)
+        return result.upserted_count + result.modified_count
+
+    for entry in entries:
+        document = {**entry, "trained_at": entry.get("trained_at", now)}
+        batch.append(ReplaceOne(
+            {"device_id": entry["device_id"], "algo": entry["algo"]},
+            document,
+            upsert=True
+        ))
+        if len(batch) >= BULK_WRITE_SIZE:
+            written += flush()
+            batch = []
+
+    if batch:
+        written += flush()
+
+    return written
+
+
+def load_model(device_id, algo, collection=None):
+    """
+    Load a registered model
+
+    Returns:
+        tuple: (model, metadata document without the model bytes), or (None, None)
+    """
+    collection = collection if collection is not None else get_registry_collection()
+    document = collection.find_one({"device_id": device_id, "algo": algo})
+    if document is None:
+        return None, None
+
+    model = numpy_engine.loads_model(bytes(document.pop("model")))
+    document.pop("_id", None)
+    return model, document
+
+
+def list_models(device_id, collection=None):
+    """Metadata of every registered model for a device"""
+    collection = collection if collection is not None else get_registry_collection()
+    return list(collection.find({"device_id": device_id}, {"_id": 0, "model": 0}))
+
+
+def get_model(device_id, algo, collection=None):
+    """
+    Like load_model, but keeps deserialized models in a per-process LRU
+
+    Only the metadata is fetched when the cached copy is still current
+    (same trained_at), so repeated scoring skips the model download.
+    """
+    collection = collection if collection is not None else get_registry_collection()
+    metadata = collection.find_one({"device_id": device_id, "algo": algo}, {"_id": 0, "model": 0})
+    if metadata is None:
+        return None, None
+
+    key = (device_id, algo)
+    with _model_cache_lock:
+        cached = _model_cache.get(key)
+        if cached is not None and cached[0] == metadata.get("trained_at"):
+            _model_cache.move_to_end(key)
+            return cached[1], metadata
+
+    model, metadata = load_model(device_id, algo, collection)
+    if model is None:
+        return None, None
+
+    with _model_cache_lock:
+        _model_cache[key] = (metadata.get("trained_at"), model)
+        _model_cache.move_to_end(key)
+        while len(_model_cache) > MAX_CACHED_MODELS:
+            _model_cache.popitem(last=False)
+
+    return model, metadata
@@ -0,0 +1,219 @@
+"""
+Bounded training-set selection.
+
+A sampling spec limits how much history a training run reads:
+
+    days       only readings from the last N days (None = all history)
+    max_rows   upper bound on rows handed to the model (None = no bound)
+    strategy   how rows are dropped when the window holds more than max_rows
+                 latest  the newest max_rows readings
+                 random  uniform random sample over the window
+                 hourly  stratified by local hour-of-day, so every hour keeps
+                         (about) the same share and the daily load shape
+                         survives the sampling
+
+Everything is pushed into MongoDB as one aggregation pipeline: a per-hour
+count over the indexed (device_id, timestamp) range fixes the keep
+probability of each hour, and a streaming `$rand` filter applies it, so no
+sort or in-memory sample of the full window is needed. Archived (cold
+Parquet) rows of the window are counted and sampled with the same
+probabilities (build_selection). Random and hourly
+samples are therefore approximate in size (binomial around max_rows) and
+not reproducible between runs.
+
+Safe to import from Django views: it only needs pymongo and NumPy.
+"""
+import datetime
+
+import numpy as np
+from django.conf import settings
+
+from monitoring import mongo
+
+from .numpy_engine import FEATURE_COLS, LABEL_COL
+
+SAMPLING_STRATEGIES = ('latest', 'random', 'hourly')
+
+
+def get_sampling(days=None, max_rows=None, strategy=None):
+    """
+    Build a sampling spec, filling gaps from settings.TRAINING_SAMPLING
+
+    Args:
+        days (int): window in days, 0 for all history
+        max_rows (int): row bound, 0 for unbounded
+        strategy (str): one of SAMPLING_STRATEGIES
+
+    Returns:
+        dict: {"days", "max_rows", "strategy"} with None for "no limit"
+
+    Raises:
+        ValueError: on non-integer or negative limits, or an unknown strategy
+    """
+    defaults = settings.TRAINING_SAMPLING
+    try:
+        days = int(defaults['DAYS'] if days is None else days)
+        max_rows = int(defaults['MAX_ROWS'] if max_rows is None else max_rows)
+    except (TypeError, ValueError):
+        raise ValueError("days and max_rows must be integers (0 = no limit)")
+    strategy = (strategy or defaults['STRATEGY']).lower()
+
+    if days < 0 or max_rows < 0:
+        raise ValueError("days and max_rows must be >= 0 (0 = no limit)")
+    if strategy not in SAMPLING_STRATEGIES:
+        raise ValueError(f"Invalid sample strategy. Valid options: {list(SAMPLING_STRATEGIES)}")
+
+    return {"days": days or None, "max_rows": max_rows or None, "strategy": strategy}
+
+
+def _hour_expression():
+    return {"$hour": {"date": "$timestamp", "timezone": settings.LOCAL_TIME_ZONE}}
+
+
+def allocate_quota(counts, total):
+    """
+    Split `total` rows over strata as evenly as their sizes allow
+
+    Strata smaller than the even share keep all their rows and the leftover
+    is spread over the larger ones (water filling).
+
+    Args:
+        counts (dict): stratum -> available rows
+        total (int): rows to keep
+
+    Returns:
+        dict: stratum -> rows to keep
+    """
+    quota = {}
+    remaining = total
+    pending = sorted(counts, key=counts.get)
+    while pending:
+        share = remaining / len(pending)
+        stratum = pending.pop(0)
+        quota[stratum] = min(counts[stratum], share)
+        remaining -= quota[stratum]
+    return quota
+
+
+def keep_fractions(counts, sampling):
+    """
+    Keep probability of every local hour for the random and hourly strategies
+
+    Args:
+        counts (dict): local hour -> rows in the window
+        sampling (dict): spec from get_sampling
+
+    Returns:
+        dict: hour -> fraction in (0, 1]; empty when no row has to be dropped
+    """
+    total = sum(counts.values())
+    max_rows = sampling["max_rows"]
+    if not max_rows or total <= max_rows:
+        return {}
+    if sampling["strategy"] == 'random':
+        return {hour: max_rows / total for hour in counts}
+    quota = allocate_quota(counts, max_rows)
+    return {hour: quota[hour] / count for hour, count in counts.items() if count}
+
+
+def keep_filter(fractions):
+    """`$match` stage keeping each row with its hour's probability (streaming `$rand`)"""
+    branches = [
+        {"case": {"$eq": [_hour_expression(), hour]}, "then": fraction}
+        for hour, fraction in fractions.items() if fraction < 1
+    ]
+    return {"$match": {"$expr": {"$lt": [
+        {"$rand": {}},
+        {"$switch": {"branches": branches, "default": 1}}
+    ]}}}
+
+
+def build_selection(device_id, sampling, collection=None, now=None, archived_hours=None):
+    """
+    Aggregation pipeline and archive mask that select a device's training rows
+
+    Runs one small aggregation (row count per local hour inside the window)
+    to size the sample. Archived rows of the same window (their local hours
+    in `archived_hours`) count toward the window and the row budget exactly
+    like hot ones: 'random' and 'hourly' keep them with the same per-hour
+    probability, 'latest' only reaches into the archive (which is older than
+    every hot reading) when the hot window holds fewer than max_rows rows.
+
+    Args:
+        device_id (str): Device ID
+        sampling (dict): spec from get_sampling
+        collection: readings collection (default: pzem_data1)
+        now (datetime): end of the window, naive UTC (default: utcnow)
+        archived_hours (ndarray): local hour of every archived row in the
+                                  window, oldest first (None: no archive)
+
+    Returns:
+        tuple: (pipeline list, boolean keep mask over the archived rows,
+        info dict for model metadata)
+    """
+    collection = collection if collection is not None else mongo.get_collection()
+    now = now or datetime.datetime.utcnow()
+    archived_hours = np.asarray([] if archived_hours is None else archived_hours, dtype=np.int64)
+
+    match = {
+        "device_id": device_id,
+        "timestamp": {"$type": "date"},
+        **{col: {"$type": "number"} for col in FEATURE_COLS + [LABEL_COL]},
+    }
+    since = None
+    if sampling["days"]:
+        since = now - datetime.timedelta(days=sampling["days"])
+        match["timestamp"]["$gte"] = since
+
+    # Jumlah reading per jam lokal di dalam window (satu agregasi kecil)
+    hot_counts = {
+        row["_id"]: row["count"]
+        for row in collection.aggregate([
+            {"$match": match},
+            {"$group": {"_id": _hour_expression(), "count": {"$sum": 1}}},
+        ])
+    }
+    counts = dict(hot_counts)
+    for hour, count in zip(*np.unique(archived_hours, return_counts=True)):
+        counts[int(hour)] = counts.get(int(hour), 0) + int(count)
+
+    hot_records = sum(hot_counts.values())
+    window_records = sum(counts.values())
+    max_rows = sampling["max_rows"]
+    sampled = bool(max_rows and window_records > max_rows)
+
+    pipeline = [{"$match": match}]
+    keep = np.ones(len(archived_hours), dtype=bool)
+    if sampled and sampling["strategy"] == 'latest':
+        if hot_records > max_rows:
+            pipeline += [{"$sort": {"timestamp": -1}}, {"$limit": max_rows}]
+        keep[:max(len(keep) - max(max_rows - hot_records, 0), 0)] = False
+    elif sampled:
+        fractions = keep_fractions(counts, sampling)
+        pipeline.append(keep_filter(fractions))
+        hour_fraction = np.array([fractions.get(hour, 1.0) for hour in range(24)])
+        keep = np.random.default_rng().random(len(archived_hours)) < hour_fraction[archived_hours]
+
+    pipeline.append({"$project": {"_id": 0, "timestamp": 1, **{col: 1 for col in FEATURE_COLS + [LABEL_COL]}}})
+
+    info = {
+        **sampling,
+        "since": since.isoformat() if since else None,
+        "until": now.isoformat(),
+        "window_records": window_records,
+        "archive_records": len(archived_hours),
+        "archive_selected": int(keep.sum()),
+        "sampled": sampled,
+    }
+    return pipeline, keep, info
+
+
+def build_pipeline(device_id, sampling, collection=None, now=None):
+    """
+    Aggregation pipeline that selects a device's hot (MongoDB) training rows
+
+    Returns:
+        tuple: (pipeline list, info dict for model metadata)
+    """
+    pipeline, _, info = build_selection(device_id, sampling, collection, now)
+    return pipeline, info
@@ -0,0 +1,195 @@
+"""
+Admission control for Spark jobs in the prediction worker.
+
+Every request that runs Spark work goes through JobScheduler.run():
+
+    cap        at most MAX_CONCURRENT_JOBS jobs run at once (each pool also
+               has its own max_running), the rest wait in a queue instead
+               of oversubscribing the local[*] executor
+    priority   waiting jobs are admitted by pool priority, then arrival, so
+               an interactive /prediction/run/ overtakes queued batch retrains
+    pools      a running job's Spark jobs are tagged with its pool name;
+               Spark's FAIR scheduler then shares cores between pools by
+               weight / minShare (see spark.fair_scheduler_file)
+    hints      per-job resource hints (fit_threads: concurrent model fits
+               inside the job) read by training via current_hints()
+
+Queue wait and run time of recent jobs are kept per pool and reported by
+stats() (worker health). A job that waits longer than QUEUE_TIMEOUT is
+rejected with HTTP 503 so callers fail fast under overload.
+"""
+import itertools
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+
+from .exceptions import PredictionError
+
+HISTORY_SIZE = 200
+
+_local = threading.local()
+
+
+def current_hints():
+    """Resource hints of the job running in this thread ({} outside a job)"""
+    return getattr(_local, 'hints', {})
+
+
+def _percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+
+class JobScheduler:
+    """
+    Priority admission queue with a global and a per-pool concurrency cap
+
+    Args:
+        max_concurrent (int): jobs allowed to run at the same time
+        pools (dict): pool name -> {"priority", "max_running", "hints", ...};
+                      lower priority value is admitted first
+        queue_timeout (float): seconds a job may wait before it is rejected
+        job_context (callable): (pool, description) -> context manager entered
+                                around each job (tags the Spark jobs)
+    """
+
+    def __init__(self, max_concurrent, pools, queue_timeout, job_context=None):
+        self.max_concurrent = max_concurrent
+        self.pools = pools
+        self.queue_timeout = queue_timeout
+        self.job_context = job_context
+
+        self._cond = threading.Condition()
+        self._sequence = itertools.count()
+        self._waiting = []
+        self._running = {name: 0 for name in pools}
+        self._stats = {
+            name: {
+                "completed": 0,
+                "failed": 0,
+                "rejected": 0,
+                "queue_seconds": deque(maxlen=HISTORY_SIZE),
+                "run_seconds": deque(maxlen=HISTORY_SIZE),
+            }
+            for name in pools
+        }
+
+    def _next_ticket(self):
+        """Highest-priority waiting ticket that may start now, or None"""
+        if sum(self._running.values()) >= self.max_concurrent:
+            return None
+        for ticket in self._waiting:
+            pool = ticket[2]
+            if self._running[pool] < self.pools[pool].get('max_running', self.max_concurrent):
+                return ticket
+        return None
+
+    def run(self, fn, pool='interactive', description=None, hints=None):
+        """
+        Wait for a slot, then run fn() in the given pool
+
+        Args:
+            fn (callable): the job
+            pool (str): scheduler pool name
+            description (str): shown in the Spark UI job group
+            hints (dict): resource hints overriding the pool defaults
+
+        Returns:
+            tuple: (fn result, {"pool", "queue_seconds", "run_seconds"})
+
+        Raises:
+            PredictionError: 400 for an unknown pool, 503 when the queue wait times out
+        """
+        if pool not in self.pools:
+            raise PredictionError(f"Unknown scheduler pool: {pool}. Valid options: {list(self.pools)}", status=400)
+
+        queued_at = time.perf_counter()
+        ticket = (self.pools[pool].get('priority', 0), next(self._sequence), pool)
+
+        with self._cond:
+            self._waiting.append(ticket)
+            self._waiting.sort()
+            deadline = queued_at + self.queue_timeout
+            while self._next_ticket() is not ticket:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    self._waiting.remove(ticket)
+                    self._stats[pool]["rejected"] += 1
+                    self._cond.notify_all()
+                    raise PredictionError(
+                        "Prediction worker is busy, please retry shortly.",
+                        status=503,
+                        payload={"pool": pool, "queue_seconds": round(time.perf_counter() - queued_at, 3)}
+                    )
+                self._cond.wait(remaining)
+            self._waiting.remove(ticket)
+            self._running[pool] += 1
+
+        started = time.perf_counter()
+        queue_seconds = started - queued_at
+        _local.hints = {**self.pools[pool].get('hints', {}), **(hints or {})}
+
+        failed = True
+        try:
+            if self.job_context is not None:
+                with self.job_context(pool, description or pool):
+                    result = fn()
+            else:
+                result = fn()
+            failed = False
+        finally:
+            run_seconds = time.perf_counter() - started
+            _local.hints = {}
+            with self._cond:
+                self._running[pool] -= 1
+                stats = self._stats[pool]
+                stats["failed" if failed else "completed"] += 1
+                stats["queue_seconds"].append(queue_seconds)
+                stats["run_seconds"].append(run_seconds)
+                self._cond.notify_all()
+
+        return result, {
+            "pool": pool,
+            "queue_seconds": round(queue_seconds, 3),
+            "run_seconds": round(run_seconds, 3),
+        }
+
+    def stats(self):
+        """Queue depth, running jobs and recent wait / run time percentiles per pool"""
+        with self._cond:
+            waiting = [ticket[2] for ticket in self._waiting]
+            pools = {}
+            for name, stats in self._stats.items():
+                queue = list(stats["queue_seconds"])
+                run = list(stats["run_seconds"])
+                pools[name] = {
+                    "running": self._running[name],
+                    "waiting": waiting.count(name),
+                    "completed": stats["completed"],
+                    "failed": stats["failed"],
+                    "rejected": stats["rejected"],
+                    "queue_seconds_p50": _percentile(queue, 0.5),
+                    "queue_seconds_p95": _percentile(queue, 0.95),
+                    "queue_seconds_max": round(max(queue), 3) if queue else None,
+                    "run_seconds_p50": _percentile(run, 0.5),
+                    "run_seconds_p95": _percentile(run, 0.95),
+                    "run_seconds_max": round(max(run), 3) if run else None,
+                }
+
+        return {
+            "max_concurrent_jobs": self.max_concurrent,
+            "running": sum(self._running.values()),
+            "waiting": len(waiting),
+            "queue_timeout_seconds": self.queue_timeout,
+            "pools": pools,
+        }
+
+
+def from_settings(job_context=None):
+    """JobScheduler configured from settings.PREDICTION_SCHEDULER"""
+    config = settings.PREDICTION_SCHEDULER
+    return JobScheduler(config['MAX_CONCURRENT_JOBS'], config['POOLS'], config['QUEUE_TIMEOUT'], job_context)
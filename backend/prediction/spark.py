@@ -0,0 +1,143 @@
+"""
+Lazy SparkSession factory for the prediction app.
+
+Spark is never started at import time. The session (and its JVM) is only
+created on the first call to get_spark(), which in practice only happens
+inside the prediction worker process (python manage.py runpredictionworker).
+"""
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+from xml.sax.saxutils import quoteattr
+
+from django.conf import settings
+
+MONGO_CONNECTOR_PACKAGE = "org.mongodb.spark:mongo-spark-connector_2.12:10.5.0"
+
+# Local properties yang menandai job Spark milik satu request
+JOB_PROPERTIES = ("spark.scheduler.pool", "spark.jobGroup.id", "spark.job.description")
+
+_spark = None
+_lock = threading.Lock()
+
+
+def fair_scheduler_file():
+    """
+    Write the FAIR scheduler allocation file for settings.PREDICTION_SCHEDULER pools
+
+    Returns:
+        str: path of the generated XML file
+    """
+    pools = "\n".join(
+        f"  <pool name={quoteattr(name)}>\n"
+        f"    <schedulingMode>FAIR</schedulingMode>\n"
+        f"    <weight>{config.get('weight', 1)}</weight>\n"
+        f"    <minShare>{config.get('min_share', 0)}</minShare>\n"
+        f"  </pool>"
+        for name, config in settings.PREDICTION_SCHEDULER['POOLS'].items()
+    )
+    handle, path = tempfile.mkstemp(prefix="wattara-fairscheduler-", suffix=".xml")
+    with os.fdopen(handle, "w") as f:
+        f.write(f'<?xml version="1.0"?>\n<allocations>\n{pools}\n</allocations>\n')
+    return path
+
+
+def get_spark():
+    """
+    Return the process-wide SparkSession, creating it on first use
+
+    Returns:
+        SparkSession: shared session for this process
+    """
+    global _spark
+
+    if _spark is None:
+        with _lock:
+            if _spark is None:
+                from pyspark.sql import SparkSession
+
+                # Python workers (pandas UDFs) must be able to import project modules
+                pythonpath = os.environ.get("PYTHONPATH", "").split(os.pathsep)
+                if str(settings.BASE_DIR) not in pythonpath:
+                    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [str(settings.BASE_DIR)] + pythonpath))
+
+                session = SparkSession.builder \
+                    .appName("PowerPredictionMultiAlgo") \
+                    .master("local[*]") \
+                    .config("spark.jars.packages", MONGO_CONNECTOR_PACKAGE) \
+                    .config("spark.mongodb.read.connection.uri", settings.MONGODB['URI']) \
+                    .config("spark.mongodb.write.connection.uri", settings.MONGODB['URI']) \
+                    .config("spark.scheduler.mode", "FAIR") \
+                    .config("spark.scheduler.allocation.file", fair_scheduler_file()) \
+                    .getOrCreate()
+
+                # Set log level to reduce verbosity
+                session.sparkContext.setLogLevel("WARN")
+                _spark = session
+
+    return _spark
+
+
+def spark_status():
+    """
+    Describe the current SparkSession without starting one
+
+    Returns:
+        dict: session information, or {"started": False}
+    """
+    if _spark is None:
+        return {"started": False}
+
+    sc = _spark.sparkContext
+    return {
+        "started": True,
+        "version": sc.version,
+        "master": sc.master,
+        "app_id": sc.applicationId,
+        "default_parallelism": sc.defaultParallelism,
+    }
+
+
+@contextmanager
+def job_properties(pool, description):
+    """
+    Tag every Spark job started by this thread with a scheduler pool and job group
+
+    Used by prediction.scheduler around each admitted job.
+    """
+    sc = get_spark().sparkContext
+    sc.setLocalProperty("spark.scheduler.pool", pool)
+    sc.setJobGroup(f"{pool}-{threading.get_ident()}", description)
+    try:
+        yield
+    finally:
+        for key in JOB_PROPERTIES:
+            sc.setLocalProperty(key, None)
+
+
+def inherit_job_properties(fn):
+    """
+    Wrap fn so it runs with the calling thread's pool / job group
+
+    Spark local properties are per thread; helper threads (e.g. the thread
+    pools that fit several models at once) would otherwise land in the
+    default pool.
+    """
+    from pyspark import SparkContext
+
+    sc = SparkContext._active_spark_context
+    if sc is None:
+        return fn
+    properties = {key: sc.getLocalProperty(key) for key in JOB_PROPERTIES}
+
+    def wrapper(*args, **kwargs):
+        for key, value in properties.items():
+            sc.setLocalProperty(key, value)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            for key in properties:
+                sc.setLocalProperty(key, None)
+
+    return wrapper
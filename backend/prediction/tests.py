@@ -1,3 +1,570 @@
-from django.test import TestCase
+import contextlib
+import copy
+import csv
+import json
+import datetime
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.conf import settings
+from django.test import SimpleTestCase, override_settings
+
+from monitoring import mongo, resampling
+from monitoring.tests import MongoTestCase
+
+from . import benchmark, feature_store, fleet, incremental, numpy_engine, registry
+from .cache import FileBackend, LocMemBackend, ResultCache
+from .exceptions import PredictionError
+from .features import FeatureBuilder
+from .sampling import allocate_quota
+from .scheduler import JobScheduler, current_hints
+from .worker import PredictionWorker
+
+try:
+    import pyspark  # noqa: F401
+    HAS_PYSPARK = True
+except ImportError:
+    HAS_PYSPARK = False
+
+# Spark butuh JVM: tanpa Java, SparkSession gagal saat gateway dijalankan
+HAS_JAVA = bool(shutil.which("java") or os.environ.get("JAVA_HOME"))
+
+
+def synthetic_readings(n=400, seed=0):
+    """Voltage/current/pf rows and a noisy power label"""
+    rng = np.random.default_rng(seed)
+    voltage = 220 + rng.normal(0, 3, n)
+    current = rng.uniform(0.5, 8, n)
+    pf = rng.uniform(0.8, 1.0, n)
+    X = np.column_stack([voltage, current, pf])
+    return X, voltage * current * pf + rng.normal(0, 5, n)
+
+
+class NumpyEngineTests(SimpleTestCase):
+
+    def test_serialization_round_trip(self):
+        X, y = synthetic_readings()
+        for algo in numpy_engine.ALGORITHMS:
+            model = numpy_engine.fit(algo, X, y)
+            restored = numpy_engine.loads_model(numpy_engine.dumps_model(model))
+            np.testing.assert_allclose(restored.predict(X), model.predict(X))
+
+    def test_stacked_trees_predict_like_the_original(self):
+        X, y = synthetic_readings()
+        forest = numpy_engine.fit('rf', X, y)
+        stacked = numpy_engine.stack_trees([forest.tree(t) for t in range(forest.n_trees)])
+        np.testing.assert_allclose(stacked.predict(X), forest.predict(X))
+
+    def test_linear_stats_merge_matches_full_fit(self):
+        X, y = synthetic_readings()
+        merged = numpy_engine.merge_linear_stats(
+            numpy_engine.linear_stats(X[:150], y[:150]),
+            numpy_engine.linear_stats(X[150:], y[150:]),
+        )
+        full = numpy_engine.fit_linear_regression(X, y)
+        incremental = numpy_engine.fit_linear_from_stats(merged)
+        np.testing.assert_allclose(incremental.coef, full.coef)
+        self.assertAlmostEqual(incremental.intercept, full.intercept)
+
+
+class SamplingTests(SimpleTestCase):
+
+    def test_hourly_quota_gives_small_hours_everything_and_splits_the_rest(self):
+        quota = allocate_quota({0: 10, 1: 1000, 2: 1000, 3: 40}, 250)
+        self.assertEqual(quota[0], 10)
+        self.assertEqual(quota[3], 40)
+        self.assertAlmostEqual(quota[1], 100)
+        self.assertAlmostEqual(quota[2], 100)
+        self.assertAlmostEqual(sum(quota.values()), 250)
+
+
+class ResamplingTests(SimpleTestCase):
+
+    def test_buckets_drop_duplicates_and_flag_gaps(self):
+        epoch = np.array([0, 1, 1, 5, 30, 95.0])
+        values = np.array([1, 2, 9, 3, 4, 10.0])
+        result = resampling.resample(epoch, values, 10, agg="max", fill_policy="linear", max_gap=2)
+        np.testing.assert_allclose(result["values"][:4], [3, 3 + 1 / 3, 3 + 2 / 3, 4])
+        self.assertTrue(np.isnan(result["values"][4:9]).all())
+        self.assertEqual(result["values"][9], 10)
+        np.testing.assert_array_equal(result["counts"][:4], [3, 0, 0, 1])
+        self.assertEqual(result["gap"].sum(), 7)
+        self.assertEqual(result["filled"].sum(), 2)
+
+    def test_feature_builder_ignores_nan_readings_and_forward_fills_gaps(self):
+        builder = FeatureBuilder(60, (1,), (2,), max_steps=10)
+        builder.extend([0, 30, 200, 250], [1.0, 3.0, np.nan, 8.0])
+        np.testing.assert_allclose(builder.series, [2, 2, 2, 2, 8])
+
+
+class JobSchedulerTests(SimpleTestCase):
+
+    def make_scheduler(self, queue_timeout=5):
+        return JobScheduler(1, {
+            'interactive': {'priority': 0, 'max_running': 1, 'hints': {'fit_threads': 3}},
+            'batch': {'priority': 1, 'max_running': 1, 'hints': {'fit_threads': 1}},
+        }, queue_timeout)
+
+    def test_interactive_jobs_overtake_queued_batch_jobs(self):
+        scheduler = self.make_scheduler()
+        release = threading.Event()
+        order = []
+
+        blocker = threading.Thread(target=scheduler.run, args=(release.wait,), kwargs={'pool': 'batch'})
+        blocker.start()
+        while scheduler.stats()['running'] == 0:
+            time.sleep(0.01)
+
+        def submit(pool):
+            thread = threading.Thread(target=scheduler.run, args=(lambda: order.append(pool),), kwargs={'pool': pool})
+            thread.start()
+            while scheduler.stats()['pools'][pool]['waiting'] == 0:
+                time.sleep(0.01)
+            return thread
+
+        threads = [submit('batch'), submit('interactive')]
+        release.set()
+        for thread in [blocker] + threads:
+            thread.join()
+
+        self.assertEqual(order, ['interactive', 'batch'])
+        self.assertEqual(scheduler.stats()['pools']['batch']['completed'], 2)
+
+    def test_queue_timeout_rejects_with_503_and_hints_reach_the_job(self):
+        scheduler = self.make_scheduler(queue_timeout=0.05)
+        release = threading.Event()
+        blocker = threading.Thread(target=scheduler.run, args=(release.wait,))
+        blocker.start()
+        while scheduler.stats()['running'] == 0:
+            time.sleep(0.01)
+
+        with self.assertRaises(PredictionError) as raised:
+            scheduler.run(lambda: None, pool='batch')
+        self.assertEqual(raised.exception.status, 503)
+        release.set()
+        blocker.join()
+
+        hints, scheduling = scheduler.run(current_hints, pool='interactive', hints={'fit_threads': 2})
+        self.assertEqual(hints, {'fit_threads': 2})
+        self.assertEqual(scheduling['pool'], 'interactive')
+        self.assertEqual(scheduler.stats()['pools']['batch']['rejected'], 1)
+
+
+def reading_docs(device_id, n, end, seconds=60, seed=0):
+    """Readings of synthetic_readings() ending at `end`, one every `seconds`"""
+    X, y = synthetic_readings(n, seed)
+    return [
+        {"device_id": device_id, "timestamp": end - datetime.timedelta(seconds=seconds * (n - i)),
+         "voltage": X[i, 0], "current": X[i, 1], "pf": X[i, 2], "power": y[i]}
+        for i in range(n)
+    ]
+
+
+@override_settings(ARCHIVE={**settings.ARCHIVE, 'ENABLED': False})
+class FleetTrainingTests(MongoTestCase):
+
+    NOW = datetime.datetime(2026, 3, 1)
+
+    def setUp(self):
+        super().setUp()
+        for seed, device_id in enumerate(["dev-a", "dev-b", "dev-c"]):
+            self.readings.insert_many(reading_docs(device_id, 300, self.NOW, seed=seed))
+        # Terlalu sedikit data: dilewati
+        self.readings.insert_many(reading_docs("dev-d", 5, self.NOW))
+
+    def test_one_grouped_read_samples_each_device(self):
+        sampling = {"days": 1, "max_rows": 100, "strategy": "latest"}
+        aggregate = self.readings.aggregate
+        with mock.patch.object(self.readings, "aggregate", side_effect=aggregate) as calls:
+            arrays = list(fleet.iter_fleet_arrays(None, sampling, self.NOW, self.readings))
+
+        # Hitungan per jam + satu cursor data, berapa pun jumlah device
+        self.assertEqual(calls.call_count, 2)
+        self.assertEqual([device_id for device_id, *_ in arrays], ["dev-a", "dev-b", "dev-c", "dev-d"])
+        _, X, y, info = arrays[0]
+        self.assertEqual(X.shape, (100, 3))
+        self.assertTrue(info["sampled"])
+        self.assertEqual(info["window_records"], 300)
+        # 'latest': 100 reading terbaru
+        expected = reading_docs("dev-a", 300, self.NOW, seed=0)[-100:]
+        np.testing.assert_allclose(np.sort(y), np.sort([doc["power"] for doc in expected]))
+
+    def test_numpy_engine_writes_one_model_per_device(self):
+        result = fleet.train_fleet_numpy(algos=("lr",), workers=2, log=lambda message: None,
+                                         sampling={"days": 0, "max_rows": 0, "strategy": "latest"})
+
+        self.assertEqual((result["devices"], result["devices_trained"], result["models_written"]), (4, 3, 3))
+        entries = list(registry.get_registry_collection().find({}, {"_id": 0, "device_id": 1, "algo": 1,
+                                                                     "sampling": 1}))
+        self.assertEqual(sorted(entry["device_id"] for entry in entries), ["dev-a", "dev-b", "dev-c"])
+        self.assertTrue(all(entry["algo"] == "lr" and entry["sampling"]["window_records"] == 300
+                            for entry in entries))
+
+
+@override_settings(ARCHIVE={**settings.ARCHIVE, 'ENABLED': False},
+                   TRAINING_SAMPLING={**settings.TRAINING_SAMPLING, 'DAYS': 1, 'MAX_ROWS': 0},
+                   INCREMENTAL_TRAINING={**settings.INCREMENTAL_TRAINING, 'TREE_WINDOW_HOURS': 6,
+                                         'MIN_NEW_RECORDS': 1})
+class IncrementalUpdateTests(MongoTestCase):
+
+    NOW = datetime.datetime(2026, 3, 1)
+
+    def setUp(self):
+        super().setUp()
+        # Tiga hari histori, satu reading per 10 menit
+        self.readings.insert_many(reading_docs("dev-1", 432, self.NOW, seconds=600))
+
+    def test_first_run_reads_sampling_window_for_lr(self):
+        summary = incremental.update_device("dev-1", "lr", self.NOW)
+        self.assertEqual((summary["status"], summary["new_records"]), ("updated", 144))
+        self.assertEqual(summary["watermark"], self.NOW - datetime.timedelta(seconds=600))
+        self.assertEqual(incremental.update_device("dev-1", "lr", self.NOW)["status"], "up_to_date")
+
+    def test_first_run_keeps_newest_max_rows(self):
+        with self.settings(TRAINING_SAMPLING={**settings.TRAINING_SAMPLING, 'DAYS': 0, 'MAX_ROWS': 50}):
+            summary = incremental.update_device("dev-1", "lr", self.NOW)
+        self.assertEqual(summary["new_records"], 50)
+        self.assertEqual(summary["watermark"], self.NOW - datetime.timedelta(seconds=600))
+
+    def test_first_run_reads_tree_window_for_trees(self):
+        summary = incremental.update_device("dev-1", "gbt", self.NOW)
+        self.assertEqual((summary["status"], summary["new_records"]), ("updated", 36))
+
+
+class ResultCacheTests(MongoTestCase):
+
+    NOW = datetime.datetime(2026, 3, 1, 10, 0, 5)
+
+    def add_reading(self, timestamp):
+        self.readings.insert_one({"device_id": "dev-1", "timestamp": timestamp, "power": 100.0})
+
+    def test_new_reading_moves_watermark_and_misses(self):
+        cache = ResultCache(LocMemBackend(max_entries=8), ttl=60)
+        self.assertIsNone(cache.watermark("dev-1"))
+
+        self.add_reading(self.NOW)
+        key = cache.make_key('predict', 'dev-1', 'lr', watermark=cache.watermark("dev-1"))
+        self.assertIsNone(cache.get(key))
+        cache.set(key, {"power": 1.0})
+        self.assertEqual(cache.get(key), {"power": 1.0})
+
+        self.add_reading(self.NOW + datetime.timedelta(seconds=2))
+        fresh_key = cache.make_key('predict', 'dev-1', 'lr', watermark=cache.watermark("dev-1"))
+        self.assertNotEqual(fresh_key, key)
+        self.assertIsNone(cache.get(fresh_key))
+        self.assertEqual((cache.stats()["hits"], cache.stats()["misses"]), (1, 2))
+
+    def test_watermark_resolution_groups_readings(self):
+        cache = ResultCache(LocMemBackend(max_entries=8), ttl=60, watermark_resolution=60)
+        self.add_reading(self.NOW)
+        first = cache.watermark("dev-1")
+        self.add_reading(self.NOW + datetime.timedelta(seconds=30))
+        self.assertEqual(cache.watermark("dev-1"), first)
+        self.assertEqual(first, "2026-03-01T10:00:00")
+
+    def test_entries_expire_after_ttl(self):
+        cache = ResultCache(LocMemBackend(max_entries=8), ttl=60)
+        with mock.patch("prediction.cache.time.time", return_value=1000.0):
+            cache.set("key", {"power": 1.0})
+            self.assertEqual(cache.get("key"), {"power": 1.0})
+        with mock.patch("prediction.cache.time.time", return_value=1061.0):
+            self.assertIsNone(cache.get("key"))
+        self.assertEqual(len(cache.backend), 0)
+
+    def test_locmem_evicts_least_recently_used(self):
+        backend = LocMemBackend(max_entries=2)
+        backend.set("a", 1, 60)
+        backend.set("b", 2, 60)
+        backend.get("a")
+        backend.set("c", 3, 60)
+        self.assertEqual((backend.get("a"), backend.get("b"), backend.get("c")), (1, None, 3))
+
+    def test_file_backend_needs_location(self):
+        with self.assertRaises(ValueError):
+            FileBackend(max_entries=2, location='')
+
+        with tempfile.TemporaryDirectory() as location:
+            backend = FileBackend(max_entries=2, location=location)
+            for key in ("a", "b", "c"):
+                backend.set(key, {"key": key}, 60)
+            self.assertEqual(len(backend), 2)
+
+
+@override_settings(ARCHIVE={**settings.ARCHIVE, 'ENABLED': False},
+                   FEATURE_STORE={**settings.FEATURE_STORE, 'ENABLED': True, 'BUCKET_SECONDS': 60})
+class FeatureStoreTests(MongoTestCase):
+
+    NOW = datetime.datetime(2026, 3, 1, 0, 3)
+
+    def setUp(self):
+        super().setUp()
+        self.features = feature_store.get_feature_collection()
+        # Tiga bucket menit, tiga reading per bucket
+        self.docs = reading_docs("dev-1", 9, self.NOW, seconds=20)
+
+    def ingest(self, docs):
+        self.features.bulk_write([feature_store.ingest_update(doc) for doc in docs])
+
+    def rebuild(self, until):
+        """
+        rebuild() on mongomock, which implements neither $merge nor date + number:
+        the bucket key is grouped as epoch milliseconds and converted back here
+        """
+        aggregate = self.readings.aggregate
+
+        def emulated(pipeline, **options):
+            pipeline = copy.deepcopy(pipeline)
+            key = pipeline[1]["$group"]["_id"]
+            epoch, key["timestamp"] = key["timestamp"]["$add"]
+            merge = pipeline.pop()["$merge"]
+            for doc in aggregate(pipeline, **options):
+                doc["timestamp"] = epoch + datetime.timedelta(milliseconds=doc["timestamp"])
+                self.features.replace_one({field: doc[field] for field in merge["on"]}, doc, upsert=True)
+            return iter([])
+
+        with mock.patch.object(self.readings, "aggregate", side_effect=emulated):
+            feature_store.rebuild(until=until, readings=self.readings, features=self.features)
+        mongo.get_collection(feature_store.STATE_COLLECTION).update_one(
+            {"_id": "rebuild"}, {"$set": {"watermark": until}}, upsert=True)
+
+    def buckets(self):
+        return list(self.features.find({}, {"_id": 0}).sort("timestamp", 1))
+
+    def test_ingest_update_folds_readings_into_bucket_means(self):
+        self.assertIsNone(feature_store.ingest_update({**self.docs[0], "power": None}))
+        self.ingest(self.docs)
+
+        buckets = self.buckets()
+        self.assertEqual([bucket["n"] for bucket in buckets], [3, 3, 3])
+        self.assertEqual(buckets[0]["timestamp"], datetime.datetime(2026, 3, 1, 0, 0))
+        power = [doc["power"] for doc in self.docs[:3]]
+        self.assertAlmostEqual(buckets[0]["power_sum"], sum(power))
+        self.assertAlmostEqual(buckets[0]["power"], np.mean(power))
+
+    def test_rebuild_matches_ingester_for_closed_buckets(self):
+        self.readings.insert_many([dict(doc) for doc in self.docs])
+        self.rebuild(until=datetime.datetime(2026, 3, 1, 0, 2))
+        rebuilt = self.buckets()
+        # Bucket 00:02 belum tertutup
+        self.assertEqual([bucket["timestamp"].minute for bucket in rebuilt], [0, 1])
+
+        self.features.delete_many({})
+        self.ingest(self.docs[:6])
+        for bucket, ingested in zip(rebuilt, self.buckets()):
+            self.assertEqual(bucket["n"], ingested["n"])
+            for col in feature_store.VALUE_COLS:
+                self.assertAlmostEqual(bucket[col], ingested[col])
+
+    def test_training_collection_needs_full_coverage(self):
+        since = self.NOW - datetime.timedelta(minutes=3)
+        self.readings.insert_many([dict(doc) for doc in self.docs[:6]])
+        self.ingest(self.docs[:6])
+        # Belum pernah rebuild
+        self.assertEqual(feature_store.training_collection("dev-1", since)[1], "raw")
+
+        self.rebuild(until=datetime.datetime(2026, 3, 1, 0, 1))
+        self.assertEqual(feature_store.training_collection("dev-1", since)[1], "features")
+        # Bucket tertua lebih baru dari awal window
+        self.assertEqual(feature_store.training_collection("dev-1", since - datetime.timedelta(minutes=1))[1], "raw")
+
+        # Reading setelah watermark yang tidak lewat ingester: ada celah
+        self.readings.insert_many([dict(doc) for doc in self.docs[6:]])
+        self.assertEqual(feature_store.training_collection("dev-1", since)[1], "raw")
+        self.ingest(self.docs[6:])
+        self.assertEqual(feature_store.training_collection("dev-1", since)[1], "features")
+
+
+@override_settings(ARCHIVE={**settings.ARCHIVE, 'ENABLED': False})
+class BenchmarkTests(MongoTestCase):
+
+    def test_report_schema_and_phase_keys(self):
+        results = benchmark.run([300], devices=2, algos=("lr",), trace_memory=False, log=lambda message: None)
+
+        self.assertEqual([row["engine"] for row in results], ["numpy", "numpy-fleet"])
+        row = results[0]
+        # ~1% reading rusak dibuang saat load / clean
+        self.assertGreater(row["records"], 290)
+        self.assertLessEqual(row["train_records"] + row["test_records"], row["records"])
+        self.assertGreater(row["train_records"], row["test_records"])
+        for phase in benchmark.PHASES:
+            self.assertIsNotNone(row[f"{phase}_seconds"], phase)
+        self.assertEqual(set(results[1]), set(benchmark.CSV_FIELDS))
+        self.assertIsNotNone(results[1]["load_seconds"])
+        self.assertEqual(self.readings.count_documents({"device_id": {"$regex": "^bench-300-"}}), 600)
+
+        with tempfile.TemporaryDirectory() as output_dir:
+            json_path, csv_path = benchmark.write_report(results, output_dir, {"sizes": [300]})
+            with open(json_path) as f:
+                report = json.load(f)
+            with open(csv_path, newline="") as f:
+                reader = csv.DictReader(f)
+                rows = list(reader)
+
+        self.assertEqual(set(report), {"run_id", "environment", "settings", "results"})
+        self.assertEqual(report["run_id"], row["run_id"])
+        self.assertIn("numpy", report["environment"])
+        self.assertEqual(reader.fieldnames, benchmark.CSV_FIELDS)
+        self.assertEqual([r["engine"] for r in rows], ["numpy", "numpy-fleet"])
+        self.assertEqual({r["rows"] for r in rows}, {"300"})
+
+        self.assertEqual(benchmark.cleanup(), 600)
+
+
+class LazySparkTests(SimpleTestCase):
+
+    def test_views_import_without_pyspark(self):
+        # Proses baru: test lain di proses ini sudah meng-import pyspark
+        script = ("import sys, django; django.setup(); import prediction.urls; from prediction import spark; "
+                  "print(any(name.startswith('pyspark') for name in sys.modules), spark._spark is None)")
+        result = subprocess.run([sys.executable, "-c", script], cwd=settings.BASE_DIR, capture_output=True, text=True,
+                                env={**os.environ, "DJANGO_SETTINGS_MODULE": "wattara.settings"}, check=True)
+        self.assertEqual(result.stdout.split()[-2:], ["False", "True"])
+
+
+class PredictionWorkerTests(SimpleTestCase):
+
+    def setUp(self):
+        self.worker = PredictionWorker(("127.0.0.1", 0), b"test-key")
+
+    @contextlib.contextmanager
+    def stub_spark(self, spark):
+        """Worker handlers and the scheduler's job tagging see `spark` instead of a real session"""
+        with mock.patch("prediction.worker.get_spark", return_value=spark), \
+                mock.patch("prediction.spark.get_spark", return_value=spark):
+            yield
+
+    def test_health_reports_without_starting_spark(self):
+        with mock.patch("prediction.worker.get_spark") as get_spark:
+            response = self.worker._dispatch({"method": "health"})
+        get_spark.assert_not_called()
+        self.assertTrue(response["ok"])
+        self.assertEqual(response["result"]["status"], "ok")
+        self.assertIn("interactive", response["result"]["scheduler"]["pools"])
+
+    def test_train_runs_through_the_scheduler(self):
+        spark = mock.MagicMock()
+        with self.stub_spark(spark), \
+                mock.patch("prediction.training.train_device_model", return_value={"rmse": 1.5}) as train:
+            response = self.worker._dispatch({"method": "train", "params": {"device_id": "dev-1", "algo": "lr"}})
+
+        train.assert_called_once_with(spark, "dev-1", "lr", 0, None)
+        self.assertEqual(response["result"]["rmse"], 1.5)
+        self.assertEqual(response["result"]["scheduling"]["pool"], "interactive")
+
+    def test_errors_are_returned_with_their_status(self):
+        failure = PredictionError("Not enough data", status=400, payload={"records": 3})
+        with self.stub_spark(mock.MagicMock()), \
+                mock.patch("prediction.training.train_device_model", side_effect=failure):
+            response = self.worker._dispatch({"method": "train", "params": {"device_id": "dev-1"}})
+        self.assertEqual(response, {"ok": False, "error": "Not enough data", "status": 400,
+                                    "payload": {"records": 3}})
+        self.assertEqual(self.worker._dispatch({"method": "drop"})["status"], 400)
+
+
+@unittest.skipUnless(HAS_PYSPARK, "pyspark is not installed")
+class TrainAllAlgorithmsTests(SimpleTestCase):
+    """train_all_algorithms with the Spark fits stubbed: no session needed"""
+
+    RMSE = {'rf': 12.0, 'gbt': 9.5, 'lr': 15.0}
+
+    def fit_and_evaluate(self, algo, train_data, test_data):
+        return {"algo": algo, "algo_used": numpy_engine.MODEL_NAMES[algo], "rmse": self.RMSE[algo],
+                "mae": self.RMSE[algo] / 2, "mape": 1.0, "predicted_power": 100.0, "fit_seconds": 0.1}
+
+    def test_best_algo_has_lowest_rmse(self):
+        from . import training
+
+        with mock.patch.object(training, "prepare_training_data", return_value=("train", "test", {"records": 10})),                 mock.patch.object(training, "release_training_data") as release,                 mock.patch.object(training, "fit_and_evaluate", side_effect=self.fit_and_evaluate) as fit,                 mock.patch.object(training, "register_results") as register:
+            result = training.train_all_algorithms(mock.Mock(), "dev-1")
+
+        self.assertEqual(fit.call_count, 3)
+        self.assertEqual({call.args[1:] for call in fit.call_args_list}, {("train", "test")})
+        release.assert_called_once_with("train", "test")
+        self.assertEqual(sorted(r["algo"] for r in result["results"]), sorted(numpy_engine.ALGORITHMS))
+        self.assertEqual((result["best_algo"], result["rmse"]), ("gbt", 9.5))
+        self.assertEqual(result["algo_used"], numpy_engine.MODEL_NAMES["gbt"])
+        self.assertEqual(register.call_args.args[0], "dev-1")
+
+
+@unittest.skipUnless(HAS_PYSPARK, "pyspark is not installed")
+@unittest.skipUnless(HAS_JAVA, "no Java runtime (java on PATH or JAVA_HOME) for Spark")
+class SparkTrainingTests(SimpleTestCase):
+    """Spark training paths on a local session: export parity and walk-forward CV"""
+
+    @classmethod
+    def setUpClass(cls):
+        from pyspark.sql import SparkSession
+
+        # JAVA_HOME bisa menunjuk ke JVM yang rusak/tidak ada: lewati, jangan error
+        try:
+            cls.spark = SparkSession.builder.master("local[2]").appName("export-parity").getOrCreate()
+        except Exception as e:
+            raise unittest.SkipTest(f"Spark session could not start: {e}")
+        super().setUpClass()
+        X, y = synthetic_readings(n=600)
+        start = datetime.datetime(2025, 1, 1)
+        rows = [
+            tuple(map(float, x)) + (float(label), start + datetime.timedelta(minutes=i))
+            for i, (x, label) in enumerate(zip(X, y))
+        ]
+        cls.df = cls.spark.createDataFrame(rows, numpy_engine.FEATURE_COLS + [numpy_engine.LABEL_COL, "timestamp"])
+        cls.X = X
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.spark.stop()
+        super().tearDownClass()
+
+    def assert_parity(self, algo):
+        from pyspark.ml import Pipeline
+        from pyspark.ml.feature import VectorAssembler
+
+        from .export import export_model
+        from .training import get_model_by_algorithm
+
+        estimator, _ = get_model_by_algorithm(algo)
+        assembler = VectorAssembler(inputCols=numpy_engine.FEATURE_COLS, outputCol="features")
+        pipeline_model = Pipeline(stages=[assembler, estimator]).fit(self.df)
+
+        spark_predictions = np.array([
+            row.prediction for row in pipeline_model.transform(self.df).select("prediction").collect()
+        ])
+        exported = export_model(pipeline_model)
+        np.testing.assert_allclose(exported.predict(self.X), spark_predictions, rtol=1e-9, atol=1e-6)
+
+    def test_random_forest_parity(self):
+        self.assert_parity('rf')
+
+    def test_gbt_parity(self):
+        self.assert_parity('gbt')
+
+    def test_linear_regression_parity(self):
+        self.assert_parity('lr')
+
+    def test_walk_forward_folds_never_train_on_the_future(self):
+        from . import training
+
+        with mock.patch.object(training, "load_device_frame", return_value=(self.df, {})), \
+                mock.patch.object(training.registry, "save_models") as save_models:
+            result = training.cross_validate(self.spark, "dev-1", ["lr", "gbt"], folds=3)
+
+        folds = result["cv"]["fold_results"]
+        self.assertEqual([f["fold"] for f in folds], [1, 2, 3])
+        # Jendela training membesar, blok test berurutan dan tidak tumpang tindih
+        self.assertEqual([f["train_records"] for f in folds], sorted(f["train_records"] for f in folds))
+        self.assertEqual(sum(f["test_records"] for f in folds) + folds[0]["train_records"], 600)
+        for earlier, later in zip(folds, folds[1:]):
+            self.assertEqual(earlier["test_end"], later["test_start"])
+
+        self.assertEqual({r["algo"] for r in result["results"]}, {"lr", "gbt"})
+        self.assertAlmostEqual(result["rmse"], min(r["rmse"] for r in result["results"]))
+        self.assertIsNotNone(result["mae"])
+        self.assertEqual(len(save_models.call_args[0][0]), 2)
@@ -0,0 +1,617 @@
+"""
+Spark training pipeline for power prediction.
+
+This module imports pyspark at module level and must only be imported by the
+prediction worker process, never by Django web views.
+"""
+import datetime
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from pyspark.ml.feature import VectorAssembler
+from pyspark.ml.regression import RandomForestRegressor, GBTRegressor, LinearRegression
+from pyspark.ml import Pipeline
+from pyspark.sql import functions as F
+import pyarrow as pa
+from bson import json_util
+from django.conf import settings
+from pymongo.errors import PyMongoError
+
+from . import registry
+from .data import archived_window
+from .exceptions import PredictionError
+from .export import export_model
+from .feature_store import training_collection
+from .numpy_engine import ALGORITHMS, FEATURE_COLS, LABEL_COL, MULTI_ALGO_MODES, dumps_model
+from .sampling import build_selection, get_sampling
+from .scheduler import current_hints
+from .spark import inherit_job_properties
+
+# Walk-forward cross-validation
+CV_PARALLELISM = 4        # fold fit bersamaan (bisa dibatasi hint fit_threads dari scheduler)
+CV_MIN_BLOCK_RECORDS = 10  # minimal reading per blok waktu
+
+
+def get_model_by_algorithm(algo):
+    """
+    Factory function untuk memilih model berdasarkan algoritma
+
+    Args:
+        algo (str): Algorithm identifier ('rf', 'gbt', 'lr')
+
+    Returns:
+        tuple: (model_instance, model_name)
+    """
+    algo = algo.lower()
+
+    if algo == 'gbt':
+        model = GBTRegressor(
+            featuresCol="features",
+            labelCol=LABEL_COL,
+            maxIter=50,
+            maxDepth=5
+        )
+        return model, "Gradient Boosted Trees"
+
+    elif algo == 'lr':
+        model = LinearRegression(
+            featuresCol="features",
+            labelCol=LABEL_COL,
+            maxIter=100,
+            regParam=0.1
+        )
+        return model, "Linear Regression"
+
+    else:  # default: 'rf'
+        model = RandomForestRegressor(
+            featuresCol="features",
+            labelCol=LABEL_COL,
+            numTrees=50,
+            maxDepth=10
+        )
+        return model, "Random Forest"
+
+
+def load_device_frame(spark, device_id, sampling=None):
+    """
+    Load the training readings of one device from MongoDB as a Spark DataFrame
+
+    Reads the materialized feature store when it covers the whole window
+    (see prediction.feature_store), otherwise the raw readings plus the cold
+    Parquet archive of the same window. The time window and row sampling are
+    pushed into MongoDB as an aggregation pipeline (see prediction.sampling),
+    so only the selected rows ever leave the database; archived rows count
+    toward the same budget and are sampled with the same strategy before
+    they reach Spark.
+
+    Args:
+        spark (SparkSession): active session
+        device_id (str): Device ID to load
+        sampling (dict): spec from sampling.get_sampling (default: settings)
+
+    Returns:
+        tuple: (DataFrame of selected readings, sampling info for metadata)
+    """
+    sampling = sampling or get_sampling()
+    columns = ["timestamp"] + FEATURE_COLS + [LABEL_COL]
+    now = datetime.datetime.utcnow()
+    since = now - datetime.timedelta(days=sampling["days"]) if sampling["days"] else None
+
+    try:
+        collection, source = training_collection(device_id, since)
+        cold, hours = archived_window(device_id, FEATURE_COLS + [LABEL_COL], since, collection)
+        pipeline, keep, sampling_info = build_selection(device_id, sampling, collection, now, archived_hours=hours)
+    except PyMongoError as mongo_error:
+        raise PredictionError(
+            f"MongoDB connection failed: {str(mongo_error)}",
+            status=500,
+            payload={"hint": "Please ensure MongoDB is running and reachable at settings.MONGODB['URI']"}
+        )
+    except (OSError, pa.ArrowException) as archive_error:
+        raise PredictionError(f"Reading the readings archive failed: {str(archive_error)}", status=500)
+    sampling_info["source"] = source
+
+    df = spark.read.format("mongodb") \
+        .option("database", settings.MONGODB['DB']) \
+        .option("collection", collection.name) \
+        .option("aggregation.pipeline", json_util.dumps(pipeline)) \
+        .load()
+
+    # === Arsip Parquet (cold), sudah disampel dengan anggaran yang sama ===
+    if cold is not None:
+        cold = cold.filter(pa.array(keep))
+        # Timestamp UTC eksplisit supaya Spark tidak menafsirkannya sebagai waktu lokal sesi
+        cold = cold.set_column(0, "timestamp", cold.column("timestamp").cast(pa.timestamp("ms", tz="UTC")))
+        if cold.num_rows:
+            df = df.select(columns).unionByName(spark.createDataFrame(cold.to_pandas()).select(columns))
+
+    return df, sampling_info
+
+
+def prepare_training_data(spark, device_id, sampling=None):
+    """
+    Load, clean and split a device's readings once
+
+    The cleaned frame and both splits are cached so several models can be
+    fitted on them without re-reading MongoDB.
+
+    Args:
+        spark (SparkSession): active session
+        device_id (str): Device ID to train on
+        sampling (dict): training window / sampling spec
+
+    Returns:
+        tuple: (train_data, test_data, data_stats)
+
+    Raises:
+        PredictionError: when there is no usable data
+    """
+    # === Baca data dari MongoDB (window & sampling di sisi database) ===
+    df, sampling_info = load_device_frame(spark, device_id, sampling)
+
+    # === Validasi Data ===
+    total_records = df.count()
+    if total_records == 0:
+        raise PredictionError("No data in MongoDB for this device.", status=404, payload={
+            "predicted_power": 0,
+            "rmse": 0,
+            "algo_used": "N/A",
+            "estimated_hourly_cost": 0,
+        })
+
+    # Buang baris null di fitur atau target
+    df_clean = df.na.drop(subset=FEATURE_COLS + [LABEL_COL]).select(FEATURE_COLS + [LABEL_COL])
+
+    clean_records = df_clean.count()
+    if clean_records == 0:
+        raise PredictionError(
+            "No valid data after removing null values. Please check data quality.",
+            status=400
+        )
+
+    # === Split train & test ===
+    train_data, test_data = df_clean.randomSplit([0.8, 0.2], seed=42)
+    train_data = train_data.cache()
+    test_data = test_data.cache()
+
+    # Validasi test data
+    test_records = test_data.count()
+    if test_records == 0:
+        release_training_data(train_data, test_data)
+        raise PredictionError(
+            "Insufficient data for train/test split. Need more records.",
+            status=400
+        )
+
+    data_stats = {
+        "total_records": total_records,
+        "clean_records": clean_records,
+        "train_records": train_data.count(),
+        "test_records": test_records,
+        "sampling": sampling_info
+    }
+    return train_data, test_data, data_stats
+
+
+def release_training_data(*frames):
+    """Drop cached training frames from Spark memory"""
+    for frame in frames:
+        frame.unpersist()
+
+
+def fit_pipeline(algo, train_data):
+    """
+    Fit the assembler + regressor pipeline for one algorithm
+
+    Returns:
+        tuple: (PipelineModel, model_name)
+    """
+    # === Vector Assembler ===
+    assembler = VectorAssembler(inputCols=FEATURE_COLS, outputCol="features")
+
+    # === Pilih Model berdasarkan Algorithm ===
+    model, model_name = get_model_by_algorithm(algo)
+
+    # === Pipeline ===
+    pipeline = Pipeline(stages=[assembler, model])
+
+    # === Training model ===
+    try:
+        return pipeline.fit(train_data), model_name
+    except Exception as train_error:
+        raise PredictionError(f"Model training failed ({model_name}): {str(train_error)}", status=500)
+
+
+def evaluate_predictions(predictions):
+    """
+    RMSE, MAE, MAPE and average prediction in a single aggregation
+
+    MAPE (percent) skips rows whose actual power is 0, where it is undefined;
+    it is None when every actual value is 0.
+    """
+    error = F.col("prediction") - F.col(LABEL_COL)
+    row = predictions.agg(
+        F.sqrt(F.avg(error * error)).alias("rmse"),
+        F.avg(F.abs(error)).alias("mae"),
+        F.avg(F.when(F.col(LABEL_COL) != 0, F.abs(error / F.col(LABEL_COL)))).alias("mape"),
+        F.avg("prediction").alias("predicted_power"),
+    ).first()
+
+    return {
+        "rmse": row["rmse"],
+        "mae": row["mae"],
+        "mape": row["mape"] * 100 if row["mape"] is not None else None,
+        "predicted_power": row["predicted_power"],
+    }
+
+
+def export_fitted(trained_model, model_name):
+    """Serialize a fitted pipeline for the registry, None when export fails"""
+    try:
+        return dumps_model(export_model(trained_model))
+    except Exception as export_error:
+        print(f"Model export failed ({model_name}): {export_error}")
+        return None
+
+
+def fit_and_evaluate(algo, train_data, test_data):
+    """
+    Fit one algorithm on prepared data and evaluate it on the test split
+
+    Args:
+        algo (str): Algorithm identifier ('rf', 'gbt', 'lr')
+        train_data (DataFrame): training split
+        test_data (DataFrame): test split
+
+    Returns:
+        dict: algo, model name, RMSE/MAE/MAPE, average test prediction and fit time
+    """
+    started = time.perf_counter()
+    trained_model, model_name = fit_pipeline(algo, train_data)
+
+    # === Prediksi & evaluasi di test set ===
+    metrics = evaluate_predictions(trained_model.transform(test_data))
+    fit_seconds = round(time.perf_counter() - started, 3)
+
+    return {
+        "algo": algo,
+        "algo_used": model_name,
+        **metrics,
+        "fit_seconds": fit_seconds,
+        # === Export ke NumPy untuk inference tanpa JVM ===
+        "model": export_fitted(trained_model, model_name),
+    }
+
+
+def register_results(device_id, results, data_stats):
+    """
+    Save exported models to the registry and strip the model bytes from results
+
+    Registry failures are logged, not raised: the prediction itself succeeded.
+    """
+    entries = [
+        {
+            "device_id": device_id,
+            "algo": r["algo"],
+            "algo_used": r["algo_used"],
+            "engine": "spark",
+            "model": r["model"],
+            "rmse": r["rmse"],
+            "train_records": data_stats["train_records"],
+            "test_records": data_stats["test_records"],
+            "fit_seconds": r["fit_seconds"],
+            "sampling": data_stats.get("sampling"),
+        }
+        for r in results if r.get("model")
+    ]
+    try:
+        registry.save_models(entries)
+    except Exception as registry_error:
+        print(f"Model registry write failed: {registry_error}")
+
+    for r in results:
+        r.pop("model", None)
+
+
+def train_device_model(spark, device_id, algo='rf', folds=0, sampling=None):
+    """
+    Train and evaluate a model for a device
+
+    Args:
+        spark (SparkSession): active session
+        device_id (str): Device ID to train on
+        algo (str): 'rf', 'gbt', 'lr', or 'auto'/'all' to compare every algorithm
+        folds (int): 0 for a single random 80/20 split, otherwise the number of
+                     walk-forward cross-validation folds (see cross_validate)
+        sampling (dict): training window / sampling spec (default: settings.TRAINING_SAMPLING)
+
+    Returns:
+        dict: average test-set prediction, RMSE/MAE/MAPE, model name and data stats
+
+    Raises:
+        PredictionError: when data is missing or training fails
+    """
+    algo = algo.lower()
+    if algo not in ALGORITHMS + MULTI_ALGO_MODES:
+        raise PredictionError(f"Invalid algo. Valid options: {list(ALGORITHMS + MULTI_ALGO_MODES)}", status=400)
+    if folds:
+        algos = ALGORITHMS if algo in MULTI_ALGO_MODES else [algo]
+        return cross_validate(spark, device_id, algos, folds, sampling)
+
+    if algo in MULTI_ALGO_MODES:
+        return train_all_algorithms(spark, device_id, sampling)
+
+    train_data, test_data, data_stats = prepare_training_data(spark, device_id, sampling)
+    try:
+        result = fit_and_evaluate(algo, train_data, test_data)
+    finally:
+        release_training_data(train_data, test_data)
+
+    register_results(device_id, [result], data_stats)
+
+    return {
+        "predicted_power": result["predicted_power"],
+        "rmse": result["rmse"],
+        "mae": result["mae"],
+        "mape": result["mape"],
+        "algo_used": result["algo_used"],
+        "data_stats": data_stats
+    }
+
+
+def train_all_algorithms(spark, device_id, sampling=None):
+    """
+    Fit every algorithm concurrently on one cached split and pick the best
+
+    Each fit runs in its own thread (up to the job's fit_threads hint); Spark
+    schedules the resulting jobs on the shared context in FAIR mode, so the
+    wall time is close to the slowest model instead of the sum of all three.
+
+    Args:
+        spark (SparkSession): active session
+        device_id (str): Device ID to train on
+        sampling (dict): training window / sampling spec
+
+    Returns:
+        dict: best model fields plus a "results" list with every RMSE
+    """
+    started = time.perf_counter()
+    train_data, test_data, data_stats = prepare_training_data(spark, device_id, sampling)
+
+    try:
+        threads = min(len(ALGORITHMS), current_hints().get('fit_threads', len(ALGORITHMS)))
+        with ThreadPoolExecutor(max_workers=max(1, threads)) as pool:
+            results = list(pool.map(
+                inherit_job_properties(lambda algo: fit_and_evaluate(algo, train_data, test_data)),
+                ALGORITHMS
+            ))
+    finally:
+        release_training_data(train_data, test_data)
+
+    register_results(device_id, results, data_stats)
+    best = min(results, key=lambda r: r["rmse"])
+
+    return {
+        "predicted_power": best["predicted_power"],
+        "rmse": best["rmse"],
+        "mae": best["mae"],
+        "mape": best["mape"],
+        "algo_used": best["algo_used"],
+        "best_algo": best["algo"],
+        "results": results,
+        "elapsed_seconds": round(time.perf_counter() - started, 3),
+        "data_stats": data_stats
+    }
+
+
+# === Walk-forward cross-validation ===
+
+def prepare_cv_data(spark, device_id, folds, sampling=None):
+    """
+    Load a device's readings once and cut them into folds + 1 time blocks
+
+    Block boundaries are approximate quantiles of the reading timestamp, so
+    every block holds about the same number of readings. Fold k trains on
+    blocks 0..k and tests on block k + 1 (expanding window), which never
+    lets the model see readings from after its test period.
+
+    Args:
+        spark (SparkSession): active session
+        device_id (str): Device ID to train on
+        folds (int): number of folds
+        sampling (dict): training window / sampling spec
+
+    Returns:
+        tuple: (cached frame with a `ts` epoch column, boundaries, block sizes, data_stats)
+
+    Raises:
+        PredictionError: when there is no usable data or too little for the folds
+    """
+    df, sampling_info = load_device_frame(spark, device_id, sampling)
+
+    total_records = df.count()
+    if total_records == 0:
+        raise PredictionError("No data in MongoDB for this device.", status=404, payload={
+            "predicted_power": 0,
+            "rmse": 0,
+            "algo_used": "N/A",
+            "estimated_hourly_cost": 0,
+        })
+
+    frame = df.na.drop(subset=FEATURE_COLS + [LABEL_COL, "timestamp"]) \
+        .select(*FEATURE_COLS, LABEL_COL, F.col("timestamp").cast("long").alias("ts")) \
+        .cache()
+    clean_records = frame.count()
+
+    # Batas blok = kuantil timestamp; satu agregasi untuk menghitung isi tiap blok
+    boundaries = frame.approxQuantile("ts", [i / (folds + 1) for i in range(1, folds + 1)], 0.001)
+    edges = [None] + boundaries + [None]
+    block_sizes = list(frame.agg(*[
+        F.sum(F.when(_between(edges[b], edges[b + 1]), 1).otherwise(0)).alias(f"block_{b}")
+        for b in range(folds + 1)
+    ]).first()) if clean_records else [0]
+
+    if min(size or 0 for size in block_sizes) < CV_MIN_BLOCK_RECORDS:
+        release_training_data(frame)
+        raise PredictionError(
+            f"Insufficient data for {folds}-fold walk-forward validation. "
+            f"Need at least {CV_MIN_BLOCK_RECORDS} readings in each of {folds + 1} time blocks.",
+            status=400
+        )
+
+    data_stats = {
+        "total_records": total_records,
+        "clean_records": clean_records,
+        "train_records": sum(block_sizes[:-1]),
+        "test_records": block_sizes[-1],
+        "sampling": sampling_info,
+    }
+    return frame, boundaries, block_sizes, data_stats
+
+
+def _between(start, end):
+    """Column predicate start <= ts < end (open ends when None)"""
+    condition = F.lit(True)
+    if start is not None:
+        condition = condition & (F.col("ts") >= start)
+    if end is not None:
+        condition = condition & (F.col("ts") < end)
+    return condition
+
+
+def _epoch_iso(seconds):
+    return datetime.datetime.utcfromtimestamp(seconds).isoformat() if seconds is not None else None
+
+
+def run_fold(algo, frame, boundaries, fold):
+    """
+    Fit one algorithm on fold `fold` (0-based) and score the following block
+
+    Returns:
+        dict: fold metrics and timings, plus the fitted pipeline under "_model"
+    """
+    started = time.perf_counter()
+    edges = [None] + boundaries + [None]
+    train = frame.filter(F.col("ts") < boundaries[fold])
+    test = frame.filter(_between(edges[fold + 1], edges[fold + 2]))
+
+    trained_model, model_name = fit_pipeline(algo, train)
+    fitted = time.perf_counter()
+    metrics = evaluate_predictions(trained_model.transform(test))
+    finished = time.perf_counter()
+
+    return {
+        "algo": algo,
+        "algo_used": model_name,
+        "fold": fold + 1,
+        "test_start": _epoch_iso(edges[fold + 1]),
+        "test_end": _epoch_iso(edges[fold + 2]),
+        **metrics,
+        "fit_seconds": round(fitted - started, 3),
+        "eval_seconds": round(finished - fitted, 3),
+        "seconds": round(finished - started, 3),
+        "_model": trained_model,
+    }
+
+
+def _mean(values):
+    values = [v for v in values if v is not None]
+    return statistics.fmean(values) if values else None
+
+
+def summarize_folds(fold_results, block_sizes):
+    """Average the fold metrics of one algorithm; the last fold supplies the model"""
+    last = fold_results[-1]
+    rmses = [r["rmse"] for r in fold_results]
+    folds = []
+    for r in fold_results:
+        fold = {key: value for key, value in r.items() if key not in ("algo", "algo_used", "_model")}
+        fold["train_records"] = sum(block_sizes[:r["fold"]])
+        fold["test_records"] = block_sizes[r["fold"]]
+        folds.append(fold)
+
+    return {
+        "algo": last["algo"],
+        "algo_used": last["algo_used"],
+        "rmse": _mean(rmses),
+        "rmse_std": statistics.pstdev(rmses),
+        "mae": _mean([r["mae"] for r in fold_results]),
+        "mape": _mean([r["mape"] for r in fold_results]),
+        # Prediksi rata-rata periode terbaru (fold terakhir)
+        "predicted_power": last["predicted_power"],
+        "fit_seconds": round(sum(r["seconds"] for r in fold_results), 3),
+        "folds": folds,
+        "model": export_fitted(last["_model"], last["algo_used"]),
+    }
+
+
+def cross_validate(spark, device_id, algos, folds, sampling=None):
+    """
+    Rolling-origin cross-validation of one or more algorithms
+
+    The readings are loaded and cached once; every (algorithm, fold) fit is
+    submitted to a thread pool of CV_PARALLELISM threads (or the job's
+    fit_threads hint, if lower) so the folds run as concurrent jobs on the
+    shared SparkContext (FAIR scheduling). Metrics are
+    averaged over folds. The model registered for each algorithm is the one
+    from the last fold, trained on everything except the most recent block.
+
+    Args:
+        spark (SparkSession): active session
+        device_id (str): Device ID to train on
+        algos (list): algorithm identifiers
+        folds (int): number of folds
+        sampling (dict): training window / sampling spec
+
+    Returns:
+        dict: same fields as train_device_model plus "cv" (per-fold metrics and
+              timings); with several algorithms also "best_algo" and "results"
+    """
+    started = time.perf_counter()
+    frame, boundaries, block_sizes, data_stats = prepare_cv_data(spark, device_id, folds, sampling)
+    tasks = [(algo, fold) for algo in algos for fold in range(folds)]
+    parallelism = max(1, min(CV_PARALLELISM, len(tasks), current_hints().get('fit_threads', CV_PARALLELISM)))
+
+    try:
+        with ThreadPoolExecutor(max_workers=parallelism) as pool:
+            fold_results = list(pool.map(
+                inherit_job_properties(lambda task: run_fold(task[0], frame, boundaries, task[1])),
+                tasks
+            ))
+    finally:
+        release_training_data(frame)
+
+    results = [
+        summarize_folds([r for r in fold_results if r["algo"] == algo], block_sizes)
+        for algo in algos
+    ]
+    elapsed = round(time.perf_counter() - started, 3)
+    data_stats["folds"] = folds
+
+    register_results(device_id, results, data_stats)
+    best = min(results, key=lambda r: r["rmse"])
+
+    response = {
+        "predicted_power": best["predicted_power"],
+        "rmse": best["rmse"],
+        "mae": best["mae"],
+        "mape": best["mape"],
+        "algo_used": best["algo_used"],
+        "cv": {
+            "strategy": "walk_forward",
+            "folds": folds,
+            "parallelism": parallelism,
+            "elapsed_seconds": elapsed,
+            # Jumlah durasi semua fold; dibanding elapsed_seconds = efek paralel
+            "fold_seconds_total": round(sum(r["seconds"] for r in fold_results), 3),
+            "rmse_std": best["rmse_std"],
+            "fold_results": best["folds"],
+        },
+        "data_stats": data_stats
+    }
+    if len(algos) > 1:
+        response["best_algo"] = best["algo"]
+        response["results"] = results
+        response["elapsed_seconds"] = elapsed
+    return response
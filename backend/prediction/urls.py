@@ -4,4 +4,8 @@ from . import views
 urlpatterns = [
     path('', views.prediction_home, name='prediction_home'),   # /prediction/
     path('run/', views.run_prediction, name='run_prediction'), # /prediction/run/
+    path('forecast/', views.run_forecast, name='run_forecast'), # /prediction/forecast/
+    path('score/', views.score_readings, name='score_readings'), # /prediction/score/
+    path('health/', views.worker_health, name='prediction_worker_health'), # /prediction/health/
+    path('cache/', views.cache_stats, name='prediction_cache_stats'), # /prediction/cache/
 ]
@@ -1,104 +1,52 @@
+from django.conf import settings
 from django.http import JsonResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated, AllowAny
-from pyspark.sql import SparkSession
-from pyspark.ml.feature import VectorAssembler
-from pyspark.ml.regression import RandomForestRegressor, GBTRegressor, LinearRegression
-from pyspark.ml.evaluation import RegressionEvaluator
-from pyspark.ml import Pipeline
+import datetime
 import sys
+import time
+import numpy as np
 sys.path.append('..')
+from monitoring import billing
 from monitoring.models import Device
+from . import client
+from . import registry
+from .cache import get_cache
+from .exceptions import PredictionError
+from .features import HORIZONS
+from .numpy_engine import ALGORITHMS, FEATURE_COLS, MULTI_ALGO_MODES
+from .sampling import SAMPLING_STRATEGIES, get_sampling
 
-# === Indonesian Electricity Tariff (PLN) ===
-TARIFF_PLN = {
-    '450VA': 415,      # Subsidi
-    '900VA': 1352,     # R1 900VA
-    '1300VA': 1444,    # R1 1300VA
-    '2200VA': 1444     # R1 2200VA+
-}
-
-# === SparkSession Global (dibuat sekali saja) ===
-try:
-    spark = SparkSession.builder \
-        .appName("PowerPredictionMultiAlgo") \
-        .master("local[*]") \
-        .config("spark.jars.packages", "org.mongodb.spark:mongo-spark-connector_2.12:10.5.0") \
-        .config("spark.mongodb.read.connection.uri", "mongodb://localhost:27017") \
-        .config("spark.mongodb.write.connection.uri", "mongodb://localhost:27017") \
-        .getOrCreate()
-    
-    # Set log level to reduce verbosity
-    spark.sparkContext.setLogLevel("WARN")
-except Exception as e:
-    spark = None
-    print(f"Failed to initialize Spark Session: {e}")
-
-
-def get_model_by_algorithm(algo):
+def calculate_electricity_cost(device_id, predicted_power_watt, meter_type):
     """
-    Factory function untuk memilih model berdasarkan algoritma
-    
-    Args:
-        algo (str): Algorithm identifier ('rf', 'gbt', 'lr')
-    
-    Returns:
-        tuple: (model_instance, model_name)
-    """
-    algo = algo.lower()
-    
-    if algo == 'gbt':
-        model = GBTRegressor(
-            featuresCol="features",
-            labelCol="power",
-            maxIter=50,
-            maxDepth=5
-        )
-        return model, "Gradient Boosted Trees"
-    
-    elif algo == 'lr':
-        model = LinearRegression(
-            featuresCol="features",
-            labelCol="power",
-            maxIter=100,
-            regParam=0.1
-        )
-        return model, "Linear Regression"
-    
-    else:  # default: 'rf'
-        model = RandomForestRegressor(
-            featuresCol="features",
-            labelCol="power",
-            numTrees=50,
-            maxDepth=10
-        )
-        return model, "Random Forest"
+    Menghitung estimasi biaya listrik satu jam ke depan dengan tarif PLN di settings.BILLING
 
+    Diharga seperti tagihan (monitoring.billing): blok tarif melanjutkan kWh
+    yang sudah terpakai di periode berjalan, time-of-use per jam lokal.
 
-def calculate_electricity_cost(predicted_power_watt, meter_type):
-    """
-    Menghitung estimasi biaya listrik per jam berdasarkan tarif PLN Indonesia
-    
     Args:
+        device_id (str): Device ID
         predicted_power_watt (float): Predicted power in Watts
         meter_type (str): Meter type (e.g., '900VA', '1300VA')
-    
+
     Returns:
-        float: Estimated hourly cost in Rupiah
+        tuple: (estimated hourly cost in Rupiah, effective Rp/kWh)
     """
-    # Validasi meter type
-    if meter_type not in TARIFF_PLN:
-        # Default ke 900VA jika tidak valid
-        meter_type = '900VA'
-    
     # Konversi Watt ke kWh (untuk 1 jam)
-    power_kwh = predicted_power_watt / 1000.0
-    
-    # Hitung biaya
-    tariff = TARIFF_PLN[meter_type]
-    estimated_cost = power_kwh * tariff
-    
-    return round(estimated_cost, 2)
+    power_kwh = max(predicted_power_watt, 0.0) / 1000.0
+    now = time.time()
+    cost = float(billing.price_energy(device_id, meter_type, [power_kwh], [now])[0])
+    # Tanpa konsumsi: tarif kWh berikutnya
+    rate = cost / power_kwh if power_kwh > 0 else float(billing.price_energy(device_id, meter_type, [1.0], [now])[0])
+    return round(cost, 2), round(rate, 2)
+
+
+MAX_CV_FOLDS = 10
+
+
+def round_metric(value, digits=2):
+    """Round an optional metric (MAPE is None when every actual value is 0)"""
+    return round(value, digits) if value is not None else None
 
 
 @api_view(['GET'])
@@ -109,19 +57,20 @@ def run_prediction(request):
     
     Query Parameters:
         - device_id (required): Device ID to run prediction for
-        - algo: Algorithm to use ('rf', 'gbt', 'lr'). Default: 'rf'
+        - algo: Algorithm to use ('rf', 'gbt', 'lr'), or 'auto'/'all' to train all three
+          concurrently on one cached split and select the lowest RMSE. Default: 'rf'
         - meter_type: PLN meter type ('450VA', '900VA', '1300VA', '2200VA'). Default: '900VA'
+        - folds: 0 for a single random 80/20 split, or 2-10 for walk-forward (rolling-origin)
+          cross-validation over time-ordered blocks, folds evaluated concurrently. Default: 0
+        - days: train only on the last N days, 0 = all history. Default: settings.TRAINING_SAMPLING
+        - max_rows: bound on training rows, 0 = unbounded. Default: settings.TRAINING_SAMPLING
+        - sample: 'latest', 'random' or 'hourly' (stratified by hour-of-day) when the
+          window holds more than max_rows. Default: settings.TRAINING_SAMPLING
     
     Returns:
-        JsonResponse with prediction results, RMSE, algorithm used, and estimated cost
+        JsonResponse with prediction results, RMSE/MAE/MAPE, algorithm used, and estimated cost
     """
     try:
-        # === Validasi Spark Session ===
-        if spark is None:
-            return JsonResponse({
-                "error": "Spark Session not initialized. Please check server configuration."
-            }, status=500)
-        
         # === Get Query Parameters ===
         device_id = request.GET.get('device_id')
         
@@ -141,111 +90,319 @@ def run_prediction(request):
         algo = request.GET.get('algo', 'rf').lower()
         meter_type = request.GET.get('meter_type', '900VA').upper()
         
+        # Validasi algo: nama lain akan jadi dokumen registry & kunci cache baru
+        if algo not in ALGORITHMS + MULTI_ALGO_MODES:
+            return JsonResponse({
+                "error": f"Invalid algo. Valid options: {list(ALGORITHMS + MULTI_ALGO_MODES)}"
+            }, status=400)
+        
         # Validasi meter_type
-        if meter_type not in TARIFF_PLN:
+        try:
+            billing.get_tariff(meter_type)
+        except ValueError as e:
             return JsonResponse({
-                "error": f"Invalid meter_type. Valid options: {list(TARIFF_PLN.keys())}"
+                "error": str(e)
             }, status=400)
         
-        # === Baca data dari MongoDB ===
+        # Validasi folds
         try:
-            df = spark.read.format("mongodb") \
-                .option("database", "iot_db") \
-                .option("collection", "pzem_data1") \
-                .load()
-            
-            # Filter by device_id
-            df = df.filter(df.device_id == device_id)
-            
-        except Exception as mongo_error:
+            folds = int(request.GET.get('folds', 0))
+        except ValueError:
+            folds = -1
+        if folds != 0 and not 2 <= folds <= MAX_CV_FOLDS:
             return JsonResponse({
-                "error": f"MongoDB connection failed: {str(mongo_error)}",
-                "hint": "Please ensure MongoDB is running and accessible at localhost:27017"
-            }, status=500)
+                "error": f"Invalid folds. Use 0 (single split) or 2-{MAX_CV_FOLDS}"
+            }, status=400)
+        
+        # Validasi window & sampling training
+        try:
+            sampling = get_sampling(
+                days=request.GET.get('days'),
+                max_rows=request.GET.get('max_rows'),
+                strategy=request.GET.get('sample')
+            )
+        except ValueError as e:
+            return JsonResponse({
+                "error": str(e)
+            }, status=400)
         
-        # === Validasi Data ===
-        if df.count() == 0:
+        # === Cache hasil (kunci ikut watermark data, jadi invalid otomatis saat ada reading baru) ===
+        cache = get_cache()
+        watermark = cache.watermark(device_id)
+        cache_key = cache.make_key(
+            'run', device_id, algo, meter_type, folds,
+            sampling['days'], sampling['max_rows'], sampling['strategy'],
+            watermark=watermark
+        )
+        cached = cache.get(cache_key) if watermark else None
+        if cached is not None:
+            response = JsonResponse(cached)
+            response['X-Cache'] = 'HIT'
+            return response
+        
+        # === Training & evaluasi di prediction worker (Spark) ===
+        try:
+            result = client.call('train', device_id=device_id, algo=algo, folds=folds, sampling=sampling)
+        except PredictionError as e:
+            if e.status == 404:
+                e.message = f"No data in MongoDB for device '{device.name}'."
             return JsonResponse({
-                "predicted_power": 0,
-                "rmse": 0,
-                "algo_used": "N/A",
-                "estimated_hourly_cost": 0,
+                **e.payload,
                 "device_id": device_id,
                 "device_name": device.name,
-                "error": f"No data in MongoDB for device '{device.name}'."
-            }, status=404)
+                "error": e.message
+            }, status=e.status)
+        
+        avg_prediction = result["predicted_power"]
+        model_name = result["algo_used"]
         
-        # === Siapkan fitur ===
-        feature_cols = ["voltage", "current", "pf"]
+        # === Hitung Estimasi Biaya Listrik ===
+        estimated_cost, tariff_per_kwh = calculate_electricity_cost(device_id, avg_prediction, meter_type)
+        
+        response = {
+            "device_id": device_id,
+            "device_name": device.name,
+            "predicted_power": round(avg_prediction, 2),
+            "rmse": round(result["rmse"], 2),
+            "mae": round_metric(result.get("mae")),
+            "mape": round_metric(result.get("mape")),
+            "algo_used": model_name,
+            "meter_type": meter_type,
+            "tariff_per_kwh": tariff_per_kwh,
+            "estimated_hourly_cost": estimated_cost,
+            "message": f"Prediction using {model_name} completed successfully.",
+            "data_stats": result["data_stats"],
+            "scheduling": result.get("scheduling")
+        }
+        
+        # === Mode auto/all: sertakan hasil semua algoritma ===
+        if "results" in result:
+            response["best_algo"] = result["best_algo"]
+            response["elapsed_seconds"] = result["elapsed_seconds"]
+            response["results"] = [
+                {
+                    "algo": r["algo"],
+                    "algo_used": r["algo_used"],
+                    "rmse": round(r["rmse"], 2),
+                    "mae": round_metric(r.get("mae")),
+                    "mape": round_metric(r.get("mape")),
+                    "predicted_power": round(r["predicted_power"], 2),
+                    "estimated_hourly_cost": calculate_electricity_cost(device_id, r["predicted_power"], meter_type)[0],
+                    "fit_seconds": r["fit_seconds"]
+                }
+                for r in result["results"]
+            ]
+            response["message"] = f"Compared {len(result['results'])} algorithms, best: {model_name}."
         
-        # Buang baris null di fitur atau target
-        df_clean = df.na.drop(subset=feature_cols + ["power"])
+        # === Walk-forward CV: metrik per fold & timing ===
+        if "cv" in result:
+            response["cv"] = {
+                **result["cv"],
+                "rmse_std": round(result["cv"]["rmse_std"], 2),
+                "fold_results": [
+                    {
+                        **fold,
+                        "rmse": round(fold["rmse"], 2),
+                        "mae": round(fold["mae"], 2),
+                        "mape": round_metric(fold["mape"]),
+                        "predicted_power": round(fold["predicted_power"], 2)
+                    }
+                    for fold in result["cv"]["fold_results"]
+                ]
+            }
+            if "results" in result:
+                for summary, r in zip(response["results"], result["results"]):
+                    summary["rmse_std"] = round(r["rmse_std"], 2)
+        
+        if watermark:
+            cache.set(cache_key, response)
+        
+        # === Return Response ===
+        return JsonResponse(response)
+    
+    except Exception as e:
+        return JsonResponse({
+            "error": f"Unexpected error: {str(e)}",
+            "type": type(e).__name__
+        }, status=500)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def run_forecast(request):
+    """
+    Time-ahead power forecast (next hour/day/week) from lag and calendar features
+    
+    Query Parameters:
+        - device_id (required): Device ID to forecast
+        - horizon: 'hour' (60 x 1 min), 'day' (96 x 15 min), 'week' (168 x 1 h). Default: 'day'
+        - algo: Algorithm to use ('rf', 'gbt', 'lr'). Default: 'gbt'
+        - meter_type: PLN meter type for the cost of the forecast energy. Default: '900VA'
+    
+    Returns:
+        JsonResponse with the forecast series, recent actual series, holdout RMSE and cost
+    """
+    from .forecasting import forecast_device
+    
+    try:
+        device_id = request.GET.get('device_id')
         
-        if df_clean.count() == 0:
+        if not device_id:
             return JsonResponse({
-                "error": "No valid data after removing null values. Please check data quality."
+                "error": "device_id parameter is required"
             }, status=400)
         
-        # === Vector Assembler ===
-        assembler = VectorAssembler(inputCols=feature_cols, outputCol="features")
+        # Validate device ownership
+        try:
+            device = Device.objects.get(device_id=device_id, user=request.user)
+        except Device.DoesNotExist:
+            return JsonResponse({
+                "error": "Device not found or you do not have permission to access it"
+            }, status=403)
         
-        # === Pilih Model berdasarkan Algorithm ===
-        model, model_name = get_model_by_algorithm(algo)
+        horizon = request.GET.get('horizon', 'day').lower()
+        algo = request.GET.get('algo', 'gbt').lower()
+        meter_type = request.GET.get('meter_type', '900VA').upper()
         
-        # === Pipeline ===
-        pipeline = Pipeline(stages=[assembler, model])
+        if horizon not in HORIZONS:
+            return JsonResponse({
+                "error": f"Invalid horizon. Valid options: {list(HORIZONS.keys())}"
+            }, status=400)
         
-        # === Split train & test ===
-        train_data, test_data = df_clean.randomSplit([0.8, 0.2], seed=42)
+        if algo not in ALGORITHMS:
+            return JsonResponse({
+                "error": f"Invalid algo. Valid options: {list(ALGORITHMS)}"
+            }, status=400)
         
-        # Validasi test data
-        if test_data.count() == 0:
+        try:
+            billing.get_tariff(meter_type)
+        except ValueError as e:
             return JsonResponse({
-                "error": "Insufficient data for train/test split. Need more records."
+                "error": str(e)
             }, status=400)
         
-        # === Training model ===
+        cache = get_cache()
+        watermark = cache.watermark(device_id)
+        cache_key = cache.make_key('forecast', device_id, horizon, algo, meter_type, watermark=watermark)
+        cached = cache.get(cache_key) if watermark else None
+        if cached is not None:
+            response = JsonResponse(cached)
+            response['X-Cache'] = 'HIT'
+            return response
+        
         try:
-            trained_model = pipeline.fit(train_data)
-        except Exception as train_error:
+            result = forecast_device(device_id, horizon, algo)
+        except PredictionError as e:
             return JsonResponse({
-                "error": f"Model training failed: {str(train_error)}"
-            }, status=500)
+                **e.payload,
+                "device_id": device_id,
+                "device_name": device.name,
+                "error": e.message
+            }, status=e.status)
         
-        # === Prediksi di test set ===
-        predictions = trained_model.transform(test_data)
+        # Biaya per langkah forecast: blok tarif & time-of-use seperti tagihan
+        step_kwh = [max(point["predicted_power"], 0.0) * result["interval_seconds"] / 3600.0 / 1000.0
+                    for point in result["forecast"]]
+        step_epoch = [datetime.datetime.fromisoformat(point["timestamp"]).replace(tzinfo=datetime.timezone.utc).timestamp()
+                      for point in result["forecast"]]
+        estimated_cost = float(billing.price_energy(device_id, meter_type, step_kwh, step_epoch).sum())
         
-        # === Evaluasi dengan RMSE ===
-        evaluator = RegressionEvaluator(
-            labelCol="power",
-            predictionCol="prediction",
-            metricName="rmse"
-        )
-        rmse = evaluator.evaluate(predictions)
+        response = {
+            "device_id": device_id,
+            "device_name": device.name,
+            **result,
+            "rmse": round(result["rmse"], 2),
+            "forecast_energy_kwh": round(result["forecast_energy_kwh"], 3),
+            "meter_type": meter_type,
+            "tariff_per_kwh": round(estimated_cost / sum(step_kwh), 2) if sum(step_kwh) > 0 else 0.0,
+            "estimated_cost": round(estimated_cost, 2),
+            "message": f"Forecast for the next {horizon} using {result['algo_used']} completed successfully."
+        }
+        if watermark:
+            cache.set(cache_key, response)
+        
+        return JsonResponse(response)
+    
+    except Exception as e:
+        return JsonResponse({
+            "error": f"Unexpected error: {str(e)}",
+            "type": type(e).__name__
+        }, status=500)
+
+
+MAX_SCORE_ROWS = 10000
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def score_readings(request):
+    """
+    Score readings with a registered model, in-process with NumPy (no Spark)
+    
+    POST /prediction/score/
+    Body: {
+        "device_id": "string",
+        "algo": "rf" | "gbt" | "lr" (default: "rf"),
+        "readings": [{"voltage": float, "current": float, "pf": float}, ...]
+    }
+    """
+    try:
+        device_id = request.data.get('device_id')
+        algo = str(request.data.get('algo', 'rf')).lower()
+        readings = request.data.get('readings')
         
-        # === Ambil rata-rata hasil prediksi ===
-        avg_prediction = predictions.selectExpr("avg(prediction)").first()[0]
+        if not device_id:
+            return JsonResponse({
+                "error": "device_id is required"
+            }, status=400)
         
-        # === Hitung Estimasi Biaya Listrik ===
-        estimated_cost = calculate_electricity_cost(avg_prediction, meter_type)
+        if algo not in ALGORITHMS:
+            return JsonResponse({
+                "error": f"Invalid algo. Valid options: {list(ALGORITHMS)}"
+            }, status=400)
+        
+        if not isinstance(readings, list) or not readings or len(readings) > MAX_SCORE_ROWS:
+            return JsonResponse({
+                "error": f"readings must be a non-empty list of at most {MAX_SCORE_ROWS} items"
+            }, status=400)
+        
+        # Validate device ownership
+        try:
+            device = Device.objects.get(device_id=device_id, user=request.user)
+        except Device.DoesNotExist:
+            return JsonResponse({
+                "error": "Device not found or you do not have permission to access it"
+            }, status=403)
+        
+        try:
+            X = np.array([[float(r[col]) for col in FEATURE_COLS] for r in readings])
+        except (KeyError, TypeError, ValueError):
+            return JsonResponse({
+                "error": f"Every reading needs numeric fields: {FEATURE_COLS}"
+            }, status=400)
+        
+        model, metadata = registry.get_model(device_id, algo)
+        if model is None:
+            return JsonResponse({
+                "device_id": device_id,
+                "device_name": device.name,
+                "error": f"No trained '{algo}' model for this device. Run /prediction/run/ or trainfleet first."
+            }, status=404)
+        
+        started = time.perf_counter()
+        predictions = model.predict(X)
+        scoring_microseconds = (time.perf_counter() - started) * 1e6
         
-        # === Return Response ===
         return JsonResponse({
             "device_id": device_id,
             "device_name": device.name,
-            "predicted_power": round(avg_prediction, 2),
-            "rmse": round(rmse, 2),
-            "algo_used": model_name,
-            "meter_type": meter_type,
-            "tariff_per_kwh": TARIFF_PLN[meter_type],
-            "estimated_hourly_cost": estimated_cost,
-            "message": f"Prediction using {model_name} completed successfully.",
-            "data_stats": {
-                "total_records": df.count(),
-                "clean_records": df_clean.count(),
-                "train_records": train_data.count(),
-                "test_records": test_data.count()
-            }
+            "algo": algo,
+            "algo_used": metadata.get("algo_used"),
+            "engine": metadata.get("engine"),
+            "trained_at": metadata["trained_at"].isoformat() if metadata.get("trained_at") else None,
+            "model_rmse": metadata.get("rmse"),
+            "predictions": [round(float(p), 2) for p in predictions],
+            "scoring_microseconds": round(scoring_microseconds, 1)
         })
     
     except Exception as e:
@@ -255,6 +412,33 @@ def run_prediction(request):
         }, status=500)
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def cache_stats(request):
+    """
+    Hit/miss counters and size of the prediction result cache (this process)
+    """
+    return JsonResponse(get_cache().stats())
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def worker_health(request):
+    """
+    Health of the prediction worker process (Spark session, uptime, memory)
+    """
+    try:
+        health = client.call('health', timeout=5)
+    except PredictionError as e:
+        return JsonResponse({
+            **e.payload,
+            "status": "unavailable",
+            "error": e.message
+        }, status=e.status)
+    
+    return JsonResponse(health)
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def prediction_home(request):
@@ -266,7 +450,11 @@ def prediction_home(request):
         "version": "3.0",
         "endpoints": {
             "/prediction/": "This documentation page",
-            "/prediction/run/": "Run prediction with multi-algorithm support (requires authentication)"
+            "/prediction/run/": "Run prediction with multi-algorithm support (requires authentication)",
+            "/prediction/forecast/": "Forecast power for the next hour/day/week (requires authentication)",
+            "/prediction/score/": "POST readings to score with a registered model, no Spark needed (requires authentication)",
+            "/prediction/health/": "Prediction worker health (requires authentication)",
+            "/prediction/cache/": "Prediction result cache statistics (requires authentication)"
         },
         "usage": {
             "endpoint": "/prediction/run/",
@@ -280,18 +468,39 @@ def prediction_home(request):
                 },
                 "algo": {
                     "type": "string",
-                    "options": ["rf", "gbt", "lr"],
+                    "options": ["rf", "gbt", "lr", "auto", "all"],
                     "default": "rf",
-                    "description": "Algorithm to use (rf=Random Forest, gbt=Gradient Boosted Trees, lr=Linear Regression)"
+                    "description": "Algorithm to use (rf=Random Forest, gbt=Gradient Boosted Trees, lr=Linear Regression, auto/all=train all three and pick the lowest RMSE)"
                 },
                 "meter_type": {
                     "type": "string",
-                    "options": ["450VA", "900VA", "1300VA", "2200VA"],
+                    "options": list(settings.BILLING['TARIFFS'].keys()),
                     "default": "900VA",
                     "description": "PLN meter type for cost calculation"
+                },
+                "folds": {
+                    "type": "integer",
+                    "default": 0,
+                    "description": f"0 = single 80/20 split, 2-{MAX_CV_FOLDS} = walk-forward cross-validation with per-fold metrics and timing"
+                },
+                "days": {
+                    "type": "integer",
+                    "default": settings.TRAINING_SAMPLING['DAYS'],
+                    "description": "Train on the last N days only (0 = all history)"
+                },
+                "max_rows": {
+                    "type": "integer",
+                    "default": settings.TRAINING_SAMPLING['MAX_ROWS'],
+                    "description": "Upper bound on training rows (0 = unbounded)"
+                },
+                "sample": {
+                    "type": "string",
+                    "options": list(SAMPLING_STRATEGIES),
+                    "default": settings.TRAINING_SAMPLING['STRATEGY'],
+                    "description": "How rows are dropped above max_rows (hourly = stratified by hour-of-day)"
                 }
             },
-            "example": "/prediction/run/?device_id=<device_id>&algo=gbt&meter_type=1300VA"
+            "example": "/prediction/run/?device_id=<device_id>&algo=gbt&meter_type=1300VA&folds=5&days=30&sample=hourly"
         },
-        "tariff_info": TARIFF_PLN
+        "tariff_info": settings.BILLING['TARIFFS']
     })
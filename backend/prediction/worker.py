@@ -0,0 +1,143 @@
+"""
+Long-lived prediction worker process.
+
+The worker owns the only SparkSession in the deployment. Django web workers,
+runmqtt and management commands talk to it over a local authenticated socket
+(multiprocessing.connection) through prediction.client, so they never import
+pyspark or start a JVM themselves.
+
+Protocol: the client sends {"method": str, "params": dict} and receives
+{"ok": True, "result": ...} or {"ok": False, "error": str, "status": int,
+"payload": dict}. One request per connection.
+"""
+import os
+import resource
+import threading
+import time
+from multiprocessing.connection import Listener, AuthenticationError
+
+from . import scheduler
+from .exceptions import PredictionError
+from .spark import get_spark, job_properties, spark_status
+
+
+class PredictionWorker:
+    """Serve prediction requests against a warm SparkSession"""
+
+    def __init__(self, address, authkey):
+        self.address = tuple(address)
+        self.authkey = authkey
+        self.started_at = time.time()
+        self.requests_served = 0
+        self.requests_failed = 0
+        self.active_requests = 0
+        self._stats_lock = threading.Lock()
+        self.scheduler = scheduler.from_settings(job_context=job_properties)
+
+        self.handlers = {
+            'health': self.health,
+            'train': self.train,
+            'train_fleet': self.train_fleet,
+        }
+
+    # === Handlers ===
+
+    def health(self):
+        """Report liveness, Spark state and resource usage"""
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        return {
+            "status": "ok",
+            "pid": os.getpid(),
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "requests_served": self.requests_served,
+            "requests_failed": self.requests_failed,
+            "active_requests": self.active_requests,
+            "max_rss_kb": usage.ru_maxrss,
+            "spark": spark_status(),
+            "scheduler": self.scheduler.stats(),
+        }
+
+    def train(self, device_id, algo='rf', folds=0, sampling=None, pool='interactive', hints=None):
+        """Train one device through the scheduler; adds queue/run timing under the "scheduling" key"""
+        from . import training
+
+        result, scheduling = self.scheduler.run(
+            lambda: training.train_device_model(get_spark(), device_id, algo, folds, sampling),
+            pool=pool,
+            description=f"train {device_id} [{algo}]",
+            hints=hints
+        )
+        return {**result, "scheduling": scheduling}
+
+    def train_fleet(self, device_ids=None, algos=None, days=None, sampling=None, pool='batch', hints=None):
+        """Fleet retrain (Spark grouped map) as a batch job"""
+        from . import fleet
+        from .numpy_engine import ALGORITHMS
+
+        result, scheduling = self.scheduler.run(
+            lambda: fleet.train_fleet_spark(get_spark(), device_ids, tuple(algos or ALGORITHMS), days=days,
+                                            sampling=sampling),
+            pool=pool,
+            description="fleet retrain",
+            hints=hints
+        )
+        return {**result, "scheduling": scheduling}
+
+    # === Server loop ===
+
+    def warmup(self):
+        """Start Spark and run a trivial job so the first request is fast"""
+        spark = get_spark()
+        spark.range(1).count()
+
+    def serve_forever(self):
+        with Listener(self.address, authkey=self.authkey) as listener:
+            while True:
+                try:
+                    conn = listener.accept()
+                except AuthenticationError:
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            try:
+                request = conn.recv()
+            except EOFError:
+                return
+
+            with self._stats_lock:
+                self.active_requests += 1
+
+            response = self._dispatch(request)
+
+            with self._stats_lock:
+                self.active_requests -= 1
+                self.requests_served += 1
+                if not response["ok"]:
+                    self.requests_failed += 1
+
+            try:
+                conn.send(response)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    def _dispatch(self, request):
+        method = request.get("method")
+        params = request.get("params") or {}
+
+        handler = self.handlers.get(method)
+        if handler is None:
+            return {"ok": False, "error": f"Unknown method: {method}", "status": 400, "payload": {}}
+
+        try:
+            return {"ok": True, "result": handler(**params)}
+        except PredictionError as e:
+            return {"ok": False, "error": e.message, "status": e.status, "payload": e.payload}
+        except Exception as e:
+            return {
+                "ok": False,
+                "error": f"Unexpected error: {str(e)}",
+                "status": 500,
+                "payload": {"type": type(e).__name__},
+            }
@@ -14,3 +14,7 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wattara.settings')
 
 application = get_asgi_application()
+
+from monitoring.indexes import ensure_on_startup  # noqa: E402
+
+ensure_on_startup()
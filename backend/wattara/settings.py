@@ -10,6 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import hashlib
+import hmac
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -119,6 +122,9 @@ LANGUAGE_CODE = 'en-us'
 
 TIME_ZONE = 'UTC'
 
+# Zona waktu lokal device (untuk profil beban harian/mingguan dan tarif)
+LOCAL_TIME_ZONE = 'Asia/Jakarta'
+
 USE_I18N = True
 
 USE_TZ = True
@@ -178,3 +184,168 @@ SIMPLE_JWT = {
     'TOKEN_TYPE_CLAIM': 'token_type',
 }
 
+
+# MongoDB Configuration (sensor readings, models, aggregates)
+MONGODB = {
+    'URI': 'mongodb://localhost:27017/',
+    'DB': 'iot_db',
+    # Buat index yang belum ada saat server/ingester start (lihat manage.py ensureindexes)
+    'ENSURE_INDEXES_ON_STARTUP': True,
+}
+
+# Prediction Worker Configuration
+# Spark hanya berjalan di proses worker: python manage.py runpredictionworker
+# Web workers memanggilnya lewat socket lokal (prediction/client.py)
+# Listener worker meng-unpickle request: authkey wajib rahasia. Set PREDICTION_WORKER_AUTHKEY
+# di environment; tanpa itu key diturunkan dari SECRET_KEY (yang ada di repo), hanya untuk DEBUG
+PREDICTION_WORKER_AUTHKEY = os.environ.get('PREDICTION_WORKER_AUTHKEY', '')
+PREDICTION_WORKER = {
+    'ADDRESS': ('127.0.0.1', 6100),
+    'AUTHKEY': PREDICTION_WORKER_AUTHKEY.encode() or hmac.new(
+        SECRET_KEY.encode(), b'prediction-worker', hashlib.sha256
+    ).hexdigest().encode(),
+    'AUTHKEY_FROM_ENV': bool(PREDICTION_WORKER_AUTHKEY),
+    'TIMEOUT': 600,  # detik, batas tunggu satu request training
+}
+
+# Training window & sampling default untuk /prediction/run/ (lihat prediction/sampling.py)
+TRAINING_SAMPLING = {
+    'DAYS': 30,             # hanya reading N hari terakhir (0 = semua histori)
+    'MAX_ROWS': 200000,     # batas baris training per device (0 = tanpa batas)
+    'STRATEGY': 'hourly',   # latest | random | hourly (stratified per jam, jaga pola beban harian)
+}
+
+# Billing period cost engine (monitoring/billing.py, /monitoring/billing/)
+BILLING = {
+    'PERIOD_START_DAY': 1,       # tanggal awal periode tagihan (1-28)
+    'PROFILE_DAYS': 14,          # histori rollup untuk profil proyeksi per jam
+    'TARIFFS': {
+        # blocks: (batas kumulatif kWh, Rp/kWh); None = blok terakhir
+        '450VA': {'blocks': [(30, 169), (60, 360), (None, 495)]},
+        '900VA': {'rate': 1352},
+        '1300VA': {'rate': 1444.70},
+        '2200VA': {'rate': 1444.70},
+        # contoh time-of-use: 'time_of_use': [{'start': 17, 'end': 22, 'multiplier': 1.4}] (jam lokal)
+    },
+    'TAXES': [
+        {'name': 'PPJ', 'rate': 0.03},   # Pajak Penerangan Jalan (tarif tergantung daerah)
+    ],
+}
+
+# Materialized feature store (prediction/feature_store.py, python manage.py buildfeatures)
+FEATURE_STORE = {
+    'ENABLED': True,             # training & forecast baca prediction_features bila device sudah punya baris
+    'BUCKET_SECONDS': 60,        # satu baris rata-rata per device per bucket
+    'INGEST_LAG_SECONDS': 5,     # bucket dianggap tertutup setelah lewat sekian detik
+}
+
+# Admission control & FAIR pools untuk job Spark di prediction worker (prediction/scheduler.py)
+PREDICTION_SCHEDULER = {
+    'MAX_CONCURRENT_JOBS': 2,    # job training yang boleh jalan bersamaan, sisanya antre
+    'QUEUE_TIMEOUT': 120,        # detik antre sebelum ditolak (HTTP 503)
+    'POOLS': {
+        # priority kecil = didahulukan; weight/min_share = FAIR scheduler Spark
+        'interactive': {'priority': 0, 'weight': 3, 'min_share': 2, 'max_running': 2,
+                        'hints': {'fit_threads': 3}},
+        'batch': {'priority': 1, 'weight': 1, 'min_share': 0, 'max_running': 1,
+                  'hints': {'fit_threads': 1}},
+    },
+}
+
+# Incremental Model Updates (python manage.py updatemodels)
+INCREMENTAL_TRAINING = {
+    'INGEST_LAG_SECONDS': 2,     # abaikan reading yang lebih baru dari ini (insert masih berjalan)
+    'MIN_NEW_RECORDS': 30,       # model tree hanya di-update setelah sekian reading baru
+    'TREE_WINDOW_HOURS': 24,     # window data terbaru untuk refit tree
+    'RF_REPLACE_TREES': 10,      # jumlah tree tertua yang diganti per update
+    'GBT_EXTRA_ITER': 10,        # stage boosting tambahan per update (warm start)
+    'GBT_MAX_TREES': 200,        # di atas ini GBT di-fit ulang dari window
+}
+
+# Prediction Result Cache (prediction/cache.py)
+PREDICTION_CACHE = {
+    'BACKEND': 'locmem',         # 'locmem' | 'file' | 'redis'
+    'LOCATION': '',              # direktori untuk 'file', URL untuk 'redis' (redis://localhost:6379/0)
+    'TTL': 900,                  # detik
+    'MAX_ENTRIES': 512,          # LRU (locmem & file)
+    # detik; watermark dibulatkan ke bawah agar device 2 detik tetap bisa hit, tapi hasil
+    # bisa tertinggal hingga sekian detik dari reading terbaru (0 = selalu terbaru)
+    'WATERMARK_RESOLUTION': 0,
+}
+
+# Deteksi anomali saat ingest (mqtt_app/anomaly.py, /monitoring/anomalies/)
+ANOMALY_DETECTION = {
+    'ENABLED': True,
+    'EWMA_ALPHA': 0.05,          # bobot reading baru pada baseline adaptif
+    'Z_THRESHOLD': 4.0,          # |z| terhadap baseline EWMA untuk dianggap anomali
+    'WARMUP_READINGS': 30,       # z-score baru dipakai setelah sekian reading per device
+    'STATE_SAVE_SECONDS': 60,    # interval simpan statistik per device ke MongoDB
+    'METRICS': {
+        # direction: low | high | both; min_std: lantai std supaya sinyal stabil tidak over-sensitif
+        # min / max: batas absolut, berlaku juga selama warmup
+        # min_load: metric hanya dinilai bila salah satu field ini >= nilainya (pf = 0 saat tanpa beban)
+        'voltage': {'direction': 'both', 'min_std': 1.0, 'min': 198.0, 'max': 242.0},  # 220V ±10%
+        'current': {'direction': 'high', 'min_std': 0.05},
+        'pf': {'direction': 'low', 'min_std': 0.02, 'min': 0.5, 'min_load': {'current': 0.05, 'power': 5.0}},
+        'power': {'direction': 'high', 'min_std': 5.0},
+    },
+}
+
+# Alert rules per device, dievaluasi di runmqtt (mqtt_app/alerts.py, /monitoring/alerts/)
+ALERTS = {
+    'ENABLED': True,
+    'RULE_REFRESH_SECONDS': 30,  # interval muat ulang rule dari database di ingester
+}
+
+# Ringkasan dashboard per user, dipelihara ingester (monitoring/summary.py)
+DASHBOARD_SUMMARY = {
+    'ENABLED': True,
+    'STALE_SECONDS': 300,            # device tanpa reading selama ini tidak dihitung di beban total
+    'OWNER_REFRESH_SECONDS': 60,     # interval minimum muat ulang peta device -> user saat ada device baru
+    'METER_TYPE': '900VA',           # tarif default untuk biaya periode (?meter_type= untuk override)
+}
+
+# Kompresi reading saat ingest (mqtt_app/compression.py): simpan hanya titik yang informatif
+COMPRESSION = {
+    'MODE': None,                   # None: simpan semua | 'deadband' | 'swinging_door'
+    'MAX_INTERVAL_SECONDS': 300,    # heartbeat: minimal satu reading tersimpan per interval per device
+    'FLUSH_SECONDS': 10,            # interval cek reading tertahan dari device yang diam
+    'TOLERANCES': {                 # galat rekonstruksi maksimum per field
+        'voltage': 2.0,             # V
+        'current': 0.2,             # A
+        'power': 40.0,              # W
+        'pf': 0.03,
+        'frequency': 0.2,           # Hz
+        'energy': 0.02,             # kWh (counter kumulatif, konsumsi tetap utuh)
+    },
+}
+
+# Retensi data mentah pzem_data1 (monitoring/retention.py, python manage.py applyretention)
+RETENTION = {
+    'RAW_DAYS': 90,               # reading mentah dihapus setelah N hari (hanya jika rollup lengkap)
+    'FEATURES_DAYS': 365,         # bucket per menit prediction_features (0 = simpan selamanya)
+    'MODE': 'purge',              # purge: job batch dengan cek kelengkapan | ttl: TTL index MongoDB
+    'REQUIRE_FEATURES': True,     # raw baru boleh dihapus setelah buildfeatures melewati range-nya
+    'BATCH_SIZE': 10000,          # dokumen per delete_many
+    'BATCH_PAUSE_SECONDS': 0.1,   # jeda antar batch supaya ingester tidak tertahan
+}
+
+# Backfill / migrasi data berukuran besar (monitoring/backfill.py, python manage.py backfill)
+BACKFILL = {
+    'WORKERS': 4,                 # proses paralel yang mengambil chunk
+    'CHUNK_HOURS': 24,            # lebar satu chunk (per device bila migrasi dipartisi per device)
+    'BATCH_SIZE': 5000,           # dokumen per bulk_write
+    'BATCH_PAUSE_SECONDS': 0.0,   # jeda antar batch supaya ingester tidak tertahan
+    'LEASE_SECONDS': 300,         # chunk 'running' tanpa progres selama ini diambil worker lain
+}
+
+# Arsip Parquet untuk reading lama (monitoring/archive.py, python manage.py archivereadings)
+# AFTER_DAYS harus lebih kecil dari RETENTION['RAW_DAYS'] supaya reading diarsip sebelum dihapus
+ARCHIVE = {
+    'ENABLED': True,             # history & loader training ikut membaca arsip
+    'ROOT': BASE_DIR / 'archive',
+    'AFTER_DAYS': 30,            # hari penuh yang lebih tua dari ini dipindah ke Parquet
+    'COMPRESSION': 'zstd',
+    'COMPRESSION_LEVEL': 9,
+    'ROW_GROUP_SIZE': 8192,      # row group kecil = pushdown filter timestamp lebih tajam
+}
@@ -14,3 +14,7 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'wattara.settings')
 
 application = get_wsgi_application()
+
+from monitoring.indexes import ensure_on_startup  # noqa: E402
+
+ensure_on_startup()
@@ -4,8 +4,8 @@ import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContai
 interface ComparisonChartProps {
     data: Array<{
         timestamp: string;
-        actual: number;
-        predicted: number;
+        actual: number | null;
+        predicted: number | null;
     }>;
     unit: string;
     title: string;
@@ -29,7 +29,7 @@ const ComparisonChart: React.FC<ComparisonChartProps> = ({ data, unit, title })
                             minute: '2-digit'
                         })}
                     </p>
-                    {payload.map((entry: any, index: number) => (
+                    {payload.filter((entry: any) => entry.value != null).map((entry: any, index: number) => (
                         <p key={index} className="text-sm font-semibold" style={{ color: entry.color }}>
                             {entry.name}: {entry.value.toFixed(2)} {unit}
                         </p>
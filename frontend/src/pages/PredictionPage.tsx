@@ -20,6 +20,27 @@ interface PredictionResult {
     train_records: number;
     test_records: number;
   };
+  best_algo?: string;
+  elapsed_seconds?: number;
+  results?: Array<{
+    algo: string;
+    algo_used: string;
+    rmse: number;
+    predicted_power: number;
+    estimated_hourly_cost: number;
+    fit_seconds: number;
+  }>;
+}
+
+interface ForecastResult {
+  horizon: string;
+  interval_seconds: number;
+  algo_used: string;
+  rmse: number;
+  forecast: Array<{ timestamp: string; predicted_power: number }>;
+  history: Array<{ timestamp: string; actual_power: number }>;
+  forecast_energy_kwh: number;
+  estimated_cost: number;
 }
 
 interface ResultCardProps {
@@ -67,11 +88,15 @@ const PredictionPage: React.FC = () => {
   const [isLoading, setIsLoading] = useState(false);
   const [result, setResult] = useState<PredictionResult | null>(null);
   const [error, setError] = useState<string | null>(null);
+  const [selectedHorizon, setSelectedHorizon] = useState('day');
+  const [forecast, setForecast] = useState<ForecastResult | null>(null);
+  const [forecastError, setForecastError] = useState<string | null>(null);
 
   const algorithms = [
     { value: 'rf', label: 'Random Forest', description: 'Ensemble learning, high accuracy' },
     { value: 'gbt', label: 'Gradient Boosted Trees (GBT)', description: 'Sequential boosting, robust' },
     { value: 'lr', label: 'Linear Regression', description: 'Simple baseline, fast' },
+    { value: 'auto', label: 'Auto (compare all)', description: 'Train all three in parallel, pick lowest RMSE' },
   ];
 
   const meterTypes = [
@@ -81,6 +106,27 @@ const PredictionPage: React.FC = () => {
     { value: '2200VA', label: '2200 VA+', tariff: 'Rp 1,444/kWh' },
   ];
 
+  const horizons = [
+    { value: 'hour', label: 'Next Hour' },
+    { value: 'day', label: 'Next Day' },
+    { value: 'week', label: 'Next Week' },
+  ];
+
+  const fetchForecast = async (deviceId: string, horizon: string) => {
+    setForecastError(null);
+    try {
+      // Forecast memakai algoritma yang dipilih (auto -> GBT)
+      const algo = ['rf', 'gbt', 'lr'].includes(selectedAlgo) ? selectedAlgo : 'gbt';
+      const response = await axios.get(
+        `http://localhost:8000/prediction/forecast/?device_id=${deviceId}&horizon=${horizon}&algo=${algo}&meter_type=${selectedMeter}`
+      );
+      setForecast(response.data);
+    } catch (err: any) {
+      setForecast(null);
+      setForecastError(err.response?.data?.error || err.message || 'Forecast failed');
+    }
+  };
+
   const handleRunPrediction = async () => {
     // <--- 3. Validasi jika tidak ada device yang aktif/dipilih
     if (!activeDevice) {
@@ -91,6 +137,7 @@ const PredictionPage: React.FC = () => {
     setIsLoading(true);
     setError(null);
     setResult(null);
+    setForecast(null);
 
     try {
       // <--- 4. Tambahkan device_id=${activeDevice.device_id} ke URL
@@ -99,6 +146,7 @@ const PredictionPage: React.FC = () => {
       );
 
       setResult(response.data);
+      await fetchForecast(activeDevice.device_id, selectedHorizon);
     } catch (err: any) {
       const errorMessage = err.response?.data?.error || err.message || 'An unexpected error occurred';
       setError(errorMessage);
@@ -107,24 +155,25 @@ const PredictionPage: React.FC = () => {
     }
   };
 
-  // Generate mock comparison data for visualization
-  const generateComparisonData = (predictedPower: number) => {
-    const data = [];
-    const now = new Date();
-
-    for (let i = 23; i >= 0; i--) {
-      const timestamp = new Date(now.getTime() - i * 60 * 60 * 1000);
-      const actual = predictedPower + (Math.random() - 0.5) * predictedPower * 0.2;
-      const predicted = predictedPower + (Math.random() - 0.5) * predictedPower * 0.15;
-
-      data.push({
-        timestamp: timestamp.toISOString(),
-        actual: Math.max(0, actual),
-        predicted: Math.max(0, predicted)
-      });
-    }
+  // Gabungkan histori aktual dan hasil forecast pada satu sumbu waktu
+  const buildForecastChartData = (data: ForecastResult) => [
+    ...data.history.map((point) => ({
+      timestamp: point.timestamp,
+      actual: point.actual_power,
+      predicted: null,
+    })),
+    ...data.forecast.map((point) => ({
+      timestamp: point.timestamp,
+      actual: null,
+      predicted: point.predicted_power,
+    })),
+  ];
 
-    return data;
+  const handleHorizonChange = (horizon: string) => {
+    setSelectedHorizon(horizon);
+    if (activeDevice && result) {
+      fetchForecast(activeDevice.device_id, horizon);
+    }
   };
 
   return (
@@ -290,12 +339,73 @@ const PredictionPage: React.FC = () => {
             />
           </div>
 
-          {/* Comparison Chart */}
-          <ComparisonChart
-            data={generateComparisonData(result.predicted_power)}
-            unit="W"
-            title="Actual vs Predicted Power Consumption"
-          />
+          {/* Algorithm Comparison (algo=auto) */}
+          {result.results && (
+            <div className="bg-white dark:bg-slate-900 rounded-xl border border-slate-200 dark:border-slate-800 p-6 shadow-sm">
+              <h3 className="text-lg font-semibold text-slate-800 dark:text-white mb-4">
+                Algorithm Comparison
+                {result.elapsed_seconds !== undefined && (
+                  <span className="ml-2 text-sm font-normal text-slate-500 dark:text-slate-400">
+                    ({result.elapsed_seconds.toFixed(1)} s total)
+                  </span>
+                )}
+              </h3>
+              <div className="space-y-2">
+                {result.results.map((r) => (
+                  <div
+                    key={r.algo}
+                    className={cn(
+                      'flex justify-between items-center p-3 rounded-lg border',
+                      r.algo === result.best_algo
+                        ? 'border-purple-400 bg-purple-50 dark:bg-purple-900/20 dark:border-purple-700'
+                        : 'border-slate-200 dark:border-slate-700'
+                    )}
+                  >
+                    <span className="font-medium text-slate-800 dark:text-slate-200">{r.algo_used}</span>
+                    <span className="text-sm text-slate-600 dark:text-slate-400">
+                      RMSE {r.rmse.toFixed(2)} · {r.predicted_power} W · {r.fit_seconds.toFixed(1)} s
+                    </span>
+                  </div>
+                ))}
+              </div>
+            </div>
+          )}
+
+          {/* Forecast Chart */}
+          <div className="flex flex-wrap gap-2">
+            {horizons.map((h) => (
+              <button
+                key={h.value}
+                onClick={() => handleHorizonChange(h.value)}
+                className={cn(
+                  'px-4 py-2 rounded-lg text-sm font-medium border-2 transition-all',
+                  selectedHorizon === h.value
+                    ? 'border-purple-500 bg-purple-50 text-purple-700 dark:bg-purple-900/20 dark:text-purple-300 dark:border-purple-400'
+                    : 'border-slate-200 text-slate-600 dark:border-slate-700 dark:text-slate-400 hover:border-slate-300'
+                )}
+              >
+                {h.label}
+              </button>
+            ))}
+          </div>
+
+          {forecastError && (
+            <p className="text-sm text-red-600 dark:text-red-400">{forecastError}</p>
+          )}
+
+          {forecast && (
+            <>
+              <ComparisonChart
+                data={buildForecastChartData(forecast)}
+                unit="W"
+                title={`Recent vs Forecast Power (${forecast.algo_used}, RMSE ${forecast.rmse.toFixed(2)})`}
+              />
+              <p className="text-sm text-slate-600 dark:text-slate-400">
+                Forecast energy: {forecast.forecast_energy_kwh.toFixed(3)} kWh · Estimated cost: Rp{' '}
+                {forecast.estimated_cost.toLocaleString('id-ID')}
+              </p>
+            </>
+          )}
 
           {/* Additional Details */}
           <div className="bg-white dark:bg-slate-900 rounded-xl border border-slate-200 dark:border-slate-800 p-6 shadow-sm">